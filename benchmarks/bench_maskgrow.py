@@ -0,0 +1,89 @@
+"""
+Compare the mask growing done by ``drizzlepac.maskgrow`` against the
+``scipy.signal.convolve2d`` calls it replaces in ``driz_cr`` and ``minmed``.
+
+For every kernel, the masks computed both ways are checked to be identical
+and the time taken by each is reported::
+
+    python benchmarks/bench_maskgrow.py --size 4096 --grow 3 --ctegrow 10
+
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import signal
+
+from drizzlepac import maskgrow
+
+
+def _best_time(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=4096,
+                        help='Size of the (square) masks')
+    parser.add_argument('--fraction', type=float, default=0.05,
+                        help='Fraction of pixels set in the masks')
+    parser.add_argument('--grow', type=int, default=3,
+                        help='driz_cr_grow (and combine_grow) value')
+    parser.add_argument('--ctegrow', type=int, default=10,
+                        help='driz_cr_ctegrow value')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timings to take the best of')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    mask = rng.random((args.size, args.size)) >= args.fraction
+    flags = ~mask
+    grow, ctegrow = args.grow, args.ctegrow
+
+    grow_window = maskgrow.convolve_box_window(grow)
+    cte_kernel = np.zeros((2 * ctegrow + 1, 2 * ctegrow + 1))
+    cte_kernel[0:ctegrow, ctegrow] = 1
+    box = 2 * grow + 1
+
+    cases = [
+        ('driz_cr 3x3 neighbors',
+         lambda: signal.convolve2d(mask, np.ones((3, 3), dtype=np.uint16),
+                                   boundary='symm', mode='same') >= 9,
+         lambda: maskgrow.erode(mask, (-1, 1), (-1, 1))),
+        ('driz_cr grow {0}x{0}'.format(grow),
+         lambda: signal.convolve2d(mask, np.ones((grow, grow), dtype=np.uint16),
+                                   boundary='symm', mode='same') >= grow**2,
+         lambda: maskgrow.erode(mask, grow_window, grow_window)),
+        ('driz_cr ctegrow {}'.format(ctegrow),
+         lambda: signal.convolve2d(mask, cte_kernel, boundary='symm',
+                                   mode='same') >= ctegrow,
+         lambda: maskgrow.erode(mask, (1, ctegrow), (0, 0))),
+        ('minmed boxcar {0}x{0}'.format(box),
+         lambda: signal.convolve2d(flags.astype(np.float64),
+                                   np.ones((box, box)) / float(box**2),
+                                   boundary='fill', mode='same') != 0,
+         lambda: maskgrow.dilate(flags, (-grow, grow), (-grow, grow))),
+    ]
+
+    print('{:<28s} {:>12s} {:>12s} {:>8s}  identical'
+          .format('kernel', 'convolve2d', 'maskgrow', 'speedup'))
+    all_identical = True
+    for name, reference, fast in cases:
+        tref, ref_mask = _best_time(reference, args.repeat)
+        tfast, fast_mask = _best_time(fast, args.repeat)
+        identical = np.array_equal(ref_mask, fast_mask)
+        all_identical &= identical
+        print('{:<28s} {:>11.3f}s {:>11.3f}s {:>7.1f}x  {}'
+              .format(name, tref, tfast, tref / tfast, identical))
+
+    if not all_identical:
+        raise SystemExit('Masks differ!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Time the WCS update stage of ``processInput`` (``_process_input_wcs``) for an
+association of exposures on local disk, run serially and with increasing
+numbers of parallel workers.
+
+Without ``--input``, synthetic two-chip exposures with an alternate WCS get
+created and the stage resets their WCS to that alternate WCS (``wcskey``),
+which does not need any reference files::
+
+    python benchmarks/bench_process_input_wcs.py --nexp 50 --num_cores 1 2 4
+
+With ``--input``, copies of the given exposures get updated by ``updatewcs``
+instead (which needs the reference files they point to)::
+
+    python benchmarks/bench_process_input_wcs.py --input 'data/*_flc.fits'
+
+For each number of workers, the headers and WCSCORR tables of all the updated
+exposures are checked to be identical to those from the serial run.
+
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from astropy.io import fits
+from stwcs.wcsutil import altwcs
+
+from drizzlepac import processInput, util
+
+
+def _make_exposure(filename, rng, shape=(2048, 4096)):
+    hdus = [fits.PrimaryHDU()]
+    hdus[0].header['INSTRUME'] = 'ACS'
+    hdus[0].header['DETECTOR'] = 'WFC'
+    hdus[0].header['ROOTNAME'] = os.path.basename(filename)[:9]
+    ra, dec = 150. + rng.uniform(-0.01, 0.01), 2. + rng.uniform(-0.01, 0.01)
+    for chip in range(2):
+        hdr = fits.Header()
+        hdr['EXTNAME'] = 'SCI'
+        hdr['EXTVER'] = chip + 1
+        hdr['CTYPE1'] = 'RA---TAN'
+        hdr['CTYPE2'] = 'DEC--TAN'
+        hdr['CRPIX1'] = shape[1] / 2.
+        hdr['CRPIX2'] = shape[0] * (1 - 2 * chip) / 2.
+        hdr['CRVAL1'] = ra
+        hdr['CRVAL2'] = dec
+        hdr['CD1_1'] = -0.05 / 3600
+        hdr['CD1_2'] = 0.
+        hdr['CD2_1'] = 0.
+        hdr['CD2_2'] = 0.05 / 3600
+        hdr['WCSNAME'] = 'OPUS'
+        hdus.append(fits.ImageHDU(data=np.zeros(shape, dtype=np.float32),
+                                  header=hdr))
+    fits.HDUList(hdus).writeto(filename, overwrite=True)
+
+    # save the WCS shifted by a fraction of a pixel as alternate WCS 'A'
+    altwcs.archive_wcs(filename, [('SCI', 1), ('SCI', 2)], wcskey='A',
+                       wcsname='SHIFTED')
+    with fits.open(filename, mode='update') as hdul:
+        for chip in range(2):
+            hdul['SCI', chip + 1].header['CRVAL1A'] += 1e-5
+
+
+def _snapshot(filenames):
+    """Headers and WCSCORR tables of all the exposures."""
+    result = []
+    for fname in filenames:
+        with fits.open(fname) as hdul:
+            for hdu in hdul:
+                hdr = hdu.header.copy()
+                # these record when the files got updated
+                for kw in ['DATE', 'IRAF-TLM', 'CHECKSUM', 'DATASUM']:
+                    hdr.remove(kw, ignore_missing=True, remove_all=True)
+                result.append(str(hdr))
+                if hdu.name == 'WCSCORR':
+                    result.append(repr(hdu.data.tolist()))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--nexp', type=int, default=50,
+                        help='Number of synthetic exposures')
+    parser.add_argument('--input', default=None,
+                        help='Exposures to run updatewcs on, instead of '
+                             'synthetic exposures')
+    parser.add_argument('--num_cores', type=int, nargs='+', default=[1, 2, 4],
+                        help='Numbers of workers to time')
+    parser.add_argument('--tmpdir', default=None,
+                        help='Local directory where the exposures get written')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(dir=args.tmpdir)
+    try:
+        source = os.path.join(workdir, 'source')
+        os.mkdir(source)
+        if args.input:
+            for fname in sorted(glob.glob(args.input)):
+                shutil.copy(fname, source)
+            wcskey, updatewcs = None, True
+        else:
+            rng = np.random.default_rng(0)
+            for k in range(args.nexp):
+                _make_exposure(os.path.join(source, 'j8c{:06d}_flc.fits'.format(k)), rng)
+            wcskey, updatewcs = 'A', False
+        names = sorted(os.listdir(source))
+
+        print('{} exposures, {} available cores (parallel: {})'
+              .format(len(names), util._cpu_count, util.can_parallel))
+        print('{:>9s} {:>9s} {:>10s} {:>8s}  identical'
+              .format('num_cores', 'workers', 'time', 'speedup'))
+        reference = None
+        serial_time = None
+        all_identical = True
+        for num_cores in args.num_cores:
+            rundir = os.path.join(workdir, 'run{}'.format(num_cores))
+            shutil.copytree(source, rundir)
+            files = [os.path.join(rundir, name) for name in names]
+            workers = min(util.get_pool_size(num_cores, len(files)),
+                          processInput.MAX_WCS_UPDATES)
+
+            t0 = time.perf_counter()
+            processInput._process_input_wcs(files, wcskey, updatewcs,
+                                            num_cores=num_cores)
+            elapsed = time.perf_counter() - t0
+
+            snapshot = _snapshot(files)
+            if reference is None:
+                reference, serial_time = snapshot, elapsed
+            identical = snapshot == reference
+            all_identical &= identical
+            print('{:>9d} {:>9d} {:>9.3f}s {:>7.1f}x  {}'
+                  .format(num_cores, workers, elapsed, serial_time / elapsed,
+                          identical))
+            shutil.rmtree(rundir)
+    finally:
+        shutil.rmtree(workdir)
+
+    if not all_identical:
+        raise SystemExit('Updated exposures differ!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare ``drizzlepac.quickDeriv.qderiv`` against the implementation it
+replaces, which shifted copies of the image into float64 arrays.
+
+The derivatives computed both ways are checked to be identical, and the
+time taken, the peak memory allocated and the number of page faults (the
+memory newly touched) by each are reported::
+
+    python benchmarks/bench_qderiv.py --size 4096
+
+"""
+import argparse
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+
+from drizzlepac import quickDeriv
+
+
+def _qderiv_float64(array):
+    """ The former implementation of `drizzlepac.quickDeriv.qderiv`. """
+    tmpArray = np.zeros(array.shape, dtype=np.float64)
+    outArray = np.zeros(array.shape, dtype=np.float64)
+    (naxis1, naxis2) = array.shape
+
+    def absolute_subtract(tmpArray, outArray):
+        tmpArray = np.fabs(array - tmpArray)
+        outArray = np.maximum(tmpArray, outArray)
+        return tmpArray * 0., outArray
+
+    tmpArray[0:(naxis1-1), 1:(naxis2-1)] = array[0:(naxis1-1), 0:(naxis2-2)]
+    tmpArray, outArray = absolute_subtract(tmpArray, outArray)
+    tmpArray[0:(naxis1-1), 0:(naxis2-2)] = array[0:(naxis1-1), 1:(naxis2-1)]
+    tmpArray, outArray = absolute_subtract(tmpArray, outArray)
+    tmpArray[1:(naxis1-1), 0:(naxis2-1)] = array[0:(naxis1-2), 0:(naxis2-1)]
+    tmpArray, outArray = absolute_subtract(tmpArray, outArray)
+    tmpArray[0:(naxis1-2), 0:(naxis2-1)] = array[1:(naxis1-1), 0:(naxis2-1)]
+    tmpArray, outArray = absolute_subtract(tmpArray, outArray)
+    return outArray.astype(np.float32)
+
+
+def _measure(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+        del result
+
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+    return best, peak, faults, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=4096,
+                        help='Size of the (square) images')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timings to take the best of')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = (args.size, args.size)
+    images = [('float32', rng.normal(100., 10., shape).astype(np.float32)),
+              ('float64', rng.normal(100., 10., shape))]
+
+    page = resource.getpagesize()
+    print('{:<8s} {:<10s} {:>9s} {:>11s} {:>11s}  identical'
+          .format('input', 'qderiv', 'time', 'peak alloc', 'new pages'))
+    all_identical = True
+    for name, image in images:
+        tref, pref, fref, ref_deriv = _measure(
+            lambda: _qderiv_float64(image), args.repeat)
+        tnew, pnew, fnew, new_deriv = _measure(
+            lambda: quickDeriv.qderiv(image), args.repeat)
+        identical = (new_deriv.dtype == ref_deriv.dtype and
+                     np.array_equal(ref_deriv, new_deriv))
+        all_identical &= identical
+        for label, t, peak, faults in [('former', tref, pref, fref),
+                                       ('blocked', tnew, pnew, fnew)]:
+            print('{:<8s} {:<10s} {:>8.3f}s {:>8.1f} MB {:>8.1f} MB  {}'
+                  .format(name, label, t, peak / 2**20,
+                          faults * page / 2**20, identical))
+        print('{:<8s} {:<10s} {:>8.1f}x {:>10.1f}x'
+              .format(name, 'speedup', tref / tnew, pref / pnew))
+
+    if not all_identical:
+        raise SystemExit('Derivatives differ!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Time the position matching done by ``hla_flag_filter.xymatch`` for catalogs
+of increasing size, against searching windows of the catalog sorted by Y one
+source at a time.
+
+For each number of sources, all the matches (and their order) are checked to
+be identical to those found by the windowed search::
+
+    python benchmarks/bench_xymatch.py --nsources 1000 10000 100000
+
+"""
+import argparse
+import time
+
+import numpy as np
+
+from drizzlepac.haputils import hla_flag_filter
+
+
+def _best_time(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _window_xymatch(cat1, cat2, sep):
+    """ All the matches within ``sep``, found the same way as the original
+    ``xymatch`` loop did it.
+    """
+    is1 = cat1[:, 1].argsort()
+    x1, y1 = cat1[is1, 0], cat1[is1, 1]
+    is2 = cat2[:, 1].argsort()
+    x2, y2 = cat2[is2, 0], cat2[is2, 1]
+    kvlo = y2.searchsorted(y1 - sep, 'left').clip(0, len(y2))
+    kvhi = y2.searchsorted(y1 + sep, 'right').clip(kvlo, len(y2))
+    p1 = []
+    p2 = []
+    for i in range(len(x1)):
+        klo, khi = kvlo[i], kvhi[i]
+        w = (np.abs(x2[klo:khi] - x1[i]) <= sep).nonzero()[0]
+        distsq = (x1[i] - x2[klo + w])**2 + (y1[i] - y2[klo + w])**2
+        ww = (distsq <= sep**2).nonzero()[0]
+        if len(ww) > 0:
+            p1.append(np.zeros(len(ww), dtype=int) + is1[i])
+            p2.append(is2[klo + w[ww]])
+    if len(p1) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate(p1), np.concatenate(p2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--nsources', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='Numbers of sources in each catalog')
+    parser.add_argument('--size', type=float, default=4096,
+                        help='Size of the (square) field')
+    parser.add_argument('--sep', type=float, default=5.0,
+                        help='Matching radius, in pixels')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timings to take the best of')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print('{:>8s} {:>10s} {:>12s} {:>12s} {:>8s}  identical'
+          .format('sources', 'matches', 'windows', 'xymatch', 'speedup'))
+    all_identical = True
+    for n in args.nsources:
+        cat2 = rng.uniform(0, args.size, size=(n, 2))
+        cat1 = cat2 + rng.normal(0, args.sep / 2, size=(n, 2))
+
+        tref, (p1_ref, p2_ref) = _best_time(
+            lambda: _window_xymatch(cat1, cat2, args.sep), 1
+        )
+        tfast, (p1, p2) = _best_time(
+            lambda: hla_flag_filter.xymatch(cat1, cat2, args.sep,
+                                            multiple=True, verbose=False),
+            args.repeat
+        )
+        identical = (np.array_equal(p1, p1_ref) and
+                     np.array_equal(p2, p2_ref))
+        all_identical &= identical
+        print('{:>8d} {:>10d} {:>11.3f}s {:>11.3f}s {:>7.1f}x  {}'
+              .format(n, len(p1), tref, tfast, tref / tfast, identical))
+
+    if not all_identical:
+        raise SystemExit('Matches differ!')
+
+
+if __name__ == '__main__':
+    main()
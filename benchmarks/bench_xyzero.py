@@ -0,0 +1,116 @@
+"""
+Time the zero-point (offset) histograms used by TweakReg for catalogs of
+increasing density, as computed by ``cdriz.arrxyzero`` and by
+``imgclasses._xy_2dhist``, against comparing all pairs of positions.
+
+For each number of sources the histograms are checked to be identical to
+those obtained by comparing all pairs of sources (skipped for catalogs with
+more than ``--max-brute`` sources, since that needs a lot of memory)::
+
+    python benchmarks/bench_xyzero.py --nsources 1000 5000 20000 50000
+
+"""
+import argparse
+import time
+
+import numpy as np
+
+from drizzlepac import cdriz, imgclasses
+
+
+def _best_time(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _all_pairs_xyzero(imgxy, refxy, searchrad):
+    """ Histogram of the offsets computed from all pairs of positions, the
+    same way as the original ``arrxyzero`` loop did it.
+    """
+    dx = np.subtract.outer(imgxy[:, 0], refxy[:, 0]).astype(np.float64)
+    dy = np.subtract.outer(imgxy[:, 1], refxy[:, 1]).astype(np.float64)
+    idx = (np.abs(dx) < searchrad) & (np.abs(dy) < searchrad)
+    zpmat = np.zeros((int(2 * searchrad) + 1,) * 2)
+    np.add.at(zpmat, ((dy[idx] + searchrad).astype(int),
+                      (dx[idx] + searchrad).astype(int)), 1)
+    return zpmat
+
+
+def _all_pairs_2dhist(imgxy, refxy, r):
+    """ Histogram of the offsets computed from all pairs of positions, the
+    same way as the original ``_xy_2dhist`` did it.
+    """
+    dx = np.subtract.outer(imgxy[:, 0], refxy[:, 0]).ravel()
+    dy = np.subtract.outer(imgxy[:, 1], refxy[:, 1]).ravel()
+    r = int(np.ceil(r))
+    idx = np.where((dx < r + 0.5) & (dx >= -r - 0.5) &
+                   (dy < r + 0.5) & (dy >= -r - 0.5))
+    h = np.histogram2d(dx[idx], dy[idx], 2 * r + 1,
+                       [[-r - 0.5, r + 0.5], [-r - 0.5, r + 0.5]])
+    return h[0].T
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--nsources', type=int, nargs='+',
+                        default=[1000, 5000, 20000, 50000],
+                        help='Numbers of sources in each catalog')
+    parser.add_argument('--size', type=float, default=4096,
+                        help='Size of the (square) field')
+    parser.add_argument('--searchrad', type=float, default=3.0,
+                        help='Search radius, in pixels')
+    parser.add_argument('--max-brute', type=int, default=5000,
+                        help='Largest catalogs compared against all pairs')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timings to take the best of')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print('{:>8s} {:>12s} {:>12s} {:>12s} {:>12s}  identical'
+          .format('sources', 'all pairs', 'arrxyzero', 'all pairs',
+                  '_xy_2dhist'))
+    all_identical = True
+    for n in args.nsources:
+        refxy = rng.uniform(0, args.size, size=(n, 2))
+        imgxy = refxy + rng.normal([2.3, -1.4], 0.2, size=(n, 2))
+        # only a fraction of the sources are common to both catalogs
+        nfake = n // 2
+        imgxy[:nfake] = rng.uniform(0, args.size, size=(nfake, 2))
+        imgxy32 = imgxy.astype(np.float32)
+        refxy32 = refxy.astype(np.float32)
+
+        tzero, zpmat = _best_time(
+            lambda: cdriz.arrxyzero(imgxy32, refxy32, args.searchrad),
+            args.repeat
+        )
+        thist, hist = _best_time(
+            lambda: imgclasses._xy_2dhist(imgxy, refxy, args.searchrad),
+            args.repeat
+        )
+
+        if n <= args.max_brute:
+            tzero_ref, zpmat_ref = _best_time(
+                lambda: _all_pairs_xyzero(imgxy32, refxy32, args.searchrad), 1
+            )
+            thist_ref, hist_ref = _best_time(
+                lambda: _all_pairs_2dhist(imgxy, refxy, args.searchrad), 1
+            )
+            identical = (np.array_equal(zpmat, zpmat_ref) and
+                         np.array_equal(hist, hist_ref))
+            all_identical &= identical
+            print('{:>8d} {:>11.3f}s {:>11.3f}s {:>11.3f}s {:>11.3f}s  {}'
+                  .format(n, tzero_ref, tzero, thist_ref, thist, identical))
+        else:
+            print('{:>8d} {:>12s} {:>11.3f}s {:>12s} {:>11.3f}s  -'
+                  .format(n, '-', tzero, '-', thist))
+
+    if not all_identical:
+        raise SystemExit('Histograms differ!')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ cosmic-rays.
 """
 import os
 import sys
+import copy
 import numpy as np
 from stsci.tools import fileutil, teal, logutil
 from . import outputimage
@@ -29,6 +30,15 @@ except ImportError:
 
 from . import __version__
 
+# Margin, in pixels, kept around the part of the median image which maps
+# onto each blotted chip, so that it also includes all the pixels used by
+# the largest interpolation kernel (sinc) around the mapped positions.
+BLOT_MARGIN = 16
+
+# Spacing, in pixels, of the grid of blotted pixels used for finding the
+# part of the median image onto which they map.
+BLOT_REGION_STEP = 32
+
 __all__ = ['blot', 'runBlot', 'help', 'getHelpAsString']
 
 __taskname__ = 'ablot'
@@ -200,7 +210,10 @@ def buildBlotParamDict(configObj):
                 'blot_sinscl':configObj[blot_name]['blot_sinscl'],
                 'blot_addsky':configObj[blot_name]['blot_addsky'],
                 'blot_skyval':configObj[blot_name]['blot_skyval'],
-                'coeffs':configObj['coeffs']}
+                'coeffs':configObj['coeffs'],
+                'num_cores':configObj.get('num_cores'),
+                'parallel_backend':configObj.get('parallel_backend', 'process'),
+                'wcsmap_cache_dir':configObj.get('wcsmap_cache_dir', '')}
     return paramDict
 
 def _setDefaults(configObj={}):
@@ -251,83 +264,134 @@ def run_blot(imageObjectList,output_wcs,paramDict,wcsmap=wcs_functions.WCSMap):
                  'PyFITS':util.__fits_version__,
                  'Numpy':util.__numpy_version__}
 
-    _hdrlist = []
-
+    # Read each median image only once; all chips blotted from it share
+    # the same (read-only) array.
+    medians = {}
+    chips = []
     for img in imageObjectList:
-
+        medianName = img.outputNames['outMedian']
+        if medianName not in medians:
+            medians[medianName] = _read_median(img)
         for chip in img.returnAllChips(extname=img.scienceExt):
-
-            print('    Blot: creating blotted image: ',chip.outputNames['data'])
-
             #### Check to see what names need to be included here for use in _hdrlist
             chip.outputNames['driz_version'] = _versions['AstroDrizzle']
-            outputvals = chip.outputNames.copy()
-            outputvals.update(img.outputValues)
-            outputvals['blotnx'] = chip.wcs.naxis1
-            outputvals['blotny'] = chip.wcs.naxis2
-            _hdrlist.append(outputvals)
-
-            plist = outputvals.copy()
-            plist.update(paramDict)
-
-            # PyFITS can be used here as it will always operate on
-            # output from PyDrizzle (which will always be a FITS file)
-            # Open the input science file
-            medianPar = 'outMedian'
-            outMedianObj = img.getOutputName(medianPar)
-            if img.inmemory:
-                outMedian = img.outputNames[medianPar]
-                _fname,_sciextn = fileutil.parseFilename(outMedian)
-                _inimg = outMedianObj
-            else:
-                outMedian = outMedianObj
-                _fname,_sciextn = fileutil.parseFilename(outMedian)
-                _inimg = fileutil.openImage(_fname, memmap=False)
-
-            # Return the PyFITS HDU corresponding to the named extension
-            _scihdu = fileutil.getExtn(_inimg,_sciextn)
-            _insci = _scihdu.data.copy()
-            _inimg.close()
-            del _inimg, _scihdu
-
-            _outsci = do_blot(_insci, output_wcs,
-                   chip.wcs, chip._exptime, coeffs=paramDict['coeffs'],
-                   interp=paramDict['blot_interp'], sinscl=paramDict['blot_sinscl'],
-                   wcsmap=wcsmap)
-            # Apply sky subtraction and unit conversion to blotted array to
-            # match un-modified input array
-            if paramDict['blot_addsky']:
-                skyval = chip.computedSky
-            else:
-                skyval = paramDict['blot_skyval']
-            _outsci /= chip._conversionFactor
-            if skyval is not None:
-                _outsci += skyval
-                log.info('Applying sky value of %0.6f to blotted image %s'%
-                            (skyval,chip.outputNames['data']))
-
-            # Write output Numpy objects to a PyFITS file
-            # Blotting only occurs from a drizzled SCI extension
-            # to a blotted SCI extension...
-
-            _outimg = outputimage.OutputImage(_hdrlist, paramDict, build=False, wcs=chip.wcs, blot=True)
-            _outimg.outweight = None
-            _outimg.outcontext = None
-            outimgs = _outimg.writeFITS(plist['data'],_outsci,None,
-                                versions=_versions,blend=False,
-                                virtual=img.inmemory)
-
-            img.saveVirtualOutputs(outimgs)
-            #_buildOutputFits(_outsci,None,plist['outblot'])
-            _hdrlist = []
-
-            del _outsci
-
-        del _outimg
+            chips.append((img, chip, medians[medianName]))
+
+    pool_size = util.get_pool_size(paramDict.get('num_cores'), len(chips))
+    if pool_size > 1:
+        use_threads = paramDict.get('parallel_backend') == 'thread'
+        log.info('Executing {:d} parallel workers{}'
+                 .format(pool_size, ' (threads)' if use_threads else ''))
+        with util.worker_pool(num_cores=pool_size) as pool:
+            if not use_threads:
+                for img in imageObjectList:
+                    if img.inmemory:
+                        # copy & wrap it in proxy
+                        img.virtualOutputs = pool.manager().dict(
+                            img.virtualOutputs)
+            # each thread needs its own copy of the output WCS since WCSLIB
+            # updates it in place when computing the mapping
+            pool.run(
+                _blot_chip,
+                [(img, chip, copy.deepcopy(output_wcs), paramDict, _versions,
+                  wcsmap, median) for img, chip, median in chips],
+                pool_size, threads=use_threads,
+                name='ablot._blot_chip()',  # for err msgs
+                memory=[12 * chip.wcs.naxis1 * chip.wcs.naxis2
+                        for img, chip, median in chips]
+            )
+        if not use_threads:
+            for img in imageObjectList:
+                if img.inmemory:
+                    # Bring any virtual outputs back from the manager
+                    img.virtualOutputs = dict(img.virtualOutputs)
+    else:
+        for img, chip, median in chips:
+            _blot_chip(img, chip, output_wcs, paramDict, _versions, wcsmap,
+                       median)
+
+
+def _read_median(img):
+    """ Return the science array of the median image used by ``img``,
+    made read-only as it gets shared by all the chips being blotted.
+    """
+    # PyFITS can be used here as it will always operate on
+    # output from PyDrizzle (which will always be a FITS file)
+    # Open the input science file
+    medianPar = 'outMedian'
+    outMedianObj = img.getOutputName(medianPar)
+    if img.inmemory:
+        outMedian = img.outputNames[medianPar]
+        _fname,_sciextn = fileutil.parseFilename(outMedian)
+        _inimg = outMedianObj
+    else:
+        outMedian = outMedianObj
+        _fname,_sciextn = fileutil.parseFilename(outMedian)
+        _inimg = fileutil.openImage(_fname, memmap=False)
+
+    # Return the PyFITS HDU corresponding to the named extension
+    _scihdu = fileutil.getExtn(_inimg,_sciextn)
+    _insci = _scihdu.data.view()
+    _inimg.close()
+    del _inimg, _scihdu
+
+    _insci.flags.writeable = False
+    return _insci
+
+
+def _blot_chip(img, chip, output_wcs, paramDict, _versions, wcsmap, median):
+    """ Blot the median image back to a single input chip and write out
+    (or save in memory) the blotted image.
+    """
+    usage = util.start_chip_usage()
+    print('    Blot: creating blotted image: ',chip.outputNames['data'])
+
+    outputvals = chip.outputNames.copy()
+    outputvals.update(img.outputValues)
+    outputvals['blotnx'] = chip.wcs.naxis1
+    outputvals['blotny'] = chip.wcs.naxis2
+    _hdrlist = [outputvals]
+
+    plist = outputvals.copy()
+    plist.update(paramDict)
+
+    _outsci = do_blot(median, output_wcs,
+           chip.wcs, chip._exptime, coeffs=paramDict['coeffs'],
+           interp=paramDict['blot_interp'], sinscl=paramDict['blot_sinscl'],
+           wcsmap=wcsmap, wcsmap_cache_dir=paramDict.get('wcsmap_cache_dir'))
+    # Apply sky subtraction and unit conversion to blotted array to
+    # match un-modified input array
+    if paramDict['blot_addsky']:
+        skyval = chip.computedSky
+    else:
+        skyval = paramDict['blot_skyval']
+    _outsci /= chip._conversionFactor
+    if skyval is not None:
+        _outsci += skyval
+        log.info('Applying sky value of %0.6f to blotted image %s'%
+                    (skyval,chip.outputNames['data']))
+
+    # Write output Numpy objects to a PyFITS file
+    # Blotting only occurs from a drizzled SCI extension
+    # to a blotted SCI extension...
+
+    _outimg = outputimage.OutputImage(_hdrlist, paramDict, build=False, wcs=chip.wcs, blot=True)
+    _outimg.outweight = None
+    _outimg.outcontext = None
+    outimgs = _outimg.writeFITS(plist['data'],_outsci,None,
+                        versions=_versions,blend=False,
+                        virtual=img.inmemory)
+
+    img.saveVirtualOutputs(outimgs)
+    #_buildOutputFits(_outsci,None,plist['outblot'])
+
+    del _outsci, _outimg
+    util.record_chip_usage('Blot', chip.outputNames['data'], usage)
 
 
 def do_blot(source, source_wcs, blot_wcs, exptime, coeffs = True,
-            interp='poly5', sinscl=1.0, stepsize=10, wcsmap=None):
+            interp='poly5', sinscl=1.0, stepsize=10, wcsmap=None,
+            wcsmap_cache_dir=None, subregion=True):
     """ Core functionality of performing the 'blot' operation to create a single
         blotted image from a single source image.
         All distortion information is assumed to be included in the WCS specification
@@ -363,6 +427,15 @@ def do_blot(source, source_wcs, blot_wcs, exptime, coeffs = True,
             Custom mapping class to use to provide transformation from
             drizzled to blotted WCS.  Default will be to use
             `~drizzlepac.wcs_functions.WCSMap`.
+        wcsmap_cache_dir
+            Directory where the coordinate tables used by the default C
+            mapping get saved for re-use (see
+            `~drizzlepac.wcs_functions.get_wcsmap`).
+        subregion
+            Only pass the part of the source image which maps onto the
+            blotted image (plus a margin of `BLOT_MARGIN` pixels for the
+            interpolation kernel) to the blotting code instead of the whole
+            source image.
 
     """
     _outsci = np.zeros(blot_wcs.array_shape, dtype=np.float32)
@@ -391,11 +464,8 @@ def do_blot(source, source_wcs, blot_wcs, exptime, coeffs = True,
         Use default C mapping function.
         """
         print('Using default C-based coordinate transformation...')
-        mapping = cdriz.DefaultWCSMapping(
-            blot_wcs, source_wcs,
-            blot_wcs.pixel_shape[0], blot_wcs.pixel_shape[1],
-            stepsize
-        )
+        mapping = wcs_functions.get_wcsmap(blot_wcs, source_wcs, stepsize,
+                                           cache_dir=wcsmap_cache_dir)
         pix_ratio = source_wcs.pscale/wcslin.pscale
     else:
         #
@@ -409,6 +479,15 @@ def do_blot(source, source_wcs, blot_wcs, exptime, coeffs = True,
         mapping = wmap.forward
         pix_ratio = source_wcs.pscale/wcslin.pscale
 
+    if subregion:
+        region = _blot_source_region(mapping, blot_wcs.array_shape,
+                                     source.shape)
+        if region is not None:
+            y1, y2, x1, x2 = region
+            source = source[y1:y2, x1:x2]
+            xmin, xmax = x1 + 1, x2
+            ymin, ymax = y1 + 1, y2
+
     t = cdriz.tblot(
         source, _outsci,xmin,xmax,ymin,ymax,
         pix_ratio, kscale, 1.0, 1.0,
@@ -419,6 +498,45 @@ def do_blot(source, source_wcs, blot_wcs, exptime, coeffs = True,
     return _outsci
 
 
+def _blot_source_region(mapping, blot_shape, source_shape,
+                        margin=BLOT_MARGIN, step=BLOT_REGION_STEP):
+    """ Return the ``(y1, y2, x1, x2)`` bounds (as slice indices) of the
+    part of the source image onto which the pixels of the blotted image map,
+    extended by ``margin`` pixels on every side, or `None` when the whole
+    source image would be needed anyway.
+
+    The mapping gets evaluated along the edges of the blotted image and
+    on a grid of every ``step`` pixels within it.
+    """
+    ny, nx = blot_shape
+    xgrid = np.unique(np.r_[np.arange(1, nx + 1, step), nx]).astype(np.float64)
+    ygrid = np.unique(np.r_[np.arange(1, ny + 1, step), ny]).astype(np.float64)
+    xin = np.concatenate([np.tile(xgrid, ygrid.size),
+                          np.full(ny, 1.0), np.full(ny, float(nx)),
+                          np.arange(1, nx + 1, dtype=np.float64),
+                          np.arange(1, nx + 1, dtype=np.float64)])
+    yin = np.concatenate([np.repeat(ygrid, xgrid.size),
+                          np.arange(1, ny + 1, dtype=np.float64),
+                          np.arange(1, ny + 1, dtype=np.float64),
+                          np.full(nx, 1.0), np.full(nx, float(ny))])
+    xout, yout = mapping(xin, yin)
+    good = np.isfinite(xout) & np.isfinite(yout)
+    if not np.all(good):
+        return None
+
+    # output positions are 1-based pixel coordinates
+    x1 = max(0, int(np.floor(xout.min())) - 1 - margin)
+    x2 = min(source_shape[1], int(np.ceil(xout.max())) + margin)
+    y1 = max(0, int(np.floor(yout.min())) - 1 - margin)
+    y2 = min(source_shape[0], int(np.ceil(yout.max())) + margin)
+    if x1 >= x2 or y1 >= y2:
+        # no overlap: blotting will only produce missing values
+        return None
+    if (x1, y1) == (0, 0) and (y2, x2) == tuple(source_shape):
+        return None
+    return y1, y2, x1, x2
+
+
 blot.__doc__ = util._def_help_functions(
     locals(), module_file=__file__, task_name=__taskname__, module_doc=__doc__
 )
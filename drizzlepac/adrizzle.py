@@ -13,7 +13,7 @@ import platform
 from . import util
 import numpy as np
 from astropy.io import fits
-from stsci.tools import fileutil, logutil, mputil, teal
+from stsci.tools import fileutil, logutil, teal
 from . import outputimage, wcs_functions
 import stwcs
 from stwcs import distortion
@@ -28,13 +28,10 @@ except ImportError:
     print('\n Please check the installation of this package to insure C code was built successfully.')
     raise ImportError
 
-if util.can_parallel:
-    import multiprocessing
-
 __all__ = ['drizzle', 'run', 'drizSeparate', 'drizFinal', 'mergeDQarray',
            'updateInputDQArray', 'buildDrizParamDict', 'interpret_maskval',
-           'run_driz', 'run_driz_img', 'run_driz_chip', 'do_driz',
-           'get_data', 'create_output']
+           'run_driz', 'run_driz_img', 'run_driz_chip', 'write_driz_output',
+           'merge_driz_accumulators', 'do_driz', 'get_data', 'create_output']
 
 
 __taskname__ = "adrizzle"
@@ -43,11 +40,6 @@ _final_step_num_ = 7
 
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
 
-time_pre_all = []
-time_driz_all = []
-time_post_all = []
-time_write_all = []
-
 #
 # ### Interactive interface for running drizzle tasks separately
 #
@@ -346,6 +338,7 @@ def drizSeparate(imageObjectList, output_wcs, configObj,
         # Record whether or not intermediate files should be deleted when finished
         paramDict['clean'] = configObj['STATE OF INPUT FILES']['clean']
         paramDict['num_cores'] = configObj.get('num_cores')
+        paramDict['parallel_backend'] = configObj.get('parallel_backend', 'process')
         paramDict['rules_file'] = configObj['rules_file'] if configObj['rules_file'] != "" else None
 
         log.info('USER INPUT PARAMETERS for Separate Drizzle Step:')
@@ -390,6 +383,8 @@ def drizFinal(imageObjectList, output_wcs, configObj,
         # Record whether or not intermediate files should be deleted when finished
         paramDict['clean'] = configObj['STATE OF INPUT FILES']['clean']
 
+        paramDict['num_cores'] = configObj.get('num_cores')
+        paramDict['parallel_backend'] = configObj.get('parallel_backend', 'process')
         paramDict['logfile'] = logfile
 
         log.info('USER INPUT PARAMETERS for Final Drizzle Step:')
@@ -454,7 +449,8 @@ def buildDrizParamDict(configObj, single=True):
 
     # Initialize paramDict with global parameter(s)
     paramDict = {'build': configObj['build'], 'stepsize': configObj['stepsize'],
-                'coeffs': configObj['coeffs'], 'wcskey': configObj['wcskey']}
+                'coeffs': configObj['coeffs'], 'wcskey': configObj['wcskey'],
+                'wcsmap_cache_dir': configObj.get('wcsmap_cache_dir', '')}
 
     # build appro
     if single:
@@ -546,6 +542,16 @@ def run_driz(imageObjectList, output_wcs, paramDict, single, build, wcsmap=None)
         build,single,units,wt_scl,pixfrac,kernel,fillval,
         rot,scale,xsh,ysh,blotnx,blotny,outnx,outny,data
     """
+    with util.worker_pool(num_cores=paramDict.get('num_cores')) as pool:
+        _run_driz(imageObjectList, output_wcs, paramDict, single, build,
+                  wcsmap, pool)
+
+
+def _run_driz(imageObjectList, output_wcs, paramDict, single, build, wcsmap,
+              pool):
+    """ Perform the drizzle operation using the parallel workers of
+    ``pool``. See `run_driz` for details.
+    """
     # Insure that input imageObject is a list
     if not isinstance(imageObjectList, list):
         imageObjectList = [imageObjectList]
@@ -579,12 +585,23 @@ def run_driz(imageObjectList, output_wcs, paramDict, single, build, wcsmap=None)
 
     # Will we be running in parallel?
     pool_size = util.get_pool_size(paramDict.get('num_cores'), len(imageObjectList))
-    run_parallel = single and pool_size > 1
+    run_parallel = pool_size > 1
+    use_threads = paramDict.get('parallel_backend') == 'thread'
     if run_parallel:
-        log.info(f'Executing {pool_size:d} parallel workers')
-    else:
-        if single:  # not yet an option for final drizzle, msg would confuse
+        log.info(f'Executing {pool_size:d} parallel workers'
+                 f'{" (threads)" if use_threads else ""}')
+    elif use_threads:
+        # With nothing to run in parallel across images, split each chip
+        # into bands of rows which get drizzled from separate threads.
+        driz_nthreads = util.get_pool_size(paramDict.get('num_cores'), None)
+        if driz_nthreads > 1:
+            log.info(f'Executing serially, drizzling each chip with '
+                     f'{driz_nthreads:d} threads')
+            paramDict = dict(paramDict, driz_nthreads=driz_nthreads)
+        else:
             log.info('Executing serially')
+    else:
+        log.info('Executing serially')
 
     # Set parameters for each input and run drizzle on it here.
     #
@@ -628,6 +645,18 @@ def run_driz(imageObjectList, output_wcs, paramDict, single, build, wcsmap=None)
         _outctx = np.zeros((_nplanes,) + output_wcs.array_shape, dtype=np.int32)
         _hdrlist = []
 
+    # The final drizzle combines all inputs into a single product, so each
+    # worker drizzles its share of the inputs onto a private accumulator
+    # and the results get merged before the product is written out.
+    if run_parallel and not single:
+        _run_driz_final_parallel(imageObjectList, output_wcs, outwcs,
+                                 paramDict, build, _versions, _numctx,
+                                 _nplanes, _outsci, _outwht, _outctx,
+                                 _hdrlist, wcsmap, pool, pool_size,
+                                 use_threads)
+        del _outsci, _outwht, _outctx, _hdrlist
+        return
+
     # Keep track of how many chips have been processed
     # For single case, this will determine when to close
     # one product and open the next.
@@ -641,7 +670,8 @@ def run_driz(imageObjectList, output_wcs, paramDict, single, build, wcsmap=None)
     #
     # Work on each image
     #
-    subprocs = []
+    proc_args = []
+    proc_memory = []
     for img in imageObjectList:
 
         chiplist = img.returnAllChips(extname=img.scienceExt)
@@ -663,23 +693,26 @@ def run_driz(imageObjectList, output_wcs, paramDict, single, build, wcsmap=None)
 
         # Work each image, possibly in parallel
         if run_parallel:
-            # use multiprocessing.Manager only if in parallel and in memory
-            mp_ctx = multiprocessing.get_context('fork')
-
-            if img.inmemory:
-                manager = mp_ctx.Manager()
-                dproxy = manager.dict(img.virtualOutputs)  # copy & wrap it in proxy
-                img.virtualOutputs = dproxy
-
-            # parallelize run_driz_img (currently for separate drizzle only)
-            p = mp_ctx.Process(
-                target=run_driz_img,
-                name='adrizzle.run_driz_img()',  # for err msgs
-                args=(img, chiplist, output_wcs, outwcs, template, paramDict,
-                      single, num_in_prod, build, _versions, _numctx, _nplanes,
-                      _chipIdx, None, None, None, None, wcsmap)
+            if use_threads:
+                # threads share all arrays (and virtual outputs) directly;
+                # each one only needs its own copy of the output WCS since
+                # WCSLIB updates it in place when computing the mapping.
+                img_outwcs = copy.deepcopy(outwcs)
+            else:
+                img_outwcs = outwcs
+                # use multiprocessing.Manager only if in parallel and in memory
+                if img.inmemory:
+                    # copy & wrap it in proxy
+                    img.virtualOutputs = pool.manager().dict(img.virtualOutputs)
+
+            # parallelize run_driz_img (separate drizzle only)
+            proc_args.append(
+                (img, chiplist, output_wcs, img_outwcs, template, paramDict,
+                 single, num_in_prod, build, _versions, _numctx, _nplanes,
+                 _chipIdx, None, None, None, None, wcsmap)
             )
-            subprocs.append(p)
+            proc_memory.append(_estimate_driz_memory(chiplist, output_wcs,
+                                                     _nplanes))
         else:
             # serial run_driz_img run (either separate drizzle or final drizzle)
             run_driz_img(img, chiplist, output_wcs, outwcs, template, paramDict,
@@ -693,12 +726,172 @@ def run_driz(imageObjectList, output_wcs, paramDict, single, build, wcsmap=None)
 
     # do the join if we spawned tasks
     if run_parallel:
-        mputil.launch_and_wait(subprocs, pool_size)  # blocks till all done
+        pool.run(run_driz_img, proc_args, pool_size, threads=use_threads,
+                 name='adrizzle.run_driz_img()',  # for err msgs
+                 memory=proc_memory)
+        for img in imageObjectList:
+            if img.inmemory and not use_threads:
+                # Bring any virtual outputs back from the manager
+                img.virtualOutputs = dict(img.virtualOutputs)
 
     del _outsci, _outwht, _outctx, _hdrlist
     # have looped over each img/chip
 
 
+def _run_driz_final_parallel(imageObjectList, output_wcs, outwcs, paramDict,
+                             build, _versions, _numctx, _nplanes, _outsci,
+                             _outwht, _outctx, _hdrlist, wcsmap, pool,
+                             pool_size, use_threads=False):
+    """ Perform the final drizzle with ``pool_size`` parallel workers.
+
+    The input images are split into contiguous groups, one per worker, and
+    each worker drizzles its group onto its own output arrays (kept in shared
+    memory when using processes so nothing needs to be copied back).  The
+    partial products are then merged in input order by
+    :py:func:`merge_driz_accumulators`, which makes the result independent
+    of the order in which the workers finish.  All chips of an input image
+    are drizzled by the same worker, since the DQ arrays of the input file
+    get updated in place.
+    """
+    maskval = interpret_maskval(paramDict)
+    manager = None if use_threads else pool.manager()
+
+    # Assign context ID's to every chip and build the full template
+    # list exactly as is done for the serial case.
+    tasks = []
+    template = []
+    chipIdx = 0
+    for img in imageObjectList:
+        chiplist = img.returnAllChips(extname=img.scienceExt)
+        template.extend([chip.outputNames['data'] for chip in chiplist])
+        if img.inmemory and manager is not None:
+            img.virtualOutputs = manager.dict(img.virtualOutputs)
+        tasks.append((img, chiplist, chipIdx))
+        chipIdx += len(chiplist)
+
+    group_args = []
+    group_memory = []
+    accumulators = []
+    for group in np.array_split(np.arange(len(tasks)), pool_size):
+        if use_threads:
+            accsci = np.empty(output_wcs.array_shape, dtype=np.float32)
+            accwht = np.zeros(output_wcs.array_shape, dtype=np.float32)
+            accctx = np.zeros((_nplanes,) + output_wcs.array_shape,
+                              dtype=np.int32)
+            acchdr = []
+        else:
+            accsci = pool.shared_array(output_wcs.array_shape, np.float32)
+            accwht = pool.shared_array(output_wcs.array_shape, np.float32)
+            accctx = pool.shared_array((_nplanes,) + output_wcs.array_shape,
+                                       np.int32)
+            acchdr = manager.list()
+        accsci.fill(maskval)
+        accumulators.append((accsci, accwht, accctx, acchdr))
+
+        # each thread needs its own copy of the output WCS since WCSLIB
+        # updates it in place when computing the mapping
+        group_args.append(
+            ([tasks[i] for i in group], output_wcs,
+             copy.deepcopy(outwcs) if use_threads else outwcs,
+             template, paramDict, build, _versions, _numctx, _nplanes,
+             accsci, accwht, accctx, acchdr, wcsmap)
+        )
+        group_memory.append(max(
+            _estimate_driz_memory(tasks[i][1]) for i in group
+        ))
+
+    # the output arrays of each group have already been allocated above
+    pool.run(_run_driz_group, group_args, pool_size, threads=use_threads,
+             name='adrizzle._run_driz_group()',  # for err msgs
+             memory=group_memory)
+
+    merge_driz_accumulators(_outsci, _outwht, _outctx,
+                            [acc[:3] for acc in accumulators])
+    for acc in accumulators:
+        _hdrlist.extend(list(acc[3]))
+    del accumulators
+
+    if manager is not None:
+        # Bring any virtual outputs back from the manager
+        for img in imageObjectList:
+            if img.inmemory:
+                img.virtualOutputs = dict(img.virtualOutputs)
+
+    last_img, last_chips, _ = tasks[-1]
+    last_chip = last_chips[-1]
+    _bunit = _get_output_bunit(last_chip, paramDict['units'])
+    write_driz_output(last_img, last_chip, output_wcs, template, paramDict,
+                      False, build, _versions, _bunit, _outsci, _outwht,
+                      _outctx, _hdrlist)
+
+
+def _run_driz_group(tasks, output_wcs, outwcs, template, paramDict, build,
+                    _versions, _numctx, _nplanes, _outsci, _outwht, _outctx,
+                    _hdrlist, wcsmap):
+    """ Drizzle a group of images onto the same output arrays without
+    writing out the product. ``tasks`` is a list of
+    ``(img, chiplist, chipIdx)`` tuples, where ``chipIdx`` is the index of
+    the first chip of ``img`` within the full list of inputs.
+    """
+    for img, chiplist, chipIdx in tasks:
+        for chip in chiplist:
+            run_driz_chip(img, chip, output_wcs, outwcs, template, paramDict,
+                          False, False, build, _versions, _numctx, _nplanes,
+                          chipIdx, _outsci, _outwht, _outctx, _hdrlist, wcsmap)
+            chipIdx += 1
+
+
+def _estimate_driz_memory(chiplist, output_wcs=None, nplanes=1):
+    """ Rough estimate, in bytes, of the memory needed for drizzling the
+    chips in ``chiplist``: the input science, weight and pixel mapping arrays
+    of the largest chip plus, when ``output_wcs`` is given, new output arrays
+    (with ``nplanes`` context planes) for ``output_wcs``.
+    """
+    if output_wcs is None:
+        npix_out = 0
+    else:
+        npix_out = int(np.prod(output_wcs.array_shape))
+    npix_in = max((chip.image_shape[0] * chip.image_shape[1]
+                   for chip in chiplist), default=0)
+    return npix_out * (8 + 4 * nplanes) + npix_in * 16
+
+
+def merge_driz_accumulators(outsci, outwht, outctx, accumulators):
+    """ Merge separately drizzled partial products into the output arrays.
+
+    Parameters
+    ----------
+    outsci, outwht, outctx : ndarray
+        Output science, weight and context arrays, updated in place.
+
+    accumulators : list
+        List of ``(sci, wht, ctx)`` tuples as generated by drizzling disjoint
+        sets of inputs onto arrays initialized the same way as the outputs.
+
+    Notes
+    -----
+    The partial products get folded in, in the order given, using the same
+    weighted mean update which ``tdriz`` applies to each output pixel, so
+    the merged product matches (to within rounding) what drizzling all the
+    inputs onto the same arrays would produce. Context bits are OR'ed.
+    """
+    sci, wht, ctx = accumulators[0]
+    outsci[...] = sci
+    outwht[...] = wht
+    outctx[...] = ctx
+
+    for sci, wht, ctx in accumulators[1:]:
+        vc = outwht.astype(np.float64)
+        vc_plus_dow = vc + wht
+        # Pixels not yet drizzled onto simply take the new values
+        np.copyto(outsci, sci, where=(vc == 0))
+        update = np.logical_and(vc != 0, vc_plus_dow != 0)
+        outsci[update] = ((outsci[update] * vc[update] +
+                           wht[update] * sci[update]) / vc_plus_dow[update])
+        outwht[...] = vc_plus_dow
+        np.bitwise_or(outctx, ctx, outctx)
+
+
 #
 # Still to check:
 #    - why have both output_wcs and outwcs?
@@ -771,29 +964,34 @@ def run_driz_chip(img, chip, output_wcs, outwcs, template, paramDict, single,
     the entirety of the code which is inside the loop over
     chips.  See the ``run_driz`` code for more documentation.
     """
-    global time_pre_all, time_driz_all, time_post_all, time_write_all
-
+    usage = util.start_chip_usage()
     epoch = time.time()
 
     # Look for sky-subtracted product
     if os.path.exists(chip.outputNames['outSky']):
         chipextn = '[' + chip.header['extname'] + ',' + str(chip.header['extver']) + ']'
         _expname = chip.outputNames['outSky'] + chipextn
+        # Open the SCI image
+        _handle = fileutil.openImage(_expname, mode='readonly', memmap=False)
+        _indata = _handle[chip.header['extname'], chip.header['extver']].data
+        _handle.close()
+        del _handle
     else:
         # If sky-subtracted product does not exist, use regular input
+        # as already read (and cached) by the earlier processing steps
         _expname = chip.outputNames['data']
+        _indata = img.getData('{:s},{:d}'.format(chip.header['extname'],
+                                                 chip.header['extver']))
     log.info('-Drizzle input: %s' % _expname)
 
-    # Open the SCI image
-    _handle = fileutil.openImage(_expname, mode='readonly', memmap=False)
-    _sciext = _handle[chip.header['extname'], chip.header['extver']]
-
     # Apply sky subtraction and unit conversion to input array
+    # (working on a copy since the input array may be shared)
     if chip.computedSky is None:
-        _insci = _sciext.data
+        _insci = _indata.copy()
     else:
         log.info("Applying sky value of %0.6f to %s" % (chip.computedSky, _expname))
-        _insci = _sciext.data - chip.computedSky
+        _insci = _indata - chip.computedSky
+    del _indata
     # If input SCI image is still integer format (RAW files)
     # transform it to float32 for all subsequent operations
     # needed for numpy >=1.12.x
@@ -809,34 +1007,7 @@ def run_driz_chip(img, chip, output_wcs, outwcs, template, paramDict, single,
     else:
         _expin = chip._exptime
 
-    ####
-    #
-    # Put the units keyword handling in the imageObject class
-    #
-    ####
-    # Determine output value of BUNITS
-    # and make sure it is not specified as 'ergs/cm...'
-    _bunit = chip._bunit
-
-    _bindx = _bunit.find('/')
-
-    if paramDict['units'] == 'cps':
-        # If BUNIT value does not specify count rate already...
-        if _bindx < 1:
-            # ... append '/SEC' to value
-            _bunit += '/S'
-        else:
-            # reset _bunit here to None so it does not
-            #    overwrite what is already in header
-            _bunit = None
-    else:
-        if _bindx > 0:
-            # remove '/S'
-            _bunit = _bunit[:_bindx]
-        else:
-            # reset _bunit here to None so it does not
-            #    overwrite what is already in header
-            _bunit = None
+    _bunit = _get_output_bunit(chip, paramDict['units'])
 
     _uniqid = _numchips + 1
     if _nplanes == 1:
@@ -929,7 +1100,8 @@ def run_driz_chip(img, chip, output_wcs, outwcs, template, paramDict, single,
                 wcslin_pscale=chip.wcslin_pscale, uniqid=_uniqid,
                 pixfrac=paramDict['pixfrac'], kernel=paramDict['kernel'],
                 fillval=paramDict['fillval'], stepsize=paramDict['stepsize'],
-                wcsmap=wcsmap)
+                wcsmap=wcsmap, nthreads=paramDict.get('driz_nthreads', 1),
+                wcsmap_cache_dir=paramDict.get('wcsmap_cache_dir'))
     time_driz = time.time() - epoch
     epoch = time.time()
 
@@ -955,92 +1127,142 @@ def run_driz_chip(img, chip, output_wcs, outwcs, template, paramDict, single,
     epoch = time.time()
 
     if doWrite:
-        ###########################
-        #
-        #   IMPLEMENTATION REQUIREMENT:
-        #
-        # Need to implement scaling of the output image
-        # from 'cps' to 'counts' in the case where 'units'
-        # was set to 'counts'... 21-Mar-2005
-        #
-        ###########################
-
-        # Convert output data from electrons/sec to counts/sec as specified
-        native_units = img.native_units
-        if paramDict['proc_unit'].lower() == 'native' and native_units.lower()[:6] == 'counts':
-            np.divide(_outsci, chip._gain, _outsci)
-            _bunit = native_units.lower()
-            if paramDict['units'] == 'counts':
-                indx = _bunit.find('/')
-                if indx > 0: _bunit = _bunit[:indx]
-
-        # record IDCSCALE for output to product header
-        paramDict['idcscale'] = chip.wcs.idcscale
-        # If output units were set to 'counts', rescale the array in-place
-        if paramDict['units'] == 'counts':
-            # determine what exposure time needs to be used
-            # to rescale the product.
-            if single:
-                _expscale = chip._exptime
-            else:
-                _expscale = img.outputValues['texptime']
-            np.multiply(_outsci, _expscale, _outsci)
-        #
-        # Write output arrays to FITS file(s)
-        #
-        if not single:
-            img.inmemory = False
-
-        _outimg = outputimage.OutputImage(_hdrlist, paramDict, build=build,
-                                          wcs=output_wcs, single=single)
-        _outimg.set_bunit(_bunit)
-        _outimg.set_units(paramDict['units'])
-        outimgs = _outimg.writeFITS(template, _outsci, _outwht, ctxarr=_outctx,
-                                        versions=_versions, virtual=img.inmemory,
-                                        rules_file=paramDict['rules_file'],
-                                        logfile=paramDict['logfile'])
-        del _outimg
-
-        # update imageObject with product in memory
-        if single:
-            img.saveVirtualOutputs(outimgs)
+        write_driz_output(img, chip, output_wcs, template, paramDict, single,
+                          build, _versions, _bunit, _outsci, _outwht, _outctx,
+                          _hdrlist)
 
     # this is after the doWrite
     time_write = time.time() - epoch
-    if False and not single:  # turn off all this perf reporting for now
-        time_pre_all.append(time_pre)
-        time_driz_all.append(time_driz)
-        time_post_all.append(time_post)
-        time_write_all.append(time_write)
-
-        log.info('chip time pre-drizzling:  %6.3f' % time_pre)
-        log.info('chip time drizzling:      %6.3f' % time_driz)
-        log.info('chip time post-drizzling: %6.3f' % time_post)
-        log.info('chip time writing output: %6.3f' % time_write)
-
-        if doWrite:
-            tot_pre = sum(time_pre_all)
-            tot_driz = sum(time_driz_all)
-            tot_post = sum(time_post_all)
-            tot_write = sum(time_write_all)
-            tot = tot_pre + tot_driz + tot_post + tot_write
-            log.info('chip total pre-drizzling:  %6.3f (%4.1f%%)' % (tot_pre, (100. * tot_pre / tot)))
-            log.info('chip total drizzling:      %6.3f (%4.1f%%)' % (tot_driz, (100. * tot_driz / tot)))
-            log.info('chip total post-drizzling: %6.3f (%4.1f%%)' % (tot_post, (100. * tot_post / tot)))
-            log.info('chip total writing output: %6.3f (%4.1f%%)' % (tot_write, (100. * tot_write / tot)))
+    log.debug('chip time pre-drizzling:  %6.3f' % time_pre)
+    log.debug('chip time drizzling:      %6.3f' % time_driz)
+    log.debug('chip time post-drizzling: %6.3f' % time_post)
+    log.debug('chip time writing output: %6.3f' % time_write)
+
+    util.record_chip_usage('Separate Drizzle' if single else 'Final Drizzle',
+                           _expname, usage, pre_time=time_pre,
+                           driz_time=time_driz, post_time=time_post,
+                           write_time=time_write)
+
+
+def _get_output_bunit(chip, units):
+    """ Determine output value of BUNIT for the drizzled product of ``chip``.
+    Returns None when the value already in the header should be kept.
+    """
+    ####
+    #
+    # Put the units keyword handling in the imageObject class
+    #
+    ####
+    # Determine output value of BUNITS
+    # and make sure it is not specified as 'ergs/cm...'
+    _bunit = chip._bunit
+
+    _bindx = _bunit.find('/')
+
+    if units == 'cps':
+        # If BUNIT value does not specify count rate already...
+        if _bindx < 1:
+            # ... append '/SEC' to value
+            _bunit += '/S'
+        else:
+            # reset _bunit here to None so it does not
+            #    overwrite what is already in header
+            _bunit = None
+    else:
+        if _bindx > 0:
+            # remove '/S'
+            _bunit = _bunit[:_bindx]
+        else:
+            # reset _bunit here to None so it does not
+            #    overwrite what is already in header
+            _bunit = None
+
+    return _bunit
+
+
+def write_driz_output(img, chip, output_wcs, template, paramDict, single,
+                      build, _versions, _bunit, _outsci, _outwht, _outctx,
+                      _hdrlist):
+    """ Write out the drizzled arrays once the last chip going into the
+    product has been drizzled. ``img`` and ``chip`` are the last input
+    image and chip which went into the product.
+    """
+    ###########################
+    #
+    #   IMPLEMENTATION REQUIREMENT:
+    #
+    # Need to implement scaling of the output image
+    # from 'cps' to 'counts' in the case where 'units'
+    # was set to 'counts'... 21-Mar-2005
+    #
+    ###########################
+
+    # Convert output data from electrons/sec to counts/sec as specified
+    native_units = img.native_units
+    if paramDict['proc_unit'].lower() == 'native' and native_units.lower()[:6] == 'counts':
+        np.divide(_outsci, chip._gain, _outsci)
+        _bunit = native_units.lower()
+        if paramDict['units'] == 'counts':
+            indx = _bunit.find('/')
+            if indx > 0: _bunit = _bunit[:indx]
+
+    # record IDCSCALE for output to product header
+    paramDict['idcscale'] = chip.wcs.idcscale
+    # If output units were set to 'counts', rescale the array in-place
+    if paramDict['units'] == 'counts':
+        # determine what exposure time needs to be used
+        # to rescale the product.
+        if single:
+            _expscale = chip._exptime
+        else:
+            _expscale = img.outputValues['texptime']
+        np.multiply(_outsci, _expscale, _outsci)
+    #
+    # Write output arrays to FITS file(s)
+    #
+    if not single:
+        img.inmemory = False
+
+    _outimg = outputimage.OutputImage(_hdrlist, paramDict, build=build,
+                                      wcs=output_wcs, single=single)
+    _outimg.set_bunit(_bunit)
+    _outimg.set_units(paramDict['units'])
+    outimgs = _outimg.writeFITS(template, _outsci, _outwht, ctxarr=_outctx,
+                                versions=_versions, virtual=img.inmemory,
+                                rules_file=paramDict['rules_file'],
+                                logfile=paramDict['logfile'])
+    del _outimg
+
+    # update imageObject with product in memory
+    if single:
+        img.saveVirtualOutputs(outimgs)
 
 
 def do_driz(insci, input_wcs, inwht,
             output_wcs, outsci, outwht, outcon,
             expin, in_units, wt_scl,
             wcslin_pscale=1.0, uniqid=1, pixfrac=1.0, kernel='square',
-            fillval="INDEF", stepsize=10, wcsmap=None):
+            fillval="INDEF", stepsize=10, wcsmap=None, nthreads=1,
+            wcsmap_cache_dir=None):
     """
     Core routine for performing 'drizzle' operation on a single input image
     All input values will be Python objects such as ndarrays, instead
     of filenames.
     File handling (input and output) will be performed by calling routine.
 
+    When ``nthreads`` is larger than 1, the rows of the input image get split
+    into ``nthreads`` bands which are drizzled at the same time from separate
+    threads, each onto its own output arrays (see
+    :py:func:`_do_driz_bands`). This requires one extra set of output-sized
+    arrays for each additional band and is only done for the default
+    WCSLIB-based mapping with a non-zero ``stepsize``; in all other cases
+    the image gets drizzled in a single call.
+
+    The default WCSLIB-based mapping re-uses the coordinate tables computed
+    for earlier calls with the same input and output WCS (see
+    :py:func:`~drizzlepac.wcs_functions.get_wcsmap`), which also get saved
+    in ``wcsmap_cache_dir`` if specified.
+
     """
     # Insure that the fillval parameter gets properly interpreted for use with tdriz
     if util.is_blank(fillval):
@@ -1079,11 +1301,8 @@ def do_driz(insci, input_wcs, inwht,
     if wcsmap is None and cdriz is not None:
         log.info('Using WCSLIB-based coordinate transformation...')
         log.info('stepsize = %s' % stepsize)
-        mapping = cdriz.DefaultWCSMapping(
-            input_wcs, output_wcs,
-            input_wcs.pixel_shape[0], input_wcs.pixel_shape[1],
-            stepsize
-        )
+        mapping = wcs_functions.get_wcsmap(input_wcs, output_wcs, stepsize,
+                                           cache_dir=wcsmap_cache_dir)
     else:
         #
         # # Using the Python class for the WCS-based transformation
@@ -1109,11 +1328,18 @@ def do_driz(insci, input_wcs, inwht,
         # WARNING: Input array recast as a float32 array
         insci = insci.astype(np.float32)
 
-    _vers, nmiss, nskip = cdriz.tdriz(insci, inwht, outsci, outwht,
-        outctx, uniqid, ystart, 1, 1, _dny,
-        pix_ratio, 1.0, 1.0, 'center', pixfrac,
-        kernel, in_units, expscale, wt_scl,
-        fillval, nmiss, nskip, 1, mapping)
+    if (nthreads > 1 and _dny >= 2 * nthreads and stepsize > 0 and
+            isinstance(mapping, cdriz.DefaultWCSMapping)):
+        _vers, nmiss, nskip = _do_driz_bands(
+            insci, inwht, outsci, outwht, outctx, uniqid, pix_ratio, pixfrac,
+            kernel, in_units, expscale, wt_scl, fillval, mapping, nthreads
+        )
+    else:
+        _vers, nmiss, nskip = cdriz.tdriz(insci, inwht, outsci, outwht,
+            outctx, uniqid, ystart, 1, 1, _dny,
+            pix_ratio, 1.0, 1.0, 'center', pixfrac,
+            kernel, in_units, expscale, wt_scl,
+            fillval, nmiss, nskip, 1, mapping)
 
     if nmiss > 0:
         log.warning('! %s points were outside the output image.' % nmiss)
@@ -1123,6 +1349,53 @@ def do_driz(insci, input_wcs, inwht,
     return _vers
 
 
+def _do_driz_bands(insci, inwht, outsci, outwht, outctx, uniqid, pix_ratio,
+                   pixfrac, kernel, in_units, expscale, wt_scl, fillval,
+                   mapping, nthreads):
+    """ Drizzle ``insci`` in ``nthreads`` bands of rows at the same time.
+
+    The first band gets drizzled directly onto the output arrays while the
+    others each get their own set of arrays. Once all threads are done, the
+    bands are merged in row order using :py:func:`merge_driz_accumulators`,
+    so the result does not depend on the order in which the threads finish
+    and matches (to within rounding) drizzling the whole image at once.
+    The fill value only gets applied after the merge, since a pixel left
+    empty by one band may well get covered by another.
+    """
+    # All bands need to work on the same arrays since 'tdriz' scales the
+    # input by the exposure time in place.
+    insci = np.ascontiguousarray(insci, dtype=np.float32)
+    inwht = np.ascontiguousarray(inwht, dtype=np.float32)
+
+    accumulators = [(outsci, outwht, outctx)]
+    arglist = []
+    for n, rows in enumerate(np.array_split(np.arange(insci.shape[0]),
+                                            nthreads)):
+        if n == 0:
+            bndsci, bndwht, bndctx = accumulators[0]
+        else:
+            bndsci = outsci.copy()
+            bndwht = np.zeros_like(outwht)
+            bndctx = np.zeros_like(outctx)
+            accumulators.append((bndsci, bndwht, bndctx))
+        arglist.append(
+            (insci, inwht, bndsci, bndwht, bndctx, uniqid, int(rows[0]), 1, 1,
+             rows.size, pix_ratio, 1.0, 1.0, 'center', pixfrac, kernel,
+             in_units, expscale, wt_scl, 'INDEF', 0, 0, 1, mapping)
+        )
+
+    results = util.run_in_threads(cdriz.tdriz, arglist, nthreads)
+
+    merge_driz_accumulators(outsci, outwht, outctx, accumulators)
+    if fillval.upper() != 'INDEF':
+        outsci[outwht == 0] = float(fillval)
+
+    _vers = results[0][0]
+    nmiss = sum(r[1] for r in results)
+    nskip = sum(r[2] for r in results)
+    return _vers, nmiss, nskip
+
+
 def get_data(filename):
     fileroot, extn = fileutil.parseFilename(filename)
     extname = fileutil.parseExtn(extn)
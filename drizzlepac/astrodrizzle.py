@@ -38,6 +38,7 @@ from stsci.tools import teal, logutil, textutil
 
 from . import adrizzle
 from . import ablot
+from . import checkpoint
 from . import createMedian
 from . import drizCR
 from . import processInput
@@ -165,7 +166,13 @@ def run(configobj, wcsmap=None, input_dict=None):
     print("AstroDrizzle log file: {}".format(logfile))
 
     clean = configobj['STATE OF INPUT FILES']['clean']
-    procSteps = util.ProcSteps()
+    if configobj.get('profile', False):
+        # profile files get written next to the trailer file
+        procSteps = util.ProcSteps(
+            profile='{}_profile'.format(os.path.splitext(logfile)[0])
+        )
+    else:
+        procSteps = util.ProcSteps()
 
     print("AstroDrizzle Version {:s} started at: {:s}\n"
           .format(__version__, util._ptime()[0]))
@@ -179,65 +186,77 @@ def run(configobj, wcsmap=None, input_dict=None):
     util.print_cfg(configobj, log.debug)
 
     try:
-        # Define list of imageObject instances and output WCSObject instance
-        # based on input paramters
-        imgObjList = None
-        procSteps.addStep('Initialization')
-        imgObjList, outwcs = processInput.setCommonInput(
-            configobj, overwrite_dict=input_dict
-        )
-        procSteps.endStep("Initialization")
-
-        if imgObjList is None or not imgObjList:
-            errmsg = "No valid images found for processing!\n"
-            errmsg += "Check log file for full details.\n"
-            errmsg += "Exiting AstroDrizzle now..."
-            print(textutil.textbox(errmsg, width=65))
-            print(textutil.textbox(
-                'ERROR:\nAstroDrizzle Version {:s} encountered a problem!  '
-                'Processing terminated at {:s}.'
-                .format(__version__, util._ptime()[0])), file=sys.stderr)
-            return
-
-        log.info("USER INPUT PARAMETERS common to all Processing Steps:")
-        util.printParams(configobj, log=log)
-
-        # Call rest of MD steps...
-        # create static masks for each image
-        staticMask.createStaticMask(imgObjList, configobj,
-                                    procSteps=procSteps)
-
-        # subtract the sky
-        sky.subtractSky(imgObjList, configobj, procSteps=procSteps)
-
-        #       _dbg_dump_virtual_outputs(imgObjList)
-
-        # drizzle to separate images
-        adrizzle.drizSeparate(imgObjList, outwcs, configobj, wcsmap=wcsmap,
-                              logfile=logfile,
-                              procSteps=procSteps)
-
-        #       _dbg_dump_virtual_outputs(imgObjList)
-
-        # create the median images from the driz sep images
-        createMedian.createMedian(imgObjList, configobj, procSteps=procSteps)
-
-        # blot the images back to the original reference frame
-        ablot.runBlot(imgObjList, outwcs, configobj, wcsmap=wcsmap,
-                      procSteps=procSteps)
-
-        # look for cosmic rays
-        drizCR.rundrizCR(imgObjList, configobj, procSteps=procSteps)
-
-        # Make your final drizzled image
-        adrizzle.drizFinal(imgObjList, outwcs, configobj, wcsmap=wcsmap,
-                           logfile=logfile,
-                           procSteps=procSteps)
-
-        print()
-        print("AstroDrizzle Version {:s} is finished processing at {:s}.\n"
-              .format(__version__, util._ptime()[0]))
-        print("", flush=True)
+        # All processing steps share the same parallel workers
+        with util.worker_pool(num_cores=configobj.get('num_cores'),
+                              max_memory=configobj.get('max_memory')):
+            # Define list of imageObject instances and output WCSObject instance
+            # based on input paramters
+            imgObjList = None
+            procSteps.addStep('Initialization')
+            imgObjList, outwcs = processInput.setCommonInput(
+                configobj, overwrite_dict=input_dict
+            )
+            procSteps.endStep("Initialization")
+
+            if imgObjList is None or not imgObjList:
+                errmsg = "No valid images found for processing!\n"
+                errmsg += "Check log file for full details.\n"
+                errmsg += "Exiting AstroDrizzle now..."
+                print(textutil.textbox(errmsg, width=65))
+                print(textutil.textbox(
+                    'ERROR:\nAstroDrizzle Version {:s} encountered a problem!  '
+                    'Processing terminated at {:s}.'
+                    .format(__version__, util._ptime()[0])), file=sys.stderr)
+                return
+
+            log.info("USER INPUT PARAMETERS common to all Processing Steps:")
+            util.printParams(configobj, log=log)
+
+            # Call rest of MD steps, skipping those completed by an earlier run
+            # when checkpoints are turned on
+            checkpoints = checkpoint.Checkpoints(
+                configobj, imgObjList, enabled=configobj.get('checkpoint', False)
+            )
+
+            # create static masks for each image
+            checkpoints.run('Static Mask', staticMask.createStaticMask,
+                            imgObjList, configobj, procSteps=procSteps)
+
+            # subtract the sky
+            checkpoints.run('Subtract Sky', sky.subtractSky,
+                            imgObjList, configobj, procSteps=procSteps)
+
+            #       _dbg_dump_virtual_outputs(imgObjList)
+
+            # drizzle to separate images
+            checkpoints.run('Separate Drizzle', adrizzle.drizSeparate,
+                            imgObjList, outwcs, configobj, wcsmap=wcsmap,
+                            logfile=logfile, procSteps=procSteps)
+
+            #       _dbg_dump_virtual_outputs(imgObjList)
+
+            # create the median images from the driz sep images
+            checkpoints.run('Create Median', createMedian.createMedian,
+                            imgObjList, configobj, procSteps=procSteps)
+
+            # blot the images back to the original reference frame
+            checkpoints.run('Blot', ablot.runBlot,
+                            imgObjList, outwcs, configobj, wcsmap=wcsmap,
+                            procSteps=procSteps)
+
+            # look for cosmic rays
+            checkpoints.run('Driz_CR', drizCR.rundrizCR,
+                            imgObjList, configobj, procSteps=procSteps)
+
+            # Make your final drizzled image
+            checkpoints.run('Final Drizzle', adrizzle.drizFinal,
+                            imgObjList, outwcs, configobj, wcsmap=wcsmap,
+                            logfile=logfile, procSteps=procSteps)
+
+            print()
+            print("AstroDrizzle Version {:s} is finished processing at {:s}.\n"
+                  .format(__version__, util._ptime()[0]))
+            print("", flush=True)
 
     except Exception:
         clean = False
@@ -249,6 +268,7 @@ def run(configobj, wcsmap=None, input_dict=None):
 
     finally:
         procSteps.reportTimes()
+        procSteps.writeProfile()
         if imgObjList:
             for image in imgObjList:
                 if clean:
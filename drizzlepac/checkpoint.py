@@ -0,0 +1,337 @@
+"""
+This module manages the checkpoints which let an AstroDrizzle run skip the
+processing steps already completed by an earlier run.
+
+After each processing step, a manifest file records the hashes of the input
+files, the parameters of the step (with the hashes of the files they name)
+and the hashes of the files it wrote.  A
+new run on the same inputs skips each step for which the parameters of that
+step and of all the steps before it are unchanged and the files it wrote
+are still on disk, unmodified.  Once a step needs to be run again, all the
+steps after it are run as well.
+
+:License: :doc:`/LICENSE`
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from astropy.io import fits
+from stsci.tools import fileutil, logutil
+
+from . import adrizzle
+from . import sky
+from . import util
+from . import __version__
+
+__all__ = ['Checkpoints']
+
+log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
+
+MANIFEST_SUFFIX = '_checkpoint.json'
+
+# Processing steps in the order they get run, along with the numbers of the
+# sections of the configuration holding their parameters.
+STEPS = [('Static Mask', ['1']),
+         ('Subtract Sky', ['2']),
+         ('Separate Drizzle', ['3', '3a']),
+         ('Create Median', ['4']),
+         ('Blot', ['5']),
+         ('Driz_CR', ['6']),
+         ('Final Drizzle', ['7', '7a'])]
+
+# Parameters which do not change the results of any step
+IGNORED_PARS = ['runfile', 'num_cores', 'parallel_backend', 'max_memory',
+                'wcsmap_cache_dir', 'profile', 'cache_size', 'cache_memmap',
+                'checkpoint', 'STATE OF INPUT FILES']
+
+# Parameters naming input files, whose contents get hashed along with the
+# names.  The files listed in those which are lists of files (an '@' input
+# list, or the sky mask catalog) get hashed as well.
+FILE_PARS = ['input', 'rules_file', 'skymask_cat', 'skyfile',
+             'driz_sep_refimage', 'final_refimage']
+
+# Keywords updated in the input files by the processing steps, or upon
+# writing them, which are left out of the hashes of the input files.
+IGNORED_KEYWORDS = ['MDRIZSKY', 'CHECKSUM', 'DATASUM', 'IRAF-TLM', 'DATE']
+
+
+def _hash_file(filename):
+    """ Return the SHA1 hash of the contents of a file. """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as fh:
+        for block in iter(lambda: fh.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _hash_input(filename):
+    """ Return the SHA1 hash of an input file, leaving out the keywords
+    which get updated by the processing steps (see ``IGNORED_KEYWORDS``).
+    """
+    digest = hashlib.sha1()
+    with fits.open(filename, memmap=False, lazy_load_hdus=False) as hdul:
+        for hdu in hdul:
+            cards = [str(card) for card in hdu.header.cards
+                     if card.keyword not in IGNORED_KEYWORDS]
+            digest.update('\n'.join(cards).encode())
+        locations = [hdu.fileinfo()['datLoc'] for hdu in hdul]
+        spans = [hdu.fileinfo()['datSpan'] for hdu in hdul]
+
+    # the data of each extension, as stored in the file
+    with open(filename, 'rb') as fh:
+        for location, span in zip(locations, spans):
+            fh.seek(location)
+            digest.update(fh.read(span))
+    return digest.hexdigest()
+
+
+def _hash_named_file(filename):
+    """ Return the hash of a file named by a parameter: as an input file for
+    FITS files (see `_hash_input`), otherwise of its whole contents.
+    """
+    try:
+        return _hash_input(filename)
+    except OSError:
+        return _hash_file(filename)
+
+
+def _file_hashes(key, value):
+    """ Return the hashes of the existing files named by the value of a
+    parameter, along with those of the files they list (see ``FILE_PARS``).
+    """
+    if not isinstance(value, str) or not value.strip():
+        return {}
+    value = value.strip()
+    is_list = value.startswith('@') or key == 'skymask_cat'
+    filename = value[1:] if value.startswith('@') else fileutil.parseFilename(value)[0]
+    if not os.path.isfile(filename):
+        return {}
+
+    hashes = {filename: _hash_named_file(filename)}
+    if is_list:
+        with open(filename) as fh:
+            for line in fh:
+                if line.lstrip().startswith('#'):
+                    continue
+                for name in line.replace(',', ' ').split():
+                    name = fileutil.parseFilename(name)[0]
+                    if name not in hashes and os.path.isfile(name):
+                        hashes[name] = _hash_named_file(name)
+    return hashes
+
+
+def _group_chips(image):
+    """ Return the chips of an image object which are being processed. """
+    chips = [image[image.scienceExt, extver]
+             for extver in range(1, image._numchips + 1)]
+    return [chip for chip in chips if chip.group_member]
+
+
+class Checkpoints:
+    """ Checkpoints of the processing steps of an AstroDrizzle run.
+
+    With ``enabled=False`` (or for in-memory processing, where the
+    intermediate products never get written out) all steps get run and
+    nothing gets recorded.
+
+    Parameters
+    ----------
+    configobj : ConfigObj
+        Configuration of the run.
+
+    imgObjList : list
+        Image objects for all the inputs, as returned by
+        `~drizzlepac.processInput.setCommonInput`.
+
+    enabled : bool
+        Whether to use and record checkpoints.
+
+    """
+    def __init__(self, configobj, imgObjList, enabled=True):
+        self.configobj = configobj
+        self.imgObjList = imgObjList
+        self.enabled = enabled and not imgObjList[0].inmemory
+        if enabled and not self.enabled:
+            log.info('Checkpoints are not used for in-memory processing.')
+        if not self.enabled:
+            return
+
+        self.filename = (os.path.splitext(imgObjList[0].outputNames['outFinal'])[0]
+                         + MANIFEST_SUFFIX)
+
+        # The input files hold the state left by the initialization, such as
+        # DQ arrays with their bits reset, which all the steps start from.
+        inputs = set()
+        for image in imgObjList:
+            inputs.add(image._filename)
+            inputs.update(chip.dqfile for chip in _group_chips(image)
+                          if chip.dqfile and os.path.isfile(chip.dqfile))
+        self.inputs = {name: _hash_input(name) for name in sorted(inputs)}
+
+        common = {key: value for key, value in configobj.items()
+                  if key not in IGNORED_PARS and
+                  (not isinstance(value, dict) or
+                   key == 'INSTRUMENT PARAMETERS')}
+        self.key = self._hash([self.inputs, self._parameters(common)])
+
+        self.previous = {}
+        if os.path.isfile(self.filename):
+            with open(self.filename) as fh:
+                try:
+                    manifest = json.load(fh)
+                except ValueError:
+                    manifest = {}
+            if manifest.get('version') == __version__:
+                self.previous = manifest.get('steps', {})
+
+        self.steps = {}
+        self._resumed = True
+
+    @staticmethod
+    def _hash(items):
+        return hashlib.sha1(json.dumps(items, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def _parameters(section):
+        """ Parameter values in a form which can be saved as JSON, along with
+        the hashes of the files named by those in ``FILE_PARS``.
+        """
+        pars = {}
+        for key, value in section.items():
+            if isinstance(value, dict):
+                pars[key] = Checkpoints._parameters(value)
+            elif key in FILE_PARS:
+                pars[key] = [repr(value), _file_hashes(key, value)]
+            else:
+                pars[key] = repr(value)
+        return pars
+
+    def run(self, step, func, *args, **kwargs):
+        """ Run a processing ``step`` by calling ``func(*args, **kwargs)``,
+        unless it can be skipped.
+        """
+        if not self.enabled:
+            func(*args, **kwargs)
+            return
+
+        sections = [util.getSectionName(self.configobj, num)
+                    for num in dict(STEPS)[step]]
+        parameters = {name: self._parameters(self.configobj[name])
+                      for name in sections}
+        self.key = self._hash([self.key, parameters])
+
+        record = self.previous.get(step)
+        if (self._resumed and record is not None and
+                record['key'] == self.key and self._unchanged(record)):
+            print('==== Processing Step {} skipped: completed by an earlier '
+                  'run (see {})'.format(step, self.filename), flush=True)
+            self._restore(step, record['state'])
+            self.steps[step] = record
+            return
+
+        # this and all the following steps need to be run
+        self._resumed = False
+        self.steps.pop(step, None)
+        func(*args, **kwargs)
+
+        self.steps[step] = {
+            'key': self.key,
+            'parameters': parameters,
+            'outputs': {name: _hash_file(name)
+                        for name in self._outputs(step)},
+            'state': self._state(step)
+        }
+        self._write()
+
+    def _write(self):
+        manifest = {'version': __version__, 'inputs': self.inputs,
+                    'steps': self.steps}
+        # Write the manifest atomically, as the run may get interrupted
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmpname = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(manifest, fh, indent=2)
+        os.replace(tmpname, self.filename)
+
+    @staticmethod
+    def _unchanged(record):
+        for name, digest in record['outputs'].items():
+            if not os.path.isfile(name) or _hash_file(name) != digest:
+                log.info('{} has changed since the checkpoint.'.format(name))
+                return False
+        return True
+
+    def _outputs(self, step):
+        """ Names of the files written by a step which exist. """
+        names = set()
+        for image in self.imgObjList:
+            chips = _group_chips(image)
+            if step == 'Static Mask':
+                names.update(chip.outputNames['staticMask'] for chip in chips)
+            elif step == 'Separate Drizzle':
+                names.update(image.outputNames[key] for key in
+                             ['outSingle', 'outSWeight', 'outSContext'])
+            elif step == 'Create Median':
+                names.add(image.outputNames['outMedian'])
+            elif step == 'Blot':
+                names.update(chip.outputNames['blotImage'] for chip in chips)
+            elif step == 'Driz_CR':
+                names.update(chip.outputNames['crmaskImage'] for chip in chips)
+                names.add(image.outputNames['crcorImage'])
+            elif step == 'Final Drizzle':
+                names.update(image.outputNames[key] for key in
+                             ['outFinal', 'outSci', 'outWeight', 'outContext'])
+        return sorted(name for name in names if name and os.path.isfile(name))
+
+    def _state(self, step):
+        """ Values set in the image objects by a step and needed by the
+        following steps.
+        """
+        state = []
+        if step == 'Static Mask':
+            for image in self.imgObjList:
+                state.append([[chip._chip, chip.outputNames['staticMask']]
+                              for chip in _group_chips(image)])
+        elif step == 'Subtract Sky':
+            for image in self.imgObjList:
+                with fits.open(image._filename) as hdul:
+                    state.append([[chip._chip, chip.subtractedSky, chip.computedSky,
+                                   hdul[image.scienceExt, chip._chip].header.get('MDRIZSKY')]
+                                  for chip in _group_chips(image)])
+        return state
+
+    def _restore(self, step, state):
+        """ Restore the values set by a skipped step in the image objects and
+        in the input files.
+        """
+        if step == 'Static Mask':
+            for image, chips in zip(self.imgObjList, state):
+                for extver, maskname in chips:
+                    image[image.scienceExt, extver].outputNames['staticMask'] = maskname
+
+        elif step == 'Subtract Sky':
+            for image, chips in zip(self.imgObjList, state):
+                with fits.open(image._filename) as hdul:
+                    current = [hdul[image.scienceExt, extver].header.get('MDRIZSKY')
+                               for extver, _, _, _ in chips]
+                for (extver, subtracted, computed, keyword), value in zip(chips, current):
+                    chip = image[image.scienceExt, extver]
+                    chip.subtractedSky = subtracted
+                    chip.computedSky = computed
+                    if keyword is not None and keyword != value:
+                        sky._updateKW(chip, image._filename,
+                                      (image.scienceExt, extver), 'MDRIZSKY', keyword)
+
+        elif step == 'Final Drizzle':
+            final_step = util.getSectionName(self.configobj, 7)
+            if not self.configobj[final_step]['driz_combine']:
+                return
+            # The final drizzle flags the cosmic rays in the input DQ arrays
+            for image in self.imgObjList:
+                for chip in _group_chips(image):
+                    adrizzle.updateInputDQArray(chip.dqfile, chip.dq_extn, chip._chip,
+                                                chip.outputNames['crmaskImage'],
+                                                self.configobj['crbit'])
@@ -6,6 +6,7 @@ Create a median image from the singly drizzled images.
 :License: :doc:`/LICENSE`
 
 """
+import copy
 import os
 import sys
 import math
@@ -87,6 +88,8 @@ def createMedian(imgObjList, configObj, procSteps=None):
 
     paramDict = configObj[step_name]
     paramDict['proc_unit'] = configObj['proc_unit']
+    paramDict['num_cores'] = configObj.get('num_cores')
+    paramDict['parallel_backend'] = configObj.get('parallel_backend', 'process')
 
     # include whether or not compression was performed
     driz_sep_name = util.getSectionName(configObj, _single_step_num_)
@@ -306,6 +309,11 @@ def _median(imageObjectList, paramDict):
         print('\nWARNING: Creating median image without the application of '
               'bad pixel masks!\n')
 
+    # Sections of rows get combined by up to 'pool_size' workers at the same
+    # time, each of them holding one section of every input image (and
+    # weight image) in memory, so split the buffer size among them.
+    pool_size = util.get_pool_size(paramDict.get('num_cores'), None)
+
     # The overlap value needs to be set to 2*grow in order to
     # avoid edge effects when scrolling down the image, and to
     # insure that the last section returned from the iterator
@@ -333,11 +341,86 @@ def _median(imageObjectList, paramDict):
         grow = new_grow
         overlap = 2 * grow
 
+    sections = _row_sections(imrows, section_nrows, grow)
+
+    # Only as many workers as there are sections get used, and then the
+    # sections get split among them (never reducing 'grow' any further).
+    pool_size = min(pool_size, len(sections))
+    if pool_size > 1:
+        section_nrows = max(section_nrows // pool_size,
+                            min(section_nrows, overlap + 1))
+        sections = _row_sections(imrows, section_nrows, grow)
+
+    combpars = {
+        'comb_type': comb_type,
+        'newmasks': newmasks,
+        'wht_mean': wht_mean,
+        'readnoise': readnoiseList,
+        'exptime': exposureTimeList,
+        'background': backgroundValueList,
+        'grow': grow,
+        'nsigma1': nsigma1,
+        'nsigma2': nsigma2,
+        'nlow': nlow,
+        'nhigh': nhigh,
+        'lthresh': lthresh,
+        'hthresh': hthresh,
+    }
+
+    if pool_size > 1:
+        medianImageArray = _median_parallel(
+            sections, singleDrizList, singleWeightList, medianImageArray,
+            combpars, pool_size, paramDict.get('parallel_backend')
+        )
+    else:
+        _combine_sections(sections, singleDrizList, singleWeightList,
+                          medianImageArray, combpars)
+
+    # Write out the combined image
+    # use the header from the first single drizzled image in the list
+    pf = _writeImage(medianImageArray, inputHeader=single_hdr)
+
+    if virtual:
+        mediandict = {}
+        mediandict[medianfile] = pf
+        for img in imageObjectList:
+            img.saveVirtualOutputs(mediandict)
+    else:
+        try:
+            print("Saving output median image to: '{}'".format(medianfile))
+            pf.writeto(medianfile)
+        except IOError:
+            msg = "Problem writing file '{}'".format(medianfile)
+            print(msg)
+            raise IOError(msg)
+
+    # Always close any files opened to produce median image; namely,
+    # single drizzle images and singly-drizzled weight images
+    #
+    for img in singleDrizList:
+        if not virtual:
+            img.close()
+
+    # Close all singly drizzled weight images used to create median image.
+    for img in singleWeightList:
+        if not virtual:
+            img.close()
+
+
+def _row_sections(imrows, section_nrows, grow):
+    """ Split ``imrows`` rows into sections of ``section_nrows`` rows
+    overlapping by ``2 * grow`` rows.
+
+    Returns a list of ``(e1, e2, u1, u2)`` tuples, where rows ``e1:e2`` of the
+    images get combined and rows ``u1:u2`` of the combined section are used.
+    """
+    overlap = 2 * grow
     nbr = section_nrows - overlap
     nsec = (imrows - overlap) // nbr
     if (imrows - overlap) % nbr > 0:
         nsec += 1
 
+    sections = []
     for k in range(nsec):
         e1 = k * nbr
         e2 = e1 + section_nrows
@@ -352,18 +435,79 @@ def _median(imageObjectList, paramDict):
             e1 = min(e1, e2 - overlap - 1)
             u2 = e2 - e1
 
-        imdrizSectionsList = np.empty(
-            (len(singleDrizList), e2 - e1, imcols),
-            dtype=single_data_dtype
-        )
+        sections.append((e1, e2, u1, u2))
+
+    return sections
+
+
+def _median_parallel(sections, singleDrizList, singleWeightList,
+                     medianImageArray, combpars, pool_size, backend):
+    """ Combine the row sections with ``pool_size`` parallel workers.
+
+    The sections are split into contiguous groups, one per worker. Each
+    worker reads its sections of the single drizzled images through its own
+    copies of the file iterators and writes the combined rows directly into
+    the median array (kept in shared memory when using processes), since
+    the rows written by each section never overlap.
+    """
+    use_threads = backend == 'thread'
+    log.info('Combining {:d} sections of rows with {:d} parallel workers{}'
+             .format(len(sections), pool_size,
+                     ' (threads)' if use_threads else ''))
+
+    with util.worker_pool(num_cores=pool_size) as pool:
+        if not use_threads:
+            shared = pool.shared_array(medianImageArray.shape,
+                                       medianImageArray.dtype)
+            shared[...] = medianImageArray
+            medianImageArray = shared
+
+        worker_args = []
+        for group in np.array_split(np.arange(len(sections)), pool_size):
+            worker_args.append((
+                [sections[k] for k in group],
+                [copy.copy(f) for f in singleDrizList],
+                [copy.copy(f) for f in singleWeightList],
+                medianImageArray,
+                combpars
+            ))
+
+        pool.run(_combine_sections, worker_args, pool_size,
+                 threads=use_threads,
+                 name='createMedian._combine_sections()')  # for err msgs
+
+    return medianImageArray
+
+
+def _combine_sections(sections, singleDrizList, singleWeightList,
+                      medianImageArray, combpars):
+    """ Combine the given ``(e1, e2, u1, u2)`` sections of rows of the single
+    drizzled images and write the results to ``medianImageArray``.
+
+    Rows ``e1:e2`` of each input get read into buffers allocated once for all
+    sections, and rows ``u1:u2`` of the combined section get written to rows
+    ``e1+u1:e1+u2`` of the output array.
+    """
+    comb_type = combpars['comb_type']
+    imcols = medianImageArray.shape[1]
+    max_nrows = max(e2 - e1 for e1, e2, _, _ in sections)
+
+    imdriz_buf = np.empty((len(singleDrizList), max_nrows, imcols),
+                          dtype=medianImageArray.dtype)
+    if singleWeightList:
+        weight_buf = np.empty((len(singleWeightList), max_nrows, imcols),
+                              dtype=medianImageArray.dtype)
+        wht_mean = np.asarray(combpars['wht_mean'])[:, None, None]
+        if combpars['newmasks']:
+            mask_buf = np.empty(weight_buf.shape, dtype=bool)
+
+    for e1, e2, u1, u2 in sections:
+        imdrizSectionsList = imdriz_buf[:, :e2 - e1]
         for i, w in enumerate(singleDrizList):
             imdrizSectionsList[i, :, :] = w[e1:e2]
 
         if singleWeightList:
-            weightSectionsList = np.empty(
-                (len(singleWeightList), e2 - e1, imcols),
-                dtype=single_data_dtype
-            )
+            weightSectionsList = weight_buf[:, :e2 - e1]
             for i, w in enumerate(singleWeightList):
                 weightSectionsList[i, :, :] = w[e1:e2]
         else:
@@ -371,7 +515,7 @@ def _median(imageObjectList, paramDict):
 
         weight_mask_list = None
 
-        if newmasks and weightSectionsList is not None:
+        if combpars['newmasks'] and weightSectionsList is not None:
             # Build new masks from single drizzled images.
             # Generate new pixel mask file for median step.
             # This mask will be created from the single-drizzled
@@ -382,10 +526,9 @@ def _median(imageObjectList, paramDict):
             # as bad in this mask. This mask will then be used when
             # creating the median image.
             # 0 means good, 1 means bad here...
-            weight_mask_list = np.less(
-                weightSectionsList,
-                np.asarray(wht_mean)[:, None, None]
-            ).astype(np.uint8)
+            weight_mask_list = mask_buf[:, :e2 - e1]
+            np.less(weightSectionsList, wht_mean, out=weight_mask_list)
+            weight_mask_list = weight_mask_list.view(np.uint8)
 
         if 'minmed' in comb_type:  # Do MINMED
             # set up use of 'imedian'/'imean' in minmed algorithm
@@ -395,13 +538,13 @@ def _median(imageObjectList, paramDict):
             result = min_med(
                 imdrizSectionsList,
                 weightSectionsList,
-                readnoiseList,
-                exposureTimeList,
-                backgroundValueList,
+                combpars['readnoise'],
+                combpars['exptime'],
+                combpars['background'],
                 weight_masks=weight_mask_list,
-                combine_grow=grow,
-                combine_nsigma1=nsigma1,
-                combine_nsigma2=nsigma2,
+                combine_grow=combpars['grow'],
+                combine_nsigma1=combpars['nsigma1'],
+                combine_nsigma2=combpars['nsigma2'],
                 fillval=fillval
             )
 
@@ -411,45 +554,15 @@ def _median(imageObjectList, paramDict):
                 imdrizSectionsList,
                 masks=weight_mask_list,
                 combination_type=comb_type,
-                nlow=nlow,
-                nhigh=nhigh,
-                upper=hthresh,
-                lower=lthresh
+                nlow=combpars['nlow'],
+                nhigh=combpars['nhigh'],
+                upper=combpars['hthresh'],
+                lower=combpars['lthresh']
             )
 
         # Write out the processed image sections to the final output array:
         medianImageArray[e1+u1:e1+u2, :] = result[u1:u2, :]
 
-    # Write out the combined image
-    # use the header from the first single drizzled image in the list
-    pf = _writeImage(medianImageArray, inputHeader=single_hdr)
-
-    if virtual:
-        mediandict = {}
-        mediandict[medianfile] = pf
-        for img in imageObjectList:
-            img.saveVirtualOutputs(mediandict)
-    else:
-        try:
-            print("Saving output median image to: '{}'".format(medianfile))
-            pf.writeto(medianfile)
-        except IOError:
-            msg = "Problem writing file '{}'".format(medianfile)
-            print(msg)
-            raise IOError(msg)
-
-    # Always close any files opened to produce median image; namely,
-    # single drizzle images and singly-drizzled weight images
-    #
-    for img in singleDrizList:
-        if not virtual:
-            img.close()
-
-    # Close all singly drizzled weight images used to create median image.
-    for img in singleWeightList:
-        if not virtual:
-            img.close()
-
 
 def _writeImage(dataArray=None, inputHeader=None):
     """ Writes out the result of the combination step.
@@ -11,19 +11,16 @@ import os
 import re
 
 import numpy as np
-from scipy import signal
 from astropy.io import fits
-from stsci.tools import fileutil, logutil, mputil, teal
+from stsci.tools import fileutil, logutil, teal
 
 
+from . import maskgrow
 from . import quickDeriv
 from . import util
 from . import processInput
 from . import __version__
 
-if util.can_parallel:
-    import multiprocessing
-
 
 __taskname__ = "drizCR"  # looks in drizzlepac for sky.cfg
 _STEP_NUM = 6  # this relates directly to the syntax in the cfg file
@@ -31,6 +28,9 @@ _STEP_NUM = 6  # this relates directly to the syntax in the cfg file
 
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
 
+# number of rows of each block processed by the 'blocked' CR detection engine
+CR_BLOCK_ROWS = 128
+
 
 def drizCR(input=None, configObj=None, editpars=False, **inputDict):
     """ Look for cosmic rays. """
@@ -74,22 +74,16 @@ def rundrizCR(imgObjList, configObj, procSteps=None):
     if imgObjList[0].inmemory:
         pool_size = 1  # reason why is output in drizzle step
 
-    subprocs = []
     if pool_size > 1:
         log.info('Executing {:d} parallel workers'.format(pool_size))
-        mp_ctx = multiprocessing.get_context('fork')
-        for image in imgObjList:
-            manager = mp_ctx.Manager()
-            mgr = manager.dict({})
-
-            p = mp_ctx.Process(
-                target=_driz_cr,
-                name='drizCR._driz_cr()',  # for err msgs
-                args=(image, mgr, paramDict.dict())
-            )
-            subprocs.append(p)
-            image.virtualOutputs.update(mgr)
-        mputil.launch_and_wait(subprocs, pool_size)  # blocks till all done
+        with util.worker_pool(num_cores=pool_size) as pool:
+            mgrs = [pool.manager().dict({}) for image in imgObjList]
+            pool.run(_driz_cr,
+                     [(image, mgr, paramDict.dict())
+                      for image, mgr in zip(imgObjList, mgrs)],
+                     pool_size, name='drizCR._driz_cr()')  # for err msgs
+            for image, mgr in zip(imgObjList, mgrs):
+                image.virtualOutputs.update(mgr)
 
     else:
         log.info('Executing serially')
@@ -138,6 +132,7 @@ def _driz_cr(sciImage, virtual_outputs, paramDict):
     """
     grow = paramDict["driz_cr_grow"]
     ctegrow = paramDict["driz_cr_ctegrow"]
+    engine = paramDict.get("driz_cr_engine", "full")
     crcorr_list = []
     cr_mask_dict = {}
 
@@ -148,6 +143,7 @@ def _driz_cr(sciImage, virtual_outputs, paramDict):
         if not sci_chip.group_member:
             continue
 
+        usage = util.start_chip_usage()
         blot_image_name = sci_chip.outputNames['blotImage']
 
         if sciImage.inmemory:
@@ -165,14 +161,7 @@ def _driz_cr(sciImage, virtual_outputs, paramDict):
         # Scale blot image, as needed, to match original input data units.
         blot_data *= sci_chip._conversionFactor
 
-        input_image = sciImage.getData(exten)
-
-        # Apply any unit conversions to input image here for comparison
-        # with blotted image in units of electrons
-        input_image *= sci_chip._conversionFactor
-
-        # make the derivative blot image
-        blot_deriv = quickDeriv.qderiv(blot_data)
+        sci_data = sciImage.getData(exten)
 
         # Boolean mask needs to take into account any crbits values
         # specified by the user to be ignored when converting DQ array.
@@ -190,83 +179,36 @@ def _driz_cr(sciImage, virtual_outputs, paramDict):
             )
         )
 
-        gain = sci_chip._effGain
-        rn = sci_chip._rdnoise
-        backg = sci_chip.subtractedSky * sci_chip._conversionFactor
-
-        # Set scaling factor (used by MultiDrizzle) to 1 since scaling has
-        # already been accounted for in blotted image
-        # expmult = 1.
-
-        # #################   COMPUTATION PART I    ###################
-        # Create a temporary array mask
-        t1 = np.absolute(input_image - blot_data)
-        # ta = np.sqrt(gain * np.abs((blot_data + backg) * expmult) + rn**2)
-        ta = np.sqrt(gain * np.abs(blot_data + backg) + rn**2)
-        t2 = (mult1 * blot_deriv + snr1 * ta / gain)  # / expmult
-        tmp1 = t1 <= t2
-
-        # Create a convolution kernel that is 3 x 3 of 1's
-        kernel = np.ones((3, 3), dtype=np.uint16)
-        # Convolve the mask with the kernel
-        tmp2 = signal.convolve2d(tmp1, kernel, boundary='symm', mode='same')
-
-        # #################   COMPUTATION PART II    ###################
-        # Create the CR Mask
-        t2 = (mult2 * blot_deriv + snr2 * ta / gain)  # / expmult
-        cr_mask = (t1 <= t2) | (tmp2 >= 9)
-
-        # #################   COMPUTATION PART III    ##################
-        # flag additional cte 'radial' and 'tail' pixels surrounding CR pixels
-        # as CRs
-
-        # In both the 'radial' and 'length' kernels below, 0->good and 1->bad,
-        # so that upon convolving the kernels with cr_mask, the convolution
-        # output will have low->bad and high->good from which 2 new arrays are
-        # created having 0->bad and 1->good. These 2 new arrays are then
-        # 'anded' to create a new cr_mask.
-
-        # make radial convolution kernel and convolve it with original cr_mask
-        cr_grow_kernel = np.ones((grow, grow), dtype=np.uint16)
-        cr_grow_kernel_conv = signal.convolve2d(
-            cr_mask, cr_grow_kernel, boundary='symm', mode='same'
-        )
-
-        # make tail convolution kernel and convolve it with original cr_mask
-        cr_ctegrow_kernel = np.zeros((2 * ctegrow + 1, 2 * ctegrow + 1))
-
-        # which pixels are masked by tail kernel depends on sign of
-        # sci_chip.cte_dir (i.e.,readout direction):
-        if sci_chip.cte_dir == 1:
-            # 'positive' direction:  HRC: amp C or D; WFC: chip = sci,1; WFPC2
-            cr_ctegrow_kernel[0:ctegrow, ctegrow] = 1
-        elif sci_chip.cte_dir == -1:
-            # 'negative' direction:  HRC: amp A or B; WFC: chip = sci,2
-            cr_ctegrow_kernel[ctegrow+1:2*ctegrow+1, ctegrow] = 1
-
-        # do the convolution
-        cr_ctegrow_kernel_conv = signal.convolve2d(
-            cr_mask, cr_ctegrow_kernel, boundary='symm', mode='same'
-        )
-
-        # select high pixels from both convolution outputs;
-        # then 'and' them to create new cr_mask
-        cr_grow_mask = cr_grow_kernel_conv >= grow**2  # radial
-        cr_ctegrow_mask = cr_ctegrow_kernel_conv >= ctegrow  # length
-        cr_mask = cr_grow_mask & cr_ctegrow_mask
+        crpars = {
+            'conversion': sci_chip._conversionFactor,
+            'gain': sci_chip._effGain,
+            'rn': sci_chip._rdnoise,
+            'backg': sci_chip.subtractedSky * sci_chip._conversionFactor,
+            'snr': (snr1, snr2),
+            'mult': (mult1, mult2),
+            'grow': grow,
+            'ctegrow': ctegrow,
+            'cte_dir': sci_chip.cte_dir
+        }
+
+        if engine == 'blocked':
+            cr_mask = _cr_mask_blocked(sci_data, blot_data, crpars)
+        else:
+            cr_mask = _cr_mask_full(sci_data, blot_data, crpars)
 
         # Apply CR mask to the DQ array in place
         dq_mask &= cr_mask
 
-        # Create the corr file
-        corrFile = np.where(dq_mask, input_image, blot_data)
-        corrFile /= sci_chip._conversionFactor
-        corrDQMask = np.where(dq_mask, 0, paramDict['crbit']).astype(np.uint16)
-
         if paramDict['driz_cr_corr']:
+            # Create the corr file
+            corrFile = np.where(dq_mask, sci_data * sci_chip._conversionFactor,
+                                blot_data)
+            corrFile /= sci_chip._conversionFactor
+            corrDQMask = np.where(dq_mask, 0, paramDict['crbit']).astype(np.uint16)
+
             crcorr_list.append({
                 'sciext': fileutil.parseExtn(exten),
-                'corrFile': corrFile.copy(),
+                'corrFile': corrFile,
                 'dqext': fileutil.parseExtn(sci_chip.dq_extn),
                 'dqMask': corrDQMask
             })
@@ -294,11 +236,153 @@ def _driz_cr(sciImage, virtual_outputs, paramDict):
             util.createFile(cr_mask.astype(np.uint8),
                             outfile=cr_mask_image, header=None)
 
+        util.record_chip_usage('Driz_CR', f'{sciImage._filename}[{exten}]',
+                               usage)
+
     if paramDict['driz_cr_corr']:
         createCorrFile(sciImage.outputNames["crcorImage"], crcorr_list,
                        sciImage._filename)
 
 
+def _cr_tests(sci_data, blot_data, blot_deriv, crpars):
+    """ Compare the (unit converted) science data with the blotted median
+    using both sets of SNR and derivative scaling factors.
+    """
+    snr1, snr2 = crpars['snr']
+    mult1, mult2 = crpars['mult']
+    gain = crpars['gain']
+    rn = crpars['rn']
+    backg = crpars['backg']
+
+    # Apply any unit conversions to input image here for comparison
+    # with blotted image in units of electrons
+    input_image = sci_data * crpars['conversion']
+
+    # Set scaling factor (used by MultiDrizzle) to 1 since scaling has
+    # already been accounted for in blotted image
+    # expmult = 1.
+
+    # #################   COMPUTATION PART I    ###################
+    # Create a temporary array mask
+    t1 = np.absolute(input_image - blot_data)
+    # ta = np.sqrt(gain * np.abs((blot_data + backg) * expmult) + rn**2)
+    ta = np.sqrt(gain * np.abs(blot_data + backg) + rn**2)
+    t2 = (mult1 * blot_deriv + snr1 * ta / gain)  # / expmult
+    tmp1 = t1 <= t2
+
+    # #################   COMPUTATION PART II    ###################
+    t2 = (mult2 * blot_deriv + snr2 * ta / gain)  # / expmult
+    return tmp1, t1 <= t2
+
+
+def _cr_grow_windows(crpars):
+    """ Return the ``(rows, cols)`` windows around each pixel which must be
+    entirely within the CR mask for the pixel to remain unflagged, or None
+    instead of the 'tail' window when the CTE tail selects all or no pixels.
+    """
+    grow_window = maskgrow.convolve_box_window(crpars['grow'])
+    ctegrow = crpars['ctegrow']
+    if ctegrow > 0 and crpars['cte_dir'] == 1:
+        # 'positive' direction:  HRC: amp C or D; WFC: chip = sci,1; WFPC2
+        cte_window = ((1, ctegrow), (0, 0))
+    elif ctegrow > 0 and crpars['cte_dir'] == -1:
+        # 'negative' direction:  HRC: amp A or B; WFC: chip = sci,2
+        cte_window = ((-ctegrow, -1), (0, 0))
+    else:
+        cte_window = None
+    return (grow_window, grow_window), cte_window
+
+
+def _cr_grow(cr_mask, crpars):
+    """ Flag additional cte 'radial' and 'tail' pixels surrounding CR pixels
+    as CRs.
+    """
+    # In both the 'radial' and 'length' kernels below, 0->good and 1->bad,
+    # so that upon convolving the kernels with cr_mask, the convolution
+    # output will have low->bad and high->good from which 2 new arrays are
+    # created having 0->bad and 1->good. These 2 new arrays are then
+    # 'anded' to create a new cr_mask.
+    grow_window, cte_window = _cr_grow_windows(crpars)
+
+    # 'radial' kernel: a grow x grow box of 1's (centered as done by
+    # scipy.signal.convolve2d) which must be entirely within cr_mask
+    cr_grow_mask = maskgrow.erode(cr_mask, *grow_window)
+
+    # 'tail' kernel: the ctegrow pixels on one side of each pixel along
+    # the columns (depending on sign of the readout direction), which must
+    # all be within cr_mask.
+    if cte_window is not None:
+        cr_grow_mask &= maskgrow.erode(cr_mask, *cte_window)
+    elif crpars['ctegrow'] > 0:
+        # an empty kernel only selects pixels when ctegrow is 0
+        cr_grow_mask[...] = False
+
+    return cr_grow_mask
+
+
+def _cr_mask_full(sci_data, blot_data, crpars):
+    """ Compute the CR mask of a chip (True for good pixels) at once. """
+    # make the derivative blot image
+    blot_deriv = quickDeriv.qderiv(blot_data)
+
+    tmp1, cr_mask = _cr_tests(sci_data, blot_data, blot_deriv, crpars)
+    del blot_deriv
+
+    # Find the pixels whose 3 x 3 neighborhood is entirely in the mask
+    # (same as convolving the mask with a 3 x 3 kernel of 1's and
+    # selecting the pixels where the result is 9)
+    cr_mask |= maskgrow.erode(tmp1, (-1, 1), (-1, 1))
+
+    # #################   COMPUTATION PART III    ##################
+    return _cr_grow(cr_mask, crpars)
+
+
+def _cr_mask_blocked(sci_data, blot_data, crpars, block_rows=CR_BLOCK_ROWS):
+    """ Compute the CR mask of a chip (True for good pixels) one block of
+    ``block_rows`` rows at a time.
+
+    Each block is computed from the rows it depends upon through the
+    derivative, the 3 x 3 neighborhood test and the 'radial' and 'tail'
+    kernels, so the result is identical to that of `_cr_mask_full` while
+    only the output mask is allocated for the whole chip.
+    """
+    nrows = sci_data.shape[0]
+    grow_window, cte_window = _cr_grow_windows(crpars)
+    reach_lo = min(0, grow_window[0][0])
+    reach_hi = max(0, grow_window[0][1])
+    if cte_window is not None:
+        reach_lo = min(reach_lo, cte_window[0][0])
+        reach_hi = max(reach_hi, cte_window[0][1])
+
+    cr_mask = np.empty(sci_data.shape, dtype=bool)
+    for r1 in range(0, nrows, block_rows):
+        r2 = min(r1 + block_rows, nrows)
+        # rows of the CR mask before growing it (including those mirrored
+        # at the edges of the chip)...
+        m1 = max(0, r1 + reach_lo)
+        m2 = min(nrows, r2 + reach_hi)
+        if m1 == 0:
+            m2 = min(nrows, max(m2, -reach_lo))
+        if m2 == nrows:
+            m1 = max(0, min(m1, nrows - reach_hi))
+        # ...and those needed for their 3 x 3 neighborhoods
+        p1 = max(0, m1 - 1)
+        p2 = min(nrows, m2 + 1)
+
+        blot_deriv = quickDeriv.qderiv_rows(blot_data, p1, p2)
+        tmp1, tmp2 = _cr_tests(sci_data[p1:p2], blot_data[p1:p2],
+                               blot_deriv, crpars)
+        tmp2 |= maskgrow.erode(tmp1, (-1, 1), (-1, 1))
+
+        # Rows next to the edges of the blocks which are not edges of the
+        # chip are affected by the mirroring done at the edges of each
+        # block, but these never end up in the rows kept from each block.
+        block_mask = _cr_grow(tmp2[m1 - p1:m2 - p1], crpars)
+        cr_mask[r1:r2] = block_mask[r1 - m1:r2 - m1]
+
+    return cr_mask
+
+
 def createCorrFile(outfile, arrlist, template):
     """
     Create a _cor file with the same format as the original input image.
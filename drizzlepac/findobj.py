@@ -154,10 +154,6 @@ def findstars(jdata, fwhm, threshold, skymode,
     yin, xin = np.mgrid[0:ny, 0:nx]
     kernel = gaussian1(1.0, xc, yc, a, b, c)(xin,yin)
 
-    # define size of extraction box for each source based on kernel size
-    grx = xc
-    gry = yc
-
     # DAOFIND STYLE KERNEL "SHAPE"
     rmat    = np.sqrt((xin-xc)**2 + (yin-yc)**2)
     rmatell = a*(xin-xc)**2 + b*(xin-xc)*(yin-yc) + c*(yin-yc)**2
@@ -201,98 +197,158 @@ def findstars(jdata, fwhm, threshold, skymode,
 
     # determine center of each source, while removing spurious sources or
     # applying limits defined by the user
-    ninit  = 0
-    ninit2 = 0
-
     s2m, s4m = precompute_sharp_round(nx, ny, xc, yc)
 
-    satur  = False # Default assumption if use_sharp_round=False
-    sharp  = None
-    round1 = None
-    round2 = None
-
-    for ss,n in zip(fobjects,range(len(fobjects))):
-        ssx = ss[1].stop - ss[1].start
-        ssy = ss[0].stop - ss[0].start
-        if ssx >= tdata.shape[1]-1 or ssy >= tdata.shape[0]-1:
-            continue
-
-        yr0 = ss[0].start - gry
-        yr1 = ss[0].stop  + gry + 1
-        if yr0 <= 0 or yr1 >= img_ny: continue # ignore sources within ny//2 of edge
-
-        xr0 = ss[1].start - grx
-        xr1 = ss[1].stop  + grx + 1
-        if xr0 <= 0 or xr1 >= img_nx: continue # ignore sources within nx//2 of edge
-
-        ssnew = (slice(yr0,yr1),slice(xr0,xr1))
-        region = tdata[ssnew]
-
-        cntr = centroid(region)
-
-        # Define region centered on max value in object (slice)
-        # This region will be bounds-checked to insure that it only accesses
-        # a valid section of the image (not off the edge)
-        maxpos = (int(cntr[1]+0.5)+ssnew[0].start,int(cntr[0]+0.5)+ssnew[1].start)
-        yr0 = maxpos[0] - gry
-        yr1 = maxpos[0] + gry + 1
-        if yr0 < 0 or yr1 > img_ny:
-            continue
-        xr0 = maxpos[1] - grx
-        xr1 = maxpos[1] + grx + 1
-        if xr0 < 0 or xr1 > img_nx:
-            continue
-
-        # Simple Centroid on the region from the input image
-        jregion = jdata[yr0:yr1,xr0:xr1]
-        src_flux = jregion.sum()
-        src_peak = jregion.max()
-
-        if (peakmax is not None and src_peak >= peakmax):
-            continue
-        if (peakmin is not None and src_peak <= peakmin):
-            continue
-
-        if fluxmin and src_flux <= fluxmin:
-            continue
-        if fluxmax and src_flux >= fluxmax:
-            continue
-
-        datamin = jregion.min()
-        datamax = jregion.max()
-
-        if use_sharp_round:
-            # Compute sharpness and first estimate of roundness:
-            dregion = convdata[yr0:yr1,xr0:xr1]
-            satur, round1, sharp = \
-                sharp_round(jregion, dregion, xyrmask, xc, yc,
-                            s2m, s4m, nx, ny, datamin, datamax)
-            # Filter sources:
-            if sharp is None or (sharp < sharplo or sharp > sharphi):
-                continue
-            if round1 is None or (round1 < roundlo or round1 > roundhi):
-                continue
-
-        px, py, round2 = xy_round(jregion, grx, gry, skymode,
-                                  kernel, xsigsq, ysigsq, datamin, datamax)
-
-        # Filter sources:
-        if px is None:
-            continue
-
-        if use_sharp_round and not satur and \
-           (round2 is None or round2 < roundlo or round2 > roundhi):
-            continue
-
-        fitind.append((px + xr0, py + yr0, sharp, round1, round2))
-        # compute a source flux value
-        fluxes.append(src_flux)
+    fitind, fluxes = _measure_sources(
+        jdata, convdata, tdata, fobjects, kernel, xyrmask, s2m, s4m,
+        skymode, xsigsq, ysigsq, peakmin=peakmin, peakmax=peakmax,
+        fluxmin=fluxmin, fluxmax=fluxmax, use_sharp_round=use_sharp_round,
+        sharplo=sharplo, sharphi=sharphi, roundlo=roundlo, roundhi=roundhi
+    )
 
     fitindc, fluxesc = apply_nsigma_separation(fitind, fluxes, fwhm*nsigma / 2)
 
     return fitindc, fluxesc
 
 
+def _stack_boxes(data, y0, x0, ny, nx):
+    """ Return the ``(ny, nx)`` boxes of ``data`` starting at rows ``y0``
+    and columns ``x0`` stacked into a single ``(len(y0), ny, nx)`` array.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(data, (ny, nx))
+    return windows[y0, x0]
+
+
+def _measure_sources(jdata, convdata, tdata, fobjects, kernel, xyrmask,
+                     s2m, s4m, skymode, xsigsq, ysigsq,
+                     peakmin=None, peakmax=None, fluxmin=None, fluxmax=None,
+                     use_sharp_round=False, sharplo=0.2, sharphi=1.0,
+                     roundlo=-1.0, roundhi=1.0):
+    """
+    Measure the position, flux, sharpness and roundness of all the objects
+    found by the segmentation of the image (``fobjects``) at once and
+    apply the limits defined by the user.
+
+    The boxes around all the sources are extracted into stacked arrays so
+    that all the quantities computed by `centroid`, `sharp_round` and
+    `xy_round` for one source at a time are computed for all the sources
+    with a few array operations.
+
+    Returns the lists of ``(x, y, sharp, round1, round2)`` positions and
+    of fluxes of the sources which were kept.
+    """
+    img_ny, img_nx = jdata.shape
+    ny, nx = kernel.shape
+    gry = ny // 2
+    grx = nx // 2
+
+    bounds = np.array([(ss[0].start, ss[0].stop, ss[1].start, ss[1].stop)
+                       for ss in fobjects if ss is not None], dtype=int)
+    bounds = bounds.reshape((-1, 4))
+    ystart, ystop, xstart, xstop = bounds.T
+
+    # ignore objects spanning the whole image and those
+    # within ny//2 (nx//2) of the edge
+    yr0 = ystart - gry
+    yr1 = ystop + gry + 1
+    xr0 = xstart - grx
+    xr1 = xstop + grx + 1
+    keep = ((xstop - xstart < tdata.shape[1] - 1) &
+            (ystop - ystart < tdata.shape[0] - 1) &
+            (yr0 > 0) & (yr1 < img_ny) & (xr0 > 0) & (xr1 < img_nx))
+    yr0, yr1, xr0, xr1 = yr0[keep], yr1[keep], xr0[keep], xr1[keep]
+    if yr0.size == 0:
+        return [], []
+
+    # Centroid of each (variable size) region around the objects, computed
+    # for all regions of the same size at once
+    xcen = np.empty(yr0.size)
+    ycen = np.empty(yr0.size)
+    shapes = np.stack([yr1 - yr0, xr1 - xr0], axis=1)
+    for shape in np.unique(shapes, axis=0):
+        same = np.flatnonzero(np.all(shapes == shape, axis=1))
+        regions = _stack_boxes(tdata, yr0[same], xr0[same], *shape)
+        regions = regions.astype(np.float64)
+        m00 = regions.sum(axis=(1, 2))
+        m10 = np.einsum('nij,i->n', regions, np.arange(shape[0], dtype=float))
+        m01 = np.einsum('nij,j->n', regions, np.arange(shape[1], dtype=float))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ycen[same] = m10 / m00
+            xcen[same] = m01 / m00
+
+    # Define region centered on max value in object (slice)
+    # This region will be bounds-checked to insure that it only accesses
+    # a valid section of the image (not off the edge)
+    good = np.isfinite(xcen) & np.isfinite(ycen)
+    ymax = np.zeros(yr0.size, dtype=int)
+    xmax = np.zeros(yr0.size, dtype=int)
+    ymax[good] = np.trunc(ycen[good] + 0.5).astype(int) + yr0[good]
+    xmax[good] = np.trunc(xcen[good] + 0.5).astype(int) + xr0[good]
+    yr0 = ymax - gry
+    xr0 = xmax - grx
+    keep = (good & (yr0 >= 0) & (ymax + gry + 1 <= img_ny) &
+            (xr0 >= 0) & (xmax + grx + 1 <= img_nx))
+    yr0, xr0 = yr0[keep], xr0[keep]
+    if yr0.size == 0:
+        return [], []
+
+    # Simple Centroid on the region from the input image
+    jregions = _stack_boxes(jdata, yr0, xr0, ny, nx)
+    src_flux = jregions.sum(axis=(1, 2))
+    src_peak = jregions.max(axis=(1, 2))
+
+    keep = np.ones(yr0.size, dtype=bool)
+    if peakmax is not None:
+        keep &= ~(src_peak >= peakmax)
+    if peakmin is not None:
+        keep &= ~(src_peak <= peakmin)
+    if fluxmin:
+        keep &= ~(src_flux <= fluxmin)
+    if fluxmax:
+        keep &= ~(src_flux >= fluxmax)
+    yr0, xr0 = yr0[keep], xr0[keep]
+    jregions, src_flux = jregions[keep], src_flux[keep]
+    if yr0.size == 0:
+        return [], []
+    datamin = jregions.min(axis=(1, 2))
+    datamax = jregions.max(axis=(1, 2))
+
+    nsrc = yr0.size
+    satur = np.zeros(nsrc, dtype=bool)  # Default assumption if use_sharp_round=False
+    sharp = np.full(nsrc, np.nan)
+    round1 = np.full(nsrc, np.nan)
+    if use_sharp_round:
+        # Compute sharpness and first estimate of roundness:
+        dregions = _stack_boxes(convdata, yr0, xr0, ny, nx)
+        satur, round1, sharp = _sharp_round_stack(
+            jregions, dregions, xyrmask, grx, gry, s2m, s4m, datamin, datamax
+        )
+        # Filter sources (NaN stands for undefined values):
+        keep = ((sharp >= sharplo) & (sharp <= sharphi) &
+                (round1 >= roundlo) & (round1 <= roundhi))
+    else:
+        keep = np.ones(nsrc, dtype=bool)
+
+    px, py, round2 = _xy_round_stack(jregions, grx, gry, skymode, kernel,
+                                     xsigsq, ysigsq, datamin, datamax)
+    keep &= np.isfinite(px)
+
+    if use_sharp_round:
+        keep &= satur | ((round2 >= roundlo) & (round2 <= roundhi))
+
+    fitind = []
+    fluxes = []
+    for k in np.flatnonzero(keep):
+        fitind.append((px[k] + xr0[k], py[k] + yr0[k],
+                       sharp[k] if use_sharp_round else None,
+                       round1[k] if use_sharp_round else None,
+                       round2[k]))
+        # compute a source flux value
+        fluxes.append(src_flux[k])
+
+    return fitind, fluxes
+
+
 def apply_nsigma_separation(fitind,fluxes,separation,niter=10):
     """
     Remove sources which are within nsigma*fwhm/2 pixels of each other, leaving
@@ -417,6 +473,120 @@ def sharp_round(data, density, kskip, xc, yc, s2m, s4m, nxk, nyk,
     return satur, round, sharp
 
 
+def _sharp_round_stack(data, density, kskip, xc, yc, s2m, s4m,
+                       datamin, datamax):
+    """
+    Compute `sharp_round` for the stacked ``(nsrc, nyk, nxk)`` arrays of
+    ``data`` and ``density`` of many sources at once. Undefined roundness
+    and sharpness values are returned as NaN.
+    """
+    # Compute the first estimate of roundness:
+    sum2 = np.sum(s2m * density, axis=(1, 2))
+    sum4 = np.sum(s4m * abs(density), axis=(1, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        round = np.where(sum2 == 0.0, 0.0,
+                         np.where(sum4 <= 0.0, np.nan, 2.0 * sum2 / sum4))
+
+    # Eliminate the sharpness test if the central pixel is bad:
+    mid_data_pix = data[:, yc, xc]
+    mid_dens_pix = density[:, yc, xc]
+    bad_high = mid_data_pix > datamax
+    bad_low = mid_data_pix < datamin
+
+    ########################
+    # Sharpness statistics:
+
+    satur = np.max(kskip * data, axis=(1, 2)) > datamax
+
+    # Exclude pixels (create a mask) outside the [datamin, datamax] range:
+    uskip = np.where((data >= datamin[:, None, None]) &
+                     (data <= datamax[:, None, None]), 1, 0)
+    # Update the mask with the "skipped" values from the convolution kernel:
+    uskip *= kskip
+    # Also, exclude central pixel:
+    uskip[:, yc, xc] = 0
+
+    npixels = np.sum(uskip, axis=(1, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharp = ((mid_data_pix - np.sum(uskip * data, axis=(1, 2)) / npixels)
+                 / mid_dens_pix)
+    sharp[(npixels < 1) | (mid_dens_pix <= 0.0) | bad_high | bad_low] = np.nan
+    satur = np.where(bad_high, True, np.where(bad_low, False, satur))
+
+    return satur, round, sharp
+
+
+def _xy_round_stack(data, x0, y0, skymode, ker2d, xsigsq, ysigsq,
+                    datamin, datamax):
+    """
+    Compute `xy_round` (``cdriz.arrxyround``) for the stacked
+    ``(nsrc, nyk, nxk)`` array of data of many sources, all centered at
+    ``(x0, y0)``, at once. The positions and roundness of the sources
+    rejected by the fit are returned as NaN.
+    """
+    nyk, nxk = ker2d.shape
+    xhalf = (nxk / 2.0) - 0.5
+    yhalf = (nyk / 2.0) - 0.5
+    xmiddle = nxk // 2
+    ymiddle = nyk // 2
+
+    data = data[:, y0 - ymiddle:y0 - ymiddle + nyk,
+                x0 - xmiddle:x0 - xmiddle + nxk].astype(np.float64)
+    # pixels out of the [datamin, datamax] range reject the source
+    bad = np.any((data < datamin[:, None, None]) |
+                 (data > datamax[:, None, None]), axis=(1, 2))
+
+    wtx = (xmiddle + 1 - np.abs(np.arange(nxk) - xmiddle)).astype(np.float64)
+    wty = (ymiddle + 1 - np.abs(np.arange(nyk) - ymiddle)).astype(np.float64)
+
+    def _fit(sd, sg, wt, d, sigsq, half):
+        # sd: (nsrc, n) marginal of the data; sg: (n,) marginal of the kernel
+        p = wt.sum()
+        sumgd = np.sum(wt * sg * sd, axis=1)
+        sumgsq = np.sum(wt * sg**2)
+        sumg = np.sum(wt * sg)
+        sumd = np.sum(wt * sd, axis=1)
+        sumdx = np.sum(wt * sd * d, axis=1)
+        dgdx = sg * d
+        sdgdxsq = np.sum(wt * dgdx**2)
+        sdgdx = np.sum(wt * dgdx)
+        sddgdx = np.sum(wt * sd * dgdx, axis=1)
+        sgdgdx = np.sum(wt * sg * dgdx)
+
+        # Solve for the height of the best-fitting gaussian to the
+        # marginal. Reject the star if the height is non-positive.
+        h1 = sumgsq - sumg**2 / p
+        with np.errstate(divide='ignore', invalid='ignore'):
+            h = (sumgd - sumg * sumd / p) / h1
+            skylvl = (sumd - h * sumg) / p
+            dx = ((sgdgdx - (sddgdx - sdgdx * (h * sumg + skylvl * p))) /
+                  (h * sdgdxsq / sigsq))
+            alt = np.where(sumd == 0.0, 0.0, sumdx / sumd)
+        dx = np.where(np.abs(dx) > half, alt, dx)
+        dx = np.where(np.abs(dx) > half, 0.0, dx)
+        reject = (h1 <= 0.0) | ~(h > 0.0) | (len(wt) <= 2) | (p <= 0.0)
+        return h, dx, reject
+
+    # x fit
+    sdx = np.einsum('nij,i->nj', data - skymode, wty)
+    sgx = np.dot(wty, ker2d)
+    hx, dx, rejx = _fit(sdx, sgx, wtx, xmiddle - np.arange(nxk), xsigsq,
+                        xhalf)
+    # y fit
+    sdy = np.einsum('nij,j->ni', data - skymode, wtx)
+    sgy = np.dot(ker2d, wtx)
+    hy, dy, rejy = _fit(sdy, sgy, wty, ymiddle - np.arange(nyk), ysigsq,
+                        yhalf)
+
+    reject = bad | rejx | rejy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        round = 2.0 * (hx - hy) / (hx + hy)
+    x = np.where(reject, np.nan, np.floor(x0) + dx)
+    y = np.where(reject, np.nan, np.floor(y0) + dy)
+    round = np.where(reject, np.nan, round)
+    return x, y, round
+
+
 def roundness(im):
     """
     from astropy.io import fits as pyfits
@@ -165,7 +165,7 @@ def rename_output_products(filter_obj, output_file_prefix=None):
 # --------------------------------------------------------------------------------------------------------------
 
 
-def create_drizzle_products(total_obj_list, custom_limits=None):
+def create_drizzle_products(total_obj_list, custom_limits=None, num_cores=None):
     """
     Run astrodrizzle to produce products specified in the total_obj_list.
 
@@ -180,6 +180,10 @@ def create_drizzle_products(total_obj_list, custom_limits=None):
         4-element list containing the mosaic bounding rectangle X min and max and Y min and max values for
         custom mosaics
 
+    num_cores : int, optional
+        Number of processes used for computing the footprints of the exposures.  All the cores of the machine
+        get used by default.
+
     RETURNS
     -------
     product_list: list
@@ -222,7 +226,7 @@ def create_drizzle_products(total_obj_list, custom_limits=None):
         log.info("~" * 118)
         # Get the common WCS for all images which are part of a total detection product,
         # where the total detection product is detector-dependent.
-        meta_wcs = filt_obj.generate_metawcs(custom_limits=custom_limits)
+        meta_wcs = filt_obj.generate_metawcs(custom_limits=custom_limits, num_cores=num_cores)
 
         log.info("CREATE DRIZZLE-COMBINED FILTER IMAGE: {}\n".format(filt_obj.drizzle_filename))
         filt_obj.wcs_drizzle_product(meta_wcs)
@@ -265,7 +269,7 @@ def create_drizzle_products(total_obj_list, custom_limits=None):
 def run_mvm_processing(input_filename, skip_gaia_alignment=True, diagnostic_mode=False,
                        use_defaults_configs=True, input_custom_pars_file=None, output_custom_pars_file=None,
                        phot_mode="both", custom_limits=None, output_file_prefix=None,
-                       log_level=logutil.logging.INFO):
+                       log_level=logutil.logging.INFO, num_cores=None):
 
     """Run the HST Advanced Products (HAP) generation code.  This routine is the sequencer or
     controller which invokes the high-level functionality to process the multi-visit data.
@@ -323,6 +327,10 @@ def run_mvm_processing(input_filename, skip_gaia_alignment=True, diagnostic_mode
         The desired level of verboseness in the log statements displayed on the screen and written to the
         .log file. Default value is 20, or 'info'.
 
+    num_cores : int, optional
+        Number of processes used for computing the footprints of the exposures.  All the cores of the machine
+        get used by default.
+
 
     RETURNS
     -------
@@ -374,10 +382,10 @@ def run_mvm_processing(input_filename, skip_gaia_alignment=True, diagnostic_mode
 
         # Update the SkyCellProduct objects with their associated configuration information.
         for filter_item in total_obj_list:
-            _ = filter_item.generate_metawcs(custom_limits=custom_limits)
+            _ = filter_item.generate_metawcs(custom_limits=custom_limits, num_cores=num_cores)
             # Compute mask keywords early in processing for use in determining what
             # parameters need to be used for processing.
-            filter_item.generate_footprint_mask(save_mask=False)
+            filter_item.generate_footprint_mask(save_mask=False, num_cores=num_cores)
             if not filter_item.valid_product:
                 log.warning(f"Ignoring {filter_item.info} as no input exposures overlap that layer.")
                 continue
@@ -409,13 +417,14 @@ def run_mvm_processing(input_filename, skip_gaia_alignment=True, diagnostic_mode
             reference_catalog = run_align_to_gaia(total_obj_list,
                                                   custom_limits=custom_limits,
                                                   log_level=log_level,
-                                                  diagnostic_mode=diagnostic_mode)
+                                                  diagnostic_mode=diagnostic_mode,
+                                                  num_cores=num_cores)
             if reference_catalog:
                 product_list += [reference_catalog]
 
         # Run AstroDrizzle to produce drizzle-combined products
         log.info("\n{}: Create drizzled imagery products.".format(str(datetime.datetime.now())))
-        driz_list = create_drizzle_products(total_obj_list, custom_limits=custom_limits)
+        driz_list = create_drizzle_products(total_obj_list, custom_limits=custom_limits, num_cores=num_cores)
         product_list += driz_list
 
         # Store total_obj_list to a pickle file to speed up development
@@ -537,7 +546,8 @@ def run_mvm_processing(input_filename, skip_gaia_alignment=True, diagnostic_mode
 
 # ------------------------------------------------------------------------------------------------------------
 
-def run_align_to_gaia(total_obj_list, custom_limits=None, log_level=logutil.logging.INFO, diagnostic_mode=False):
+def run_align_to_gaia(total_obj_list, custom_limits=None, log_level=logutil.logging.INFO, diagnostic_mode=False,
+                      num_cores=None):
     # Run align.py on all input images sorted by overlap with GAIA bandpass
     log.info("\n{}: Align all the filters to GAIA with the same fit".format(str(datetime.datetime.now())))
     gaia_obj = None
@@ -569,7 +579,7 @@ def run_align_to_gaia(total_obj_list, custom_limits=None, log_level=logutil.logg
                                                          fit_label='MVM')
 
     for tot_obj in total_obj_list:
-        _ = tot_obj.generate_metawcs(custom_limits=custom_limits)
+        _ = tot_obj.generate_metawcs(custom_limits=custom_limits, num_cores=num_cores)
     log.info("\n{}: Finished aligning gaia_obj to GAIA".format(str(datetime.datetime.now())))
 
     # Return the name of the alignment catalog
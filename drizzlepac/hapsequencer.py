@@ -47,6 +47,7 @@
 """
 import datetime
 import fnmatch
+import functools
 import logging
 import os
 import pickle
@@ -69,6 +70,7 @@ from drizzlepac.haputils import hla_flag_filter
 from drizzlepac.haputils import poller_utils
 from drizzlepac.haputils import product
 from drizzlepac.haputils import processing_utils as proc_utils
+from drizzlepac.haputils.product_scheduler import ProductScheduler
 from drizzlepac.haputils import svm_quality_analysis as svm_qa
 from drizzlepac.haputils.catalog_utils import HAPCatalogs
 from . import __version__
@@ -97,11 +99,15 @@ envvar_cat_svm = {"SVM_CATALOG_SBC": 'on',
                   "SVM_CATALOG_PC": 'on'}
 envvar_cat_str = "SVM_CATALOG_{}"
 
+# Attributes of the product objects which get set when creating the drizzled products, to be copied back
+# from the processes creating them.
+PRODUCT_STATE_ATTRIBUTES = ["meta_wcs", "mask", "mask_computed", "mask_kws", "mask_whtkws", "valid_product"]
+
 # --------------------------------------------------------------------------------------------------------------
 
 
 def create_catalog_products(total_obj_list, log_level, diagnostic_mode=False, phot_mode='both',
-                            catalog_switches=None):
+                            catalog_switches=None, num_cores=None, max_memory=None):
     """This subroutine utilizes haputils/catalog_utils module to produce photometric sourcelists for the specified
     total drizzle product and it's associated child filter products.
 
@@ -125,6 +131,12 @@ def create_catalog_products(total_obj_list, log_level, diagnostic_mode=False, ph
                        SVM_CATALOG_HRC, SVM_CATALOG_SBC, SVM_CATALOG_WFC, SVM_CATALOG_UVIS, SVM_CATALOG_IR, SVM_CATALOG_PC
 
                        These variables can be defined with values of 'on'/'off'/'yes'/'no'/'true'/'false'.
+    num_cores : int, optional
+                Maximum number of filter products measured at the same time.  All the cores of the machine get used
+                by default.
+    max_memory : float, optional
+                 Maximum total memory, in MB, estimated to be used by the filter products measured at the same time.
+                 By default, there is no limit.
 
     Returns
     -------
@@ -181,34 +193,28 @@ def create_catalog_products(total_obj_list, log_level, diagnostic_mode=False, ph
             n1_exposure_time = 0
 
             log.info("Generating filter product source catalogs")
+            # The filter products only read the sources of the total product, so they get measured at the same
+            # time in separate processes (which inherit these sources) and then get combined in their order.
+            measured = {}
+            scheduler = ProductScheduler(num_cores=num_cores, max_memory=max_memory)
+            for filter_product_obj in total_product_obj.fdp_list:
+                scheduler.add(filter_product_obj.drizzle_filename, _measure_filter_product,
+                              args=(filter_product_obj, total_product_obj, sources_dict, phot_mode, log_level,
+                                    diagnostic_mode),
+                              memory=_estimate_catalog_memory(filter_product_obj),
+                              on_done=functools.partial(_attach_total_sources, measured, sources_dict))
+            scheduler.run()
+
             for filter_product_obj in total_product_obj.fdp_list:
 
                 # Load a dictionary with the filter subset table for each catalog...
                 subset_columns_dict = {}
 
-                # Instantiate filter catalog product object
-                filter_product_catalogs = HAPCatalogs(filter_product_obj.drizzle_filename,
-                                                      total_product_obj.configobj_pars.get_pars('catalog generation'),
-                                                      total_product_obj.configobj_pars.get_pars('quality control'),
-                                                      total_product_obj.mask,
-                                                      log_level,
-                                                      types=phot_mode,
-                                                      diagnostic_mode=diagnostic_mode,
-                                                      tp_sources=sources_dict)
+                # Filter catalog product object, with its photometry and flags
+                filter_product_catalogs = measured[filter_product_obj.drizzle_filename]
 
                 flag_trim_value = filter_product_catalogs.param_dict['flag_trim_value']
 
-                # Perform photometry
-                # The measure method also copies a specified portion of the filter table into
-                # a filter "subset" table which will be combined with the total detection table.
-                filter_name = filter_product_obj.filters
-                filter_product_catalogs.measure(filter_name)
-                log.info("Flagging sources in filter product catalog")
-                filter_product_catalogs = run_sourcelist_flagging(filter_product_obj,
-                                                                  filter_product_catalogs,
-                                                                  log_level,
-                                                                  diagnostic_mode)
-
                 if total_product_obj.detector.upper() not in ['IR', 'SBC']:
                     # Apply cosmic-ray threshold criteria used by HLA to determine whether or not to reject
                     # the catalogs.
@@ -337,12 +343,110 @@ def create_catalog_products(total_obj_list, log_level, diagnostic_mode=False, ph
     return product_list
 
 
+def _measure_filter_product(filter_product_obj, total_product_obj, sources_dict, phot_mode, log_level,
+                            diagnostic_mode):
+    """Measure the sources identified in the total product in a filter product, then flag them.
+
+    Parameters
+    ----------
+    filter_product_obj : `~drizzlepac.haputils.product.FilterProduct`
+        Filter product to measure
+
+    total_product_obj : `~drizzlepac.haputils.product.TotalProduct`
+        Total product the filter product belongs to
+
+    sources_dict : dict
+        Sources of the total product for each type of catalog
+
+    phot_mode : str
+        Types of catalogs to generate ('aperture', 'segment' or 'both')
+
+    log_level : int
+        The desired level of verboseness in the log statements
+
+    diagnostic_mode : bool
+        Generate diagnostic files?
+
+    Returns
+    -------
+    result : tuple
+        Name of the filter product, its `~drizzlepac.haputils.catalog_utils.HAPCatalogs` object and the
+        attributes of the catalogs referring to the sources of the total product, which have been set to None
+        (see `_attach_total_sources`).
+    """
+    # Instantiate filter catalog product object
+    filter_product_catalogs = HAPCatalogs(filter_product_obj.drizzle_filename,
+                                          total_product_obj.configobj_pars.get_pars('catalog generation'),
+                                          total_product_obj.configobj_pars.get_pars('quality control'),
+                                          total_product_obj.mask,
+                                          log_level,
+                                          types=phot_mode,
+                                          diagnostic_mode=diagnostic_mode,
+                                          tp_sources=sources_dict)
+
+    # Perform photometry
+    # The measure method also copies a specified portion of the filter table into
+    # a filter "subset" table which will be combined with the total detection table.
+    filter_name = filter_product_obj.filters
+    filter_product_catalogs.measure(filter_name)
+    log.info("Flagging sources in filter product catalog")
+    filter_product_catalogs = run_sourcelist_flagging(filter_product_obj,
+                                                      filter_product_catalogs,
+                                                      log_level,
+                                                      diagnostic_mode)
+
+    # Leave the sources of the total product out of the catalogs so that they do not get copied back from
+    # the process measuring each filter product: (keys in sources_dict) of each of these objects
+    shared = {id(sources_dict): ()}
+    for cat_type, sources in sources_dict.items():
+        shared[id(sources)] = (cat_type,)
+        shared.update({id(value): (cat_type, key) for key, value in sources.items() if value is not None})
+
+    detached = []
+    objs = [filter_product_catalogs] + list(filter_product_catalogs.catalogs.values())
+    for k, obj in enumerate(objs):
+        attrs = [attr for attr, value in vars(obj).items() if id(value) in shared]
+        for attr in attrs:
+            detached.append((k, attr, shared[id(getattr(obj, attr))]))
+            setattr(obj, attr, None)
+    return filter_product_obj.drizzle_filename, filter_product_catalogs, detached
+
+
+def _attach_total_sources(measured, sources_dict, result):
+    """Store the catalogs returned by `_measure_filter_product` in ``measured``, under the name of their filter
+    product, after setting back their references to the sources of the total product.
+    """
+    name, filter_product_catalogs, detached = result
+    objs = [filter_product_catalogs] + list(filter_product_catalogs.catalogs.values())
+    for k, attr, keys in detached:
+        value = sources_dict
+        for key in keys:
+            value = value[key]
+        setattr(objs[k], attr, value)
+    measured[name] = filter_product_catalogs
+
+
+def _estimate_catalog_memory(filter_product_obj):
+    """Rough estimate, in bytes, of the memory used when measuring the sources of a filter product: 8 arrays of 8 bytes
+    per pixel of the drizzled image, for the SCI and WHT arrays, the background and its RMS, the footprint masks, the
+    convolved image, the segmentation image and the copies of the image used for the photometry.
+    """
+    filename = filter_product_obj.drizzle_filename
+    if not os.path.exists(filename):
+        return 0
+    header = fits.getheader(filename, ('SCI', 1))
+    return 8 * 8 * header['NAXIS1'] * header['NAXIS2']
+
 # ----------------------------------------------------------------------------------------------------------------------
 
-def create_drizzle_products(total_obj_list):
+def create_drizzle_products(total_obj_list, num_cores=None, max_memory=None):
     """
     Run astrodrizzle to produce products specified in the total_obj_list.
 
+    The drizzle-combined filter images get created first, since their cosmic-ray flagging is used by the
+    drizzled exposure images, then the drizzle-combined total detection images.  Products which do not depend
+    on each other, such as the filter images for different filters, get created at the same time.
+
     Parameters
     ----------
     total_obj_list : list
@@ -350,6 +454,14 @@ def create_drizzle_products(total_obj_list):
         a visit.  The TotalProduct objects are comprised of FilterProduct and ExposureProduct
         objects.
 
+    num_cores : int, optional
+        Maximum number of products created at the same time.  All the cores of the machine get used by
+        default.
+
+    max_memory : float, optional
+        Maximum total memory, in MB, estimated to be used by the products created at the same time.
+        By default, there is no limit.
+
     RETURNS
     -------
     product_list : list
@@ -376,6 +488,9 @@ def create_drizzle_products(total_obj_list):
     # For each detector (as the total detection product are instrument- and detector-specific),
     # create the drizzle-combined filtered image, the drizzled exposure (aka single) images,
     # and finally the drizzle-combined total detection image.
+    scheduler = ProductScheduler(num_cores=num_cores, max_memory=max_memory)
+    # Products created at the same time need their own static mask files
+    static_prefix = scheduler.num_cores > 1
     for total_obj in total_obj_list:
         # Need to have direct exposures to drizzle
         if total_obj.edp_list:
@@ -383,28 +498,36 @@ def create_drizzle_products(total_obj_list):
             # Get the common WCS for all images which are part of a total detection product,
             # where the total detection product is detector-dependent.
             meta_wcs = total_obj.generate_metawcs()
+            total_depends = []
 
             # Create drizzle-combined filter image as well as the single exposure drizzled image
             for filt_obj in total_obj.fdp_list:
-                log.info("~" * 118)
                 filt_obj.rules_file = proc_utils.get_rules_file(filt_obj.edp_list[0].full_filename,
                                                                 rules_root=filt_obj.drizzle_filename)
                 # add filter rules files to dict of all rules files for deletion later
                 rules_files[filt_obj.drizzle_filename] = filt_obj.rules_file
 
                 print(f"Filter RULES_FILE: {filt_obj.rules_file}")
-                log.info("CREATE DRIZZLE-COMBINED FILTER IMAGE: {}\n".format(filt_obj.drizzle_filename))
-                filt_obj.wcs_drizzle_product(meta_wcs)
+                filt_task = scheduler.add(filt_obj.drizzle_filename, _drizzle_product,
+                                          args=(filt_obj, meta_wcs, "CREATE DRIZZLE-COMBINED FILTER IMAGE",
+                                                static_prefix),
+                                          memory=_estimate_drizzle_memory(filt_obj, meta_wcs),
+                                          on_done=functools.partial(_update_product, filt_obj))
+                total_depends.append(filt_task)
                 product_list.append(filt_obj.drizzle_filename)
                 product_list.append(filt_obj.trl_filename)
 
-                # Create individual single drizzled images
+                # Create individual single drizzled images, using the cosmic rays flagged for the filter image
                 for exposure_obj in filt_obj.edp_list:
-                    log.info("~" * 118)
                     exposure_obj.rules_file = rules_files[exposure_obj.full_filename]
 
-                    log.info("CREATE SINGLE DRIZZLED IMAGE: {}".format(exposure_obj.drizzle_filename))
-                    exposure_obj.wcs_drizzle_product(meta_wcs)
+                    exposure_task = scheduler.add(exposure_obj.drizzle_filename, _drizzle_product,
+                                                  args=(exposure_obj, meta_wcs, "CREATE SINGLE DRIZZLED IMAGE",
+                                                        static_prefix),
+                                                  depends=[filt_task],
+                                                  memory=_estimate_drizzle_memory(exposure_obj, meta_wcs),
+                                                  on_done=functools.partial(_update_product, exposure_obj))
+                    total_depends.append(exposure_task)
                     product_list.append(exposure_obj.drizzle_filename)
                     product_list.append(exposure_obj.full_filename)
                     # product_list.append(exposure_obj.headerlet_filename)
@@ -412,17 +535,22 @@ def create_drizzle_products(total_obj_list):
 
             # Create drizzle-combined total detection image after the drizzle-combined filter image and
             # drizzled exposure images in order to take advantage of the cosmic ray flagging.
-            log.info("CREATE DRIZZLE-COMBINED TOTAL IMAGE: {}\n".format(total_obj.drizzle_filename))
             total_obj.rules_file = proc_utils.get_rules_file(total_obj.edp_list[0].full_filename,
                                                                 rules_root=total_obj.drizzle_filename)
             # add total rules files to dict of all rules files for deletion later
             rules_files[total_obj.drizzle_filename] = total_obj.rules_file
 
             print(f"Total product RULES_FILE: {total_obj.rules_file}")
-            total_obj.wcs_drizzle_product(meta_wcs)
+            scheduler.add(total_obj.drizzle_filename, _drizzle_product,
+                          args=(total_obj, meta_wcs, "CREATE DRIZZLE-COMBINED TOTAL IMAGE", static_prefix),
+                          depends=total_depends,
+                          memory=_estimate_drizzle_memory(total_obj, meta_wcs),
+                          on_done=functools.partial(_update_product, total_obj))
             product_list.append(total_obj.drizzle_filename)
             product_list.append(total_obj.trl_filename)
 
+    scheduler.run()
+
     # Ensure that all drizzled products have headers that are to specification
     try:
         log.info("Updating these drizzle products for CAOM compatibility:")
@@ -455,8 +583,61 @@ def create_drizzle_products(total_obj_list):
 # ----------------------------------------------------------------------------------------------------------------------
 
 
+def _drizzle_product(drizzle_product, meta_wcs, description, static_prefix=False):
+    """Create a drizzled product, returning the attributes of the product object set in the process.
+
+    Parameters
+    ----------
+    drizzle_product : TotalProduct, FilterProduct or ExposureProduct
+        Product to create
+
+    meta_wcs : HSTWCS
+        Common WCS of the products of the detector
+
+    description : str
+        Kind of product, for the log
+
+    static_prefix : bool, optional
+        Start the names of the static mask files with the rootname of the product, so that products created
+        at the same time do not use the same static mask files
+
+    Returns
+    -------
+    state : dict
+        Values of the attributes listed in ``PRODUCT_STATE_ATTRIBUTES``, so they can be set on the product object
+        of the calling process when the product gets created in another process.
+    """
+    log.info("~" * 118)
+    log.info("{}: {}\n".format(description, drizzle_product.drizzle_filename))
+    drizzle_product.wcs_drizzle_product(meta_wcs, static_prefix=static_prefix)
+    return {attr: getattr(drizzle_product, attr) for attr in PRODUCT_STATE_ATTRIBUTES
+            if hasattr(drizzle_product, attr)}
+
+
+def _update_product(drizzle_product, state):
+    """Set the attributes of a product object returned by `_drizzle_product`."""
+    for attr, value in state.items():
+        setattr(drizzle_product, attr, value)
+
+
+def _estimate_drizzle_memory(drizzle_product, meta_wcs):
+    """Rough estimate, in bytes, of the memory used when creating a drizzled product: the output SCI, WHT and
+    CTX arrays and one more array of the same size for each input exposure, plus the input exposures.
+    """
+    if hasattr(drizzle_product, "edp_list"):
+        filenames = [e.full_filename for e in drizzle_product.edp_list]
+    else:
+        filenames = [drizzle_product.full_filename]
+    input_size = sum(os.path.getsize(f) for f in filenames if os.path.exists(f))
+    output_size = 4 * int(np.prod(meta_wcs.pixel_shape))
+    return output_size * (3 + len(filenames)) + input_size
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
 def run_hap_processing(input_filename, diagnostic_mode=False, input_custom_pars_file=None,
-                       output_custom_pars_file=None, phot_mode="both", log_level=logutil.logging.INFO):
+                       output_custom_pars_file=None, phot_mode="both", log_level=logutil.logging.INFO,
+                       num_cores=None, max_memory=None):
     """
     Run the HST Advanced Products (HAP) generation code.  This routine is the sequencer or
     controller which invokes the high-level functionality to process the single visit data.
@@ -490,6 +671,14 @@ def run_hap_processing(input_filename, diagnostic_mode=False, input_custom_pars_
         The desired level of verboseness in the log statements displayed on the screen and written to the
         .log file. Default value is 20, or 'info'.
 
+    num_cores : int, optional
+        Maximum number of drizzled products created, or of filter products measured, at the same time.  All
+        the cores of the machine get used by default.
+
+    max_memory : float, optional
+        Maximum total memory, in MB, estimated to be used by the drizzled products created, or by the filter
+        products measured, at the same time.  By default, there is no limit.
+
 
     RETURNS
     -------
@@ -630,7 +819,7 @@ def run_hap_processing(input_filename, diagnostic_mode=False, input_custom_pars_
 
         # Run AstroDrizzle to produce drizzle-combined products
         log.info("\n{}: Create drizzled imagery products.".format(str(datetime.datetime.now())))
-        driz_list = create_drizzle_products(total_obj_list)
+        driz_list = create_drizzle_products(total_obj_list, num_cores=num_cores, max_memory=max_memory)
         product_list += driz_list
 
         # Create source catalogs from newly defined products (HLA-204)
@@ -639,7 +828,9 @@ def run_hap_processing(input_filename, diagnostic_mode=False, input_custom_pars_
             catalog_list = create_catalog_products(total_obj_list, log_level,
                                                    diagnostic_mode=diagnostic_mode,
                                                    phot_mode=phot_mode,
-                                                   catalog_switches=cat_switches)
+                                                   catalog_switches=cat_switches,
+                                                   num_cores=num_cores,
+                                                   max_memory=max_memory)
             product_list += catalog_list
         else:
             log.warning("No total detection product has been produced. The sourcelist generation step has been skipped")
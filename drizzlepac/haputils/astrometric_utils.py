@@ -12,6 +12,14 @@ reference catalog. ::
                                 obtain listing of astrometric sources,
                                 sky coordinates, and magnitudes.
 
+The sources retrieved from the web service can also be saved on disk, and
+used for any later query of the same area of the sky, by defining the
+directory to save them in with the environment variable::
+
+    ASTROMETRIC_CATALOG_CACHE  -- directory of the on-disk cache of the
+                                  astrometric catalogs, as described in
+                                  `~drizzlepac.haputils.catalog_cache`.
+
 """
 import os
 from io import BytesIO
@@ -77,6 +85,7 @@ from stsci.tools.bitmask import bitfield_to_boolean_mask
 import stsci.tools
 
 from ..tweakutils import build_xy_zeropoint, ndfind
+from . import catalog_cache
 
 __taskname__ = 'astrometric_utils'
 
@@ -97,7 +106,7 @@ MODULE_PATH = os.path.dirname(inspect.getfile(inspect.currentframe()))
 
 __all__ = ['create_astrometric_catalog', 'compute_radius',
            'build_auto_kernel', 'find_fwhm',
-           'get_catalog', 'get_catalog_from_footprint',
+           'get_catalog', 'get_catalog_from_footprint', 'seed_catalog_cache',
            'extract_sources', 'find_hist2d_offset', 'generate_source_catalog',
            'classify_sources', 'within_footprint',
            'compute_similarity', 'determine_focus_index', 'max_overlap_diff']
@@ -246,7 +255,9 @@ def create_astrometric_catalog(inputs, catalog="GAIAedr3", output="ref_cat.ecsv"
     Notes
     -----
     This function will point to astrometric catalog web service defined
-    through the use of the ASTROMETRIC_CATALOG_URL environment variable.
+    through the use of the ASTROMETRIC_CATALOG_URL environment variable,
+    and use the on-disk cache of the catalogs defined through the use of
+    the ASTROMETRIC_CATALOG_CACHE environment variable, if any.
 
     Returns
     -------
@@ -441,7 +452,27 @@ def get_catalog(ra, dec, sr=0.1, epoch=None, catalog='GSC241'):
     csv : CSV object
         CSV object of returned sources with all columns as provided by catalog
 
+    Notes
+    -----
+    When the ``ASTROMETRIC_CATALOG_CACHE`` environment variable is defined,
+    the sources get taken from the on-disk cache of the catalog, only
+    querying the web service for the parts of the sky not in the cache yet.
+
     """
+    cache = catalog_cache.get_catalog_cache()
+    if cache is not None and catalog.upper() in SUPPORTED_CATALOGS:
+        cat_dict = SUPPORTED_CATALOGS[catalog.upper()]
+        try:
+            return cache.cone_search(ra, dec, sr, _query_catalog, catalog, epoch=epoch,
+                                     ra_col=cat_dict['RA'], dec_col=cat_dict['DEC'])
+        except ValueError as err:
+            log.warning("{} - querying catalog service directly.".format(err))
+
+    return _query_catalog(ra, dec, sr=sr, epoch=epoch, catalog=catalog)
+
+
+def _query_catalog(ra, dec, sr=0.1, epoch=None, catalog='GSC241'):
+    """ Query the VO web service for the sources of a cone-search."""
     serviceType = 'vo/CatalogSearch.aspx'
     spec_str = 'RA={}&DEC={}&SR={}&FORMAT={}&CAT={}&MINDET=5'
     headers = {'Content-Type': 'text/csv'}
@@ -458,8 +489,10 @@ def get_catalog(ra, dec, sr=0.1, epoch=None, catalog='GSC241'):
     rstr = r_contents.split('\r\n')
     # remove initial line describing the number of sources returned
     # CRITICAL to proper interpretation of CSV data
+    query_epoch = epoch
     if rstr[0].startswith('Error'):
         # Try again without EPOCH
+        query_epoch = None
         serviceUrl = '{}/{}?{}'.format(SERVICELOCATION, serviceType, base_spec)
         log.warning(f"Problem accessing catalog service - getting catalog using: \n    {serviceUrl}")
         rawcat = requests.get(serviceUrl, headers=headers)
@@ -480,6 +513,9 @@ def get_catalog(ra, dec, sr=0.1, epoch=None, catalog='GSC241'):
 
     del rstr[0]
     r_csv = Table.read(rstr, format='ascii.csv')
+    # epoch of the positions actually returned, so that the catalog cache
+    # never saves positions at the catalog epoch as those at another epoch
+    r_csv.meta['query_epoch'] = query_epoch
     return r_csv
 
 
@@ -508,7 +544,22 @@ def get_catalog_from_footprint(footprint, epoch=None, catalog='GSC241'):
     csv : CSV object
         CSV object of returned sources with all columns as provided by catalog
 
+    Notes
+    -----
+    When the ``ASTROMETRIC_CATALOG_CACHE`` environment variable is defined,
+    the sources get taken from the on-disk cache of the catalog, only
+    querying the web service for the parts of the sky not in the cache yet.
+
     """
+    cache = catalog_cache.get_catalog_cache()
+    if cache is not None and catalog.upper() in SUPPORTED_CATALOGS:
+        cat_dict = SUPPORTED_CATALOGS[catalog.upper()]
+        try:
+            return cache.footprint_search(footprint, _query_catalog, catalog, epoch=epoch,
+                                          ra_col=cat_dict['RA'], dec_col=cat_dict['DEC'])
+        except ValueError as err:
+            log.warning("{} - querying catalog service directly.".format(err))
+
     serviceType = 'vo/CatalogSearch.aspx'
     spec_str = 'STCS=polygon{}&FORMAT={}&CAT={}&MINDET=5'
     headers = {'Content-Type': 'text/csv'}
@@ -557,6 +608,57 @@ def get_catalog_from_footprint(footprint, epoch=None, catalog='GSC241'):
     return r_csv
 
 
+def seed_catalog_cache(filename, catalog, epoch=None, ra=None, dec=None, radius=None, cache_dir=None):
+    """ Save the sources of a local catalog file in the on-disk catalog cache.
+
+    This allows `get_catalog` and `get_catalog_from_footprint` to work
+    without any access to the web service for the fields covered by the file.
+
+    Parameters
+    ----------
+    filename : str
+        Catalog file, with the columns returned by the web service (such as
+        the table returned by `get_catalog` written out as an ECSV file).
+
+    catalog : str
+        Name of the catalog, as defined by the web-service.
+
+    epoch : float, optional
+        Epoch of the positions in the file, as given to `get_catalog`.
+
+    ra, dec, radius : float, optional
+        Cone (in decimal degrees) containing all the sources of the catalog
+        for the field, such as those used to get the file with `get_catalog`.
+        Only the parts of the sky entirely within it get saved.  If not
+        specified, the file is assumed to contain all the sources of the
+        cache tiles it overlaps.
+
+    cache_dir : str, optional
+        Directory of the cache.  Default: the directory given by the
+        ASTROMETRIC_CATALOG_CACHE environment variable.
+
+    Returns
+    -------
+    tiles : dict
+        Tiles of the cache which got saved, for each tile size.
+
+    """
+    cache = catalog_cache.CatalogCache(cache_dir) if cache_dir else catalog_cache.get_catalog_cache()
+    if cache is None:
+        raise ValueError("No catalog cache directory given or defined with {}".format(
+                         catalog_cache.CATALOG_CACHE_ENVVAR))
+    if catalog.upper() not in SUPPORTED_CATALOGS:
+        raise ValueError("Catalog {} is not supported by the catalog cache".format(catalog))
+    cat_dict = SUPPORTED_CATALOGS[catalog.upper()]
+
+    table = Table.read(filename)
+    if cat_dict['RA'] not in table.colnames or cat_dict['DEC'] not in table.colnames:
+        raise ValueError("Catalog file {} does not have the columns returned by the web service".format(
+                         filename))
+    return cache.seed(table, catalog, epoch=epoch, ra=ra, dec=dec, radius=radius,
+                      ra_col=cat_dict['RA'], dec_col=cat_dict['DEC'])
+
+
 def compute_radius(wcs):
     """Compute the radius from the center to the furthest edge of the WCS.
 
@@ -0,0 +1,362 @@
+"""On-disk cache of the astrometric reference catalogs retrieved from the catalog web service.
+
+The sky gets divided into tiles of (roughly) equal area: declination bands ``tile_size`` degrees high, each
+split into as many tiles in RA as needed for them to be about ``tile_size`` degrees wide.  The sources of
+each tile get retrieved from the web service the first time a query overlaps that tile, then saved as an
+ECSV file for the catalog and epoch requested::
+
+    <cache directory>/<catalog>/epoch_<epoch>/tiles_<tile_size>/tile_<band>_<tile>.ecsv
+
+Each query uses the largest of the `TILE_SIZES` no larger than its radius, so that the tiles retrieved
+for it cover only a few times the area requested, whatever the size of the field.
+
+Any later query of the same catalog at the same epoch (reprocessing the same field, or processing
+neighboring visits) gets answered from the saved tiles, only retrieving from the service the tiles which
+have not been saved yet.  The cache can also be seeded from a catalog file for processing without any
+access to the service.
+
+The cache gets used by `~drizzlepac.haputils.astrometric_utils.get_catalog` and
+`~drizzlepac.haputils.astrometric_utils.get_catalog_from_footprint` (and so by all the alignment code)
+once the directory to use has been defined with the environment variable::
+
+    ASTROMETRIC_CATALOG_CACHE  -- directory where the retrieved catalog tiles get saved
+
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from astropy.table import Table, vstack
+
+from stsci.tools import logutil
+
+__taskname__ = 'catalog_cache'
+
+log = logutil.create_logger(__name__, level=logutil.logging.NOTSET, stream=sys.stdout)
+
+CATALOG_CACHE_ENVVAR = "ASTROMETRIC_CATALOG_CACHE"
+
+# Heights of the declination bands, and approximate widths of the tiles, in degrees, of the tilings
+# the queries choose from
+TILE_SIZES = (0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def get_catalog_cache():
+    """Return the cache defined by the ``ASTROMETRIC_CATALOG_CACHE`` environment variable, if any."""
+    cache_dir = os.environ.get(CATALOG_CACHE_ENVVAR, '').strip()
+    return CatalogCache(cache_dir) if cache_dir else None
+
+
+class SkyTiles:
+    """Division of the sky into tiles of (roughly) equal area.
+
+    Parameters
+    ----------
+    tile_size : float
+        Height of the declination bands, in degrees.  It has to divide 180.
+    """
+    def __init__(self, tile_size):
+        nbands = 180. / tile_size if tile_size > 0 else 0.
+        if nbands < 1 or abs(nbands - round(nbands)) > 1e-6:
+            raise ValueError("Tile size {} does not divide 180 degrees".format(tile_size))
+        self.tile_size = tile_size
+        self.nbands = int(round(nbands))
+        self._ntiles = np.array([self._band_tiles(band) for band in range(self.nbands)])
+
+    def _band_tiles(self, band):
+        """Number of tiles in a declination band."""
+        center = np.deg2rad(-90. + (band + 0.5) * self.tile_size)
+        return max(1, int(round(360. * np.cos(center) / self.tile_size)))
+
+    def _bands(self, dec):
+        return np.clip(np.floor((np.asarray(dec, dtype=np.float64) + 90.) / self.tile_size).astype(int),
+                       0, self.nbands - 1)
+
+    def tile_bounds(self, tile):
+        """RA and Dec limits, in degrees, of a tile given as ``(band, index)``."""
+        band, index = tile
+        width = 360. / self._band_tiles(band)
+        dec_min = -90. + band * self.tile_size
+        return index * width, (index + 1) * width, dec_min, dec_min + self.tile_size
+
+    def tiles_of(self, ra, dec):
+        """Tile containing each position, as an [N,2] array of band numbers and tile indices."""
+        bands = self._bands(dec)
+        ntiles = self._ntiles[bands]
+        index = np.floor(np.mod(ra, 360.) / (360. / ntiles)).astype(int) % ntiles
+        return np.column_stack([bands, index])
+
+    def cone_tiles(self, ra, dec, radius):
+        """All the tiles overlapping a cone, in degrees, as a list of ``(band, index)`` tuples."""
+        tiles = []
+        contains_pole = dec + radius >= 90. or dec - radius <= -90.
+        # half-width in RA of the cone, unless it contains a pole
+        sin_dra = 1. if contains_pole else np.sin(np.deg2rad(radius)) / np.cos(np.deg2rad(dec))
+        first_band = int(self._bands(max(dec - radius, -90.)))
+        last_band = int(self._bands(min(dec + radius, 90.)))
+        for band in range(first_band, last_band + 1):
+            ntiles = self._ntiles[band]
+            if sin_dra >= 1:
+                tiles.extend((band, index) for index in range(ntiles))
+                continue
+            dra = np.rad2deg(np.arcsin(sin_dra))
+            width = 360. / ntiles
+            first, last = int(np.floor((ra - dra) / width)), int(np.floor((ra + dra) / width))
+            if last - first + 1 >= ntiles:
+                tiles.extend((band, index) for index in range(ntiles))
+            else:
+                tiles.extend((band, index % ntiles) for index in range(first, last + 1))
+        return tiles
+
+    def _tile_cone(self, tile):
+        """Center and radius of a cone (slightly) larger than a tile."""
+        ra_min, ra_max, dec_min, dec_max = self.tile_bounds(tile)
+        if dec_min <= -90. or dec_max >= 90.:
+            pole = 90. if dec_max >= 90. else -90.
+            return 0., pole, self.tile_size * 1.001
+        ra_c, dec_c = (ra_min + ra_max) / 2., (dec_min + dec_max) / 2.
+        ra_b = np.array([ra_min, ra_max, ra_min, ra_max, ra_c, ra_c])
+        dec_b = np.array([dec_min, dec_min, dec_max, dec_max, dec_min, dec_max])
+        return ra_c, dec_c, angular_separation(ra_c, dec_c, ra_b, dec_b).max() * 1.001
+
+
+class CatalogCache:
+    """Astrometric catalogs saved on disk as tiles of the sky, for each catalog and epoch.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory where the tiles get saved.  It gets created when needed.
+
+    tile_size : float, optional
+        Size of the tiles, in degrees, to use for all the queries.  It has to divide 180.  By default,
+        each query uses the largest of the `TILE_SIZES` no larger than its radius.
+    """
+    def __init__(self, cache_dir, tile_size=None):
+        self.cache_dir = cache_dir
+        sizes = TILE_SIZES if tile_size is None else (tile_size,)
+        self.tilings = [SkyTiles(size) for size in sorted(sizes)]
+
+    def tiling(self, radius):
+        """Tiling to use for a query of the sources within ``radius`` degrees."""
+        smaller = [tiling for tiling in self.tilings if tiling.tile_size <= radius]
+        return smaller[-1] if smaller else self.tilings[0]
+
+    # ------------------------------------------------------------------------------------------------------
+    # Files
+    def tile_filename(self, tiling, catalog, epoch, tile):
+        """Name of the file where a tile of a catalog gets saved."""
+        epoch_str = '{:.3f}'.format(epoch) if epoch else 'none'
+        return os.path.join(self.cache_dir, catalog.upper(), 'epoch_{}'.format(epoch_str),
+                            'tiles_{:g}'.format(tiling.tile_size), 'tile_{:04d}_{:05d}.ecsv'.format(*tile))
+
+    def _write_tile(self, table, filename):
+        # Write to a temporary file first, so that concurrent processes never read a partial tile
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(suffix='.ecsv', dir=os.path.dirname(filename))
+        os.close(fd)
+        try:
+            table.write(tmpname, format='ascii.ecsv', overwrite=True)
+            os.replace(tmpname, filename)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+    def _in_tile(self, tiling, table, tile, ra_col, dec_col):
+        ra = np.asarray(table[ra_col], dtype=np.float64)
+        dec = np.asarray(table[dec_col], dtype=np.float64)
+        return np.all(tiling.tiles_of(ra, dec) == tile, axis=1)
+
+    def get_tiles(self, tiling, tiles, fetch, catalog, epoch=None, ra_col='ra', dec_col='dec'):
+        """Sources of all the given tiles, retrieving and saving those which are not in the cache yet.
+
+        Parameters
+        ----------
+        tiling : `SkyTiles`
+            Tiling the tiles belong to.
+
+        tiles : list of tuple
+            Tiles, as ``(band, index)``, to get the sources of.
+
+        fetch : callable
+            Function called as ``fetch(ra, dec, radius, epoch=epoch, catalog=catalog)`` to retrieve the
+            sources within a cone (in degrees) from the web service.  When the service could not give
+            the positions at ``epoch``, the returned table has to set ``meta['query_epoch']`` to the
+            epoch of the positions it has (None for the catalog epoch), and the tile gets saved for
+            that epoch instead.
+
+        catalog : str
+            Name of the catalog.
+
+        epoch : float, optional
+            Epoch of the positions of the sources.
+
+        ra_col, dec_col : str, optional
+            Names of the columns with the positions of the sources, in the tables returned by ``fetch``.
+
+        Returns
+        -------
+        table : `~astropy.table.Table`
+            The sources of all the tiles.
+
+        Raises
+        ------
+        ValueError
+            The sources of a tile could not be retrieved from the service.
+        """
+        tables = []
+        for tile in tiles:
+            filename = self.tile_filename(tiling, catalog, epoch, tile)
+            if os.path.exists(filename):
+                tables.append(Table.read(filename, format='ascii.ecsv'))
+                continue
+            ra, dec, radius = tiling._tile_cone(tile)
+            log.info("Catalog {} tile {} not in cache {}".format(catalog, tile, self.cache_dir))
+            table = fetch(ra, dec, radius, epoch=epoch, catalog=catalog)
+            if ra_col not in table.colnames or dec_col not in table.colnames:
+                raise ValueError("Could not get the sources of catalog {} tile {}".format(catalog, tile))
+            table = table[self._in_tile(tiling, table, tile, ra_col, dec_col)]
+            query_epoch = table.meta.pop('query_epoch', epoch)
+            if query_epoch != epoch:
+                # positions not at the requested epoch must never be taken from the cache for it
+                log.warning("Catalog {} tile {} saved for epoch {} instead of {}".format(
+                            catalog, tile, query_epoch, epoch))
+                filename = self.tile_filename(tiling, catalog, query_epoch, tile)
+            self._write_tile(table, filename)
+            tables.append(table)
+
+        # Tiles without any source may not have the same column types as the others
+        nonempty = [t for t in tables if len(t) > 0]
+        if not nonempty:
+            return tables[0] if tables else Table()
+        return vstack(nonempty, join_type='exact', metadata_conflicts='silent')
+
+    # ------------------------------------------------------------------------------------------------------
+    # Queries
+    def cone_search(self, ra, dec, radius, fetch, catalog, epoch=None, ra_col='ra', dec_col='dec'):
+        """Sources within ``radius`` degrees of a position.
+
+        See `get_tiles` for the description of the other parameters.
+        """
+        tiling = self.tiling(radius)
+        table = self.get_tiles(tiling, tiling.cone_tiles(ra, dec, radius), fetch, catalog, epoch=epoch,
+                               ra_col=ra_col, dec_col=dec_col)
+        if len(table) == 0:
+            return table
+        sep = angular_separation(ra, dec, np.asarray(table[ra_col], dtype=np.float64),
+                                 np.asarray(table[dec_col], dtype=np.float64))
+        return table[sep <= radius]
+
+    def footprint_search(self, footprint, fetch, catalog, epoch=None, ra_col='ra', dec_col='dec'):
+        """Sources within a footprint polygon, given as an [N,2] array of RA and Dec, in degrees.
+
+        See `get_tiles` for the description of the other parameters.
+        """
+        footprint = np.asarray(footprint, dtype=np.float64)
+        # cone around the polygon, centered on the average of its vertices
+        xyz = _radec_to_xyz(footprint[:, 0], footprint[:, 1]).mean(axis=0)
+        ra_c = np.rad2deg(np.arctan2(xyz[1], xyz[0])) % 360.
+        dec_c = np.rad2deg(np.arctan2(xyz[2], np.hypot(xyz[0], xyz[1])))
+        radius = angular_separation(ra_c, dec_c, footprint[:, 0], footprint[:, 1]).max()
+
+        tiling = self.tiling(radius)
+        table = self.get_tiles(tiling, tiling.cone_tiles(ra_c, dec_c, radius), fetch, catalog, epoch=epoch,
+                               ra_col=ra_col, dec_col=dec_col)
+        if len(table) == 0:
+            return table
+        return table[in_polygon(footprint, ra_c, dec_c, np.asarray(table[ra_col], dtype=np.float64),
+                                np.asarray(table[dec_col], dtype=np.float64))]
+
+    def seed(self, table, catalog, epoch=None, ra=None, dec=None, radius=None, ra_col='ra', dec_col='dec'):
+        """Save the sources of a catalog table in the cache, for each of its tilings.
+
+        Parameters
+        ----------
+        table : `~astropy.table.Table`
+            Sources, with the columns of the tables returned by the catalog web service.
+
+        catalog : str
+            Name of the catalog.
+
+        epoch : float, optional
+            Epoch of the positions of the sources, as would have been requested from the service.
+
+        ra, dec, radius : float, optional
+            Cone, in degrees, containing all the sources of the catalog for this field.  Only the tiles
+            entirely within it get saved.  When not specified, all the tiles with sources get saved,
+            which assumes the table contains all the sources of these tiles.
+
+        ra_col, dec_col : str, optional
+            Names of the columns with the positions of the sources.
+
+        Returns
+        -------
+        tiles : dict
+            Tiles, as ``(band, index)``, which got saved, for each tile size.
+        """
+        saved = {}
+        for tiling in self.tilings:
+            src_tiles = tiling.tiles_of(np.asarray(table[ra_col], dtype=np.float64),
+                                        np.asarray(table[dec_col], dtype=np.float64))
+            if radius is None:
+                tiles = sorted(set(map(tuple, src_tiles)))
+            else:
+                tiles = []
+                for tile in tiling.cone_tiles(ra, dec, radius):
+                    ra_min, ra_max, dec_min, dec_max = tiling.tile_bounds(tile)
+                    ra_b = np.array([ra_min, ra_max, ra_min, ra_max, (ra_min + ra_max) / 2., (ra_min + ra_max) / 2.])
+                    dec_b = np.array([dec_min, dec_min, dec_max, dec_max, dec_min, dec_max])
+                    if np.all(angular_separation(ra, dec, ra_b, dec_b) <= radius):
+                        tiles.append(tile)
+
+            for tile in tiles:
+                self._write_tile(table[np.all(src_tiles == tile, axis=1)],
+                                 self.tile_filename(tiling, catalog, epoch, tile))
+            log.info("Saved {} tiles of {} degrees of catalog {} in cache {}".format(
+                     len(tiles), tiling.tile_size, catalog, self.cache_dir))
+            saved[tiling.tile_size] = tiles
+        return saved
+
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    """Angular separation, in degrees, between positions given in degrees."""
+    ra1, dec1, ra2, dec2 = map(np.deg2rad, (ra1, dec1, ra2, dec2))
+    sin_ddec = np.sin((dec2 - dec1) / 2.)
+    sin_dra = np.sin((ra2 - ra1) / 2.)
+    hav = sin_ddec**2 + np.cos(dec1) * np.cos(dec2) * sin_dra**2
+    return np.rad2deg(2. * np.arcsin(np.sqrt(np.clip(hav, 0., 1.))))
+
+
+def _radec_to_xyz(ra, dec):
+    ra, dec = np.deg2rad(ra), np.deg2rad(dec)
+    return np.column_stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)])
+
+
+def in_polygon(footprint, ra_c, dec_c, ra, dec):
+    """Whether positions are inside a polygon of the sky with great circle edges.
+
+    The polygon and the positions get projected onto the plane tangent to the sky at ``(ra_c, dec_c)``,
+    where the edges of the polygon become straight lines.
+    """
+    def project(xyz):
+        center = _radec_to_xyz(ra_c, dec_c)[0]
+        east = np.array([-np.sin(np.deg2rad(ra_c)), np.cos(np.deg2rad(ra_c)), 0.])
+        north = np.cross(center, east)
+        depth = xyz @ center
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (xyz @ east) / depth, (xyz @ north) / depth, depth
+
+    px, py, _ = project(_radec_to_xyz(footprint[:, 0], footprint[:, 1]))
+    x, y, depth = project(_radec_to_xyz(ra, dec))
+
+    # even-odd rule, counting the edges crossed by a ray going from each position towards +x
+    inside = np.zeros(len(x), dtype=bool)
+    for x1, y1, x2, y2 in zip(px, py, np.roll(px, -1), np.roll(py, -1)):
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xcross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < xcross)
+    # positions in the opposite hemisphere also get projected onto the plane
+    return inside & (depth > 0)
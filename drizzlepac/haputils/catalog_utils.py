@@ -56,6 +56,11 @@ log = logutil.create_logger(__name__, level=logutil.logging.NOTSET, stream=sys.s
 
 
 class CatalogImage:
+    # Attributes holding arrays the size of the image, which are no longer needed to write the catalogs once
+    # the sources have been measured
+    image_arrays = ['data', 'wht_image', 'num_images_mask', 'footprint_mask', 'inv_footprint_mask',
+                    'bkg_background_ra', 'bkg_rms_ra']
+
     def __init__(self, filename, num_images_mask, log_level):
         # set logging level to user-specified level
         log.setLevel(log_level)
@@ -107,6 +112,15 @@ class CatalogImage:
         self.kernel_fwhm = None
         self.kernel_psf = False
 
+    def __getstate__(self):
+        # The image is sent back from the process measuring a filter product once it has been closed, only
+        # for its header keywords to annotate the catalogs: an open FITS file cannot be pickled, and copying
+        # back the arrays of the image would only use memory.
+        state = self.__dict__.copy()
+        state['imghdu'] = None
+        state.update(dict.fromkeys(self.image_arrays))
+        return state
+
     def close(self):
         self.imghdu.close()
         self.bkg_background_ra = None
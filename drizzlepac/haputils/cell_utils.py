@@ -21,6 +21,7 @@ from PIL import Image, ImageDraw
 from stwcs.wcsutil import HSTWCS
 from stsci.tools import logutil
 
+from .. import util
 from .. import wcs_functions
 
 
@@ -37,6 +38,9 @@ SKYCELL_OVERLAP = 256
 
 SUPPORTED_SCALES = {'fine': 0.04, 'coarse': 0.12}  # arcseconds/pixel
 
+# Spacing, in pixels, of the positions along the edges of the chips used to build SkyFootprint masks
+EDGE_STEP = 32
+
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
 
 def get_sky_cells(visit_input, input_path=None, scale=None, cell_size=None, diagnostic_mode=False):
@@ -273,7 +277,7 @@ class SkyFootprint(object):
         self.edges_dec = None
         self.polygon = None
 
-    def build(self, expnames, scale=False, scale_kw='EXPTIME'):
+    def build(self, expnames, scale=False, scale_kw='EXPTIME', num_cores=1):
         """ Create mask showing where all input exposures overlap the SkyFootprint's WCS
 
         Notes
@@ -282,6 +286,10 @@ class SkyFootprint(object):
           - total_mask : shows number of chips per pixel
           - scaled_mask : if computed, shows (by default) exposure time per pixel
 
+        Only the headers of the input exposures get read.  The edges of each chip
+        get sampled every ``EDGE_STEP`` pixels, then the polygon they define on the
+        SkyFootprint's WCS gets filled directly in the masks.
+
         Parameters
         -----------
         expnames : list
@@ -294,41 +302,43 @@ class SkyFootprint(object):
             If ``scale`` is ``True``, get the scaling value from this keyword.  This keyword is assumed to be
             in the PRIMARY header.
 
+        num_cores : int, optional
+            Number of processes used for computing the chip polygons of the
+            exposures at the same time.  They get computed serially by default,
+            as this may already run in one of several processes; None uses all
+            the cores of the machine.
+
         """
         if scale:
             # Only assign memory for this array if requested.
             self.scaled_mask = np.zeros(self.meta_wcs.array_shape, dtype=np.float32)
 
+        pool_size = util.get_pool_size(num_cores, len(expnames))
+        if pool_size > 1:
+            with util.worker_pool(num_cores=pool_size) as pool:
+                results = pool.manager().dict({})
+                pool.run(_store_chip_polygons,
+                         [(exposure, self.meta_wcs, scale_kw, results) for exposure in expnames],
+                         pool_size, name='SkyFootprint.build()')
+                chip_polygons = dict(results)
+        else:
+            chip_polygons = None
+
         for exposure in expnames:
+            if chip_polygons is None:
+                scale_val, chips = get_chip_polygons(exposure, self.meta_wcs, scale_kw)
+            else:
+                scale_val, chips = chip_polygons[exposure]
             self.exp_masks[exposure] = {'sky_corners': [], 'xy_corners': [], 'mask': {}}
-            exp = fits.open(exposure)
-
-            scale_val = exp[0].header[scale_kw]
-
-            sci_extns = wcs_functions.get_extns(exp)
-            if len(sci_extns) == 0 and '_single' in exposure:
-                sci_extns = [0]
-
-            for sci in sci_extns:
-                wcs = HSTWCS(exp, ext=sci)
 
+            for sci, radec, xycorners, poly_x, poly_y in chips:
                 # save the footprint for each chip as RA/Dec corner positions
-                # radec = wcs.calc_footprint().tolist()
-                radec = calc_wcs_footprint(wcs, offset=1).tolist()
-                radec.append(radec[0])  # close the polygon/chip
                 self.exp_masks[exposure]['sky_corners'].append(radec)
-
                 # Also save those corner positions as X,Y positions in the footprint
-                xycorners = self.meta_wcs.all_world2pix(radec, 0).astype(np.int32).tolist()
                 self.exp_masks[exposure]['xy_corners'].append(xycorners)
 
-                # Now compute RA/Dec of all pixels along each edge
-                edges_x = [0] * wcs.naxis2 + [wcs.naxis1 - 1] * wcs.naxis2 + list(range(wcs.naxis1)) * 2
-                edges_y = list(range(wcs.naxis2)) * 2 + [0] * wcs.naxis1 + [wcs.naxis2 - 1] * wcs.naxis1
-                sky_edges = wcs.pixel_to_world_values(edges_x, edges_y)
-                meta_x, meta_y = self.meta_wcs.world_to_pixel_values(sky_edges[0], sky_edges[1])
-                meta_x = meta_x.astype(np.int32)
-                meta_y = meta_y.astype(np.int32)
+                meta_x = poly_x.astype(np.int32)
+                meta_y = poly_y.astype(np.int32)
 
                 # check to see whether or not this image falls within meta_wcs at all...
                 off_x = (meta_x.max() <= 0) or meta_x.min() > (self.meta_wcs.array_shape[1] - 1)
@@ -349,18 +359,13 @@ class SkyFootprint(object):
                 meta_x -= scell_ltm[0]
                 meta_y -= scell_ltm[1]
 
-                # apply meta_edges to blank mask
-                # Use PIL to create mask
-                # parray = np.array(meta_edges.T)
-                parray = (meta_x, meta_y)
-                polygon = list(zip(parray[0], parray[1]))
-                nx = self.total_mask[tuple(scell_slice)].shape[1]
-                ny = self.total_mask[tuple(scell_slice)].shape[0]
+                polygon = list(zip(meta_x.tolist(), meta_y.tolist()))
+                nx = scell_slice[1].stop - scell_slice[1].start
+                ny = scell_slice[0].stop - scell_slice[0].start
                 if nx == 0 or ny == 0:
                     continue
-                img = Image.new('L', (nx, ny), 0)
-                ImageDraw.Draw(img).polygon(polygon, outline=1, fill=1)
-                blank = np.array(img).astype(np.int16)
+                # the polygon extending beyond the SkyCell gets clipped by the filling itself
+                spans = polygon_spans(poly_x - scell_ltm[0], poly_y - scell_ltm[1], (ny, nx))
 
                 # Remember information needed to recreate the mask for this chip
                 sci_dict = {}
@@ -369,19 +374,12 @@ class SkyFootprint(object):
                 sci_dict['scale_val'] = scale_val
                 sci_dict['polygon'] = polygon
                 sci_dict['img_shape'] = (nx, ny)
+                sci_dict['spans'] = spans
                 self.exp_masks[exposure]['mask'][sci] = sci_dict
 
                 if scale:
-                    scaled_blank = blank * scale_val
-                    self.scaled_mask[tuple(scell_slice)] += scaled_blank
-                    del scaled_blank
-
-                self.total_mask[tuple(scell_slice)] += blank
-                del blank
-
-            # clean up any open fits handles
-            exp.close()
-            del exp
+                    fill_spans(self.scaled_mask[scell_slice], spans, scale_val)
+                fill_spans(self.total_mask[scell_slice], spans, 1)
 
             # Only add members which contributed to this footprint
             if exposure not in self.members:
@@ -482,10 +480,7 @@ class SkyFootprint(object):
             mask = np.zeros(self.meta_wcs.array_shape, dtype=np.int16)
 
             for sci in exp_mask.values():
-                img = Image.new('L', sci['img_shape'], 0)
-                ImageDraw.Draw(img).polygon(sci['polygon'], outline=1, fill=1)
-                blank = np.array(img).astype(np.int16)
-                mask[sci['scell_slice']] += blank
+                fill_spans(mask[sci['scell_slice']], sci['spans'], 1)
 
         self.footprint = np.clip(mask, 0, 1)
         self.footprint_member = member
@@ -1249,6 +1244,137 @@ def calc_wcs_footprint(wcs, offset=1, sample=4):
 
     return new_sky
 
+def get_chip_polygons(exposure, meta_wcs, scale_kw='EXPTIME', step=None):
+    """Compute the polygon of each chip of an exposure on the pixel grid of ``meta_wcs``.
+
+    Only the headers (and distortion tables) of the exposure get read.
+
+    Parameters
+    ----------
+    exposure : str
+        Filename of the exposure
+
+    meta_wcs : `stwcs.wcsutil.HSTWCS`
+        WCS of the footprint
+
+    scale_kw : str, optional
+        Keyword from the PRIMARY header of the exposure to return the value of.
+
+    step : int, optional
+        Spacing, in pixels, of the positions sampled along each edge of the
+        chips.  Default: ``EDGE_STEP``
+
+    Returns
+    -------
+    scale_val : float
+        Value of the ``scale_kw`` keyword
+
+    chips : list
+        For each chip, a tuple of its extension, the positions of its corners
+        in sky coordinates and in ``meta_wcs`` X,Y coordinates, and the X and Y
+        positions of the polygon on ``meta_wcs`` tracing its edges.
+
+    """
+    step = EDGE_STEP if step is None else step
+    chips = []
+    with fits.open(exposure) as exp:
+        scale_val = exp[0].header[scale_kw]
+
+        sci_extns = wcs_functions.get_extns(exp)
+        if len(sci_extns) == 0 and '_single' in exposure:
+            sci_extns = [0]
+
+        for sci in sci_extns:
+            wcs = HSTWCS(exp, ext=sci)
+
+            radec = calc_wcs_footprint(wcs, offset=1).tolist()
+            radec.append(radec[0])  # close the polygon/chip
+            xycorners = meta_wcs.all_world2pix(radec, 0).astype(np.int32).tolist()
+
+            # Now compute RA/Dec of positions along each edge, in counter-clockwise order
+            x = np.append(np.arange(0, wcs.naxis1 - 1, step), wcs.naxis1 - 1)
+            y = np.append(np.arange(0, wcs.naxis2 - 1, step), wcs.naxis2 - 1)
+            edges_x = np.concatenate([x[:-1], np.full(len(y) - 1, x[-1]), x[:0:-1], np.zeros(len(y) - 1)])
+            edges_y = np.concatenate([np.zeros(len(x) - 1), y[:-1], np.full(len(x) - 1, y[-1]), y[:0:-1]])
+            sky_edges = wcs.pixel_to_world_values(edges_x, edges_y)
+            meta_x, meta_y = meta_wcs.world_to_pixel_values(sky_edges[0], sky_edges[1])
+
+            chips.append((sci, radec, xycorners, meta_x, meta_y))
+
+    return scale_val, chips
+
+
+def _store_chip_polygons(exposure, meta_wcs, scale_kw, results):
+    """Run `get_chip_polygons` in a separate process, saving its result in ``results``"""
+    results[exposure] = get_chip_polygons(exposure, meta_wcs, scale_kw=scale_kw)
+
+
+def polygon_spans(x, y, shape):
+    """Find the pixels of an array inside (or on the edges of) a convex polygon.
+
+    The edges of the polygon get traced one pixel at a time, including where
+    they cross each row, and truncating the positions along them to integer
+    pixels.  The pixels between the first and last pixels traced in each row
+    are inside the polygon.
+
+    Parameters
+    ----------
+    x, y : ndarray
+        Positions of the vertices of the polygon, in pixels
+
+    shape : tuple
+        Shape of the array
+
+    Returns
+    -------
+    rows, first, last : ndarray
+        For each row of the array overlapping the polygon, the first and last
+        (included) columns of the pixels inside the polygon.
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    dx = np.roll(x, -1) - x
+    dy = np.roll(y, -1) - y
+
+    # positions spaced by at most one pixel along each edge
+    npts = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+    edge = np.repeat(np.arange(len(x)), npts)
+    step = np.arange(npts.sum()) - np.repeat(np.cumsum(npts) - npts, npts)
+    frac = step / np.maximum(npts - 1, 1)[edge]
+    px = x[edge] + frac * dx[edge]
+    py = y[edge] + frac * dy[edge]
+
+    # along with the positions where the edges cross each row
+    ymin = np.ceil(np.minimum(y, y + dy)).astype(np.int64)
+    nrows = np.maximum(np.floor(np.maximum(y, y + dy)).astype(np.int64) - ymin + 1, 0)
+    nrows[dy == 0] = 0
+    edge = np.repeat(np.arange(len(x)), nrows)
+    cross_y = ymin[edge] + np.arange(nrows.sum()) - np.repeat(np.cumsum(nrows) - nrows, nrows)
+    cross_x = x[edge] + (cross_y - y[edge]) * dx[edge] / dy[edge]
+
+    px = np.trunc(np.concatenate([px, cross_x])).astype(np.int64)
+    py = np.trunc(np.concatenate([py, cross_y])).astype(np.int64)
+
+    ny, nx = shape
+    inside = (py >= 0) & (py < ny)
+    first = np.full(ny, nx, dtype=np.int64)
+    last = np.full(ny, -1, dtype=np.int64)
+    np.minimum.at(first, py[inside], px[inside])
+    np.maximum.at(last, py[inside], px[inside])
+    first = np.maximum(first, 0)
+    last = np.minimum(last, nx - 1)
+
+    rows = np.where(first <= last)[0]
+    return rows, first[rows], last[rows]
+
+
+def fill_spans(arr, spans, value):
+    """Add ``value`` to the pixels of ``arr`` listed by `polygon_spans`, in place."""
+    for row, first, last in zip(*spans):
+        arr[row, first:last + 1] += value
+
+
 def find_vertices(edge_path, exp_masks):
     """Find vertices the input exposures that overlap this part of the footprint.
 
@@ -1315,9 +1441,11 @@ def compute_edge(start, end, int_pixel=True):
 def trace_polygon(input_mask, mask_slice):
     """Convert mask with only edge pixels into a single contiguous polygon"""
 
-    # now extract the edges to trace
-    slice_edges = input_mask.astype(np.int16) - \
-                  ndimage.binary_erosion(input_mask).astype(np.int16)
+    # now extract the edges to trace: the pixels of the mask with one of
+    # their 4 neighbors (or the border of the mask) outside of the mask
+    mask = np.pad(input_mask.astype(bool), 1)
+    slice_edges = (input_mask.astype(bool) &
+                   ~(mask[:-2, 1:-1] & mask[2:, 1:-1] & mask[1:-1, :-2] & mask[1:-1, 2:]))
 
     # trace edge from this region and identify corners of edge
     edge_pixels = _poly_trace(slice_edges)
@@ -1327,62 +1455,99 @@ def trace_polygon(input_mask, mask_slice):
     return edge_pixels
 
 
+# Positions (row, column) within a 3x3 box of the pixels set in each 9-bit code
+_BOX_PIXELS = [[(j, i) for j in range(3) for i in range(3) if code & (1 << (j * 3 + i))]
+               for code in range(512)]
+
+
 def _poly_trace(input_mask, box_size=3):
-    # find a starting point on the mask
-    # expand input array to include empty border pixels to account for extraction box
+    """Order the edge pixels of a mask by walking along them from pixel to pixel.
+
+    The walk starts from the first pixel of the first column with edge pixels,
+    then moves at each step to a neighboring edge pixel not yet visited,
+    preferring the one leading to the most pixels while keeping the direction
+    of the previous step.  Small gaps get jumped by looking at a larger box.
+
+    The edge pixels get gathered from the whole mask at once, then the walk
+    only looks up the positions remaining to be visited instead of extracting
+    boxes from the mask at each step.
+
+    Returns
+    -------
+    polygon : ndarray
+        Positions of the edge pixels, in the order they were visited, in the
+        mask padded by ``box_size // 2`` pixels on each side.
+
+    """
     border = (box_size // 2)
-    mask = np.zeros((input_mask.shape[0] + (border * 2), input_mask.shape[1] + (border * 2)),
-                    dtype=input_mask.dtype)
-    mask[border:-border, border:-border] = input_mask.copy()
-    for x in range(mask.shape[1]):
-        pts = np.where(mask[:, x] == 1)[0]
-        if len(pts) > 0:
-            ystart = pts[0]
-            xstart = x
-            break
-    # Now start tracing looking at a 3x3 set of pixels around that position
+    edges = np.pad(input_mask == 1, 1)
+    ys, xs = np.nonzero(edges)
+    # which of the 3x3 pixels around each edge pixel are edge pixels, as bits
+    # of a code indexing the list of their positions in ``_BOX_PIXELS``
+    codes = np.zeros(len(xs), dtype=np.int16)
+    for bit, (j, i) in enumerate(_BOX_PIXELS[511]):
+        codes |= edges[ys + j - 1, xs + i - 1].astype(np.int16) << bit
+    # positions of all the edge pixels, in the padded mask
+    xs += border - 1
+    ys += border - 1
+    neighbors = dict(zip(zip(xs.tolist(), ys.tolist()), codes.tolist()))
+    remaining = set(neighbors)
+
+    def box_pixels(x, y, size=3):
+        """Positions, relative to the box corner, of the pixels remaining in a box around (x, y)
+
+        These get listed in the same order as ``np.where`` would, with boxes
+        starting before the first row or column of the mask being empty.
+        """
+        half = size // 2
+        if x < half or y < half:
+            return []
+        if size == 3 and (x, y) in neighbors:
+            candidates = _BOX_PIXELS[neighbors[(x, y)]]
+        else:
+            candidates = [(j, i) for j in range(size) for i in range(size)]
+        return [(j, i) for j, i in candidates if (x - half + i, y - half + j) in remaining]
+
+    # find a starting point on the mask
+    xstart = int(xs.min())
+    ystart = int(ys[xs == xs.min()].min())
     polygon = [[xstart, ystart]]
     # Zero out already identified pixels on the polygon
-    mask[ystart, xstart] = 0
+    remaining.discard((xstart, ystart))
     new_x = xstart
     new_y = ystart
-    xstart = None
-    ystart = None
     new_start = True
     slope = -1
     # determine how many pixels should be in polygon.
-    num_pixels = mask.sum()
+    num_pixels = len(remaining)
 
     while new_start or (num_pixels > 0):
         xstart = new_x
         ystart = new_y
-        # Zero out already identified pixels on the polygon
-        mask[ystart, xstart] = 0
-        box = get_box(mask, xstart, ystart)
-        pts = np.where(box == 1)
+        remaining.discard((xstart, ystart))
+        pts = box_pixels(xstart, ystart)
 
-        if len(pts[0]) == 0:
+        if len(pts) == 0:
             # try a larger box to see if we can jump this gap
-            box = get_box(mask, xstart, ystart, size=5)
-            pts = np.where(box == 1)
-            if len(pts[0]) == 0:
+            pts = box_pixels(xstart, ystart, size=5)
+            if len(pts) == 0:
                 # We are back where we started, so quit
                 break
 
         indx = 0
-        if len(pts[0]) > 1:
+        if len(pts) > 1:
             # Perform some disambiguation to look for
             # pixel which leads to the most pixels going on
             # start with pixels along the same slope that we have been going
             slope_indx = 0 if slope <= 0 else 1
-            slope_y = pts[0][slope_indx] + ystart - 1
-            slope_x = pts[1][slope_indx] + xstart - 1
-            slope_sum = get_box(mask, slope_x, slope_y).sum()
+            slope_y = pts[slope_indx][0] + ystart - 1
+            slope_x = pts[slope_indx][1] + xstart - 1
+            slope_sum = len(box_pixels(slope_x, slope_y))
             # Now get sum for the other pixel
             indx2 = 1 if slope < 0 else 0
-            y2 = pts[0][indx2] + ystart - 1
-            x2 = pts[1][indx2] + xstart - 1
-            sum2 = get_box(mask, x2, y2).sum()
+            y2 = pts[indx2][0] + ystart - 1
+            x2 = pts[indx2][1] + xstart - 1
+            sum2 = len(box_pixels(x2, y2))
             # select point which leads to the largest sum,
             # but favor the previous slope if both directions are equal.
             if slope_sum == sum2:
@@ -1390,15 +1555,17 @@ def _poly_trace(input_mask, box_size=3):
             else:
                 indx = indx2 if sum2 > slope_sum else slope_indx
 
-        new_y = pts[0][indx] + ystart - 1
-        new_x = pts[1][indx] + xstart - 1
+        new_y = pts[indx][0] + ystart - 1
+        new_x = pts[indx][1] + xstart - 1
         polygon.append([new_x, new_y])
         # reset for next pixel
         num_pixels -= 1
         new_start = False
-        slope = (new_y - ystart) / (new_x - xstart)
+        if new_x != xstart:
+            slope = (new_y - ystart) / (new_x - xstart)
+        else:
+            slope = np.sign(new_y - ystart) * np.inf if new_y != ystart else np.nan
 
-    del mask
     # close the polygon
     polygon.append(polygon[0])
     return np.array(polygon, dtype=np.int32)
@@ -43,6 +43,7 @@ from astropy.io import fits as fits
 import numpy
 import scipy
 import scipy.ndimage
+from scipy.spatial import cKDTree
 
 from stsci.tools import logutil
 from stsci.tools import fileutil
@@ -229,53 +230,28 @@ def ci_filter(drizzled_image, catalog_name, catalog_data, proc_type, param_dict,
     log.info('ci_upper_limit = {}'.format(ci_upper_limit))
     log.info(' ')
 
-    failed_index_list = []
-    for i, table_row in enumerate(catalog_data):
-        try:
-            table_row["Flags"] = int(table_row["Flags"])
-        except ValueError:
-            table_row["Flags"] = 0
-
-        ci_value = table_row["CI"]
-        if ci_value:
-            ci_value = float(ci_value)
-        merr1 = table_row["MagErrAp1"]
-        if not merr1:
-            merr1 = numpy.nan
-        else:
-            merr1 = float(merr1)
-        merr2 = table_row["MagErrAp2"]
-        if not merr2:
-            merr2 = numpy.nan
-        else:
-            merr2 = float(merr2)
-        
-        # SNR calculation based on flux instead of magnitude as negative magnitudes are possible
-        fluxap2 = table_row["FluxAp2"]
-        fluxerr2 = table_row["FluxErrAp2"]
-        good_snr = fluxap2 >= snr * fluxerr2
-        
-        ci_err = numpy.sqrt(merr1 ** 2 + merr2 ** 2)
-
-        if not good_snr:
-            table_row["Flags"] |= 8
+    # missing (masked or zero) CI values and magnitude errors are undefined
+    ci_value = _column_values(catalog_data, "CI", undefined=0.0)
+    no_ci = ci_value == 0.0
+    merr1 = _column_values(catalog_data, "MagErrAp1", undefined=numpy.nan)
+    merr2 = _column_values(catalog_data, "MagErrAp2", undefined=numpy.nan)
 
-        if not ci_value or (not numpy.isfinite(ci_err)) or ci_value < ci_lower_limit - ci_err:
-            table_row["Flags"] |= 16
+    # SNR calculation based on flux instead of magnitude as negative magnitudes are possible
+    fluxap2 = _column_values(catalog_data, "FluxAp2")
+    fluxerr2 = _column_values(catalog_data, "FluxErrAp2")
+    good_snr = fluxap2 >= snr * fluxerr2
 
-        if not ci_value or ci_value > ci_upper_limit:
-            table_row["Flags"] |= 1
+    ci_err = numpy.sqrt(merr1 ** 2 + merr2 ** 2)
 
-        if not ci_value and diagnostic_mode:
-            failed_index_list.append(i)
+    flags = catalog_data["Flags"]
+    flags[~good_snr] |= 8
+    flags[no_ci | ~numpy.isfinite(ci_err) | (ci_value < ci_lower_limit - ci_err)] |= 16
+    flags[no_ci | (ci_value > ci_upper_limit)] |= 1
 
     if diagnostic_mode:
         # Write out list of ONLY failed rows to to file
         catalog_name_failed = catalog_name_root + '_Failed-CI.txt'
-        catalog_data_failed = catalog_data.copy()
-        all_indicies = range(0, len(catalog_data))
-        rows_to_remove = [z for z in all_indicies if z not in failed_index_list]
-        catalog_data_failed.remove_rows(rows_to_remove)
+        catalog_data_failed = catalog_data[no_ci]
         catalog_data_failed.write(catalog_name_failed, delimiter=",", format='ascii')
 
         # Write out intermediate catalog with updated flags
@@ -484,11 +460,7 @@ def hla_saturation_flags(drizzled_image, flt_list, catalog_name, catalog_data, p
     # ----------------------------------------------------
     all_detections = catalog_data
 
-    nrows = len(all_detections)
-    full_coord_list = numpy.empty((nrows, 2), dtype=float)
-    for row_count, detection in enumerate(all_detections):
-        full_coord_list[row_count, 0] = float(detection[column_titles["x_coltitle"]])
-        full_coord_list[row_count, 1] = float(detection[column_titles["y_coltitle"]])
+    full_coord_list = _catalog_positions(all_detections, column_titles)
     """
     # This option to determine saturation from the drizzled image alone should complement
     # the computation based on the DQ array, since the IR (and MAMA?) detectors will not
@@ -581,9 +553,7 @@ def hla_saturation_flags(drizzled_image, flt_list, catalog_name, catalog_data, p
         phot_table_root = phot_table.split('.')[0]
 
         phot_table_rows = catalog_data
-        for i, table_row in enumerate(phot_table_rows):
-            if saturation_flag[i]:
-                table_row["Flags"] = int(table_row["Flags"]) | 4
+        phot_table_rows["Flags"][saturation_flag] |= 4
 
         if diagnostic_mode:
             phot_table_temp = phot_table_root + '_SATFILT.txt'
@@ -680,23 +650,13 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
 
     nrows = len(catalog_data)
 
+    # columns: x, y, flux, electronpp, sky, eppsky
     complete_src_list = numpy.empty((nrows, 6), dtype=float)
-
-    for row_num, row in enumerate(catalog_data[0:]):
-        x_val = float(row[column_titles["x_coltitle"]])
-        y_val = float(row[column_titles["y_coltitle"]])
-        flux = row["FluxAp2"]
-        sky = row["MSkyAp2"]
-
-        if not flux:
-            flux = 0.0
-
-        if not sky:
-            sky = 0.0
-
-        electronpp = flux / area * exptime
-        eppsky = electronpp / median_sky
-        complete_src_list[row_num, :] = [x_val, y_val, flux, electronpp, sky, eppsky]
+    complete_src_list[:, 0:2] = _catalog_positions(catalog_data, column_titles)
+    complete_src_list[:, 2] = _column_values(catalog_data, "FluxAp2", undefined=0.0)
+    complete_src_list[:, 3] = complete_src_list[:, 2] / area * exptime
+    complete_src_list[:, 4] = _column_values(catalog_data, "MSkyAp2", undefined=0.0)
+    complete_src_list[:, 5] = complete_src_list[:, 3] / median_sky
 
     if len(complete_src_list) == 0:
         return catalog_data
@@ -790,6 +750,9 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
             selfradii = list(map(float, selfradii))
             selfradii = numpy.array(selfradii) * scale_to_hla
 
+            # all the cut ranges get matched against the same central pixel positions
+            central_matcher = XYMatcher(initial_central_pixel_list[:, 0:2])
+            ncentral = len(initial_central_pixel_list)
             p1 = []
             p2 = []
             for cut_cnt, cut in enumerate(cuts):
@@ -815,61 +778,37 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
                 # Determine all matches for detections in "cut_value_positions"
                 # within the radius value identified for the cut range being implemented
                 # -----------------------------------------------------------------------
-                p1_sub, p2_sub = xymatch(initial_central_pixel_list[cut_value_positions, :][:, 0:2],
-                                         initial_central_pixel_list[:, 0:2], selfradii[cut_cnt],
-                                         multiple=True, stack=False, verbose=False)
+                p1_sub, p2_sub = central_matcher.match(initial_central_pixel_list[cut_value_positions, :][:, 0:2],
+                                                       selfradii[cut_cnt], multiple=True, verbose=False)
 
-                # ------------------------------------------
-                # For each cut range, add the corresponding
-                # matches to each detection to a final list
-                # ------------------------------------------
-                for p1_arr in p1_sub:
-                    p1.append(p1_arr)
-
-                for p2_arr in p2_sub:
-                    p2.append(p2_arr)
+                # ------------------------------------------------------------
+                # For each cut range, add the corresponding matches to each
+                # detection to a final list, numbering the groups of matches
+                # of each detection differently for each cut range
+                # ------------------------------------------------------------
+                p1.append(p1_sub + cut_cnt * ncentral)
+                p2.append(p2_sub)
 
                 # Not sure if this is still needed???
                 # ------------------------------------
                 if cut_cnt == len(cuts) - 1:
-                    if len(p1) == 0 and len(p2) == 0:
-                        p1, p2 = xymatch(initial_central_pixel_list[:, 0:2], initial_central_pixel_list[:, 0:2],
-                                         selfradius, multiple=True, stack=False, verbose=False)
-
-            # ---------------------------------------------------------------------
-            # each object is guaranteed to have at least one match (itself)
-            # get brightest of each group of matches by building a list of indices
-            # ---------------------------------------------------------------------
-            exclude_index = None
-            for i1, i2 in zip(p1, p2):
-                flux2 = initial_central_pixel_list[i2, 2]
-
-                # -------------------------------------------------------------
-                # Verify that there is more than one detection in a given group
-                # otherwise no detection is added to exclude index because
-                # there is only one detection for the source being evaluated
-                # -------------------------------------------------------------
-                if len(i2[numpy.where(flux2 < numpy.max(flux2))]) > 0:
-
-                    # ----------------------------------------------------------
-                    # Add all detections in grouping with a flux value less than
-                    # that of the maximum flux value to an array to be excluded
-                    # ----------------------------------------------------------
-                    if exclude_index is None:
-                        exclude_index = i2[numpy.where(flux2 < numpy.max(flux2))]
-                    else:
-                        exclude_index = numpy.concatenate((exclude_index,
-                                                           i2[numpy.where(flux2 < numpy.max(flux2))]), axis=0)
-
-                    exclude_index = exclude_index.astype(numpy.int32)
-
-            # -----------------------------------------------------------
-            # exclude_index can have multiple copies of the same index
-            # use exclude_bool array to get a list of the unique indices
-            # -----------------------------------------------------------
-            exclude_bool = numpy.ones(len(initial_central_pixel_list), dtype=bool)
-            if not (exclude_index is None):
-                exclude_bool[exclude_index] = False
+                    if sum(len(p1_arr) for p1_arr in p1) == 0:
+                        p1_all, p2_all = central_matcher.match(initial_central_pixel_list[:, 0:2], selfradius,
+                                                               multiple=True, verbose=False)
+                        p1 = [p1_all]
+                        p2 = [p2_all]
+
+            # -------------------------------------------------------------------
+            # Add all detections in each grouping with a flux value less than
+            # that of the maximum flux value of the grouping to the excluded
+            # detections (detections alone in their group never get excluded)
+            # -------------------------------------------------------------------
+            exclude_bool = numpy.ones(ncentral, dtype=bool)
+            if len(p1) > 0:
+                p1 = numpy.concatenate(p1)
+                p2 = numpy.concatenate(p2)
+                flux2 = initial_central_pixel_list[p2, 2]
+                exclude_bool[p2[flux2 < _group_max(flux2, p1)]] = False
             out_values = numpy.where(exclude_bool)[0]
 
             # -------------------------------------------------------------------------------
@@ -881,16 +820,19 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
         else:
 
             p1, p2 = xymatch(initial_central_pixel_list[:, 0:2], initial_central_pixel_list[:, 0:2], selfradius,
-                             multiple=True, stack=False, verbose=False)
+                             multiple=True, verbose=False)
 
             # ---------------------------------------------------------------------
             # each object is guaranteed to have at least one match (itself)
             # get brightest of each group of matches by building a list of indices
+            # (the first one in case of ties, or the first NaN flux if any)
             # ---------------------------------------------------------------------
             keep_index = numpy.arange(len(initial_central_pixel_list), dtype=int)
-            for i1, i2 in zip(p1, p2):
-                flux2 = initial_central_pixel_list[i2, 2]
-                keep_index[i1] = i2[flux2.argmax()]
+            flux2 = initial_central_pixel_list[p2, 2]
+            max_flux2 = _group_max(flux2, p1)
+            brightest = numpy.flatnonzero((flux2 == max_flux2) | (numpy.isnan(flux2) & numpy.isnan(max_flux2)))
+            first = numpy.r_[True, p1[brightest[1:]] != p1[brightest[:-1]]] if len(brightest) else brightest
+            keep_index[p1[brightest[first]]] = p2[brightest[first]]
 
             # --------------------------------------------------------
             # keep_index can have multiple copies of the same index
@@ -953,7 +895,7 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
     log.info('Matching {} swarm centers with {} catalog sources'.format(len(final_flag_src_central_pixel_list),
                                                                         len(swarm_list_b)))
     pcentral, pfull = xymatch(final_flag_src_central_pixel_list[:, 0:2], swarm_list_b[:, 0:2],
-                              clip_radius_list[0], multiple=True, stack=False, verbose=False)
+                              clip_radius_list[0], multiple=True, verbose=False)
 
     # TODO: RLW: the ring list is needed only for testing, get rid of it when code works
 
@@ -963,70 +905,41 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
         ring_thresh_list = []
         ring_count = []
 
-    for pindex, ii in enumerate(pcentral):
-
-        central_pixel_value = final_flag_src_central_pixel_list[ii, :]
-        log.debug(' ')
-        log.debug('CENTRAL PIXEL VALUE: {}'.format(central_pixel_value))
-        log.debug(' ')
-
-        base_epp = central_pixel_value[3]
-        coords = central_pixel_value[0:2]
-
-        allmatches = pfull[pindex]
+    # central pixel value and distance to it of each swarm candidate
+    central_pixel_values = final_flag_src_central_pixel_list[pcentral, :]
+    base_epp = central_pixel_values[:, 3]
+    distsq = ((swarm_x_list_b[pfull] - central_pixel_values[:, 0])**2 +
+              (swarm_y_list_b[pfull] - central_pixel_values[:, 1])**2)
+    clip_radius_sq = numpy.array(clip_radius_list)**2
+    for radius_cnt in range(1, len(clip_radius_list)):
 
-        if len(allmatches) == 0:
-            # (this should not happen using xymatch)
-            log.info(' ')
-            log.info('------------------------------------------')
-            log.info('NOTE: NO SWARM CANDIDATES FOR THIS SOURCE ')
-            log.info('------------------------------------------')
-            log.info(' ')
+        # -------------------------------------------
+        # ISOLATE THE DETECTIONS WITHIN A GIVEN RING
+        # -------------------------------------------
+        in_ring = numpy.where((distsq >= clip_radius_sq[radius_cnt]) & (distsq < clip_radius_sq[radius_cnt-1]))[0]
+        if len(in_ring) == 0:
             continue
-
-        distsq = (swarm_x_list_b[allmatches]-coords[0])**2 + (swarm_y_list_b[allmatches]-coords[1])**2
-        sind = distsq.argsort()
-        allmatches = allmatches[sind]
-        distsq = distsq[sind]
-        rcut = distsq.searchsorted(numpy.array(clip_radius_list)**2)
-        for radius_cnt in range(1, len(clip_radius_list)):
-
-            # -------------------------------------------
-            # ISOLATE THE DETECTIONS WITHIN A GIVEN RING
-            # -------------------------------------------
-
-            matches = allmatches[rcut[radius_cnt]:rcut[radius_cnt-1]]
-
-            if len(matches) == 0:
-                log.debug(' ')
-                log.debug('------------------------------------------')
-                log.debug('NOTE: ALL MATCHES/DETECTIONS IN THIS RING ')
-                log.debug('      HAVE PREVIOUSLY BEEN ACCOUNTED FOR  ')
-                log.debug('------------------------------------------')
-                log.debug(' ')
-
-                continue
-
-            # -----------------------------------------------------------
-            # CALCULATE THE MEDIAN SKY VALUE FOR THE GROUP OF DETECTIONS
-            # CONTAINED WITHIN THE SPECIFIED RING BEING PROCESSED
-            # -----------------------------------------------------------
-            ref_epp = base_epp * scale_factor_list[radius_cnt-1]
-
-            # -----------------------------------------------------------------------------------
-            # DIFFERENTIATE BETWEEN GOOD DETECTIONS AND SWARM DETECTIONS WITHIN SPECIFIED RINGS
-            # -----------------------------------------------------------------------------------
-            ring = swarm_list_b[matches, :]
-            w = numpy.where(ring[:, 3]/ref_epp < swarm_thresh)
-            if len(w) > 0:
-                swarm_flag[notcentral_index[matches[w]]] = True
-
-            # TODO: RLW: following needed only for testing, get rid of it when code works
-            if diagnostic_mode:
-                ring_index_list.append(matches)
-                ring_count.append(len(matches))
-                ring_refepp_list.append(ring[:, 3]/ref_epp)
-                ring_thresh_list.append(swarm_thresh)
+        matches = pfull[in_ring]
+
+        # -----------------------------------------------------------
+        # CALCULATE THE MEDIAN SKY VALUE FOR THE GROUP OF DETECTIONS
+        # CONTAINED WITHIN THE SPECIFIED RING BEING PROCESSED
+        # -----------------------------------------------------------
+        ref_epp = base_epp[in_ring] * scale_factor_list[radius_cnt-1]
+
+        # -----------------------------------------------------------------------------------
+        # DIFFERENTIATE BETWEEN GOOD DETECTIONS AND SWARM DETECTIONS WITHIN SPECIFIED RINGS
+        # -----------------------------------------------------------------------------------
+        ring = swarm_list_b[matches, :]
+        w = numpy.where(ring[:, 3]/ref_epp < swarm_thresh)
+        swarm_flag[notcentral_index[matches[w]]] = True
+
+        # TODO: RLW: following needed only for testing, get rid of it when code works
+        if diagnostic_mode:
+            ring_index_list.append(matches)
+            ring_count.append(len(matches))
+            ring_refepp_list.append(ring[:, 3]/ref_epp)
+            ring_thresh_list.append(swarm_thresh)
 
     # TODO: RLW: following needed only for testing, get rid of it when code works
     if diagnostic_mode:
@@ -1097,6 +1010,7 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
             ctr_list_threshold_list = param_dict["quality control"]["swarm filter"]["ctrList_thresholdList"]  # TODO: optimize ctr_list_threshold_list for ACS wfc, hrc, sbc in quality control config files
             ctr_list_threshold_list = list(map(int, ctr_list_threshold_list))
 
+            swarm_matcher = XYMatcher(swarm_list_b[:, 0:2])
             for ctr_list_cnt, (threshold, radius) in enumerate(zip(ctr_list_threshold_list, ctr_list_radius_list)):
 
                 if ctr_list_cnt == 0:
@@ -1107,8 +1021,7 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
                                                      ctr_list_threshold_list[ctr_list_cnt - 1])
 
                 ctr_list_cut1 = final_flag_src_central_pixel_list[ctr_list_cut, :]
-                pcentral, pfull = xymatch(ctr_list_cut1[:, 0:2], swarm_list_b[:, 0:2],
-                                          radius, multiple=True, verbose=False)
+                pcentral, pfull = swarm_matcher.match(ctr_list_cut1[:, 0:2], radius, multiple=True, verbose=False)
                 proximity_flag[notcentral_index[pfull]] = True
 
         log.info("Proximity filter flagged {} sources".format(proximity_flag.sum()))
@@ -1174,9 +1087,7 @@ def hla_swarm_flags(drizzled_image, catalog_name, catalog_data, exptime, plate_s
         final_source_file.close()
 
     # Update catalog_data flag values
-    for i, table_row in enumerate(catalog_data[0:]):
-        if combined_flag[i]:
-            table_row["Flags"] |= 32
+    catalog_data["Flags"][combined_flag] |= 32
 
     if diagnostic_mode:
         # Write out intermediate catalog with updated flags
@@ -1262,11 +1173,7 @@ def hla_nexp_flags(drizzled_image, flt_list, param_dict, plate_scale, catalog_na
     phot_table_root = catalog_name.split('/')[-1].split('.')[0]
 
     nrows = len(catalog_data)
-    cat_coords = numpy.empty((nrows, 2), dtype=float)
-    for line_cnt, phot_table_line in enumerate(catalog_data):
-        x_coord = phot_table_line[column_titles["x_coltitle"]]
-        y_coord = phot_table_line[column_titles["y_coltitle"]]
-        cat_coords[line_cnt, :] = [x_coord, y_coord]
+    cat_coords = _catalog_positions(catalog_data, column_titles)
     # ----------------------------------
     # Convert aperture radius to pixels
     # ----------------------------------
@@ -1314,9 +1221,7 @@ def hla_nexp_flags(drizzled_image, flt_list, param_dict, plate_scale, catalog_na
     log.info('FLAGGING {} OF {} SOURCES'.format(artifact_flag.sum(), nrows))
 
     # Add flag bit to appropriate sources
-    for i, table_row in enumerate(catalog_data):
-        if artifact_flag[i]:
-            table_row["Flags"] |= 64
+    catalog_data["Flags"][artifact_flag] |= 64
 
     if diagnostic_mode:
         # Write out intermediate catalog with updated flags
@@ -1405,6 +1310,178 @@ def get_component_drz_list(drizzled_image, drz_root_dir, flt_file_names):
 # =============================================================================
 
 
+def _column_values(catalog_data, column_name, undefined=None):
+    """Return the values of a catalog column as a float64 array.
+
+    Parameters
+    ----------
+    catalog_data : astropy.Table object
+        catalog
+
+    column_name : string
+        name of the column
+
+    undefined : float, optional
+        if specified, value given to the masked and zero values of the column. Otherwise, masked values are
+        returned as NaN.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        column values
+    """
+    column = catalog_data[column_name]
+    values = numpy.array(numpy.ma.getdata(column), dtype=numpy.float64)
+    missing = numpy.ma.getmaskarray(column)
+    if undefined is None:
+        values[missing] = numpy.nan
+    else:
+        values[missing | (values == 0.0)] = undefined
+    return values
+
+# ======================================================================================================================
+
+
+def _catalog_positions(catalog_data, column_titles):
+    """Return the x, y positions of the catalog sources as a [N, 2] float64 array, with NaN for masked values.
+
+    Parameters
+    ----------
+    catalog_data : astropy.Table object
+        catalog
+
+    column_titles : dictionary
+        Relevant column titles
+
+    Returns
+    -------
+    positions : numpy.ndarray
+        [N, 2] array of x, y source coords
+    """
+    positions = numpy.empty((len(catalog_data), 2), dtype=numpy.float64)
+    positions[:, 0] = _column_values(catalog_data, column_titles["x_coltitle"])
+    positions[:, 1] = _column_values(catalog_data, column_titles["y_coltitle"])
+    return positions
+
+# ======================================================================================================================
+
+
+def _group_max(values, groups):
+    """Return, for each value, the maximum of the values with the same group number, where the elements of each
+    group are consecutive. NaN values propagate to the maximum of their group, as with numpy.max.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        values to compute the maxima of
+
+    groups : numpy.ndarray
+        group number of each value
+
+    Returns
+    -------
+    group_max : numpy.ndarray
+        maximum of the group of each value
+    """
+    if len(values) == 0:
+        return values.copy()
+    starts = numpy.flatnonzero(numpy.r_[True, groups[1:] != groups[:-1]])
+    return numpy.repeat(numpy.maximum.reduceat(values, starts), numpy.diff(numpy.r_[starts, len(values)]))
+
+# ======================================================================================================================
+
+
+class XYMatcher:
+    """Match lists of positions against the same catalog using a k-d tree of its positions.
+
+    The positions of ``cat2`` matching a position are those within a distance ``sep`` of it, returned in order of
+    increasing Y.  Positions which are not finite never match.  The tree gets built once, so that several lists
+    of positions, or several separations, can be matched against ``cat2`` without building it again.
+
+    Parameters
+    ----------
+    cat2 : numpy.ndarray
+        [N, 2] array of x,y source coords to match against.
+    """
+    def __init__(self, cat2):
+        if not (isinstance(cat2, numpy.ndarray) and len(cat2.shape) == 2 and cat2.shape[1] == 2):
+            log.error("catalog 2 must be a [N, 2] array")
+            raise ValueError("cat2 must be a [N, 2] array")
+        self.cat2 = cat2
+        self._is2 = cat2[:, 1].argsort()
+        self._rank2 = numpy.empty(len(cat2), dtype=int)
+        self._rank2[self._is2] = numpy.arange(len(cat2))
+        # non-finite positions never match anything
+        self._good2 = numpy.flatnonzero(numpy.isfinite(cat2).all(axis=1))
+        self._tree = None
+        if len(self._good2) > 0:
+            self._tree = cKDTree(cat2[self._good2].astype(numpy.float64))
+
+    def pairs(self, cat1, sep):
+        """Return the indices ``(p1, p2)`` of all the pairs of positions of cat1 and cat2 within ``sep`` of each
+        other, sorted by increasing Y of the cat1 and then of the cat2 positions, along with the squared
+        distances between them.
+        """
+        if not (isinstance(cat1, numpy.ndarray) and len(cat1.shape) == 2 and cat1.shape[1] == 2):
+            log.error("catalog 1 must be a [N, 2] array")
+            raise ValueError("cat1 must be a [N, 2] array")
+        cat2 = self.cat2
+        good1 = numpy.flatnonzero(numpy.isfinite(cat1).all(axis=1))
+        if self._tree is None or len(good1) == 0:
+            empty = numpy.array([], dtype=int)
+            return empty, empty, numpy.array([], dtype=numpy.result_type(cat1, cat2))
+
+        # candidate pairs, with some slack for the rounding of the separations computed below
+        tree1 = cKDTree(cat1[good1].astype(numpy.float64))
+        radius = sep * (1.0 + 1.0e-5) + 1.0e-12
+        cand = tree1.sparse_distance_matrix(self._tree, radius, output_type='ndarray')
+        p1 = good1[cand['i']]
+        p2 = self._good2[cand['j']]
+
+        # exactly the same selection as when searching through cat2 sorted by y
+        x1 = cat1[p1, 0]
+        y1 = cat1[p1, 1]
+        x2 = cat2[p2, 0]
+        y2 = cat2[p2, 1]
+        distsq = (x1 - x2)**2 + (y1 - y2)**2
+        ok = ((y2 >= y1 - sep) & (y2 <= y1 + sep) & (numpy.abs(x2 - x1) <= sep) &
+              (distsq <= sep**2))
+        p1, p2, distsq = p1[ok], p2[ok], distsq[ok]
+
+        rank1 = numpy.empty(len(cat1), dtype=int)
+        rank1[cat1[:, 1].argsort()] = numpy.arange(len(cat1))
+        order = numpy.lexsort((self._rank2[p2], rank1[p1]))
+        return p1[order], p2[order], distsq[order]
+
+    def match(self, cat1, sep, multiple=False, stack=True, verbose=True):
+        """Match the positions in cat1 with those of cat2. See `xymatch` for the description of the
+        parameters and of the results.
+        """
+        t0 = time.time()
+        n1 = len(cat1)
+        p1, p2, distsq = self.pairs(cat1, sep)
+        # first match of each cat1 object
+        first = numpy.flatnonzero(numpy.r_[True, p1[1:] != p1[:-1]]) if len(p1) else numpy.array([], dtype=int)
+        nnomatch = n1 - len(first)
+
+        if verbose:
+            log.info("%.1f s: Finished %d (%d unmatched)" % (time.time()-t0, n1, nnomatch))
+
+        if not multiple:
+            # closest match, the first one (in order of increasing y) in case of ties
+            result = numpy.zeros(n1, dtype='int') - len(self.cat2) - 1
+            order = numpy.lexsort((numpy.arange(len(p1)), distsq, p1))
+            best = order[numpy.r_[True, p1[order][1:] != p1[order][:-1]]] if len(p1) else order
+            result[p1[best]] = p2[best]
+            return result
+
+        if stack:
+            return p1, p2
+        if len(p1) == 0:
+            return [], []
+        return list(p1[first]), numpy.split(p2, first[1:])
+
+
 def xymatch(cat1, cat2, sep, multiple=False, stack=True, verbose=True):
     """Routine to match two lists of objects by position using 2-D Cartesian distances.
 
@@ -1442,6 +1519,9 @@ def xymatch(cat1, cat2, sep, multiple=False, stack=True, verbose=True):
     Marcel Haas, 2012-06-29, after IDL routine xymatch.pro by Rick White
     With some tweaks by Rick White
 
+    The candidate pairs get found using a k-d tree of cat2 (see `XYMatcher`, which
+    should be used directly when matching several catalogs against the same cat2).
+
     Parameters
     ----------
     cat1 : numpy.ndarray
@@ -1469,86 +1549,7 @@ def xymatch(cat1, cat2, sep, multiple=False, stack=True, verbose=True):
     -------
     Varies; Depending on inputs, either just 'p2', or 'p1' and 'p2'. p1 and p2 are lists of matched indices
     """
-    if not (isinstance(cat1, numpy.ndarray) and len(cat1.shape) == 2 and cat1.shape[1] == 2):
-        log.error("catalog 1 must be a [N, 2] array")
-        raise ValueError("cat1 must be a [N, 2] array")
-    if not (isinstance(cat2, numpy.ndarray) and len(cat2.shape) == 2 and cat2.shape[1] == 2):
-        log.error("catalog 2 must be a [N, 2] array")
-        raise ValueError("cat2 must be a [N, 2] array")
-
-    x1 = cat1[:, 0]
-    y1 = cat1[:, 1]
-    x2 = cat2[:, 0]
-    y2 = cat2[:, 1]
-
-    # Sort the arrays by increasing y-coordinate
-    is1 = y1.argsort()
-    x1 = x1[is1]
-    y1 = y1[is1]
-    is2 = y2.argsort()
-    x2 = x2[is2]
-    y2 = y2[is2]
-    # find search limits in y2 for each object in y1
-    kvlo = y2.searchsorted(y1-sep, 'left').clip(0, len(y2))
-    kvhi = y2.searchsorted(y1+sep, 'right').clip(kvlo, len(y2))
-
-    nnomatch = 0
-    n1 = len(x1)
-    if multiple:
-        # build lists of array segments for matches
-        p1 = []
-        p2 = []
-    else:
-        p2 = numpy.zeros(n1, dtype='int') - len(x2) - 1
-    t0 = time.time()
-    sepsq = sep**2
-    for i in range(n1):
-        y = y1[i]
-        x = x1[i]
-        klo = kvlo[i]
-        khi = kvhi[i]
-        dx = numpy.abs(x2[klo:khi] - x)
-        w = (dx <= sep).nonzero()[0]
-        if len(w) == 0:
-            # Nothing matched
-            nnomatch += 1
-        else:
-            distsq = (x - x2[klo+w])**2 + (y - y2[klo+w])**2
-
-            if multiple:
-                ww = (distsq <= sepsq).nonzero()[0]
-                if len(ww) == 0:
-                    nnomatch += 1
-                else:
-                    if stack:
-                        p1.append(numpy.zeros(len(ww), dtype='int')+is1[i])
-                    else:
-                        p1.append(is1[i])
-                    p2.append(is2[klo + w[ww]])
-
-            else:
-                if dist.min() <= sep:
-                    p2[is1[i]] = is2[klo+w[dist.argmin()]]
-                else:
-                    nnomatch += 1
-
-        if verbose and (i+1) % 10000 == 0:
-            log.info("%.1f s: Finished %d of %d (%d unmatched)" % (time.time()-t0, i+1, n1, nnomatch))
-
-    if verbose:
-        log.info("%.1f s: Finished %d (%d unmatched)" % (time.time()-t0, n1, nnomatch))
-    if multiple:
-        if stack:
-            if len(p1) == 0:
-                # no matches found
-                # return empty integer arrays that are still usable as indices
-                return numpy.array([], dtype=int), numpy.array([], dtype=int)
-            else:
-                return numpy.concatenate(p1), numpy.concatenate(p2)
-        else:
-            return (p1, p2)
-    else:
-        return p2
+    return XYMatcher(cat2).match(cat1, sep, multiple=multiple, stack=stack, verbose=verbose)
 
 # ======================================================================================================================
 
@@ -120,15 +120,24 @@ class HAPProduct:
     """
     # print("Object information: {}".format(self.info))
 
-    def generate_footprint_mask(self, save_mask=True):
+    def generate_footprint_mask(self, save_mask=True, num_cores=1):
         """Create a footprint mask for a set of exposure images
 
         Create a mask which is True/1/on for the illuminated portion of the image, and
         False/0/off for the remainder of the image.
+
+        Parameters
+        ----------
+        save_mask : bool, optional
+            Write out the footprint mask to a FITS file?
+
+        num_cores : int, optional
+            Number of processes used for computing the footprints of the exposures at the same time.  See
+            `~drizzlepac.haputils.cell_utils.SkyFootprint.build`.
         """
         footprint = cell_utils.SkyFootprint(self.meta_wcs)
         exposure_names = [element.full_filename for element in self.edp_list]
-        footprint.build(exposure_names, scale=True)
+        footprint.build(exposure_names, scale=True, num_cores=num_cores)
         if footprint.bounded_wcs is None:
             log.warning(
                 f"These exposures do not overlap this WCS:\n{exposure_names}\n{self.meta_wcs}"
@@ -626,9 +635,10 @@ class TotalProduct(HAPProduct):
         """Add a FilterProduct object to the list - composition."""
         self.fdp_list.append(fdp)
 
-    def wcs_drizzle_product(self, meta_wcs):
+    def wcs_drizzle_product(self, meta_wcs, static_prefix=False):
         """
-        Create the drizzle-combined total image using the meta_wcs as the reference output
+        Create the drizzle-combined total image using the meta_wcs as the reference output.
+        The names of the static mask files start with the product rootname when ``static_prefix`` is set.
 
         .. note:: Cosmic-ray identification is NOT performed when creating the total detection image.
         """
@@ -648,6 +658,7 @@ class TotalProduct(HAPProduct):
         # of this directory is now obsolete.
         drizzle_pars["preserve"] = False
         drizzle_pars["rules_file"] = self.rules_file
+        drizzle_pars["static_prefix"] = static_prefix
         drizzle_pars["resetbits"] = "0"
 
         log.debug(
@@ -766,9 +777,10 @@ class FilterProduct(HAPProduct):
         """Add an ExposureProduct object to the list - composition."""
         self.edp_list.append(edp)
 
-    def wcs_drizzle_product(self, meta_wcs):
+    def wcs_drizzle_product(self, meta_wcs, static_prefix=False):
         """
-        Create the drizzle-combined filter image using the meta_wcs as the reference output
+        Create the drizzle-combined filter image using the meta_wcs as the reference output.
+        The names of the static mask files start with the product rootname when ``static_prefix`` is set.
         """
         # This insures that keywords related to the footprint are generated for this
         # specific object to use in updating the output drizzle product.
@@ -794,6 +806,7 @@ class FilterProduct(HAPProduct):
         # of this directory is now obsolete.
         drizzle_pars["preserve"] = False
         drizzle_pars["rules_file"] = self.rules_file
+        drizzle_pars["static_prefix"] = static_prefix
 
         log.debug(
             "The 'final_refimage' ({}) and 'runfile' ({}) configuration variables "
@@ -928,9 +941,10 @@ class ExposureProduct(HAPProduct):
         )
         return sorted(class_set - unwanted_set)
 
-    def wcs_drizzle_product(self, meta_wcs):
+    def wcs_drizzle_product(self, meta_wcs, static_prefix=False):
         """
-        Create the drizzle-combined exposure image using the meta_wcs as the reference output
+        Create the drizzle-combined exposure image using the meta_wcs as the reference output.
+        The names of the static mask files start with the product rootname when ``static_prefix`` is set.
         """
         # Retrieve the configuration parameters for astrodrizzle
         drizzle_pars = self.configobj_pars.get_pars("astrodrizzle")
@@ -941,6 +955,7 @@ class ExposureProduct(HAPProduct):
         # of this directory is now obsolete.
         drizzle_pars["preserve"] = False
         drizzle_pars["rules_file"] = self.rules_file
+        drizzle_pars["static_prefix"] = static_prefix
         drizzle_pars["resetbits"] = "0"
 
         log.debug(
@@ -1460,7 +1475,7 @@ class SkyCellProduct(HAPProduct):
         """
         self.all_mvm_exposures = exp_list
 
-    def generate_metawcs(self, custom_limits=None):
+    def generate_metawcs(self, custom_limits=None, num_cores=1):
         """Generate a meta wcs
 
         Parameters
@@ -1469,6 +1484,10 @@ class SkyCellProduct(HAPProduct):
             a 4-element list containing the mosaic bounding rectangle X min and max and Y min and max values
             This input argument is only used for creation of custom mosaics. These coordinates are in the
             frame of reference of the projection cell, at fine (platescale = 0.04 arcsec/pixel) resolution.
+
+        num_cores : int, optional
+            Number of processes used for computing the footprints of all the MVM exposures at the same time.
+            See `~drizzlepac.haputils.cell_utils.SkyFootprint.build`.
         """
         if (
             custom_limits
@@ -1516,7 +1535,7 @@ class SkyCellProduct(HAPProduct):
         # poller file).
         mvm_footprint = cell_utils.SkyFootprint(wcs)
         log.debug(self.all_mvm_exposures)
-        mvm_footprint.build(self.all_mvm_exposures)
+        mvm_footprint.build(self.all_mvm_exposures, num_cores=num_cores)
 
         # This is the exposure-dependent WCS.
         self.meta_bounded_wcs = copy.deepcopy(mvm_footprint.bounded_wcs)
@@ -0,0 +1,186 @@
+"""Run the tasks creating the drizzled products of a visit, concurrently where possible.
+
+The products of a visit depend on each other: drizzling the filter products flags the cosmic rays in the DQ
+arrays of their exposures, which then get used when drizzling the single exposure products and the total
+detection product.  The `ProductScheduler` runs each task once all the tasks it depends on have completed,
+running independent tasks (e.g. the products of different filters) at the same time in processes forked
+from the calling one, up to a number of processes and a total estimated memory use.
+
+"""
+import multiprocessing
+import sys
+import time
+import traceback
+from collections import namedtuple
+
+from stsci.tools import logutil
+
+from drizzlepac import util
+
+__taskname__ = 'product_scheduler'
+
+log = logutil.create_logger(__name__, level=logutil.logging.NOTSET, stream=sys.stdout)
+
+_Task = namedtuple('_Task', ['func', 'args', 'depends', 'memory', 'on_done'])
+
+
+class ProductScheduler:
+    """Run a graph of tasks, concurrently for the tasks which do not depend on each other.
+
+    Parameters
+    ----------
+    num_cores : int, optional
+        Maximum number of tasks running at the same time.  All the cores of the machine get used by default.
+        The tasks run one after the other, in the calling process, when this is 1 (or parallel processing
+        is not available).
+
+    max_memory : float, optional
+        Maximum total memory, in MB, of the tasks running at the same time based on the estimates given for
+        each of them.  A task always gets started when no other task is running.
+    """
+    def __init__(self, num_cores=None, max_memory=None):
+        self.num_cores = util.get_pool_size(num_cores, None)
+        self.max_memory = None if max_memory is None else max_memory * 2**20
+        self.tasks = {}
+        self.timing = {}
+
+    def add(self, name, func, args=(), depends=(), memory=0, on_done=None):
+        """Add the task calling ``func(*args)``.
+
+        Parameters
+        ----------
+        name : str
+            Unique name of the task, such as the name of the product it creates.
+
+        func : callable
+            Function run by the task.  Its return value has to be picklable.
+
+        args : tuple, optional
+            Arguments of ``func``.
+
+        depends : list of str, optional
+            Names of the (previously added) tasks which have to complete before this one can start.
+
+        memory : int, optional
+            Estimated memory used by the task, in bytes.
+
+        on_done : callable, optional
+            Function called, in the calling process, with the value returned by ``func`` once the task
+            has completed.
+
+        Returns
+        -------
+        name : str
+            Name of the task
+        """
+        if name in self.tasks:
+            raise ValueError("Task '{}' has already been added".format(name))
+        unknown = [d for d in depends if d not in self.tasks]
+        if unknown:
+            raise ValueError("Task '{}' depends on unknown tasks: {}".format(name, unknown))
+        self.tasks[name] = _Task(func, tuple(args), tuple(depends), memory, on_done)
+        return name
+
+    def run(self):
+        """Run all the tasks, then log the time taken by each of them.
+
+        When a task fails in a separate process, the tasks depending on it are not run, the tasks already
+        running get completed, and a `RuntimeError` is raised.
+
+        Returns
+        -------
+        timing : dict
+            Time, in seconds, taken by each task that completed.
+        """
+        log.info("Running {} tasks using up to {} processes".format(len(self.tasks), self.num_cores))
+        start = time.time()
+        try:
+            if self.num_cores > 1 and len(self.tasks) > 1:
+                self._run_processes()
+            else:
+                self._run_serial()
+        finally:
+            self._report(time.time() - start)
+        return self.timing
+
+    def _run_serial(self):
+        # the tasks got added after those they depend on
+        for name, task in self.tasks.items():
+            t0 = time.time()
+            result = task.func(*task.args)
+            self.timing[name] = time.time() - t0
+            if task.on_done is not None:
+                task.on_done(result)
+
+    def _admit(self, running, memory):
+        if not running:
+            return True
+        return self.max_memory is None or sum(r[2] for r in running.values()) + memory <= self.max_memory
+
+    def _run_processes(self):
+        from multiprocessing.connection import wait
+
+        # forked processes inherit the product objects and their state
+        ctx = multiprocessing.get_context('fork')
+        pending = list(self.tasks)
+        done = set()
+        failed = []
+        running = {}
+        while running or (pending and not failed):
+            # start the tasks ready to run, in the order they were added
+            for name in list(pending):
+                if failed or len(running) >= self.num_cores:
+                    break
+                task = self.tasks[name]
+                if not all(d in done for d in task.depends):
+                    continue
+                if not self._admit(running, task.memory):
+                    break
+                reader, writer = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=_run_task, args=(writer, task.func, task.args), name=name)
+                proc.start()
+                writer.close()
+                pending.remove(name)
+                running[reader] = (name, proc, task.memory, time.time())
+
+            for reader in wait(list(running)):
+                name, proc, _, t0 = running.pop(reader)
+                try:
+                    success, result = reader.recv()
+                except EOFError:
+                    success, result = False, None
+                reader.close()
+                proc.join()
+                if success:
+                    self.timing[name] = time.time() - t0
+                    done.add(name)
+                    task = self.tasks[name]
+                    if task.on_done is not None:
+                        task.on_done(result)
+                else:
+                    log.error("Task {} failed (exitcode: {})".format(name, proc.exitcode))
+                    if result:
+                        log.error(result)
+                    failed.append(name)
+
+        if failed:
+            raise RuntimeError("Problem during: {}. Check log.".format(", ".join(failed)))
+
+    def _report(self, elapsed):
+        log.info("Task processing times:")
+        for name in self.tasks:
+            if name in self.timing:
+                log.info("    {:<72s} {:>9.2f} sec".format(name, self.timing[name]))
+            else:
+                log.info("    {:<72s} {:>13s}".format(name, "not run"))
+        log.info("    {:<72s} {:>9.2f} sec".format("Total (elapsed)", elapsed))
+
+
+def _run_task(conn, func, args):
+    """Run a task in a forked process and send back whether it succeeded with its result (or traceback)."""
+    try:
+        message = (True, func(*args))
+    except Exception:
+        message = (False, traceback.format_exc())
+    conn.send(message)
+    conn.close()
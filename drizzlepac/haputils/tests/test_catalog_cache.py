@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from astropy.table import Table
+
+from drizzlepac.haputils import astrometric_utils as amutils
+from drizzlepac.haputils import catalog_cache
+
+
+RA, DEC = 150.2, 2.3
+
+
+@pytest.fixture
+def sky():
+    """Sources spread around (RA, DEC), as returned by the catalog service."""
+    rng = np.random.default_rng(1)
+    n = 5000
+    return Table({'ra': RA + rng.uniform(-1.5, 1.5, n), 'dec': DEC + rng.uniform(-1.5, 1.5, n),
+                  'mag': rng.uniform(12, 21, n), 'objID': np.arange(n)})
+
+
+@pytest.fixture
+def service(monkeypatch, sky):
+    """Replace the catalog service by cone searches of ``sky``, counting the queries."""
+    queries = []
+
+    def query(ra, dec, sr=0.1, epoch=None, catalog='GSC241'):
+        queries.append((ra, dec, sr))
+        sep = catalog_cache.angular_separation(ra, dec, sky['ra'], sky['dec'])
+        return sky[sep <= sr]
+
+    monkeypatch.setattr(amutils, '_query_catalog', query)
+    return queries
+
+
+def test_cache_cone(tmpdir, monkeypatch, sky, service):
+    """Cone searches get retrieved once, then answered from the cache."""
+    monkeypatch.setenv(catalog_cache.CATALOG_CACHE_ENVVAR, str(tmpdir))
+    expected = sky[catalog_cache.angular_separation(RA, DEC, sky['ra'], sky['dec']) <= 0.2]
+
+    for k in range(2):
+        table = amutils.get_catalog(RA, DEC, sr=0.2, epoch=2019.5, catalog='GAIAedr3')
+        assert sorted(table['objID']) == sorted(expected['objID'])
+        if k == 0:
+            nqueries = len(service)
+            assert nqueries > 0
+    assert len(service) == nqueries
+
+    # A different epoch is not in the cache yet
+    amutils.get_catalog(RA, DEC, sr=0.2, epoch=2020.5, catalog='GAIAedr3')
+    assert len(service) == 2 * nqueries
+
+
+def test_cache_footprint(tmpdir, monkeypatch, sky, service):
+    """Footprint searches return the sources inside the polygon."""
+    monkeypatch.setenv(catalog_cache.CATALOG_CACHE_ENVVAR, str(tmpdir))
+    footprint = np.array([[RA - 0.1, DEC - 0.1], [RA + 0.15, DEC - 0.1],
+                          [RA + 0.15, DEC + 0.05], [RA - 0.1, DEC + 0.1]])
+    table = amutils.get_catalog_from_footprint(footprint, catalog='GAIAedr3')
+
+    # the edges are close enough to straight lines in RA, Dec for the sources used here
+    inside = catalog_cache.in_polygon(footprint, RA, DEC, sky['ra'], sky['dec'])
+    assert inside.sum() > 0
+    assert sorted(table['objID']) == sorted(sky['objID'][inside])
+    x, y = sky['ra'] - RA, sky['dec'] - DEC
+    assert np.all((x[inside] > -0.1) & (x[inside] < 0.15) & (y[inside] > -0.1))
+
+
+def test_seed_cache(tmpdir, monkeypatch, sky, service):
+    """A cache seeded from a catalog file gets used without querying the service."""
+    catfile = str(tmpdir.join('gaia.ecsv'))
+    field = sky[catalog_cache.angular_separation(RA, DEC, sky['ra'], sky['dec']) <= 1.2]
+    field.write(catfile, format='ascii.ecsv')
+    cache_dir = str(tmpdir.join('cache'))
+    tiles = amutils.seed_catalog_cache(catfile, 'GAIAedr3', ra=RA, dec=DEC, radius=1.2, cache_dir=cache_dir)
+    assert len(tiles) > 0
+
+    monkeypatch.setenv(catalog_cache.CATALOG_CACHE_ENVVAR, cache_dir)
+    table = amutils.get_catalog(RA, DEC, sr=0.3, catalog='GAIAedr3')
+    assert len(service) == 0
+    expected = sky[catalog_cache.angular_separation(RA, DEC, sky['ra'], sky['dec']) <= 0.3]
+    assert sorted(table['objID']) == sorted(expected['objID'])
+
+
+@pytest.mark.parametrize('tile_size', [0.1, 0.5])
+def test_cone_tiles(tile_size):
+    """The tiles of a cone contain all the positions within it, including around the poles."""
+    tiling = catalog_cache.SkyTiles(tile_size)
+    rng = np.random.default_rng(2)
+    for ra, dec, radius in [(0.1, 10., 0.4), (359.9, -45., 1.0), (20., 89.6, 0.6), (200., -89.9, 0.2)]:
+        pos_ra = rng.uniform(0, 360, 200000)
+        pos_dec = np.rad2deg(np.arcsin(rng.uniform(-1, 1, 200000)))
+        pos_dec = np.clip(dec + (pos_dec - dec) * radius / 45., -90, 90)
+        within = catalog_cache.angular_separation(ra, dec, pos_ra, pos_dec) <= radius
+        tiles = set(tiling.cone_tiles(ra, dec, radius))
+        assert within.sum() > 0
+        assert set(map(tuple, tiling.tiles_of(pos_ra[within], pos_dec[within]))) <= tiles
+
+
+@pytest.mark.parametrize('tile_size', [0, -0.5, 0.7, 200.])
+def test_bad_tile_size(tile_size):
+    with pytest.raises(ValueError):
+        catalog_cache.CatalogCache('unused', tile_size=tile_size)
+
+
+@pytest.mark.parametrize('sr', [0.05, 0.08, 0.2, 0.7, 1.4])
+def test_cache_query_area(tmpdir, monkeypatch, sky, service, sr):
+    """The tiles retrieved for a cone cover only a few times its area, whatever its radius."""
+    monkeypatch.setenv(catalog_cache.CATALOG_CACHE_ENVVAR, str(tmpdir))
+    amutils.get_catalog(RA, DEC, sr=sr, catalog='GAIAedr3')
+    queried = sum(radius**2 for _, _, radius in service)
+    assert queried < 6 * sr**2
+
+
+def test_cache_epoch_fallback(tmpdir, monkeypatch, sky):
+    """Positions returned without the requested epoch do not get saved for that epoch."""
+    queries = []
+
+    def query(ra, dec, sr=0.1, epoch=None, catalog='GSC241'):
+        queries.append(epoch)
+        table = sky[catalog_cache.angular_separation(ra, dec, sky['ra'], sky['dec']) <= sr]
+        table.meta['query_epoch'] = None
+        return table
+
+    monkeypatch.setattr(amutils, '_query_catalog', query)
+    monkeypatch.setenv(catalog_cache.CATALOG_CACHE_ENVVAR, str(tmpdir))
+    expected = sky[catalog_cache.angular_separation(RA, DEC, sky['ra'], sky['dec']) <= 0.2]
+    table = amutils.get_catalog(RA, DEC, sr=0.2, epoch=2019.5, catalog='GAIAedr3')
+    assert sorted(table['objID']) == sorted(expected['objID'])
+    assert not tmpdir.join('GAIAEDR3', 'epoch_2019.500').check()
+    nqueries = len(queries)
+
+    # the fallback positions got saved as those of the catalog epoch
+    table = amutils.get_catalog(RA, DEC, sr=0.2, catalog='GAIAedr3')
+    assert sorted(table['objID']) == sorted(expected['objID'])
+    assert len(queries) == nqueries
+    amutils.get_catalog(RA, DEC, sr=0.2, epoch=2019.5, catalog='GAIAedr3')
+    assert len(queries) == 2 * nqueries
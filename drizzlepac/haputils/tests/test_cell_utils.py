@@ -0,0 +1,161 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from matplotlib.path import Path
+from scipy import ndimage
+
+from drizzlepac.haputils import cell_utils
+
+
+def test_polygon_spans():
+    """The spans of a polygon cover its inside, and only go one pixel past its edges."""
+    angle = np.deg2rad(np.arange(0, 360, 5.) + 12.)
+    # part of the polygon lies beyond the array
+    x = 60. + 70. * np.cos(angle)
+    y = 50. + 35. * np.sin(angle)
+    shape = (90, 120)
+    mask = np.zeros(shape, dtype=np.int16)
+    cell_utils.fill_spans(mask, cell_utils.polygon_spans(x, y, shape), 1)
+
+    yy, xx = np.indices(shape)
+    pixels = np.column_stack([xx.ravel(), yy.ravel()])
+    inside = Path(np.column_stack([x, y])).contains_points(pixels).reshape(shape)
+    grown = Path(np.column_stack([60. + 72. * np.cos(angle), 50. + 37. * np.sin(angle)]))
+    assert mask.max() == 1
+    assert np.all(mask[inside] == 1)
+    assert np.all(mask[~grown.contains_points(pixels).reshape(shape)] == 0)
+
+
+def test_build_serial_by_default(tmpdir, monkeypatch):
+    """SkyFootprint.build never starts a pool of its own unless asked to."""
+    from stwcs import wcsutil
+    from drizzlepac import util
+
+    sample = os.path.join(os.path.dirname(__file__), 'sample_svm_flc.fits')
+    expnames = [str(tmpdir.join('exp{}_flc.fits'.format(k))) for k in range(3)]
+    for expname in expnames:
+        shutil.copy(sample, expname)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("worker pool started")
+
+    monkeypatch.setattr(util, 'can_parallel', True)
+    monkeypatch.setattr(util, '_cpu_count', 4)
+    monkeypatch.setattr(util, 'worker_pool', no_pool)
+    footprint = cell_utils.SkyFootprint(wcsutil.HSTWCS(expnames[0], ext=('SCI', 1)))
+    footprint.build(expnames, scale=True)
+    assert footprint.total_mask.max() == 3
+
+
+def _reference_poly_trace(input_mask, box_size=3):
+    """The walk of ``_poly_trace`` as first written, extracting boxes from the mask at each step."""
+    border = (box_size // 2)
+    mask = np.pad(input_mask, border)
+    xstart = int(np.nonzero(mask.any(axis=0))[0][0])
+    ystart = int(np.nonzero(mask[:, xstart] == 1)[0][0])
+    polygon = [[xstart, ystart]]
+    mask[ystart, xstart] = 0
+    new_x, new_y = xstart, ystart
+    new_start = True
+    slope = -1
+    num_pixels = mask.sum()
+
+    while new_start or (num_pixels > 0):
+        xstart, ystart = new_x, new_y
+        mask[ystart, xstart] = 0
+        pts = np.where(cell_utils.get_box(mask, xstart, ystart) == 1)
+        if len(pts[0]) == 0:
+            pts = np.where(cell_utils.get_box(mask, xstart, ystart, size=5) == 1)
+            if len(pts[0]) == 0:
+                break
+
+        indx = 0
+        if len(pts[0]) > 1:
+            slope_indx = 0 if slope <= 0 else 1
+            slope_sum = cell_utils.get_box(mask, pts[1][slope_indx] + xstart - 1,
+                                           pts[0][slope_indx] + ystart - 1).sum()
+            indx2 = 1 if slope < 0 else 0
+            sum2 = cell_utils.get_box(mask, pts[1][indx2] + xstart - 1, pts[0][indx2] + ystart - 1).sum()
+            if slope_sum == sum2:
+                indx = slope_indx
+            else:
+                indx = indx2 if sum2 > slope_sum else slope_indx
+
+        new_y = pts[0][indx] + ystart - 1
+        new_x = pts[1][indx] + xstart - 1
+        polygon.append([new_x, new_y])
+        num_pixels -= 1
+        new_start = False
+        slope = (new_y - ystart) / (new_x - xstart)
+
+    polygon.append(polygon[0])
+    return np.array(polygon, dtype=np.int32)
+
+
+def _test_masks():
+    """Masks with known outlines, as (name, mask)."""
+    masks = []
+    rect = np.zeros((40, 60), dtype=bool)
+    rect[5:30, 8:50] = True
+    masks.append(('rectangle', rect))
+
+    # touching the left, top and bottom borders
+    border = np.zeros((40, 60), dtype=bool)
+    border[:, :35] = True
+    border[10:, 35:45] = True
+    masks.append(('border', border))
+    masks.append(('full', np.ones((25, 30), dtype=bool)))
+
+    yy, xx = np.indices((80, 100))
+    xr = (xx - 50) * np.cos(0.4) + (yy - 40) * np.sin(0.4)
+    yr = -(xx - 50) * np.sin(0.4) + (yy - 40) * np.cos(0.4)
+    ellipse = (xr / 40.)**2 + (yr / 25.)**2 <= 1
+    masks.append(('ellipse', ellipse))
+    # with a hole in the middle
+    masks.append(('annulus', ellipse & ((xr / 15.)**2 + (yr / 8.)**2 > 1)))
+
+    # single pixel spurs, along a row, a column and a diagonal
+    spurs = rect.copy()
+    spurs[17, 50:56] = True
+    spurs[1:5, 20] = True
+    for k in range(1, 4):
+        spurs[29 + k, 49 + k] = True
+    masks.append(('spurs', spurs))
+
+    # rotated square reaching the borders
+    diamond = (np.abs(xx[:60, :60] - 30) + np.abs(yy[:60, :60] - 28)) <= 31
+    masks.append(('diamond', diamond))
+
+    rng = np.random.default_rng(3)
+    for k in range(5):
+        blobs = np.zeros((50, 70), dtype=bool)
+        blobs[rng.integers(5, 45, 6), rng.integers(5, 65, 6)] = True
+        masks.append(('blobs{}'.format(k), ndimage.binary_dilation(blobs, iterations=rng.integers(4, 9))))
+    return masks
+
+
+@pytest.mark.parametrize('name, mask', _test_masks())
+def test_poly_trace(name, mask):
+    """Edge pixels get traced as they were by the original implementation."""
+    edges = (mask.astype(np.int16) - ndimage.binary_erosion(mask).astype(np.int16))
+    mask_slice = (slice(3, 3 + mask.shape[0]), slice(7, 7 + mask.shape[1]))
+    polygon = cell_utils.trace_polygon(mask, mask_slice)
+
+    expected = _reference_poly_trace(edges)
+    np.testing.assert_array_equal(cell_utils._poly_trace(edges), expected)
+    np.testing.assert_array_equal(polygon, expected + (7, 3))
+
+    # the polygon only follows edge pixels, closing on the first one, with the
+    # padding of the traced mask offsetting it by one pixel
+    x, y = (expected[:, 0] - 1), (expected[:, 1] - 1)
+    assert np.all(edges[y, x] == 1)
+    assert tuple(expected[0]) == tuple(expected[-1])
+
+    if name in ('ellipse', 'annulus', 'diamond'):
+        # the whole outer outline gets traced, step by step, leaving out the edges of holes
+        filled = ndimage.binary_fill_holes(mask)
+        outline = filled & ~ndimage.binary_erosion(filled)
+        assert set(zip(y.tolist(), x.tolist())) == set(zip(*np.nonzero(outline)))
+        assert np.abs(np.diff(expected, axis=0)).max() == 1
@@ -0,0 +1,391 @@
+import numpy
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import MaskedColumn, Table
+
+from drizzlepac.haputils import hla_flag_filter
+
+
+def test_xymatch():
+    """All the pairs within the separation get found, in order of increasing Y."""
+    rng = np.random.default_rng(0)
+    cat1 = rng.uniform(0, 100, (300, 2))
+    cat2 = rng.uniform(0, 100, (200, 2))
+    cat2[0] = np.nan
+    sep = 3.0
+
+    distsq = ((cat1[:, None, :] - cat2[None, :, :])**2).sum(axis=2)
+    within = distsq <= sep**2
+
+    p1, p2 = hla_flag_filter.xymatch(cat1, cat2, sep, multiple=True, verbose=False)
+    assert len(p1) == within.sum()
+    assert within[p1, p2].all()
+    order = np.lexsort((cat2[p2, 1], cat1[p1, 1]))
+    assert np.array_equal(order, np.arange(len(p1)))
+
+    g1, g2 = hla_flag_filter.xymatch(cat1, cat2, sep, multiple=True, stack=False, verbose=False)
+    assert np.array_equal(np.repeat(g1, [len(g) for g in g2]), p1)
+    assert np.array_equal(np.concatenate(g2), p2)
+
+    closest = hla_flag_filter.xymatch(cat1, cat2, sep, verbose=False)
+    matched = within.any(axis=1)
+    assert np.all(closest[~matched] == -len(cat2) - 1)
+    best = np.where(within, distsq, np.inf).min(axis=1)
+    assert np.array_equal(distsq[matched, closest[matched]], best[matched])
+
+
+def test_ci_filter():
+    """Missing CI values and magnitude errors get flagged like undefined ones."""
+    catalog = Table()
+    catalog["CI"] = MaskedColumn([0.4, 0.0, 0.4, 0.9, 0.1, 0.4], mask=[0, 0, 1, 0, 0, 0])
+    catalog["MagErrAp1"] = [0.01, 0.01, 0.01, 0.01, 0.01, 0.0]
+    catalog["MagErrAp2"] = [0.01] * 6
+    catalog["FluxAp2"] = MaskedColumn([100.0, 100.0, 100.0, 100.0, 1.0, 100.0], mask=[0, 0, 0, 1, 0, 0])
+    catalog["FluxErrAp2"] = [1.0] * 6
+    catalog["Flags"] = np.zeros(6, dtype=np.int64)
+    param_dict = {"quality control": {"ci filter": {"aperture": {"ci_lower_limit": 0.25, "ci_upper_limit": 0.55,
+                                                                 "bthresh": 5.0}}}}
+
+    catalog = hla_flag_filter.ci_filter("image", "catalog.ecsv", catalog, "aperture", param_dict, {}, 20, False)
+    assert list(catalog["Flags"]) == [0, 17, 17, 9, 24, 16]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# The swarm, saturation and nexp flags set from the catalog columns are compared with those set by going through the
+# catalog rows one by one, as done before, on synthetic catalogs with masked, NaN and zero values.
+
+COLUMN_TITLES = {"x_coltitle": "X-Center", "y_coltitle": "Y-Center"}
+SWARM_FILTER = {
+    "uvis": {"HLA_plate_scale": 0.03962, "upper_epp_limit": 70000.0, "lower_epp_limit": 2000.0,
+             "eppsky_limit": 1000.0, "selfradius": 20.0, "swarm_thresh": 1.0,
+             "clip_radius_list": [120.0, 100.0, 80.0, 60.0, 40.0, 20.0, 10.0, 5.0, 2.0, 0.0],
+             "scale_factor_list": [2.3e-06, 4e-06, 8e-06, 2e-05, 0.0005, 0.005, 0.005, 0.015, 0.45, 1.0],
+             "proximity_binary": True, "ctrList_radiusList": [40, 35, 20, 15, 10],
+             "ctrList_thresholdList": [100000, 70000, 50000, 10000, 2000]},
+    "ir": {"HLA_plate_scale": 0.09, "upper_epp_limit": 70000.0, "lower_epp_limit": 2000.0, "eppsky_limit": 100.0,
+           "selfradius": 10.0, "cuts_list": [2000000.0, 1800000.0, 1000000.0, 500000.0, 70000.0, 20000.0, 0.0],
+           "selfradii_list": [125.0, 100.0, 35.0, 30.0, 20.0, 15.0, 10.0], "swarm_thresh": 1.0,
+           "clip_radius_list": [140.0, 120.0, 100.0, 80.0, 60.0, 40.0, 20.0, 10.0, 5.0, 2.0, 0.0],
+           "scale_factor_list": [1e-05, 2.3e-05, 4e-05, 8e-05, 0.0002, 0.0006, 0.015, 0.05, 0.15, 0.9, 1.0],
+           "proximity_binary": True, "ctrList_radiusList": [125, 100, 80, 30, 50, 20, 15],
+           "ctrList_thresholdList": [2000000, 1800000, 500000, 250000, 100000, 40000, 20000]},
+}
+PLATE_SCALE = {"uvis": 0.04, "ir": 0.128}
+APERTURE_2 = {"uvis": 0.15, "ir": 0.45}
+
+
+def _param_dict(channel):
+    return {"catalog generation": {"aperture_2": APERTURE_2[channel]},
+            "quality control": {"swarm filter": SWARM_FILTER[channel]}}
+
+
+def _drizzled_image(channel):
+    return "hst_12345_01_wfc3_{}_f160w_ib4606_drz.fits".format(channel)
+
+
+def _swarm_catalog(rng, size=400.):
+    """Bright sources surrounded by fainter ones, with masked, NaN and zero values."""
+    fluxes = [3e3, 2e4, 4e4, 1e5, 3e5, 1e6]
+    x = [rng.uniform(0, size, len(fluxes))]
+    y = [rng.uniform(0, size, len(fluxes))]
+    flux = [numpy.array(fluxes)]
+    for cx, cy, cflux in zip(x[0], y[0], fluxes):
+        # duplicated detections of the bright source, with the same flux for some of them
+        n = 3
+        x.append(cx + rng.uniform(-8, 8, n))
+        y.append(cy + rng.uniform(-8, 8, n))
+        flux.append(cflux * rng.choice([0.3, 1.0, 2.0], n))
+        # fainter sources around it
+        n = 40
+        r = rng.uniform(0, 150, n)
+        theta = rng.uniform(0, 2 * numpy.pi, n)
+        x.append(cx + r * numpy.cos(theta))
+        y.append(cy + r * numpy.sin(theta))
+        flux.append(cflux * 10**rng.uniform(-7, -0.5, n))
+    n = 60
+    x.append(rng.uniform(0, size, n))
+    y.append(rng.uniform(0, size, n))
+    flux.append(rng.uniform(0, 3000, n))
+    x, y, flux = numpy.concatenate(x), numpy.concatenate(y), numpy.concatenate(flux)
+    nrows = len(x)
+    # bright sources sharing the same position
+    x[1], y[1] = x[0], y[0]
+    sky = rng.uniform(0, 10, nrows)
+    for values in (x, y, flux, sky):
+        values[rng.choice(nrows, 5, replace=False)] = numpy.nan
+    flux[rng.choice(nrows, 5, replace=False)] = 0.0
+    sky[rng.choice(nrows, 5, replace=False)] = 0.0
+
+    catalog = Table()
+    catalog["X-Center"] = MaskedColumn(x, mask=rng.random(nrows) < 0.03)
+    catalog["Y-Center"] = MaskedColumn(y, mask=rng.random(nrows) < 0.03)
+    catalog["FluxAp2"] = MaskedColumn(flux, mask=rng.random(nrows) < 0.03)
+    catalog["MSkyAp2"] = MaskedColumn(sky, mask=rng.random(nrows) < 0.03)
+    catalog["Flags"] = rng.choice([0, 1, 32], nrows).astype(numpy.int64)
+    return catalog
+
+
+def _row_positions(catalog):
+    """Positions read from each row of the catalog, as done before."""
+    positions = numpy.empty((len(catalog), 2), dtype=float)
+    for row_count, row in enumerate(catalog):
+        positions[row_count, 0] = float(row[COLUMN_TITLES["x_coltitle"]])
+        positions[row_count, 1] = float(row[COLUMN_TITLES["y_coltitle"]])
+    return positions
+
+
+def _row_flags(catalog, flagged, bit):
+    """Flags set on each row of the catalog, as done before."""
+    catalog = catalog.copy()
+    for i, table_row in enumerate(catalog):
+        if flagged[i]:
+            table_row["Flags"] = int(table_row["Flags"]) | bit
+    return numpy.array(catalog["Flags"])
+
+
+def _reference_swarm_flags(catalog, exptime, plate_scale, median_sky, channel, param_dict):
+    """Swarm flags computed row by row and group by group."""
+    swarm_pars = param_dict["quality control"]["swarm filter"]
+    scale_to_hla = swarm_pars["HLA_plate_scale"] / plate_scale
+    area = numpy.pi * (param_dict["catalog generation"]["aperture_2"] / plate_scale)**2
+
+    nrows = len(catalog)
+    src = numpy.empty((nrows, 6), dtype=float)
+    for row_num, row in enumerate(catalog):
+        flux = row["FluxAp2"]
+        sky = row["MSkyAp2"]
+        if not flux:
+            flux = 0.0
+        if not sky:
+            sky = 0.0
+        electronpp = flux / area * exptime
+        src[row_num, 2:] = [flux, electronpp, sky, electronpp / median_sky]
+    src[:, 0:2] = _row_positions(catalog)
+    epp = src[:, 3]
+
+    # brightest detections of the swarm candidates
+    central_pos = numpy.where((epp > swarm_pars["upper_epp_limit"]) |
+                              ((epp > swarm_pars["eppsky_limit"] * median_sky) &
+                               (epp > swarm_pars["lower_epp_limit"])))[0]
+    central = src[central_pos, :]
+    selfradius = swarm_pars["selfradius"] * scale_to_hla
+    if len(central_pos) > 0 and channel == "ir":
+        cuts = swarm_pars["cuts_list"]
+        selfradii = numpy.array(swarm_pars["selfradii_list"]) * scale_to_hla
+        p1 = []
+        p2 = []
+        for cut_cnt, cut in enumerate(cuts):
+            if cut_cnt == 0:
+                cut_pos = numpy.where(central[:, 3] > cut)[0]
+            else:
+                cut_pos = numpy.where((central[:, 3] >= cut) & (central[:, 3] <= cuts[cut_cnt - 1]))[0]
+            if len(cut_pos) == 0:
+                continue
+            p1_sub, p2_sub = hla_flag_filter.xymatch(central[cut_pos, 0:2], central[:, 0:2], selfradii[cut_cnt],
+                                                     multiple=True, stack=False, verbose=False)
+            p1.extend(p1_sub)
+            p2.extend(p2_sub)
+            if cut_cnt == len(cuts) - 1 and len(p1) == 0:
+                p1, p2 = hla_flag_filter.xymatch(central[:, 0:2], central[:, 0:2], selfradius,
+                                                 multiple=True, stack=False, verbose=False)
+        exclude_bool = numpy.ones(len(central), dtype=bool)
+        for i2 in p2:
+            flux2 = central[i2, 2]
+            exclude_bool[i2[flux2 < numpy.max(flux2)]] = False
+        central_pos = central_pos[exclude_bool]
+        central = central[exclude_bool]
+    elif len(central_pos) > 0:
+        p1, p2 = hla_flag_filter.xymatch(central[:, 0:2], central[:, 0:2], selfradius,
+                                         multiple=True, stack=False, verbose=False)
+        keep_index = numpy.arange(len(central))
+        for i1, i2 in zip(p1, p2):
+            keep_index[i1] = i2[central[i2, 2].argmax()]
+        keep_bool = numpy.zeros(len(central), dtype=bool)
+        keep_bool[keep_index] = True
+        central_pos = central_pos[keep_bool]
+        central = central[keep_bool]
+
+    # sources clipped in the rings around each central source
+    clip_radius_list = numpy.array(swarm_pars["clip_radius_list"]) * scale_to_hla
+    scale_factor_list = swarm_pars["scale_factor_list"]
+    notcentral_index = numpy.setdiff1d(numpy.arange(nrows), central_pos)
+    others = src[notcentral_index, :]
+    flagged = numpy.zeros(nrows, dtype=bool)
+    pcentral, pfull = hla_flag_filter.xymatch(central[:, 0:2], others[:, 0:2], clip_radius_list[0],
+                                              multiple=True, stack=False, verbose=False)
+    for ii, allmatches in zip(pcentral, pfull):
+        distsq = (others[allmatches, 0] - central[ii, 0])**2 + (others[allmatches, 1] - central[ii, 1])**2
+        sind = distsq.argsort()
+        allmatches = allmatches[sind]
+        rcut = distsq[sind].searchsorted(clip_radius_list**2)
+        for radius_cnt in range(1, len(clip_radius_list)):
+            matches = allmatches[rcut[radius_cnt]:rcut[radius_cnt - 1]]
+            ref_epp = central[ii, 3] * scale_factor_list[radius_cnt - 1]
+            clipped = others[matches, 3] / ref_epp < swarm_pars["swarm_thresh"]
+            flagged[notcentral_index[matches[clipped]]] = True
+
+    # sources close to the central sources
+    thresholds = swarm_pars["ctrList_thresholdList"]
+    radii = numpy.array(swarm_pars["ctrList_radiusList"]) * scale_to_hla
+    for cnt, (threshold, radius) in enumerate(zip(thresholds, radii)):
+        cut = central[:, 3] > threshold
+        if cnt > 0:
+            cut &= central[:, 3] <= thresholds[cnt - 1]
+        for k in numpy.flatnonzero(cut):
+            distsq = (others[:, 0] - central[k, 0])**2 + (others[:, 1] - central[k, 1])**2
+            flagged[notcentral_index[distsq <= radius**2]] = True
+
+    return _row_flags(catalog, flagged, 32)
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("channel", ["uvis", "ir"])
+def test_swarm_flags(channel, seed):
+    """The swarm flags match those computed row by row, for the brightest detections of each group and the
+    sources clipped in each ring."""
+    rng = numpy.random.default_rng(seed)
+    catalog = _swarm_catalog(rng)
+    param_dict = _param_dict(channel)
+    expected = _reference_swarm_flags(catalog, 100., PLATE_SCALE[channel], 5., channel, param_dict)
+    flags = numpy.array(catalog["Flags"])
+
+    result = hla_flag_filter.hla_swarm_flags(_drizzled_image(channel), "catalog.ecsv", catalog, 100.,
+                                             PLATE_SCALE[channel], 5., "aperture", param_dict, COLUMN_TITLES, False)
+    assert result["Flags"].dtype == numpy.int64
+    assert numpy.array_equal(result["Flags"], expected)
+    # some, but not all, sources get flagged
+    flagged = (result["Flags"] & 32) > (flags & 32)
+    assert 0 < flagged.sum() < len(catalog) // 2
+
+
+def test_swarm_flags_empty():
+    """Nothing to flag in an empty catalog or without bright sources."""
+    catalog = _swarm_catalog(numpy.random.default_rng(0))
+    param_dict = _param_dict("uvis")
+    empty = catalog[:0]
+    result = hla_flag_filter.hla_swarm_flags(_drizzled_image("uvis"), "catalog.ecsv", empty, 100.,
+                                             PLATE_SCALE["uvis"], 5., "aperture", param_dict, COLUMN_TITLES, False)
+    assert len(result) == 0
+
+    faint = catalog.copy()
+    faint["FluxAp2"] = 1.0
+    flags = numpy.array(faint["Flags"])
+    result = hla_flag_filter.hla_swarm_flags(_drizzled_image("uvis"), "catalog.ecsv", faint, 100.,
+                                             PLATE_SCALE["uvis"], 5., "aperture", param_dict, COLUMN_TITLES, False)
+    assert numpy.array_equal(result["Flags"], flags)
+
+
+def test_group_max():
+    """The maxima of the groups are those of numpy.max, including NaN values."""
+    rng = numpy.random.default_rng(1)
+    groups = numpy.sort(rng.integers(0, 40, 300))
+    values = rng.choice([1.0, 2.0, 3.0, numpy.nan], 300, p=[0.4, 0.3, 0.28, 0.02])
+    expected = numpy.array([numpy.max(values[groups == g]) for g in groups])
+    assert numpy.array_equal(hla_flag_filter._group_max(values, groups), expected, equal_nan=True)
+    assert len(hla_flag_filter._group_max(values[:0], groups[:0])) == 0
+
+
+def _sat_catalog(rng, nrows=300, size=100.):
+    catalog = Table()
+    x = rng.uniform(0, size, nrows)
+    y = rng.uniform(0, size, nrows)
+    x[rng.choice(nrows, 5, replace=False)] = numpy.nan
+    x[:3] = 0.0
+    catalog["X-Center"] = MaskedColumn(x, mask=rng.random(nrows) < 0.03)
+    catalog["Y-Center"] = MaskedColumn(y, mask=rng.random(nrows) < 0.03)
+    catalog["Flags"] = rng.choice([0, 4, 16], nrows).astype(numpy.int64)
+    return catalog
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_saturation_flags(tmpdir, monkeypatch, seed):
+    """The saturation flags match those computed row by row."""
+    monkeypatch.chdir(tmpdir)
+    rng = numpy.random.default_rng(seed)
+    # saturated pixels of the two chips of two exposures, the chips being next to each other in the drizzled image
+    flt_list = []
+    sat_coords = []
+    for k in range(2):
+        hdul = fits.HDUList([fits.PrimaryHDU()])
+        for chip in (1, 2):
+            dq = numpy.zeros((50, 100), dtype=numpy.int16)
+            dq[rng.integers(0, 50, 4), rng.integers(0, 100, 4)] |= 256 | 2
+            dq[rng.integers(0, 50, 10), rng.integers(0, 100, 10)] |= 512
+            hdul.append(fits.ImageHDU(dq, name="DQ", ver=chip))
+            yy, xx = numpy.nonzero(dq & 256)
+            sat_coords.append(numpy.stack([xx, yy + 50. * (chip - 1)], axis=1))
+        flt_list.append("ib4606c{}q_flc.fits".format(k))
+        hdul.writeto(flt_list[-1])
+    sat_coords = numpy.concatenate(sat_coords)
+
+    def xytord(xy_coord_array, image, image_ext, origin=1):
+        chip = int(image_ext.split(',')[1].split(']')[0])
+        return xy_coord_array + [0., 50. * (chip - 1)]
+
+    monkeypatch.setattr(hla_flag_filter, "xytord", xytord)
+    monkeypatch.setattr(hla_flag_filter, "rdtoxy", lambda rd_coord_array, image, image_ext, origin=1: rd_coord_array)
+
+    catalog = _sat_catalog(rng)
+    param_dict = _param_dict("uvis")
+    radius = round((APERTURE_2["uvis"] / PLATE_SCALE["uvis"]) + 0.5) * 2.
+    positions = _row_positions(catalog)
+    distsq = ((positions[:, None, :] - sat_coords[None, :, :])**2).sum(axis=2)
+    expected = _row_flags(catalog, (distsq <= radius**2).any(axis=1), 4)
+    flags = numpy.array(catalog["Flags"])
+
+    result = hla_flag_filter.hla_saturation_flags(_drizzled_image("uvis"), flt_list, "catalog.ecsv", catalog,
+                                                  "aperture", param_dict, PLATE_SCALE["uvis"], COLUMN_TITLES, False)
+    assert numpy.array_equal(result["Flags"], expected)
+    assert 0 < ((result["Flags"] & 4) > (flags & 4)).sum()
+
+
+def _reference_nexp_flags(catalog, nexp_array, radius, artifact_filt):
+    """Sources with a low number of exposures within the radius, computed source by source."""
+    positions = _row_positions(catalog)
+    flagged = numpy.zeros(len(catalog), dtype=bool)
+    ny, nx = nexp_array.shape
+    for i, (x, y) in enumerate(positions):
+        ix, iy = (numpy.array([x, y]) + 0.5).astype(int)
+        iradius = int(radius + 1)
+        nexp_min = None
+        for dy in range(-iradius, iradius + 1):
+            for dx in range(-iradius, iradius + 1):
+                if dx**2 + dy**2 <= radius**2:
+                    value = nexp_array[min(max(iy + dy, 0), ny - 1), min(max(ix + dx, 0), nx - 1)]
+                    nexp_min = value if nexp_min is None else min(nexp_min, value)
+        flagged[i] = nexp_min < artifact_filt
+    return flagged
+
+
+@pytest.mark.parametrize("nexp", [1, 3, 6])
+def test_nexp_flags(tmpdir, monkeypatch, nexp):
+    """The flags of sources where few exposures contribute match those computed source by source."""
+    monkeypatch.chdir(tmpdir)
+    rng = numpy.random.default_rng(nexp)
+    shape = (60, 90)
+    drizzled_image = _drizzled_image("uvis")
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(numpy.ones(shape, dtype=numpy.float32))]).writeto(drizzled_image)
+    nexp_array = numpy.zeros(shape, dtype=numpy.int32)
+    component_list = []
+    for k in range(nexp):
+        data = numpy.zeros(shape, dtype=numpy.float32)
+        # exposures covering different parts of the image
+        data[rng.integers(0, 20):, :rng.integers(40, 91)] = 1.0
+        component_list.append("comp{}_drz.fits".format(k))
+        fits.PrimaryHDU(data).writeto(component_list[-1])
+        nexp_array += data != 0
+    monkeypatch.setattr(hla_flag_filter, "get_component_drz_list", lambda *args: component_list)
+    mask_data = numpy.zeros(shape)
+    mask_data[:5, :] = 1.0
+
+    catalog = _sat_catalog(rng, size=95.)
+    radius = APERTURE_2["uvis"] / PLATE_SCALE["uvis"]
+    artifact_filt = {1: 0.5, 3: 1.5, 6: 2.5}[nexp]
+    flagged = _reference_nexp_flags(catalog, nexp_array * (mask_data == 0.0), radius, artifact_filt)
+    expected = _row_flags(catalog, flagged, 64)
+
+    result = hla_flag_filter.hla_nexp_flags(drizzled_image, [], _param_dict("uvis"), PLATE_SCALE["uvis"],
+                                            "catalog.ecsv", catalog, {}, mask_data, COLUMN_TITLES, False)
+    assert numpy.array_equal(result["Flags"], expected)
+    assert 0 < flagged.sum() < len(catalog)
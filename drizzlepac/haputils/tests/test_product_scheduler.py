@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from drizzlepac import util
+from drizzlepac.haputils.product_scheduler import ProductScheduler
+
+
+def _task(logfile, name, duration=0.0, fail=False):
+    with open(logfile, "a") as f:
+        f.write("start {}\n".format(name))
+    time.sleep(duration)
+    if fail:
+        raise ValueError("failed")
+    with open(logfile, "a") as f:
+        f.write("end {}\n".format(name))
+    return name.upper()
+
+
+def _events(logfile):
+    with open(logfile) as f:
+        return [line.split()[:2] for line in f]
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    monkeypatch.setattr(util, "can_parallel", True)
+    monkeypatch.setattr(util, "_cpu_count", 4)
+
+
+@pytest.mark.parametrize("num_cores", [1, 3])
+def test_scheduler_order(tmpdir, parallel, num_cores):
+    """Tasks start once those they depend on have completed, and their results get returned."""
+    logfile = str(tmpdir.join("tasks.log"))
+    results = {}
+    scheduler = ProductScheduler(num_cores=num_cores)
+    for name in ["f1", "f2"]:
+        scheduler.add(name, _task, args=(logfile, name, 0.2), on_done=results.setdefault)
+        for k in range(2):
+            scheduler.add(name + "e" + str(k), _task, args=(logfile, name + "e" + str(k)), depends=[name])
+    scheduler.add("total", _task, args=(logfile, "total"), depends=list(scheduler.tasks),
+                  on_done=results.setdefault)
+    timing = scheduler.run()
+
+    assert set(timing) == set(scheduler.tasks)
+    assert set(results) == {"F1", "F2", "TOTAL"}
+    events = _events(logfile)
+    for name, task in scheduler.tasks.items():
+        start = events.index(["start", name])
+        for dep in task.depends:
+            assert events.index(["end", dep]) < start
+    if num_cores > 1:
+        # both filter tasks run at the same time
+        assert events[:2] == [["start", "f1"], ["start", "f2"]]
+
+
+def test_scheduler_failure(tmpdir, parallel):
+    """A failed task stops the tasks depending on it."""
+    logfile = str(tmpdir.join("tasks.log"))
+    scheduler = ProductScheduler(num_cores=2)
+    scheduler.add("f1", _task, args=(logfile, "f1", 0.0, True))
+    scheduler.add("f1e0", _task, args=(logfile, "f1e0"), depends=["f1"])
+    with pytest.raises(RuntimeError, match="f1"):
+        scheduler.run()
+    assert ["start", "f1e0"] not in _events(logfile)
+    assert "f1e0" not in scheduler.timing
+
+
+def test_scheduler_memory(tmpdir, parallel):
+    """Tasks do not run at the same time when their memory adds up to more than the limit."""
+    logfile = str(tmpdir.join("tasks.log"))
+    scheduler = ProductScheduler(num_cores=2, max_memory=1)
+    for name in ["f1", "f2"]:
+        scheduler.add(name, _task, args=(logfile, name, 0.1), memory=2**20)
+    scheduler.run()
+    assert _events(logfile) == [["start", "f1"], ["end", "f1"], ["start", "f2"], ["end", "f2"]]
@@ -6,7 +6,9 @@ A class which makes image objects for each input filename.
 :License: :doc:`/LICENSE`
 
 """
+import collections
 import copy, os, re, sys
+import threading
 
 import numpy as np
 from stwcs import distortion
@@ -18,7 +20,7 @@ from . import wcs_functions
 from . import buildmask
 from . import __version__
 
-__all__ = ['baseImageObject', 'imageObject', 'WCSObject']
+__all__ = ['baseImageObject', 'imageObject', 'WCSObject', 'DataCache']
 
 
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
@@ -30,6 +32,93 @@ _NUMPY_TO_IRAF_DTYPES = {'float64': -64, 'float32': -32, 'uint8': 8,
 _IRAF_DTYPES_TO_NUMPY = {-64: 'float64', -32: 'float32', 8: 'uint8',
                          16: 'int16', 32: 'int32', 64: 'int64'}
 
+# Default limit on the size of the arrays cached for each image (in bytes)
+DEFAULT_CACHE_SIZE = 256 * 2**20
+
+
+class DataCache:
+    """ Cache of the data arrays read from the extensions of FITS files.
+
+    Arrays are kept until their total size exceeds ``max_bytes``, at which
+    point the least recently used ones get dropped.  An array also gets read
+    again when its file has been modified since it was cached, as is the case
+    for the DQ arrays updated by the ``driz_cr`` step.
+
+    With ``memmap=True``, arrays from uncompressed files are memory-mapped
+    instead of read into memory.  Since the operating system can then drop
+    (and later re-read) their pages as needed, they do not count against
+    ``max_bytes``.
+
+    Arrays returned by the cache are shared by all callers, so they must
+    not be modified in place.
+    """
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE, memmap=False):
+        self.max_bytes = max_bytes
+        self.memmap = memmap
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._arrays = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fname, exten):
+        """ Return the data array of extension ``exten`` of file ``fname``,
+        or None if that file does not exist.
+        """
+        if not os.path.exists(fname):
+            return None
+        key = (fname, exten.lower())
+        stat = os.stat(fname)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._arrays.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._arrays.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        memmap = self.memmap and not fname.endswith(('.gz', '.bz2', '.zip'))
+        _image = fileutil.openImage(fname, clobber=False, memmap=memmap)
+        data = fileutil.getExtn(_image, extn=exten).data
+        _image.close()
+        del _image
+
+        if data is None:
+            return None
+        size = 0 if isinstance(data, np.memmap) else data.nbytes
+
+        with self._lock:
+            old = self._arrays.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            if size <= self.max_bytes:
+                self._arrays[key] = (stamp, data, size)
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    self.nbytes -= self._arrays.popitem(last=False)[1][2]
+
+        return data
+
+    def __getstate__(self):
+        # cached arrays and the lock are not passed on to other processes
+        state = self.__dict__.copy()
+        state['_arrays'] = collections.OrderedDict()
+        state['nbytes'] = 0
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """ Release all the cached arrays. """
+        with self._lock:
+            self._arrays.clear()
+            self.nbytes = 0
+
 
 class baseImageObject:
     """ Base ImageObject which defines the primary set of methods. """
@@ -59,6 +148,9 @@ class baseImageObject:
         # this is the number of chip which will be combined based on 'group' parameter
         self._nmembers = 0
 
+        # arrays read by getData()
+        self._data_cache = DataCache()
+
     def __getitem__(self,exten):
         """ Overload  getitem to return the data and header
             these only work on the HDU list already in memory
@@ -97,6 +189,7 @@ class baseImageObject:
             the data array returned for future use. You can use
             putData to reattach a new data array to the imageObject.
         """
+        self._data_cache.clear()
         if self._image is None:
             return
 
@@ -146,10 +239,22 @@ class baseImageObject:
                 if fname in chip.outputNames:
                     util.removeFileSafely(chip.outputNames[fname])
 
+    def setDataCache(self, max_bytes=DEFAULT_CACHE_SIZE, memmap=False):
+        """ Set the limit on the total size of the arrays which `getData`
+            keeps for re-use, and whether they get memory-mapped from
+            uncompressed files.  See `DataCache` for details.
+        """
+        self._data_cache.clear()
+        self._data_cache = DataCache(max_bytes=max_bytes, memmap=memmap)
+
     def getData(self,exten=None):
         """ Return just the data array from the specified extension
             fileutil is used instead of fits to account for non-
             FITS input images. openImage returns a fits object.
+
+            Arrays read from the file are kept in a cache (see
+            `setDataCache`) shared by all processing steps, so the
+            returned array must not be modified in place.
         """
         if exten.lower().find('sci') > -1:
             # For SCI extensions, the current file will have the data
@@ -164,19 +269,15 @@ class baseImageObject:
             fname = sci_chip.dqfile
 
         extnum = self._interpretExten(exten)
-        if self._image[extnum].data is None:
-            if os.path.exists(fname):
-                _image=fileutil.openImage(fname, clobber=False, memmap=False)
-                _data=fileutil.getExtn(_image, extn=exten).data
-                _image.close()
-                del _image
-                self._image[extnum].data = _data
-            else:
-                _data = None
-        else:
+        # Use any array which has been explicitly attached to this object
+        # (only check the instance dict since simply accessing 'data' would
+        # read the array from the file and keep it outside the cache).
+        if 'data' in vars(self._image[extnum]):
             _data = self._image[extnum].data
+            if _data is not None:
+                return _data
 
-        return _data
+        return self._data_cache.get(fname, exten)
 
     def getHeader(self,exten=None):
         """ Return just the specified header extension fileutil
@@ -11,6 +11,7 @@ import os
 import sys
 import copy
 import numpy as np
+from scipy.spatial import cKDTree
 
 from astropy import wcs as pywcs
 from astropy.io import fits
@@ -1547,18 +1548,41 @@ def _is_cd_unitary(wcs):
 
 def _xy_2dhist(imgxy, refxy, r):
     # This code replaces the C version (arrxyzero) from carrutils.c
-    # It is about 5-8 times slower than the C version.
-    dx = np.subtract.outer(imgxy[:, 0], refxy[:, 0]).ravel()
-    dy = np.subtract.outer(imgxy[:, 1], refxy[:, 1]).ravel()
+    # Only the pairs of positions closer than the search radius along both
+    # axes get compared, as found using a k-d tree of the reference
+    # positions, instead of all len(imgxy) x len(refxy) pairs.
     r = int(np.ceil(r))
+    imgidx, refidx = _xy_close_pairs(imgxy, refxy, r + 1)
+    dx = imgxy[imgidx, 0] - refxy[refidx, 0]
+    dy = imgxy[imgidx, 1] - refxy[refidx, 1]
     idx = np.where((dx < r + 0.5) & (dx >= -r - 0.5) &
                    (dy < r + 0.5) & (dy >= -r - 0.5))
-    r = int(np.ceil(r))
     h = np.histogram2d(dx[idx], dy[idx], 2 * r + 1,
                        [[-r - 0.5, r + 0.5], [-r - 0.5, r + 0.5]])
     return h[0].T
 
 
+def _xy_close_pairs(imgxy, refxy, r):
+    """ Return the indices into ``imgxy`` and ``refxy`` of all the pairs of
+    (finite) positions differing by at most ``r`` along both axes.
+    """
+    goodimg = np.flatnonzero(np.all(np.isfinite(imgxy[:, :2]), axis=1))
+    goodref = np.flatnonzero(np.all(np.isfinite(refxy[:, :2]), axis=1))
+    if goodimg.size == 0 or goodref.size == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    tree = cKDTree(np.asarray(refxy[goodref, :2], dtype=np.float64))
+    matches = tree.query_ball_point(
+        np.asarray(imgxy[goodimg, :2], dtype=np.float64), r, p=np.inf
+    )
+    nmatches = np.array([len(m) for m in matches], dtype=int)
+    imgidx = np.repeat(goodimg, nmatches)
+    if imgidx.size == 0:
+        return imgidx, np.empty(0, dtype=int)
+    refidx = goodref[np.concatenate(matches).astype(int)]
+    return imgidx, refidx
+
+
 def _estimate_2dhist_shift(imgxy, refxy, searchrad=3.0):
     """ Create a 2D matrix-histogram which contains the delta between each
         XY position and each UV position. Then estimate initial offset
@@ -26,8 +26,8 @@ or median image based up bad pixel identification.
 #        code up to modern standards.-- Mihai Cara -- 02/19/2018
 import warnings
 import numpy as np
-from scipy import signal
 from stsci.image.numcombine import numCombine, num_combine
+from . import maskgrow
 from . import __version__
 
 class minmed:
@@ -260,8 +260,6 @@ class minmed:
             # The box size value must be an integer.  This is not a problem since __combine_grow should always
             # be an integer type.  The combine_grow column in the MDRIZTAB should also be an integer type.
             boxsize = int(2 * self._combine_grow + 1)
-            boxshape = (boxsize, boxsize)
-            minimum_grow_file = np.zeros(self._imageList[0].shape,dtype=self._imageList[0].dtype)
 
 
             # If the boxcar convolution has failed it is potentially for two reasons:
@@ -292,16 +290,16 @@ class minmed:
                 print(self._imageList[0].shape)
                 raise ValueError(errormsg2)
 
-            # Attempt the boxcar convolution using the boxshape based upon the user input value of "grow"
-            ker = np.ones(boxshape) / float(boxsize**2)
-            minimum_grow_file = signal.convolve2d(minimum_flag_file, ker,
-                                                  boundary='fill', mode='same')
+            # Grow the flagged regions by a box of boxsize pixels based upon the user input value of "grow"
+            # (the boxcar smoothed image is non-zero wherever the box contains a flagged pixel)
+            window = (-int(self._combine_grow), int(self._combine_grow))
+            minimum_grow_file = maskgrow.dilate(minimum_flag_file, window, window)
 
             del(minimum_flag_file)
 
             temp1 = (median_file_weighted - (rms_file * self._combine_nsigma1))
             temp2 = (median_file_weighted - (rms_file * self._combine_nsigma2))
-            median_rms2_file = np.where(np.equal(minimum_grow_file, 0), temp1, temp2)
+            median_rms2_file = np.where(minimum_grow_file, temp2, temp1)
             del(temp1)
             del(temp2)
             del(rms_file)
@@ -568,15 +566,12 @@ def min_med(images, weight_images, readnoise_list, exptime_list,
         #
         # Then use this image in the final replacement, in the same way as for
         # the case where this option is not selected.
-        minimum_flag_file = np.less(minimum_file_weighted,
-                                    median_rms_file).astype(np.float64)
+        minimum_flag_file = np.less(minimum_file_weighted, median_rms_file)
 
         # The box size value must be an integer. This is not a problem since
         # __combine_grow should always be an integer type. The combine_grow
         # column in the MDRIZTAB should also be an integer type.
         boxsize = int(2 * combine_grow + 1)
-        boxshape = (boxsize, boxsize)
-        minimum_grow_file = np.zeros_like(images[0])
 
         # If the boxcar convolution has failed it is potentially for
         # two reasons:
@@ -607,16 +602,16 @@ def min_med(images, weight_images, readnoise_list, exptime_list,
             print(images.shape[1:])
             raise ValueError(errormsg2)
 
-        # Attempt the boxcar convolution using the boxshape based upon the user
-        # input value of "grow"
-        ker = np.ones((boxsize, boxsize)) / float(boxsize**2)
-        minimum_grow_file = signal.convolve2d(minimum_flag_file, ker,
-                                              boundary='fill', mode='same')
+        # Grow the flagged regions by a box of boxsize pixels based upon the
+        # user input value of "grow" (the boxcar smoothed image is non-zero
+        # wherever the box contains a flagged pixel)
+        window = (-int(combine_grow), int(combine_grow))
+        minimum_grow_file = maskgrow.dilate(minimum_flag_file, window, window)
 
         median_rms_file = np.where(
-            np.equal(minimum_grow_file, 0),
-            median_file_weighted - rms_file * combine_nsigma1,
-            median_file_weighted - rms_file * combine_nsigma2
+            minimum_grow_file,
+            median_file_weighted - rms_file * combine_nsigma2,
+            median_file_weighted - rms_file * combine_nsigma1
         )
         del rms_file, minimum_grow_file
 
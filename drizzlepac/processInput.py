@@ -43,7 +43,7 @@ from stsci.tools.bitmask import interpret_bit_flags
 from stwcs import updatewcs as uw
 from stwcs.wcsutil import altwcs, wcscorr
 from stsci.tools import (cfgpars, parseinput, fileutil, asnutil, irafglob,
-                         check_files, logutil, mputil, textutil)
+                         check_files, logutil, textutil)
 
 from . import wcs_functions
 from . import util
@@ -53,10 +53,12 @@ from . import mdzhandler
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
 
 # list parameters which correspond to steps where multiprocessing can be used
-parallel_steps = [(3,'driz_separate'),(6,'driz_cr')]
+parallel_steps = [(3,'driz_separate'),(6,'driz_cr'),(7,'driz_combine')]
 
-if util.can_parallel:
-    import multiprocessing
+# Maximum number of input files getting their WCS updated at the same time.
+# These updates mostly read and rewrite the headers of the files, so running
+# more of them at once than the disk can serve only slows them down.
+MAX_WCS_UPDATES = 4
 
 
 def setCommonInput(configObj, createOutwcs=True, overwrite_dict={}):
@@ -113,6 +115,7 @@ def setCommonInput(configObj, createOutwcs=True, overwrite_dict={}):
     asndict, ivmlist, output = process_input(
             configObj['input'], configObj['output'],
             updatewcs=configObj['updatewcs'], wcskey=configObj['wcskey'],
+            num_cores=configObj.get('num_cores'),
             **configObj['STATE OF INPUT FILES'])
 
     if not asndict:
@@ -214,6 +217,12 @@ def setCommonInput(configObj, createOutwcs=True, overwrite_dict={}):
     for i in range(len(imageObjectList)):
         imageObjectList[i]._original_file_name = original_files[i]
 
+    # set the limits on the input arrays kept in memory for each image
+    cache_size = configObj.get('cache_size', 256)
+    for img in imageObjectList:
+        img.setDataCache(max_bytes=int(cache_size) * 2**20,
+                         memmap=configObj.get('cache_memmap', False))
+
     # apply context parameter
     applyContextPar(imageObjectList, configObj['context'])
 
@@ -518,7 +527,7 @@ def processFilenames(input=None,output=None,infilesOnly=False):
 
 
 def process_input(input, output=None, ivmlist=None, updatewcs=True,
-                  prodonly=False,  wcskey=None, **workinplace):
+                  prodonly=False,  wcskey=None, num_cores=None, **workinplace):
     """
     Create the full input list of filenames after verifying and converting
     files as needed.
@@ -526,7 +535,7 @@ def process_input(input, output=None, ivmlist=None, updatewcs=True,
 
     newfilelist, ivmlist, output, oldasndict, origflist = buildFileListOrig(
             input, output=output, ivmlist=ivmlist, wcskey=wcskey,
-            updatewcs=updatewcs, **workinplace)
+            updatewcs=updatewcs, num_cores=num_cores, **workinplace)
 
     if not newfilelist:
         buildEmptyDRZ(input, output)
@@ -568,43 +577,36 @@ def process_input(input, output=None, ivmlist=None, updatewcs=True,
     return asndict, ivmlist, output
 
 
-def _process_input_wcs(infiles, wcskey, updatewcs):
+def _process_input_wcs(infiles, wcskey, updatewcs, num_cores=None):
     """
     This is a subset of process_input(), for internal use only.  This is the
     portion of input handling which sets/updates WCS data, and is a performance
     hit - a target for parallelization. Returns the expanded list of filenames.
+
+    The files get updated by up to ``num_cores`` processes at the same time,
+    but never more than ``MAX_WCS_UPDATES`` since this part is mostly I/O bound.
     """
 
     # Run parseinput though it's likely already been done in processFilenames
     outfiles = parseinput.parseinput(infiles)[0]
 
-    # Disable parallel processing here for now until hardware I/O gets "wider".
-    # Since this part is IO bound, parallelizing doesn't help more than a little
-    # in most cases, and may actually slow this down on some desktop nodes.
-#   cfgval_num_cores = None # get this from paramDict
-#   pool_size = util.get_pool_size(cfgval_num_cores, len(outfiles))
-    pool_size = 1
-
     # do the WCS updating
     if wcskey in ['', ' ', 'INDEF', None]:
-        if updatewcs:
-            log.info('Updating input WCS using "updatewcs"')
+        if not updatewcs:
+            # nothing to update
+            return outfiles
+        log.info('Updating input WCS using "updatewcs"')
     else:
         log.info('Resetting input WCS to be based on WCS key = %s' % wcskey)
 
+    pool_size = min(util.get_pool_size(num_cores, len(outfiles)), MAX_WCS_UPDATES)
+
     if pool_size > 1:
         log.info('Executing %d parallel workers' % pool_size)
-        subprocs = []
-        mp_ctx = multiprocessing.get_context('fork')
-
-        for fname in outfiles:
-            p = mp_ctx.Process(
-                target=_process_input_wcs_single,
-                name='processInput._process_input_wcs()', # for err msgs
-                args=(fname, wcskey, updatewcs)
-            )
-            subprocs.append(p)
-        mputil.launch_and_wait(subprocs, pool_size) # blocks till all done
+        with util.worker_pool(num_cores=pool_size) as pool:
+            pool.run(_process_input_wcs_single,
+                     [(fname, wcskey, updatewcs) for fname in outfiles],
+                     pool_size, name='processInput._process_input_wcs()')  # for err msgs
     else:
         log.info('Executing serially')
         for fname in outfiles:
@@ -621,8 +623,15 @@ def _process_input_wcs_single(fname, wcskey, updatewcs):
     if wcskey in ['', ' ', 'INDEF', None]:
         if updatewcs:
             uw.updatewcs(fname, checkfiles=False)
-    else:
-        numext = fileutil.countExtn(fname)
+            # Make sure there is a WCSCORR table for each input image
+            wcscorr.init_wcscorr(fname)
+        return
+
+    # The file gets opened once for restoring the WCS and creating the
+    # WCSCORR table, which only read the headers (the data arrays only get
+    # read if the file has to be rewritten).
+    with fits.open(fname, mode='update') as hdul:
+        numext = fileutil.countExtn(hdul)
         extlist = []
         for extn in range(1, numext + 1):
             extlist.append(('SCI', extn))
@@ -632,27 +641,26 @@ def _process_input_wcs_single(fname, wcskey, updatewcs):
         else:
             wname = wcskey
             wkey = ' '
-        altwcs.restoreWCS(fname, extlist, wcskey=wkey, wcsname=wname)
-    # make an asn table at the end
-    # Make sure there is a WCSCORR table for each input image
-    if wcskey not in ['', ' ', 'INDEF', None] or updatewcs:
-        wcscorr.init_wcscorr(fname)
+        altwcs.restoreWCS(hdul, extlist, wcskey=wkey, wcsname=wname)
+        # Make sure there is a WCSCORR table for each input image
+        wcscorr.init_wcscorr(hdul)
 
 
 def buildFileList(input, output=None, ivmlist=None,
-                wcskey=None, updatewcs=True, **workinplace):
+                wcskey=None, updatewcs=True, num_cores=None, **workinplace):
     """
     Builds a file list which has undergone various instrument-specific
     checks for input to MultiDrizzle, including splitting STIS associations.
     """
     newfilelist, ivmlist, output, oldasndict, filelist = \
         buildFileListOrig(input=input, output=output, ivmlist=ivmlist,
-                    wcskey=wcskey, updatewcs=updatewcs, **workinplace)
+                    wcskey=wcskey, updatewcs=updatewcs, num_cores=num_cores,
+                    **workinplace)
     return newfilelist, ivmlist, output, oldasndict
 
 
 def buildFileListOrig(input, output=None, ivmlist=None,
-                wcskey=None, updatewcs=True, **workinplace):
+                wcskey=None, updatewcs=True, num_cores=None, **workinplace):
     """
     Builds a file list which has undergone various instrument-specific
     checks for input to MultiDrizzle, including splitting STIS associations.
@@ -694,7 +702,8 @@ def buildFileListOrig(input, output=None, ivmlist=None,
         filelist = checkDGEOFile(filelist)
 
     # run all WCS updating
-    updated_input = _process_input_wcs(filelist, wcskey, updatewcs)
+    updated_input = _process_input_wcs(filelist, wcskey, updatewcs,
+                                       num_cores=num_cores)
 
     newfilelist, ivmlist = check_files.checkFiles(updated_input, ivmlist)
 
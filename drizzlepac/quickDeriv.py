@@ -15,59 +15,105 @@ IS RETURNED BY :py:func:`quickderiv`.
 import numpy as np
 from . import __version__
 
+# number of rows of the image differenced with their neighbors at a time
+QDERIV_BLOCK_ROWS = 64
+
+
 def qderiv(array): # TAKE THE ABSOLUTE DERIVATIVE OF A NUMARRY OBJECT
-    """Take the absolute derivate of an image in memory."""
-
-    #Create 2 empty arrays in memory of the same dimensions as 'array'
-    tmpArray = np.zeros(array.shape,dtype=np.float64)
-    outArray = np.zeros(array.shape, dtype=np.float64)
-
-    # Get the length of an array side
-    (naxis1,naxis2) = array.shape
-    #print "The input image size is (",naxis1,",",naxis2,")."
-
-#Main derivate loop:
-    #Shift images +/- 1 in Y.
-    for y in range(-1,2,2):
-        if y == -1:
-            #shift input image 1 pixel right
-            tmpArray[0:(naxis1-1),1:(naxis2-1)] = array[0:(naxis1-1),0:(naxis2-2)]
-            #print "Y shift = 1"
-        else:
-            #shift input image 1 pixel left
-            tmpArray[0:(naxis1-1),0:(naxis2-2)] = array[0:(naxis1-1),1:(naxis2-1)]
-            #print "Y shift = -1"
-        #print "call _absoluteSubtract()"
-        (tmpArray,outArray) = _absoluteSubtract(array,tmpArray,outArray)
-
-    #Shift images +/- 1 in X.
-    for x in range(-1,2,2):
-        if x == -1:
-            #shift input image 1 pixel right
-            tmpArray[1:(naxis1-1),0:(naxis2-1)] = array[0:(naxis1-2),0:(naxis2-1)]
-            #print "X shift = 1"
-        else:
-            #shift input image 1 pixel left
-            tmpArray[0:(naxis1-2),0:(naxis2-1)] = array[1:(naxis1-1),0:(naxis2-1)]
-            #print "X shift = -1"
-        #print "call _absoluteSubtract()"
-        (tmpArray,outArray) = _absoluteSubtract(array,tmpArray,outArray)
-
-
-
-    return outArray.astype(np.float32)
-
-
-def _absoluteSubtract(array,tmpArray,outArray):
-    #subtract shifted image from imput image
-    tmpArray = array - tmpArray
-    #take the absolute value of tmpArray
-    tmpArray = np.fabs(tmpArray)
-    #save maximum value of outArray or tmpArray and save in outArray
-    outArray = np.maximum(tmpArray,outArray)
-    #zero out tmpArray before reuse
-    tmpArray = tmpArray * 0.
-
-    return (tmpArray,outArray)
+    """Take the absolute derivate of an image in memory.
+
+    Each pixel of the float32 output is the maximum absolute difference
+    between the pixel and its 4 neighbors.  Along the first row and column
+    and the last two rows and columns of the image, the value of the pixel
+    itself is also included, as if it had a neighbor equal to 0.
+
+    Differences with a NaN, or between infinities of the same sign, are NaN
+    and make the pixel NaN; otherwise, the pixel is infinite whenever one of
+    its differences is.  Versions before the blocked computation also turned
+    into NaN the pixels along the edges of the image with a non-finite
+    difference, as the NaN of one shift leaked into the next ones there.
+
+    The image is processed one block of ``QDERIV_BLOCK_ROWS`` rows at a
+    time, so that only the output array gets allocated for the whole image.
+    """
+    array = np.asarray(array)
+    outArray = np.empty(array.shape, dtype=np.float32)
+    naxis1 = array.shape[0]
+    work = _work_arrays(array, min(QDERIV_BLOCK_ROWS, naxis1))
+    for start in range(0, naxis1, QDERIV_BLOCK_ROWS):
+        stop = min(start + QDERIV_BLOCK_ROWS, naxis1)
+        _qderiv_block(array, start, stop, outArray[start:stop], work)
+    return outArray
+
+
+def qderiv_rows(array, start, stop):
+    """Return rows ``start:stop`` of ``qderiv(array)``.
+
+    Only rows ``start-1`` to ``stop`` (inclusive) of ``array`` are used, so
+    that the derivative of a large image can be computed in blocks of rows.
+    The edges of the image are handled exactly as done by `qderiv`.
+    """
+    array = np.asarray(array)
+    naxis1 = array.shape[0]
+    start = max(start, 0)
+    stop = min(stop, naxis1)
+    outArray = np.empty((max(stop - start, 0),) + array.shape[1:],
+                        dtype=np.float32)
+    if stop > start:
+        _qderiv_block(array, start, stop, outArray,
+                      _work_arrays(array, stop - start))
+    return outArray
+
+
+def _work_arrays(array, nrows):
+    """ Scratch arrays for the differences of ``nrows`` rows of ``array``
+    and, unless ``array`` is float32, for their maximum before it gets
+    rounded to float32.
+    """
+    shape = (nrows, array.shape[1])
+    if array.dtype == np.float32:
+        return np.empty(shape, dtype=np.float32), None
+    return np.empty(shape, dtype=np.float64), np.empty(shape, dtype=np.float64)
+
+
+def _qderiv_block(array, start, stop, out, work):
+    """ Write rows ``start:stop`` of the derivative of ``array`` to ``out``.
+
+    The differences are computed in float32 for float32 images, and in
+    float64 otherwise.
+    """
+    naxis1, naxis2 = array.shape
+    nrows = stop - start
+    diff = work[0][:nrows]
+    acc = out if work[1] is None else work[1][:nrows]
+
+    # Pixels outside of the interior of the image are compared with 0 by at
+    # least one of the shifts, that is, with their own absolute value...
+    np.absolute(array[start:stop], out=acc, dtype=acc.dtype)
+    y1 = max(1, start)
+    y2 = min(naxis1 - 2, stop)
+    if y1 < y2 and naxis2 > 3:
+        acc[y1 - start:y2 - start, 1:naxis2 - 2] = 0
+
+    # ...and all of them with the neighbors within the rows and columns of
+    # each shift: (rows, columns, row shift, column shift)
+    shifts = [((0, naxis1 - 1), (1, naxis2 - 1), 0, -1),
+              ((0, naxis1 - 1), (0, naxis2 - 2), 0, 1),
+              ((1, naxis1 - 1), (0, naxis2 - 1), -1, 0),
+              ((0, naxis1 - 2), (0, naxis2 - 1), 1, 0)]
+    for (y1, y2), (x1, x2), dy, dx in shifts:
+        y1 = max(y1, start)
+        y2 = min(y2, stop)
+        if y1 >= y2 or x1 >= x2:
+            continue
+        d = diff[:y2 - y1, :x2 - x1]
+        np.subtract(array[y1:y2, x1:x2],
+                    array[y1 + dy:y2 + dy, x1 + dx:x2 + dx], out=d, dtype=d.dtype)
+        np.absolute(d, out=d)
+        a = acc[y1 - start:y2 - start, x1:x2]
+        np.maximum(a, d, out=a)
+
+    if acc is not out:
+        out[...] = acc
 
 # END MODULE
@@ -200,10 +200,32 @@ wcs_preference = ['IDC_?????????-FIT_REL_GAIA*3', 'IDC_?????????-FIT_IMG_GAIA*3'
 # Primary user interface
 def process(inFile, force=False, newpath=None, num_cores=None, inmemory=True,
             headerlets=True, align_to_gaia=True, force_alignment=False,
-            do_verify_guiding=False, debug=False, make_manifest=False):
+            do_verify_guiding=False, debug=False, make_manifest=False,
+            max_memory=None):
     """ Run astrodrizzle on input file/ASN table
         using default values for astrodrizzle parameters.
+
+        ``num_cores`` and ``max_memory`` (in MB) limit the number and the
+        total estimated memory of the parallel tasks of all the runs.
     """
+    # All the astrodrizzle runs share the same parallel workers, and only
+    # recompute the steps which depend on the WCS being aligned (the static
+    # mask statistics and sky values only depend on the pixel values)
+    with util.worker_pool(num_cores=num_cores, max_memory=max_memory), \
+            util.reuse_intermediates():
+        return _process(inFile, force=force, newpath=newpath,
+                        num_cores=num_cores, inmemory=inmemory,
+                        headerlets=headerlets, align_to_gaia=align_to_gaia,
+                        force_alignment=force_alignment,
+                        do_verify_guiding=do_verify_guiding, debug=debug,
+                        make_manifest=make_manifest, max_memory=max_memory)
+
+
+def _process(inFile, force=False, newpath=None, num_cores=None, inmemory=True,
+             headerlets=True, align_to_gaia=True, force_alignment=False,
+             do_verify_guiding=False, debug=False, make_manifest=False,
+             max_memory=None):
+    """ See docs for `process`. """
     init_time = time.time()
     trlmsg = "{}: Calibration pipeline processing of {} started.\n".format(init_time, inFile)
     trlmsg += __trlmarker__
@@ -555,6 +577,7 @@ def process(inFile, force=False, newpath=None, num_cores=None, inmemory=True,
         adriz_pars['driz_sep_kernel'] = 'turbo'
         adriz_pars['driz_sep_fillval'] = 0.0
         adriz_pars['num_cores'] = num_cores
+        adriz_pars['max_memory'] = max_memory
         adriz_pars['resetbits'] = 0
 
         exptimes = np.array([fits.getval(flt, 'exptime') for flt in _calfiles])
@@ -697,6 +720,7 @@ def process(inFile, force=False, newpath=None, num_cores=None, inmemory=True,
         pipeline_pars['in_memory'] = inmemory
         pipeline_pars['clean'] = True
         pipeline_pars['num_cores'] = num_cores
+        pipeline_pars['max_memory'] = max_memory
         if wfpc2_input:
             pipeline_pars.update(adriz_pars)
             pipeline_pars['mdriztab'] = False
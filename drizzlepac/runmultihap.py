@@ -63,6 +63,10 @@ def perform(input_filename, **kwargs):
         The desired level of verboseness in the log statements displayed on the screen and written to the
         .log file.
 
+    num_cores : int, optional
+        Number of processes used for computing the footprints of the exposures. If not specified, all the
+        cores of the machine get used.
+
     Updates
     -------
     return_value : list
@@ -119,6 +123,9 @@ def main():
                         help='Skip alignment of all input images to known Gaia/HSC sources in the input '
                              'image footprint? If this option is turned on, the existing input image '
                              'alignment solution will be used instead. The default is False.')
+    parser.add_argument('-n', '--num_cores', required=False, type=int, default=None, help='Number of '
+                        'processes used for computing the footprints of the exposures. If not specified, all '
+                        'the cores of the machine get used.')
     user_args = parser.parse_args()
 
     print("Multi-visit processing started for: {}".format(user_args.input_filename))
@@ -126,6 +133,7 @@ def main():
                  diagnostic_mode=user_args.diagnostic_mode,
                  input_custom_pars_file=user_args.input_custom_pars_file,
                  log_level=user_args.log_level,
+                 num_cores=user_args.num_cores,
                  skip_gaia_alignment=user_args.skip_gaia_alignment)
     print("Return Value: ", rv)
     return rv
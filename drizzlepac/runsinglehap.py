@@ -5,7 +5,7 @@
 :License: :doc:`/LICENSE`
 
 USAGE:
-    >>> runsinglehap [-cdl] inputFilename
+    >>> runsinglehap [-cdlnm] inputFilename
 
     - The '-c' option allows the user to specify a customized configuration JSON file which has been tuned for
       specialized processing.  This file should contain ALL the input parameters necessary for processing. If
@@ -19,6 +19,12 @@ USAGE:
       statements, and specifying "error" will record/display both "error" and "critical" log statements, and so
       on. Valid inputs: 'critical', 'error', 'warning', 'info', or 'debug'.
 
+    - The '-n' option sets the maximum number of drizzled products created at the same time. All the cores of
+      the machine get used by default.
+
+    - The '-m' option sets the maximum total memory, in MB, estimated to be used by the drizzled products
+      created at the same time.
+
 Python USAGE:
     >>> python
     >>> from drizzlepac import runsinglehap
@@ -68,6 +74,14 @@ def perform(input_filename, **kwargs):
         .log file. Valid inputs: 'critical', 'error', 'warning', 'info', or 'debug'. If not specified, the
         default value is 'info'.
 
+    num_cores : int, optional
+        Maximum number of drizzled products created at the same time. If not specified, all the cores of the
+        machine get used.
+
+    max_memory : float, optional
+        Maximum total memory, in MB, estimated to be used by the drizzled products created at the same time.
+        If not specified, there is no limit.
+
     Updates
     -------
     return_value : list
@@ -118,11 +132,18 @@ def main():
                         'statements with a log_level left of the specified level. Specifying "critical" will '
                         'only record/display "critical" log statements, and specifying "error" will '
                         'record/display both "error" and "critical" log statements, and so on.')
+    parser.add_argument('-n', '--num_cores', required=False, type=int, default=None, help='Maximum number '
+                        'of drizzled products created at the same time. If not specified, all the cores of '
+                        'the machine get used.')
+    parser.add_argument('-m', '--max_memory', required=False, type=float, default=None, help='Maximum total '
+                        'memory, in MB, estimated to be used by the drizzled products created at the same '
+                        'time. If not specified, there is no limit.')
     user_args = parser.parse_args()
 
     print("Single-visit processing started for: {}".format(user_args.input_filename))
     rv = perform(user_args.input_filename, input_custom_pars_file=user_args.input_custom_pars_file,
-                 diagnostic_mode=user_args.diagnostic_mode, log_level=user_args.log_level)
+                 diagnostic_mode=user_args.diagnostic_mode, log_level=user_args.log_level,
+                 num_cores=user_args.num_cores, max_memory=user_args.max_memory)
     print("Return Value: ", rv)
     return rv
 
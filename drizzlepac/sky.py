@@ -33,6 +33,10 @@ __taskname__= "drizzlepac.sky" #looks in drizzlepac for sky.cfg
 _step_num_ = 2  #this relates directly to the syntax in the cfg file
 
 
+# keywords used by skymatch for converting the pixel values to brightness
+SKY_UNITS_KEYWORDS = ['TELESCOP', 'INSTRUME', 'EXPTIME', 'BUNIT', 'PHOTFLAM',
+                      'PHOTCORR', 'FLUXCORR', 'IDCSCALE', 'PAMSCALE']
+
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
 
 
@@ -194,12 +198,76 @@ def subtractSky(imageObjList,configObj,saveFile=False,procSteps=None):
         else:
             clean = True
 
-        _skymatch(imageObjList, paramDict, inmemory, clean, log)
+        cache = util.get_intermediate_cache()
+        if cache is not None and _canReuseSky(paramDict):
+            key = _skyContentKey(cache, imageObjList, paramDict)
+            skyvals = cache.get('Subtract Sky', key)
+            if skyvals is None:
+                _skymatch(imageObjList, paramDict, inmemory, clean, log)
+                cache.put('Subtract Sky', key, _getSkyValues(imageObjList))
+            else:
+                log.info('Reusing sky values computed for the same pixel '
+                         'values by an earlier run.')
+                _setSkyValues(imageObjList, skyvals)
+        else:
+            _skymatch(imageObjList, paramDict, inmemory, clean, log)
 
     if procSteps is not None:
         procSteps.endStep('Subtract Sky')
 
 
+def _canReuseSky(paramDict):
+    """ Sky values can be reused when they do not depend on the overlap of
+    the images (and therefore on their WCS) nor on user-supplied masks.
+    """
+    return ('match' not in paramDict['skymethod'] and
+            util.is_blank(paramDict['skymask_cat']))
+
+
+def _skyContentKey(cache, imageList, paramDict):
+    """ Build the key of the sky values computed by ``_skymatch`` from the
+    pixel values, DQ and static masks of all the images, the keywords used
+    for converting their units and the sky parameters.
+    """
+    sky_bits = interpret_bit_flags(paramDict['sky_bits'])
+    items = [sorted(paramDict.items())]
+    for img in imageList:
+        primary_header = img._image['PRIMARY'].header
+        for extver in range(1, img._numchips + 1):
+            chip = img[img.scienceExt, extver]
+            if not chip.group_member:
+                continue
+            items.append(img.getData('{:s},{:d}'.format(img.scienceExt, extver)))
+            if sky_bits is not None:
+                items.append(img.getData('{:s},{:d}'.format(img.maskExt, extver)))
+            if paramDict['use_static']:
+                items.append(_getStaticMask(img, (img.scienceExt, extver)))
+            items.append([(kw, primary_header.get(kw), chip.header.get(kw))
+                          for kw in SKY_UNITS_KEYWORDS])
+    return cache.content_key(*items)
+
+
+def _getSkyValues(imageList):
+    """ Return the sky value of each chip used from each image. """
+    skyvals = []
+    for img in imageList:
+        skyvals.append([(extver, img[img.scienceExt, extver].subtractedSky)
+                        for extver in range(1, img._numchips + 1)
+                        if img[img.scienceExt, extver].group_member])
+    return skyvals
+
+
+def _setSkyValues(imageList, skyvals):
+    """ Apply the sky values returned by `_getSkyValues` for the same images. """
+    skyKW = "MDRIZSKY"
+    for img, values in zip(imageList, skyvals):
+        for extver, value in values:
+            chip = img[img.scienceExt, extver]
+            _updateKW(chip, img._filename, (img.scienceExt, extver), skyKW, value)
+            chip.subtractedSky = value
+            chip.computedSky = value
+
+
 def _skymatch(imageList, paramDict, in_memory, clean, logfile):
     # '_skymatch' converts input imageList and other parameters to
     # data structures accepted by the "skymatch" package.
@@ -298,6 +366,7 @@ def _skymatch(imageList, paramDict, in_memory, clean, logfile):
         mextlist = []
 
         for k in range(fi.count):
+            usage = util.start_chip_usage()
             if fi.mask_images[k].closed:
                 umask = None
             else:
@@ -308,6 +377,10 @@ def _skymatch(imageList, paramDict, in_memory, clean, logfile):
 
             masklist.append(mask)
             mextlist.append(mext)
+            util.record_chip_usage(
+                'Subtract Sky', '{:s}[{:s},{:d}]'.format(loaded_fnames[i], *extlist[k]),
+                usage, stage='mask'
+            )
 
         # replace the original user-supplied masks with the
         # newly computed combined static+DQ+user masks:
@@ -413,35 +486,9 @@ def _buildStaticDQUserMask(img, ext, sky_bits, use_static, umask,
     if sky_bits is not None:
         mask = img.buildMask(img[ext]._chip,bits=sky_bits)
 
-    # get correct static mask mask filenames/objects
-    staticMaskName = img[ext].outputNames['staticMask']
-    smask = None
     if use_static:
-        if img.inmemory:
-            if staticMaskName in img.virtualOutputs:
-                smask = img.virtualOutputs[staticMaskName].data
-        else:
-            if staticMaskName is not None and os.path.isfile(staticMaskName):
-                sm, dq = openImageEx(
-                    staticMaskName,
-                    mode='readonly',
-                    memmap=False,
-                    saveAsMEF=False,
-                    clobber=False,
-                    imageOnly=True,
-                    openImageHDU=True,
-                    openDQHDU=False,
-                    preferMEF=False,
-                    verbose=False
-                )
-                if sm.hdu is not None:
-                    smask = sm.hdu[0].data
-                    sm.release()
-            else:
-                log.warning("Static mask for file \'{}\', ext={} NOT FOUND." \
-                            .format(img._filename, ext))
         # combine DQ and static masks:
-        mask = merge_masks(mask, smask)
+        mask = merge_masks(mask, _getStaticMask(img, ext))
 
     # combine user mask with the previously computed mask:
     if umask is not None and not umask.closed:
@@ -475,6 +522,36 @@ def _buildStaticDQUserMask(img, ext, sky_bits, use_static, umask,
 
     return (tmpmask, 0)
 
+def _getStaticMask(img, ext):
+    """ Return the static mask array of the chip, or None when not found. """
+    # get correct static mask mask filenames/objects
+    staticMaskName = img[ext].outputNames['staticMask']
+    smask = None
+    if img.inmemory:
+        if staticMaskName in img.virtualOutputs:
+            smask = img.virtualOutputs[staticMaskName].data
+    else:
+        if staticMaskName is not None and os.path.isfile(staticMaskName):
+            sm, dq = openImageEx(
+                staticMaskName,
+                mode='readonly',
+                memmap=False,
+                saveAsMEF=False,
+                clobber=False,
+                imageOnly=True,
+                openImageHDU=True,
+                openDQHDU=False,
+                preferMEF=False,
+                verbose=False
+            )
+            if sm.hdu is not None:
+                smask = sm.hdu[0].data
+                sm.release()
+        else:
+            log.warning("Static mask for file \'{}\', ext={} NOT FOUND." \
+                        .format(img._filename, ext))
+    return smask
+
 # this function applies user supplied sky values from an input file
 def _skyUserFromFile(imageObjList, skyFile, apply_sky=None):
     """
@@ -676,11 +753,13 @@ def _skySub(imageSet,paramDict,saveFile=False):
         for chip in range(1,numchips+1,1):
             myext=sciExt+","+str(chip)
 
-            #add the data back into the chip, leave it there til the end of this function
+            #add the data back into the chip while computing its sky
             imageSet[myext].data=imageSet.getData(myext)
 
             image=imageSet[myext]
             _skyValue= _computeSky(image, paramDict, memmap=False)
+            # release the reference so the array is only kept by the cache
+            del image.data
             #scale the sky value by the area on sky
             # account for the case where no IDCSCALE has been set, due to a
             # lack of IDCTAB or to 'coeffs=False'.
@@ -26,6 +26,12 @@ _step_num_ = 1
 
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
 
+# maximum number of pixels used by the 'sampled' statistics engine
+STATIC_SAMPLE_SIZE = 2**20
+
+# number of rows of each block of the chips compared to the static mask limit
+STATIC_BLOCK_ROWS = 256
+
 
 #this is called by the user
 def createMask(input=None, static_sig=4.0, group=None, editpars=False, configObj=None, **inputDict):
@@ -86,9 +92,8 @@ def createStaticMask(imageObjectList=[],configObj=None,procSteps=None):
     #create a static mask object
     myMask = staticMask(configObj)
 
-    for image in imageObjectList:
-        myMask.addMember(image) # create tmp filename here...
-
+    # create tmp filenames here...
+    myMask.addMembers(imageObjectList, num_cores=configObj.get('num_cores'))
 
     #save the masks to disk for later access
     myMask.saveToFile(imageObjectList)
@@ -97,14 +102,52 @@ def createStaticMask(imageObjectList=[],configObj=None,procSteps=None):
     if procSteps is not None:
         procSteps.endStep('Static Mask')
 
-def constructFilename(signature):
+def chipStats(chipimage, engine='full'):
+    """ Returns the clipped mode, the rms and the number of histogram bins
+    used for the mode of a chip image.
+
+    With ``engine='full'``, these are computed from all the pixels.  With
+    ``engine='sampled'``, they are computed from a regular grid of at most
+    ``STATIC_SAMPLE_SIZE`` pixels of the image, which only reads those
+    rows of the image (in particular when memory-mapped).
+    """
+    if engine == 'sampled':
+        step = int(np.ceil(np.sqrt(chipimage.size / STATIC_SAMPLE_SIZE)))
+        if step > 1:
+            chipimage = np.ascontiguousarray(chipimage[::step, ::step])
+    stats = ImageStats(chipimage,nclip=3,fields='mode')
+    return (stats.mode, stats.stddev, len(stats.histogram))
+
+
+def _storeChipStats(imagePtr, chipid, engine, key, results):
+    """ Computes the statistics of a chip in a parallel worker. """
+    results[key] = chipStats(imagePtr.getData(chipid), engine=engine)
+
+
+def maskBelow(mask, chipimage, threshold, block_rows=STATIC_BLOCK_ROWS):
+    """ Sets ``mask`` to 0, in place, where ``chipimage`` is below
+    ``threshold``, one block of rows at a time so that only a temporary
+    array for a block is needed.
+    """
+    below = np.empty((min(block_rows, mask.shape[0]), mask.shape[1]), dtype=bool)
+    for start in range(0, mask.shape[0], block_rows):
+        rows = slice(start, start + block_rows)
+        block = below[:mask[rows].shape[0]]
+        np.less(chipimage[rows], threshold, out=block)
+        np.putmask(mask[rows], block, 0)
+
+
+def constructFilename(signature, output=None):
     """Construct an output filename for the given signature::
 
          signature=[instr+detector,(nx,ny),detnum]
 
-    The signature is in the image object.
+    The signature is in the image object. When the name of the final
+    ``output`` product is given, the filename starts with its rootname.
     """
     suffix = buildSignatureKey(signature)
+    if output:
+        suffix = os.path.splitext(os.path.basename(output))[0] + '_' + suffix
     filename = os.path.join('.', suffix)
     return filename
 
@@ -137,7 +180,11 @@ class staticMask:
         self.step_name=util.getSectionName(configObj,_step_num_)
         if configObj is not None:
             self.static_sig = configObj[self.step_name]['static_sig']
+            self.engine = configObj[self.step_name].get('static_engine', 'full')
+            self.prefix = configObj[self.step_name].get('static_prefix', False)
         else:
+            self.engine = 'full'
+            self.prefix = False
             self.static_sig = 4. # define a reasonable number
             log.warning('Using default of 4. for static mask sigma.')
 
@@ -160,48 +207,92 @@ class staticMask:
         The signature is defined in the image object for each chip
 
         """
-        numchips=imagePtr._numchips
-        log.info("Computing static mask:\n")
+        self.addMembers([imagePtr])
 
-        chips = imagePtr.group
-        if chips is None:
-            chips = imagePtr.getExtensions()
-
-        #for chip in range(1,numchips+1,1):
-        for chip in chips:
-            chipid=imagePtr.scienceExt + ','+ str(chip)
-            chipimage=imagePtr.getData(chipid)
-            signature=imagePtr[chipid].signature
-
-            # If this is a new signature, create a new Static Mask file which is empty
-            # only create a new mask if one doesn't already exist
-            if ((signature not in self.masklist) or (len(self.masklist) == 0)):
-                self.masklist[signature] = self._buildMaskArray(signature)
-                maskname =  constructFilename(signature)
-                self.masknames[signature] = maskname
-            else:
-                chip_sig = buildSignatureKey(signature)
-                for s in self.masknames:
-                    if chip_sig in self.masknames[s]:
-                        maskname  = self.masknames[s]
-                        break
-            imagePtr[chipid].outputNames['staticMask'] = maskname
-
-            stats = ImageStats(chipimage,nclip=3,fields='mode')
-            mode = stats.mode
-            rms  = stats.stddev
-            nbins = len(stats.histogram)
-            del stats
+    def addMembers(self, imageObjectList, num_cores=None):
+        """
+        Combines all the input images with the static masks that
+        have the same signature (see `addMember`).
 
+        The statistics of the chips are computed in parallel, using up to
+        ``num_cores`` workers, and then the chips are combined with the
+        static masks in the order of the images.
+        """
+        members = []
+        for imagePtr in imageObjectList:
+            chips = imagePtr.group
+            if chips is None:
+                chips = imagePtr.getExtensions()
+
+            for chip in chips:
+                chipid=imagePtr.scienceExt + ','+ str(chip)
+                signature=imagePtr[chipid].signature
+
+                # If this is a new signature, create a new Static Mask file which is empty
+                # only create a new mask if one doesn't already exist
+                if ((signature not in self.masklist) or (len(self.masklist) == 0)):
+                    self.masklist[signature] = self._buildMaskArray(signature)
+                    output = imagePtr.outputNames['outFinal'] if self.prefix else None
+                    maskname = constructFilename(signature, output=output)
+                    self.masknames[signature] = maskname
+                else:
+                    chip_sig = buildSignatureKey(signature)
+                    for s in self.masknames:
+                        if chip_sig in self.masknames[s]:
+                            maskname  = self.masknames[s]
+                            break
+                imagePtr[chipid].outputNames['staticMask'] = maskname
+                members.append((imagePtr, chipid, signature))
+
+        log.info("Computing static mask:\n")
+        chip_stats = self._chipStats(members, num_cores=num_cores)
+
+        for (imagePtr, chipid, signature), (mode, rms, nbins) in zip(members, chip_stats):
             log.info('  mode = %9f;   rms = %7f;   static_sig = %0.2f' %
                      (mode, rms, self.static_sig))
 
             if nbins >= 2: # only combine data from new image if enough data to mask
                 sky_rms_diff = mode - (self.static_sig*rms)
-                np.bitwise_and(self.masklist[signature],
-                               np.logical_not(np.less(chipimage, sky_rms_diff)),
-                               self.masklist[signature])
-            del chipimage
+                maskBelow(self.masklist[signature], imagePtr.getData(chipid),
+                          sky_rms_diff)
+
+    def _chipStats(self, members, num_cores=None):
+        """ Returns the mode, rms and number of histogram bins of each chip
+        image, reusing those computed for the same pixel values by an
+        earlier run within `~drizzlepac.util.reuse_intermediates`.
+        """
+        results = [None] * len(members)
+        keys = [None] * len(members)
+        cache = util.get_intermediate_cache()
+        if cache is not None:
+            for k, (imagePtr, chipid, signature) in enumerate(members):
+                keys[k] = cache.content_key(imagePtr.getData(chipid), self.engine)
+                results[k] = cache.get('Static Mask', keys[k])
+        todo = [k for k, result in enumerate(results) if result is None]
+
+        pool_size = util.get_pool_size(num_cores, len(todo))
+        if pool_size > 1:
+            log.info('Executing {:d} parallel workers'.format(pool_size))
+            with util.worker_pool(num_cores=pool_size) as pool:
+                stats = pool.manager().dict({})
+                # the chip as read and as float32 for the histogram
+                memory = [8 * np.prod(members[k][2][1]) for k in todo]
+                pool.run(_storeChipStats,
+                         [(members[k][0], members[k][1], self.engine, k, stats)
+                          for k in todo],
+                         pool_size, name='staticMask._storeChipStats()',
+                         memory=memory)
+                for k in todo:
+                    results[k] = stats[k]
+        else:
+            for k in todo:
+                imagePtr, chipid, signature = members[k]
+                results[k] = chipStats(imagePtr.getData(chipid), engine=self.engine)
+
+        if cache is not None:
+            for k in todo:
+                cache.put('Static Mask', keys[k], results[k])
+        return results
 
     def _buildMaskArray(self,signature):
         """ Creates empty  numpy array for static mask array signature. """
@@ -219,9 +310,9 @@ class staticMask:
         """Returns the name of the output mask file that
         should reside on disk for the given signature. """
 
-        filename=constructFilename(signature)
+        filename = self.masknames.get(signature)
 
-        if(fileutil.checkFileExists(filename)):
+        if filename is not None and fileutil.checkFileExists(filename):
             return filename
         else:
             print("\nmMask file for ", str(signature), " does not exist on disk", file=sys.stderr)
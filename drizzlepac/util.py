@@ -14,7 +14,20 @@ import os
 import sys
 import string
 import errno
+import hashlib
 import platform
+import concurrent.futures
+import contextlib
+import csv
+import json
+import queue
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available under Windows
+    resource = None
 
 import numpy as np
 import astropy
@@ -31,6 +44,8 @@ from . import __version__
 __fits_version__ = astropy.__version__
 __numpy_version__ = np.__version__
 
+log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
+
 _cpu_count = 1
 can_parallel = False
 if 'ASTRODRIZ_NO_PARALLEL' not in os.environ and platform.system() != "Windows":
@@ -76,6 +91,362 @@ def get_pool_size(usr_config_value, num_tasks):
         return min(_cpu_count, num_tasks)
 
 
+def run_in_threads(func, arglist, pool_size):
+    """ Call ``func`` once for each tuple of arguments in ``arglist`` using
+    a pool of ``pool_size`` threads. This only results in a speed-up when
+    ``func`` spends most of its time in code which releases the GIL, such
+    as ``cdriz.tdriz`` and ``cdriz.tblot`` with the default WCS mapping.
+
+    The results are returned in the same order as ``arglist``. Any
+    exception raised by one of the calls gets raised again here once all
+    the calls have completed.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size) as executor, \
+            _thread_output() as outputs:
+        futures = [executor.submit(func, *args) for args in arglist]
+        _wait_threads(futures, outputs)
+    return [f.result() for f in futures]
+
+
+class _ThreadOutput:
+    """ Stand-in for ``sys.stdout`` or ``sys.stderr`` while tasks run in
+    worker threads.
+
+    The ``logutil.StreamTeeLogger`` set up by `init_logging` can only be
+    written to from the thread which created it, so the lines written by
+    the other threads get queued here until the thread waiting for the
+    tasks writes them out with `drain`.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.owner = threading.current_thread()
+        self._lines = queue.SimpleQueue()
+        self._local = threading.local()
+
+    def write(self, message):
+        if threading.current_thread() is self.owner:
+            return self.stream.write(message)
+        # queue whole lines so that those of different threads do not mix
+        lines = (getattr(self._local, 'buffer', '') + message).split('\n')
+        self._local.buffer = lines.pop(-1)
+        for line in lines:
+            self._lines.put(line + '\n')
+        return len(message)
+
+    def flush(self):
+        if threading.current_thread() is self.owner:
+            self.stream.flush()
+
+    def drain(self):
+        """ Write out the lines queued by the worker threads. """
+        while True:
+            try:
+                line = self._lines.get_nowait()
+            except queue.Empty:
+                return
+            self.stream.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+@contextlib.contextmanager
+def _thread_output():
+    """ Context manager letting worker threads write to ``sys.stdout`` and
+    ``sys.stderr`` when these are a ``logutil.StreamTeeLogger`` (see
+    `_ThreadOutput`). Returns the list of streams to be drained by the
+    calling thread while waiting for the tasks.
+    """
+    outputs = []
+    for name in ('stdout', 'stderr'):
+        stream = getattr(sys, name)
+        if isinstance(stream, logutil.StreamTeeLogger):
+            outputs.append((name, _ThreadOutput(stream)))
+            setattr(sys, name, outputs[-1][1])
+    try:
+        yield [output for _, output in outputs]
+    finally:
+        for name, output in outputs:
+            setattr(sys, name, output.stream)
+            output.drain()
+
+
+def _wait_threads(futures, outputs,
+                  return_when=concurrent.futures.ALL_COMPLETED):
+    """ `concurrent.futures.wait` writing out the output of the worker
+    threads in the meantime.
+    """
+    while True:
+        done, not_done = concurrent.futures.wait(futures, timeout=0.1,
+                                                 return_when=return_when)
+        for output in outputs:
+            output.drain()
+        if not not_done or (done and return_when != concurrent.futures.ALL_COMPLETED):
+            return done, not_done
+
+
+class WorkerPool:
+    """ Workers shared by all the processing steps which can run in parallel.
+
+    A single pool is meant to be used for a whole ``AstroDrizzle`` run, or
+    for all the runs made by ``runastrodriz``, (see `worker_pool`) so that
+    the limits on the number of tasks running at once and on the memory they
+    use are enforced in one place, and so that the threads and the
+    ``multiprocessing.Manager`` server needed by the tasks only get started
+    once.
+
+    Tasks run either in the threads of a persistent thread pool or in
+    processes forked for each task, which then inherit all the data they
+    need (such as the image objects and their open files) from the parent.
+
+    Parameters
+    ----------
+    num_cores : int, None
+        Maximum number of tasks running at any time (see `get_pool_size`).
+
+    max_memory : float, None
+        Maximum total memory, in MB, of the tasks running at any time
+        based on the estimates given for each of them. A task is always
+        started when no other task is running.
+
+    """
+    def __init__(self, num_cores=None, max_memory=None):
+        self.max_workers = get_pool_size(num_cores, None)
+        self.max_memory = None if max_memory is None else max_memory * 2**20
+        self._executor = None
+        self._manager = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def mp_context(self):
+        import multiprocessing
+        return multiprocessing.get_context('fork')
+
+    def manager(self):
+        """ Return the ``multiprocessing.Manager`` shared by all tasks,
+        starting its server process on first use.
+        """
+        with self._lock:
+            if self._manager is None:
+                self._manager = self.mp_context.Manager()
+            return self._manager
+
+    def shared_array(self, shape, dtype):
+        """ Return a zero-initialized array backed by shared memory which
+        remains shared with the processes forked for later tasks.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        buf = self.mp_context.RawArray('b', nbytes)
+        return np.frombuffer(buf, dtype=dtype).reshape(shape)
+
+    def run(self, func, arglist, pool_size, threads=False, name=None,
+            memory=None):
+        """ Call ``func`` once for each tuple of arguments in ``arglist``,
+        running at most ``pool_size`` (and never more than ``max_workers``)
+        of these calls at a time.
+
+        With ``threads=True`` the calls are made from the threads of the
+        pool and their results are returned in the same order as
+        ``arglist``. Otherwise each call is made in a new process, and a
+        `RuntimeError` is raised if any of them fails.
+
+        ``memory`` gives the estimated memory, in bytes, used by each call
+        (a single value or one per call) for limiting the number of calls
+        running at the same time to ``max_memory``.
+        """
+        pool_size = max(1, min(pool_size, self.max_workers))
+        if memory is None or np.isscalar(memory):
+            memory = [memory or 0] * len(arglist)
+
+        if threads:
+            return self._run_threads(func, arglist, pool_size, memory)
+        self._run_processes(func, arglist, pool_size, memory,
+                            name or func.__name__)
+
+    def _admit(self, running, mem):
+        """ Can a task using ``mem`` bytes start with ``running`` tasks
+        using the memory listed there? """
+        if not running:
+            return True
+        return (self.max_memory is None or
+                sum(running) + mem <= self.max_memory)
+
+    def _run_threads(self, func, arglist, pool_size, memory):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers
+                )
+            executor = self._executor
+
+        futures = [None] * len(arglist)
+        running = {}
+        pending = list(range(len(arglist)))
+        with _thread_output() as outputs:
+            while pending or running:
+                while pending and len(running) < pool_size and \
+                        self._admit(list(running.values()), memory[pending[0]]):
+                    k = pending.pop(0)
+                    futures[k] = executor.submit(func, *arglist[k])
+                    running[futures[k]] = memory[k]
+                done, _ = _wait_threads(
+                    running, outputs,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for f in done:
+                    del running[f]
+
+        return [f.result() for f in futures]
+
+    def _run_processes(self, func, arglist, pool_size, memory, name):
+        from multiprocessing.connection import wait
+
+        ctx = self.mp_context
+        procs = [ctx.Process(target=func, args=args, name=name)
+                 for args in arglist]
+        running = {}
+        pending = list(range(len(procs)))
+        while pending or running:
+            while pending and len(running) < pool_size and \
+                    self._admit(list(running.values()), memory[pending[0]]):
+                k = pending.pop(0)
+                procs[k].start()
+                running[procs[k]] = memory[k]
+            for sentinel in wait([p.sentinel for p in running]):
+                for p in list(running):
+                    if p.sentinel == sentinel:
+                        p.join()
+                        del running[p]
+
+        for p in procs:
+            if p.exitcode != 0:
+                raise RuntimeError("Problem during: {:s}, exitcode: {}. "
+                                   "Check log.".format(p.name, p.exitcode))
+
+    def close(self):
+        """ Stop the threads and the manager server of the pool. """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+
+_active_pool = None
+
+
+@contextlib.contextmanager
+def worker_pool(num_cores=None, max_memory=None):
+    """ Context manager providing the `WorkerPool` to be used by the
+    processing steps.
+
+    Within an enclosing ``worker_pool`` context, the pool created by that
+    context gets returned (and the arguments are ignored). Otherwise, a new
+    pool is created which remains available to all nested ``worker_pool``
+    contexts until it gets closed upon leaving this one.
+    """
+    global _active_pool
+    if _active_pool is not None:
+        yield _active_pool
+        return
+
+    pool = WorkerPool(num_cores=num_cores, max_memory=max_memory)
+    _active_pool = pool
+    try:
+        yield pool
+    finally:
+        _active_pool = None
+        pool.close()
+
+
+class IntermediateCache:
+    """ Results of the processing steps which only depend on the pixel
+    values of the input images and not on their WCS, such as the statistics
+    used for the static masks and the sky values.
+
+    When the same exposures get drizzled again after only their WCS has
+    been updated (as done by ``runastrodriz`` for each alignment mode),
+    those results can be reused instead of being computed again (see
+    `reuse_intermediates`).  Results are stored for each processing step
+    under a key built by `content_key` from everything they depend on.
+    """
+    def __init__(self):
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_key(*items):
+        """ Return a hash of ``items``, which may be arrays (hashed from
+        their values) or any other objects (hashed from their ``repr``).
+        """
+        digest = hashlib.sha1()
+        for item in items:
+            if isinstance(item, np.ndarray):
+                digest.update(repr((item.dtype.str, item.shape)).encode())
+                digest.update(np.ascontiguousarray(item).view(np.uint8).data)
+            else:
+                digest.update(repr(item).encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, step, key):
+        """ Return the result stored for ``key`` by ``step``, or None. """
+        result = self._results.get((step, key))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, step, key, result):
+        self._results[(step, key)] = result
+
+
+_active_cache = None
+
+
+@contextlib.contextmanager
+def reuse_intermediates():
+    """ Context manager making the processing steps of all the
+    ``AstroDrizzle`` runs within it share an `IntermediateCache`, so that
+    running again on the same pixel values (for instance with a different
+    WCS) only recomputes the steps depending on the WCS.
+
+    Nested ``reuse_intermediates`` contexts share the cache of the outermost
+    one, which gets discarded upon leaving it.
+    """
+    global _active_cache
+    if _active_cache is not None:
+        yield _active_cache
+        return
+
+    cache = IntermediateCache()
+    _active_cache = cache
+    try:
+        yield cache
+    finally:
+        _active_cache = None
+        log.info('Reused {:d} of {:d} WCS-independent results'
+                 .format(cache.hits, cache.hits + cache.misses))
+
+
+def get_intermediate_cache():
+    """ Return the `IntermediateCache` of the enclosing `reuse_intermediates`
+    context, or None outside of any such context.
+    """
+    return _active_cache
+
+
 DEFAULT_LOGNAME = 'astrodrizzle.log'
 blank_list = [None, '', ' ', 'None', 'INDEF']
 
@@ -295,16 +666,26 @@ class ProcSteps:
 
         The 'reportTimes()' method can then be used to provide a summary
         of all the elapsed times and total run time.
+
+        When 'profile' is given, the resources used by each step (see
+        `get_resource_usage`) get recorded as well, along with those
+        recorded for each chip using `record_chip_usage`.  The
+        'writeProfile()' method then writes them all out to the JSON file
+        '<profile>.json' and the CSV file '<profile>.csv'.
     """
     __report_header = '\n   %20s          %s\n' % ('-' * 20, '-' * 20)
     __report_header += '   %20s          %s\n' % ('Step', 'Elapsed time')
     __report_header += '   %20s          %s\n' % ('-' * 20, '-' * 20)
 
-    def __init__(self):
+    def __init__(self, profile=None):
         self.steps = {}
         self.order = []
         self.start = _ptime()
         self.end = None
+        self.profile = profile
+        if profile:
+            self._start_usage = get_resource_usage()
+            start_chip_profile(profile + '_chips.tmp')
 
     def addStep(self, key):
         """
@@ -317,6 +698,8 @@ class ProcSteps:
         print('==== Processing Step ', key, ' started at ', ptime[0])
         print("", flush=True)
         self.steps[key] = {'start': ptime}
+        if self.profile:
+            self.steps[key]['start_usage'] = get_resource_usage()
         self.order.append(key)
 
     def endStep(self, key):
@@ -330,6 +713,10 @@ class ProcSteps:
         if key is not None:
             self.steps[key]['end'] = ptime
             self.steps[key]['elapsed'] = ptime[1] - self.steps[key]['start'][1]
+            if self.profile:
+                self.steps[key]['usage'] = _usage_delta(
+                    self.steps[key]['start_usage'], get_resource_usage()
+                )
         self.end = ptime
 
         print('==== Processing Step {} finished at {}'.format(key, ptime[0]), flush=True)
@@ -355,6 +742,162 @@ class ProcSteps:
         print('   %20s          %0.4f sec.' % ('Total', total_time))
         print("", flush=True)
 
+    def writeProfile(self):
+        """
+        Write out the resources used by each step and chip to
+        '<profile>.json' and '<profile>.csv'.  Nothing gets written
+        unless this instance was created with a 'profile' name.
+        """
+        if not self.profile:
+            return
+
+        chips = stop_chip_profile()
+        steps = []
+        for step in self.order:
+            if 'usage' in self.steps[step]:
+                steps.append(dict(step=step, **self.steps[step]['usage']))
+        total = _usage_delta(self._start_usage, get_resource_usage())
+
+        with open(self.profile + '.json', 'w') as fh:
+            json.dump({'version': __version__,
+                       'start': self.start[0],
+                       'total': total,
+                       'steps': steps,
+                       'chips': chips}, fh, indent=2)
+
+        fields = ['step', 'chip'] + list(USAGE_FIELDS)
+        with open(self.profile + '.csv', 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=fields,
+                                    extrasaction='ignore')
+            writer.writeheader()
+            writer.writerow(dict(step='Total', chip='', **total))
+            for row in steps:
+                writer.writerow(dict(chip='', **row))
+            for row in chips:
+                writer.writerow(row)
+
+        print('Processing profile written to: {}.json and {}.csv'
+              .format(self.profile, self.profile), flush=True)
+
+
+# Names of the values returned by get_resource_usage()
+USAGE_FIELDS = ('wall_time', 'cpu_time', 'read_bytes', 'write_bytes',
+                'peak_rss')
+
+# File which collects the records written by record_chip_usage(), one
+# JSON object per line, so that they can be written from parallel
+# processes as well as threads.
+_chip_profile_file = None
+_chip_profile_lock = threading.Lock()
+
+
+def get_resource_usage(thread=False):
+    """ Return a snapshot of the resources used so far.
+
+    The returned dict contains the wall-clock time, the CPU time (including
+    that of child processes which have completed), the number of bytes read
+    and written (on Linux only, otherwise None) and the peak resident set
+    size in bytes of this process or of any completed child process
+    (None when not available).  With ``thread=True``, CPU time and I/O
+    are only those of the current thread, so that the resources used for
+    one chip can be measured while other threads are running.
+    """
+    if thread:
+        cpu_time = time.thread_time()
+        io_file = '/proc/thread-self/io'
+    else:
+        cpu_time = time.process_time()
+        io_file = '/proc/self/io'
+
+    peak_rss = None
+    if resource is not None:
+        # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+        rss_units = 1 if sys.platform == 'darwin' else 1024
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        peak_rss = usage.ru_maxrss * rss_units
+        if not thread:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu_time += usage.ru_utime + usage.ru_stime
+            peak_rss = max(peak_rss, usage.ru_maxrss * rss_units)
+
+    read_bytes = write_bytes = None
+    try:
+        with open(io_file) as fh:
+            counters = dict(line.split(':') for line in fh)
+        read_bytes = int(counters['rchar'])
+        write_bytes = int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    return {'wall_time': time.time(), 'cpu_time': cpu_time,
+            'read_bytes': read_bytes, 'write_bytes': write_bytes,
+            'peak_rss': peak_rss}
+
+
+def _usage_delta(start, end):
+    """ Resources used between two `get_resource_usage` snapshots. The peak
+    RSS is that reached by the end, which includes any earlier peak.
+    """
+    delta = {'peak_rss': end['peak_rss']}
+    for key in ('wall_time', 'cpu_time', 'read_bytes', 'write_bytes'):
+        if start[key] is None or end[key] is None:
+            delta[key] = None
+        else:
+            delta[key] = end[key] - start[key]
+    return delta
+
+
+def start_chip_profile(filename):
+    """ Start collecting the records from `record_chip_usage` in ``filename``.
+    """
+    global _chip_profile_file
+    if os.path.exists(filename):
+        os.remove(filename)
+    _chip_profile_file = filename
+
+
+def stop_chip_profile():
+    """ Stop collecting the records from `record_chip_usage` and return the
+    list of all the records collected.
+    """
+    global _chip_profile_file
+    filename = _chip_profile_file
+    _chip_profile_file = None
+    if filename is None or not os.path.exists(filename):
+        return []
+    with open(filename) as fh:
+        records = [json.loads(line) for line in fh if line.strip()]
+    os.remove(filename)
+    return records
+
+
+def start_chip_usage():
+    """ Return the snapshot of the resources used by the current thread to
+    be given to `record_chip_usage` once a chip has been processed, or
+    None when no profile has been started by `ProcSteps`.
+    """
+    if _chip_profile_file is None:
+        return None
+    return get_resource_usage(thread=True)
+
+
+def record_chip_usage(step, chip, start_usage, **kwargs):
+    """ Record the resources used to process ``chip`` (a name) in the
+    processing step ``step`` since ``start_usage``, which must have been
+    returned by `start_chip_usage` in the same thread.
+    Any additional keyword arguments get recorded as-is.  Nothing gets
+    recorded unless a profile has been started by `ProcSteps`.
+    """
+    if _chip_profile_file is None or start_usage is None:
+        return
+    record = {'step': step, 'chip': chip}
+    record.update(_usage_delta(start_usage, get_resource_usage(thread=True)))
+    record.update(kwargs)
+    line = json.dumps(record) + '\n'
+    with _chip_profile_lock:
+        with open(_chip_profile_file, 'a') as fh:
+            fh.write(line)
+
 
 def _ptime():
     import time
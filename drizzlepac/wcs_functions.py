@@ -6,7 +6,11 @@
 
 """
 from astropy.io import fits as pyfits
+import collections
 import copy
+import hashlib
+import os
+import threading
 import numpy as np
 from numpy import linalg
 
@@ -22,12 +26,23 @@ from stsci.tools.fileutil import countExtn
 
 from drizzlepac.haputils import processing_utils as proc_utils
 
+try:
+    from . import cdriz
+except ImportError:
+    cdriz = None
+
 DEFAULT_WCS_PARS = {'ra': None, 'dec': None, 'scale': None, 'rot': None,
                     'outnx': None, 'outny': None,
                     'crpix1': None, 'crpix2': None}
 
 log = logutil.create_logger(__name__, level=logutil.logging.NOTSET)
 
+# Most recently used interpolation tables for DefaultWCSMapping, keyed by
+# the hash of the input/output WCS pair (see get_wcsmap)
+WCSMAP_CACHE_SIZE = 32
+_wcsmap_tables = collections.OrderedDict()
+_wcsmap_lock = threading.Lock()
+
 
 # Default mapping function based on astropy.wcs
 class WCSMap:
@@ -124,6 +139,105 @@ class LinearMap:
         return np.dot(self.transform, [pixx, pixy]) + self.offset
 
 
+##
+#
+# ### Cached C-based WCS mapping
+#
+##
+def get_wcsmap(input_wcs, output_wcs, stepsize, cache_dir=None):
+    """ Return a `cdriz.DefaultWCSMapping` from ``input_wcs`` to
+    ``output_wcs``, re-using the table of output positions computed for
+    any earlier mapping between the same pair of WCS's.
+
+    With ``stepsize > 0``, the mapping interpolates a table of output
+    positions evaluated every ``stepsize`` input pixels (every pixel for
+    ``stepsize=1``).  Drizzling and blotting the same chip onto the same
+    output frame (single drizzle, blot, final drizzle or re-runs of any
+    of these) uses the same table, so it only gets computed once and the
+    results remain identical.  Tables are kept in memory for the
+    ``WCSMAP_CACHE_SIZE`` most recently used pairs of WCS's.
+
+    Parameters
+    ----------
+    input_wcs, output_wcs : `~stwcs.wcsutil.HSTWCS`
+        WCS of the input image and of the output frame.
+
+    stepsize : int
+        Number of input pixels between positions in the table.  A value
+        of 0 evaluates the WCS's for every position, without caching.
+
+    cache_dir : str, optional
+        Directory where tables also get saved as ``.npy`` files, for use
+        (memory-mapped) by other processes or later runs.
+
+    """
+    nx, ny = input_wcs.pixel_shape
+    if stepsize <= 0:
+        return cdriz.DefaultWCSMapping(input_wcs, output_wcs, nx, ny, stepsize)
+
+    key = hashlib.sha1()
+    for w in (input_wcs, output_wcs):
+        key.update(_wcs_hash(w).encode())
+    key.update(f'{nx:d},{ny:d},{stepsize}'.encode())
+    key = key.hexdigest()
+
+    with _wcsmap_lock:
+        table = _wcsmap_tables.get(key)
+        if table is not None:
+            _wcsmap_tables.move_to_end(key)
+
+    cache_file = None
+    if table is None and cache_dir:
+        cache_file = os.path.join(cache_dir, f'wcsmap_{key}.npy')
+        if os.path.exists(cache_file):
+            table = np.load(cache_file, mmap_mode='r')
+
+    if table is None:
+        mapping = cdriz.DefaultWCSMapping(input_wcs, output_wcs, nx, ny,
+                                          stepsize)
+        table = mapping.table
+        if cache_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temporary file first so that other processes never
+            # see a partially written table
+            tmpname = f'{cache_file}.{os.getpid():d}.{threading.get_ident():d}'
+            with open(tmpname, 'wb') as fh:
+                np.save(fh, table)
+            os.replace(tmpname, cache_file)
+    else:
+        mapping = cdriz.DefaultWCSMapping(input_wcs, output_wcs, nx, ny,
+                                          stepsize, table=table)
+
+    with _wcsmap_lock:
+        _wcsmap_tables[key] = table
+        while len(_wcsmap_tables) > WCSMAP_CACHE_SIZE:
+            _wcsmap_tables.popitem(last=False)
+
+    return mapping
+
+
+def _wcs_hash(w):
+    """ Return a hash of everything which affects the pixel to sky
+    transformation of WCS ``w``, including all distortion corrections.
+    """
+    h = hashlib.sha1()
+    h.update(w.wcs.to_header(relax=True).encode())
+    for arr in (w.wcs.crpix, w.wcs.crval, w.wcs.get_pc(), w.wcs.get_cdelt()):
+        h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    if w.sip is not None:
+        for arr in (w.sip.crpix, w.sip.a, w.sip.b, w.sip.ap, w.sip.bp):
+            if arr is not None:
+                h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    for name in ('cpdis1', 'cpdis2', 'det2im1', 'det2im2'):
+        lookup = getattr(w, name)
+        if lookup is not None:
+            h.update(name.encode())
+            for arr in (lookup.crpix, lookup.crval, lookup.cdelt):
+                h.update(np.asarray(arr, dtype=np.float64).tobytes())
+            h.update(np.ascontiguousarray(lookup.data).tobytes())
+    return h.hexdigest()
+
+
 # Stand-alone functions for WCS handling
 def get_hstwcs(filename, extnum):
     """ Return the HSTWCS object for a given chip. """
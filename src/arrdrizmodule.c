@@ -167,25 +167,54 @@ PyWCSMap_init(PyWCSMap *self, PyObject *args, PyObject *kwds)
   PyObject *output_obj = NULL;
   int nx, ny;
   double factor;
+  PyObject *table_obj = Py_None;
+  PyArrayObject *table = NULL;
   int status = -1;
 
   /* Other miscellaneous local variables */
   struct driz_error_t error;
   int istat = 1;
+  npy_intp table_size;
+  static char *kwlist[] = {"input", "output", "nx", "ny", "factor", "table",
+                           NULL};
 
   driz_error_init(&error);
 
   /* TODO: Make factor a kwarg */
-  if (! PyArg_ParseTuple(args, "OOiid:DefaultWCSMapping.__init__",
-                         &input_obj, &output_obj, &nx, &ny, &factor)){
+  if (! PyArg_ParseTupleAndKeywords(args, kwds, "OOiid|O:DefaultWCSMapping.__init__",
+                                    kwlist, &input_obj, &output_obj, &nx, &ny,
+                                    &factor, &table_obj)){
     goto exit;
   }
 
+  /* A previously computed interpolation table (see the 'table' attribute)
+     saves evaluating the WCS's again */
+  if (table_obj != Py_None) {
+    if (factor <= 0) {
+      PyErr_SetString(PyExc_ValueError,
+                      "A mapping table can only be used with factor > 0");
+      goto exit;
+    }
+    table = (PyArrayObject*)PyArray_ContiguousFromAny(table_obj, NPY_FLOAT64, 1, 3);
+    if (table == NULL) {
+      goto exit;
+    }
+    table_size = 2 * (npy_intp)((int)((double)nx / factor) + 2) *
+                     (npy_intp)((int)((double)ny / factor) + 2);
+    if (PyArray_SIZE(table) != table_size) {
+      PyErr_Format(PyExc_ValueError,
+                   "Mapping table has %ld values, expected %ld",
+                   (long)PyArray_SIZE(table), (long)table_size);
+      goto exit;
+    }
+  }
+
   /* Create the C struct from all of these mapping parameters */
   istat = default_wcsmap_init(
       &self->m,
       &((Wcs*)input_obj)->x, &((Wcs*)output_obj)->x,
       nx, ny, factor,
+      (table == NULL) ? NULL : (double*)PyArray_DATA(table),
       &error);
 
   if (istat || driz_error_is_set(&error)) {
@@ -202,10 +231,41 @@ PyWCSMap_init(PyWCSMap *self, PyObject *args, PyObject *kwds)
   status = 0;
 
  exit:
+  Py_XDECREF(table);
 
   return status;
 }
 
+static PyObject*
+PyWCSMap_get_table(PyWCSMap* self, void* closure UNUSED_PARAM)
+{
+  npy_intp dims[3];
+  PyArrayObject* table;
+
+  /* There is no table for the direct (factor == 0) transformation */
+  if (self->m.table == NULL) {
+    Py_RETURN_NONE;
+  }
+
+  dims[0] = self->m.sny;
+  dims[1] = self->m.snx;
+  dims[2] = 2;
+  table = (PyArrayObject*)PyArray_SimpleNew(3, dims, NPY_FLOAT64);
+  if (table == NULL) {
+    return NULL;
+  }
+  memcpy(PyArray_DATA(table), self->m.table, PyArray_NBYTES(table));
+
+  return (PyObject*)table;
+}
+
+static PyGetSetDef PyWCSMap_getset[] = {
+  {"table", (getter)PyWCSMap_get_table, NULL,
+   "Copy of the table of output positions interpolated by the mapping, "
+   "or None when the WCS's get evaluated directly (factor = 0).", NULL},
+  {NULL}  /* Sentinel */
+};
+
 static PyObject*
 PyWCSMap_call(PyWCSMap* self, PyObject* args, PyObject* kwargs)
 {
@@ -302,7 +362,7 @@ static PyTypeObject WCSMapType = {
   0,                                               /*tp_setattro*/
   0,                                               /*tp_as_buffer*/
   (long) Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE, /*tp_flags*/
-  (char *) "DefaultWCSMapping(input,output)",      /* tp_doc */
+  (char *) "DefaultWCSMapping(input, output, nx, ny, factor, table=None)", /* tp_doc */
   0,                                               /* tp_traverse */
   0,                                               /* tp_clear */
   0,                                               /* tp_richcompare */
@@ -311,7 +371,7 @@ static PyTypeObject WCSMapType = {
   0,                                               /* tp_iternext */
   0,                                               /* tp_methods */
   0,                                               /* tp_members */
-  0,                                               /* tp_getset */
+  PyWCSMap_getset,                                 /* tp_getset */
   0,                                               /* tp_base */
   0,                                               /* tp_dict */
   0,                                               /* tp_descr_get */
@@ -463,6 +523,13 @@ tdriz(PyObject *obj UNUSED_PARAM, PyObject *args)
   onx = PyArray_DIMS(out)[1];
   ony = PyArray_DIMS(out)[0];
 
+  /* Only rows ystart to ystart + dny - 1 of the input get drizzled */
+  if (ystart < 0 || dny < 0 || ystart + dny > ny) {
+    driz_error_format_message(&error, "Invalid input rows %ld to %ld for input with %ld rows",
+                              ystart, ystart + dny - 1, (long)ny);
+    goto _exit;
+  }
+
   nmiss = 0;
   nskip = 0;
 
@@ -499,8 +566,16 @@ tdriz(PyObject *obj UNUSED_PARAM, PyObject *args)
   /*
   start_t = clock();
   */
-  /* Do the drizzling */
-  if (dobox(&p, ystart, &nmiss, &nskip, &error)) {
+  /* Do the drizzling.  The GIL can only be released when the mapping
+     does not need to call back into Python. */
+  if (callback == default_wcsmap) {
+    Py_BEGIN_ALLOW_THREADS
+    istat = dobox(&p, ystart, &nmiss, &nskip, &error);
+    Py_END_ALLOW_THREADS
+  } else {
+    istat = dobox(&p, ystart, &nmiss, &nskip, &error);
+  }
+  if (istat) {
     goto _exit;
   }
   /*
@@ -666,8 +741,15 @@ tblot(PyObject *obj, PyObject *args)
     goto _exit;
   }
 
-  callback = py_mapping_callback;
-  callback_state = (void *)callback_obj;
+  if (PyObject_TypeCheck(callback_obj, &WCSMapType)) {
+    /* If we're using the default mapping, we can set things up to avoid
+       the Python/C bridge */
+    callback = default_wcsmap;
+    callback_state = (void *)&(((PyWCSMap *)callback_obj)->m);
+  } else {
+    callback = py_mapping_callback;
+    callback_state = (void *)callback_obj;
+  }
 
   img = (PyArrayObject *)PyArray_ContiguousFromAny(oimg, NPY_FLOAT32, 2, 2);
   if (!img) {
@@ -715,11 +797,19 @@ tblot(PyObject *obj, PyObject *args)
   p.mapping_callback = callback;
   p.mapping_callback_state = callback_state;
 
-  istat = doblot(&p, &error);
+  /* The GIL can only be released when the mapping does not need to
+     call back into Python. */
+  if (callback == default_wcsmap) {
+    Py_BEGIN_ALLOW_THREADS
+    istat = doblot(&p, &error);
+    Py_END_ALLOW_THREADS
+  } else {
+    istat = doblot(&p, &error);
+  }
 
  _exit:
-  Py_DECREF(img);
-  Py_DECREF(out);
+  Py_XDECREF(img);
+  Py_XDECREF(out);
 
   if (istat || driz_error_is_set(&error)) {
     if (strcmp(driz_error_get_message(&error), "<PYTHON>") != 0)
@@ -731,46 +821,54 @@ tblot(PyObject *obj, PyObject *args)
 }
 
 
-/* To replace the default prinf log; instead log to a pythonic log */
+/* To replace the default prinf log; instead log to a pythonic log.
+   This may get called from code running without the GIL (see tdriz),
+   so the GIL is (re-)acquired here for the duration of the call. */
 void cdriz_log_func(const char *format, ...) {
   static PyObject *logging = NULL;
   va_list args;
   PyObject *logger;
   PyObject *string;
+  PyObject *result;
+  PyGILState_STATE gstate;
   char msg[256];
   int n;
 
-  va_start(args, format);
-
-  if (logging == NULL) {
-    logging = PyImport_ImportModuleNoBlock("logging");
-    if (logging == NULL) return;
-  }
+  gstate = PyGILState_Ensure();
 
+  va_start(args, format);
   n = PyOS_vsnprintf(msg, sizeof(msg), format, args);
-
   va_end(args);
 
   if (n < 0) {
     /* XXX: An error occurred in string formatting; just ignore for now */
-    return;
+    goto _exit;
+  }
+
+  if (logging == NULL) {
+    logging = PyImport_ImportModuleNoBlock("logging");
+    if (logging == NULL) goto _exit;
   }
 
   /* XXX: Provide a way to specify the log level to use */
   string = Py_BuildValue("s", msg);
-  if (string == NULL) return;
+  if (string == NULL) goto _exit;
 
   logger = PyObject_CallMethod(logging, "getLogger", "s",
                                "drizzlepac.cdriz");
   if (logger == NULL) {
       Py_XDECREF(string);
-      return;
+      goto _exit;
   }
 
-  PyObject_CallMethod(logger, "info", "O", string);
+  result = PyObject_CallMethod(logger, "info", "O", string);
 
+  Py_XDECREF(result);
   Py_XDECREF(logger);
   Py_XDECREF(string);
+
+ _exit:
+  PyGILState_Release(gstate);
   return;
 }
 
@@ -1093,6 +1191,113 @@ void free_Carrayptrs(double **v)  {
     free((char*) v);
 }
 
+/*
+  Spatial index of the reference positions used by arrxyzero: the positions
+  get sorted into square cells at least as large as the search radius, so
+  that all the reference positions within the search radius of any point
+  are found in the 3x3 cells around the cell of that point.
+*/
+struct xy_grid_t {
+  double xmin, ymin;    /* lower left corner of the grid */
+  double cell;          /* size of the cells */
+  integer_t nx, ny;     /* number of cells along each axis */
+  integer_t *start;     /* [nx*ny+1] index of the first position of each cell */
+  float *x, *y;         /* positions sorted by cell */
+};
+
+static void
+xy_grid_free(struct xy_grid_t *grid) {
+  free(grid->start);
+  free(grid->x);
+  free(grid->y);
+  grid->start = NULL;
+  grid->x = grid->y = NULL;
+}
+
+/* Cell (along one axis) of a coordinate within the grid */
+static inline_macro integer_t
+xy_grid_cell(double v, double vmin, double cell) {
+  return (integer_t)floor((v - vmin) / cell);
+}
+
+static int
+xy_grid_init(struct xy_grid_t *grid, const float *x, const float *y,
+             integer_t n, double searchrad) {
+  integer_t i, k, nvalid = 0, ncells, maxcells;
+  integer_t *cellidx = NULL, *fill = NULL;
+  double xmax = 0.0, ymax = 0.0;
+
+  grid->start = NULL;
+  grid->x = grid->y = NULL;
+  grid->xmin = grid->ymin = 0.0;
+
+  /* Non-finite positions never match anything and are left out */
+  for (i = 0; i < n; ++i) {
+    if (!isfinite(x[i]) || !isfinite(y[i])) continue;
+    if (nvalid == 0) {
+      grid->xmin = xmax = x[i];
+      grid->ymin = ymax = y[i];
+    } else {
+      if (x[i] < grid->xmin) grid->xmin = x[i];
+      if (x[i] > xmax) xmax = x[i];
+      if (y[i] < grid->ymin) grid->ymin = y[i];
+      if (y[i] > ymax) ymax = y[i];
+    }
+    ++nvalid;
+  }
+
+  /* Slightly larger than the search radius so that rounding can never put
+     matching positions more than one cell apart. Use larger cells when
+     needed to keep the number of cells comparable to that of positions. */
+  grid->cell = searchrad * (1.0 + 1e-6);
+  maxcells = 4 * (nvalid + 1);
+  while ((floor((xmax - grid->xmin) / grid->cell) + 1.0) *
+         (floor((ymax - grid->ymin) / grid->cell) + 1.0) > (double)maxcells) {
+    grid->cell *= 2.0;
+  }
+  grid->nx = (integer_t)((xmax - grid->xmin) / grid->cell) + 1;
+  grid->ny = (integer_t)((ymax - grid->ymin) / grid->cell) + 1;
+  ncells = grid->nx * grid->ny;
+
+  grid->start = calloc((size_t)ncells + 1, sizeof(integer_t));
+  grid->x = malloc(((size_t)nvalid + 1) * sizeof(float));
+  grid->y = malloc(((size_t)nvalid + 1) * sizeof(float));
+  cellidx = malloc(((size_t)n + 1) * sizeof(integer_t));
+  fill = malloc(((size_t)ncells + 1) * sizeof(integer_t));
+  if (grid->start == NULL || grid->x == NULL || grid->y == NULL ||
+      cellidx == NULL || fill == NULL) {
+    free(cellidx);
+    free(fill);
+    xy_grid_free(grid);
+    return 1;
+  }
+
+  /* Counting sort of the positions by cell */
+  for (i = 0; i < n; ++i) {
+    if (!isfinite(x[i]) || !isfinite(y[i])) {
+      cellidx[i] = -1;
+      continue;
+    }
+    cellidx[i] = xy_grid_cell(y[i], grid->ymin, grid->cell) * grid->nx +
+                 xy_grid_cell(x[i], grid->xmin, grid->cell);
+    grid->start[cellidx[i] + 1] += 1;
+  }
+  for (k = 0; k < ncells; ++k) {
+    grid->start[k + 1] += grid->start[k];
+    fill[k] = grid->start[k];
+  }
+  for (i = 0; i < n; ++i) {
+    if (cellidx[i] < 0) continue;
+    k = fill[cellidx[i]]++;
+    grid->x[k] = x[i];
+    grid->y[k] = y[i];
+  }
+
+  free(cellidx);
+  free(fill);
+  return 0;
+}
+
 static PyObject *
 arrxyzero(PyObject *obj, PyObject *args)
 {
@@ -1110,7 +1315,15 @@ arrxyzero(PyObject *obj, PyObject *args)
   npy_intp dimensions[2];
   integer_t xind, yind;
   double dx, dy;
-  integer_t j, k;
+  float fdx, fdy, imgx, imgy;
+  float *refx = NULL, *refy = NULL;
+  integer_t imgcols, refcols;
+  integer_t j, k, cx, cy, ix, iy, ix1, ix2, iy1, iy2, cellk;
+  struct xy_grid_t grid;
+  int istat = 0;
+
+  grid.start = NULL;
+  grid.x = grid.y = NULL;
 
   if (!PyArg_ParseTuple(args,"OOd:arrxyzero", &oimgxy, &orefxy, &searchrad)){
     return PyErr_Format(gl_Error, "cdriz.arrxyzero: Invalid Parameters.");
@@ -1131,34 +1344,93 @@ arrxyzero(PyObject *obj, PyObject *args)
     goto _exit;
   PyArray_FILLWBYTE(ozpmat, 0);
 
+  imgnum = PyArray_DIMS(imgxy)[0];
+  refnum = PyArray_DIMS(refxy)[0];
+  imgcols = PyArray_DIMS(imgxy)[1];
+  refcols = PyArray_DIMS(refxy)[1];
+  if (searchrad <= 0.0 || imgnum == 0 || refnum == 0)
+    goto _exit;
+
   /* Allocate memory for return matrix */
   zpmat = pymatrix_to_Carrayptrs(ozpmat);
 
-  imgnum = PyArray_DIMS(imgxy)[0];
-  refnum = PyArray_DIMS(refxy)[0];
+  /* Split the (contiguous) reference positions into separate X and Y
+     arrays and sort them into the cells of a grid, so that only the pairs
+     of positions in neighboring cells need to be compared, instead of all
+     imgnum x refnum pairs. */
+  refx = malloc((size_t)refnum * sizeof(float));
+  refy = malloc((size_t)refnum * sizeof(float));
+  if (refx == NULL || refy == NULL) {
+    istat = 1;
+    goto _exit;
+  }
+  for (k = 0; k < refnum; k++) {
+    refx[k] = ((float *)PyArray_DATA(refxy))[refcols*k];
+    refy[k] = ((float *)PyArray_DATA(refxy))[refcols*k + 1];
+  }
+  if (xy_grid_init(&grid, refx, refy, refnum, searchrad)) {
+    istat = 1;
+    goto _exit;
+  }
 
   /* For each entry in the input image...*/
-  for (j=0; j< imgnum; j++)
-    /* compute the delta relative to each source in ref image */
-    for (k = 0; k < refnum; k++){
-        dx = *(float *)((char*)PyArray_DATA(imgxy) + j*PyArray_STRIDES(imgxy)[0]) -
-             *(float *)((char*)PyArray_DATA(refxy) + k*PyArray_STRIDES(refxy)[0]);
-        dy = *((float *)((char*)PyArray_DATA(imgxy) +
-               j*PyArray_STRIDES(imgxy)[0]+ PyArray_STRIDES(imgxy)[1]))
-           - *((float *)((char*)PyArray_DATA(refxy) +
-               k*PyArray_STRIDES(refxy)[0]+ PyArray_STRIDES(refxy)[1]));
-        if ((fabs(dx) < searchrad) && (fabs(dy) < searchrad)) {
+  for (j=0; j< imgnum; j++) {
+    imgx = ((float *)PyArray_DATA(imgxy))[imgcols*j];
+    imgy = ((float *)PyArray_DATA(imgxy))[imgcols*j + 1];
+    if (!isfinite(imgx) || !isfinite(imgy))
+      continue;
+    /* skip positions beyond the cells next to the grid, which would
+       not match anything (and might overflow the cell index) */
+    if (imgx < grid.xmin - grid.cell || imgy < grid.ymin - grid.cell ||
+        imgx > grid.xmin + (grid.nx + 1) * grid.cell ||
+        imgy > grid.ymin + (grid.ny + 1) * grid.cell)
+      continue;
+
+    cx = xy_grid_cell(imgx, grid.xmin, grid.cell);
+    cy = xy_grid_cell(imgy, grid.ymin, grid.cell);
+    ix1 = (cx > 0) ? cx - 1 : 0;
+    ix2 = (cx + 1 < grid.nx) ? cx + 1 : grid.nx - 1;
+    iy1 = (cy > 0) ? cy - 1 : 0;
+    iy2 = (cy + 1 < grid.ny) ? cy + 1 : grid.ny - 1;
+
+    /* compute the delta relative to each source of the ref image
+       in the neighboring cells */
+    for (iy = iy1; iy <= iy2; iy++) {
+      for (ix = ix1; ix <= ix2; ix++) {
+        cellk = iy * grid.nx + ix;
+        for (k = grid.start[cellk]; k < grid.start[cellk + 1]; k++) {
+          /* differences of the single precision positions are computed
+             in single precision, as for the direct comparison of all
+             pairs of positions */
+          fdx = imgx - grid.x[k];
+          fdy = imgy - grid.y[k];
+          dx = fdx;
+          dy = fdy;
+          if ((fabs(dx) < searchrad) && (fabs(dy) < searchrad)) {
             xind = (integer_t)(dx+searchrad);
             yind = (integer_t)(dy+searchrad);
             zpmat[yind][xind] += 1;
+          }
         }
+      }
     }
+  }
 
  _exit:
-  Py_DECREF(imgxy);
-  Py_DECREF(refxy);
+  Py_XDECREF(imgxy);
+  Py_XDECREF(refxy);
+  free(refx);
+  free(refy);
+  xy_grid_free(&grid);
   free_Carrayptrs(zpmat);
 
+  if (istat) {
+    Py_XDECREF(ozpmat);
+    return PyErr_NoMemory();
+  }
+  if (ozpmat == NULL)
+    return NULL;
+
   return PyArray_Return(ozpmat);
 }
 
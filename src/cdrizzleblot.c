@@ -1110,8 +1110,11 @@ doblot(struct driz_param_t* p,
 
     /* Loop through the output positions and do the interpolation */
     for (i = 0; i < p->onx; ++i) {
-      xo = (float)(xout[i] - dx);
-      yo = (float)(yout[i] - dy);
+      /* Subtract the offset of an image subset only after rounding the
+         position to float, so that it gets interpolated exactly as when
+         using the whole image (the offsets are whole pixels). */
+      xo = (float)(xout[i] - 1.0) - (float)(dx - 1.0);
+      yo = (float)(yout[i] - 1.0) - (float)(dy - 1.0);
 
       /* Check it is on the input image */
       if (xo >= 0.0 && xo <= p->dnx &&
@@ -1234,7 +1234,7 @@ dobox(struct driz_param_t* p, const integer_t ystart,
     /* TODO: Removing this printf causes the results to be
        less accurate.  Frustrating Heisenbug */
     /*printf("%f\n", inv_exposure_time); */
-    data_begin = p->data;
+    data_begin = p->data + (ystart * p->dnx);
     data_end = data_begin + (p->ny * p->dnx);
     for (; data_begin != data_end; ++data_begin) {
       *data_begin *= inv_exposure_time;
@@ -1290,7 +1290,10 @@ dobox(struct driz_param_t* p, const integer_t ystart,
           goto dobox_exit_;
         }
       } else {
-        if (do_kernel_square(p, j, y, x1, x2, last_x1, last_x2,
+        /* Input rows are indexed from the start of the input array, as
+           done by the other kernels, so that any band of rows can be
+           drizzled on its own by setting ystart. */
+        if (do_kernel_square(p, ystart + j, y, x1, x2, last_x1, last_x2,
                              xi, yi, xtmp, ytmp, xo, yo,
                              &oldcon, &newcon, nmiss, error)) {
           goto dobox_exit_;
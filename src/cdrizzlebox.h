@@ -17,6 +17,11 @@ output is covered, or not.
 
 In V1.6 this was simplified to use the DRIVAL routine and also to
 include some limited multi-kernel support.
+
+Only the p->ny input rows starting at row ystart (0-based) get
+drizzled, so that separate bands of rows of the same input image can
+be drizzled independently (for example from separate threads onto
+separate output arrays).
 */
 int
 dobox(struct driz_param_t* p, const integer_t ystart, integer_t* nmiss,
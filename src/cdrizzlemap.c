@@ -473,6 +473,7 @@ default_wcsmap_init(struct wcsmap_param_t* m,
                     pipeline_t* output,
                     int nx, int ny,
                     double factor,
+                    const double* table,
                     struct driz_error_t* error) {
   int     n;
   int     table_size;
@@ -515,6 +516,12 @@ default_wcsmap_init(struct wcsmap_param_t* m,
       goto exit;
     }
 
+    /* A table computed earlier for the same WCS's can be used as-is */
+    if (table != NULL) {
+      memcpy(m->table, table, table_size * sizeof(double));
+      goto done;
+    }
+
     tmp = malloc(table_size * sizeof(double));
     if (tmp == NULL) {
       driz_error_set_message(error, "Out of memory");
@@ -576,6 +583,7 @@ default_wcsmap_init(struct wcsmap_param_t* m,
     }
   } /* End if_then for factor > 0 */
 
+ done:
   m->input_wcs = input;
   m->output_wcs = output;
 
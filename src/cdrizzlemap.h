@@ -43,11 +43,20 @@ default_wcsmap(void* state,
                 /* Output parameters */
                 double* xout, double* yout,
                 struct driz_error_t* error);
+/**
+Set up the mapping from input to output pixel positions.  When factor
+is larger than 0, the transformation gets evaluated on a grid of
+(nx/factor + 2) x (ny/factor + 2) points which is then interpolated.
+If table is not NULL, it must hold such a grid (as computed earlier
+for the same input and output WCS) and gets copied instead of being
+computed again.
+*/
 int
 default_wcsmap_init(struct wcsmap_param_t* m,
                     pipeline_t* input,
                     pipeline_t* output,
                     int nx, int ny, double factor,
+                    const double* table,
                     /* Output parameters */
                     struct driz_error_t* error);
 
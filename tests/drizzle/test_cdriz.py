@@ -2,6 +2,7 @@ import pytest
 import os
 import numpy as np
 import cdriz_setup
+from drizzlepac import ablot, cdriz, wcs_functions
 
 
 @pytest.fixture
@@ -70,3 +71,82 @@ def test_lanczos3_kernel(kernel_pars, return_png=True):
     if return_png:
         cdriz_setup.generate_png(kernel_pars, output_fullpath)
     assert np.allclose(np.sum(kernel_pars.outsci), 9882.103, 1e-3)
+
+
+def test_cached_wcsmap(tmpdir):
+    """Mappings re-using a saved coordinate table match a new mapping."""
+    pars = cdriz_setup.Get_Grid(inx=50, iny=40, outx=60, outy=60)
+    w1 = cdriz_setup.get_wcs(pars.in_grid[::-1], pscale=0.037)
+    w1.pixel_shape = pars.in_grid[::-1]
+    mapping = cdriz.DefaultWCSMapping(w1, pars.w2, 50, 40, 5)
+    x, y = np.meshgrid(np.arange(1, 51.0), np.arange(1, 41.0))
+    x, y = x.ravel(), y.ravel()
+
+    cached = wcs_functions.get_wcsmap(w1, pars.w2, 5, cache_dir=str(tmpdir))
+    assert len(tmpdir.listdir()) == 1
+    assert np.array_equal(cached.table, mapping.table)
+    # clear the in-memory tables to read the one saved on disk
+    wcs_functions._wcsmap_tables.clear()
+    for _ in range(2):
+        cached = wcs_functions.get_wcsmap(w1, pars.w2, 5,
+                                          cache_dir=str(tmpdir))
+        assert np.array_equal(cached(x, y), mapping(x, y))
+
+    # a different WCS does not use the same table
+    w1.wcs.crpix = w1.wcs.crpix + 1
+    w1.wcs.set()
+    other = wcs_functions.get_wcsmap(w1, pars.w2, 5, cache_dir=str(tmpdir))
+    assert len(tmpdir.listdir()) == 2
+    assert not np.array_equal(other(x, y), mapping(x, y))
+
+
+@pytest.mark.parametrize("interp", ["nearest", "linear", "poly5", "sinc",
+                                    "lan5"])
+def test_blot_source_region(interp):
+    """Blotting from the region found by _blot_source_region gives exactly
+    the same results as blotting from the whole source image."""
+    pars = cdriz_setup.Get_Grid(inx=60, iny=50, outx=300, outy=280)
+    rng = np.random.default_rng(2)
+    source = rng.normal(10, 1, size=pars.out_grid).astype(np.float32)
+    w1 = cdriz_setup.get_wcs(pars.in_grid[::-1], pscale=0.037)
+    w1.wcs.crpix = w1.wcs.crpix + [40.3, -25.6]
+    w1.wcs.set()
+    mapping = cdriz.DefaultWCSMapping(w1, pars.w2, pars.in_grid[1],
+                                      pars.in_grid[0], 10)
+
+    region = ablot._blot_source_region(mapping, pars.in_grid, source.shape)
+    assert region is not None
+    y1, y2, x1, x2 = region
+    assert (y2 - y1) * (x2 - x1) < source.size // 4
+
+    results = []
+    for sci, xmin, ymin in [(source, 1, 1),
+                            (source[y1:y2, x1:x2], x1 + 1, y1 + 1)]:
+        outsci = np.zeros(pars.in_grid, dtype=np.float32)
+        cdriz.tblot(sci, outsci, xmin, xmin + sci.shape[1] - 1, ymin,
+                    ymin + sci.shape[0] - 1, 1.0, 1.0, 1.0, 1.0, "center",
+                    interp, 1.0, 0.0, 1.0, 1, mapping)
+        results.append(outsci)
+    assert np.array_equal(results[1], results[0])
+
+
+@pytest.mark.parametrize("searchrad", [0.7, 3.0, 12.5])
+def test_arrxyzero(searchrad):
+    """The zero-point histogram matches comparing all pairs of positions."""
+    rng = np.random.default_rng(5)
+    refxy = rng.uniform(0, 400, size=(800, 2)).astype(np.float32)
+    imgxy = (refxy[:600] + rng.normal([2.3, -1.6], 0.3, size=(600, 2)))
+    imgxy = np.vstack([imgxy, rng.uniform(-50, 450, size=(200, 2))])
+    imgxy = imgxy.astype(np.float32)
+    imgxy[5] = np.nan
+
+    dx = np.subtract.outer(imgxy[:, 0], refxy[:, 0]).astype(np.float64)
+    dy = np.subtract.outer(imgxy[:, 1], refxy[:, 1]).astype(np.float64)
+    idx = (np.abs(dx) < searchrad) & (np.abs(dy) < searchrad)
+    truth = np.zeros((int(2 * searchrad) + 1,) * 2)
+    np.add.at(truth, ((dy[idx] + searchrad).astype(int),
+                      (dx[idx] + searchrad).astype(int)), 1)
+
+    zpmat = cdriz.arrxyzero(imgxy, refxy, searchrad)
+    assert np.array_equal(zpmat, truth)
+    assert zpmat.sum() > 0
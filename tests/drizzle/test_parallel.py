@@ -0,0 +1,155 @@
+import io
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+from stsci.tools import logutil
+
+import cdriz_setup
+from drizzlepac import adrizzle, cdriz, util
+
+
+def _drizzle_inputs(inputs, shape, uniqids):
+    """Drizzle all (insci, inwht, mapping) inputs onto a new set of outputs."""
+    outsci = np.zeros(shape, dtype=np.float32)
+    outwht = np.zeros(shape, dtype=np.float32)
+    outctx = np.zeros(shape, dtype=np.int32)
+    for (insci, inwht, mapping), uniqid in zip(inputs, uniqids):
+        cdriz.tdriz(insci, inwht, outsci, outwht, outctx, uniqid, 0, 1, 1,
+                    insci.shape[0], 1.0, 1.0, 1.0, "center", 1.0, "square",
+                    "cps", 1.0, 1.0, "INDEF", 0, 0, 1, mapping)
+    return outsci, outwht, outctx
+
+
+@pytest.mark.parametrize("ngroups", [2, 3])
+def test_merge_driz_accumulators(ngroups):
+    """Merging separately drizzled groups matches drizzling all inputs at once."""
+    pars = cdriz_setup.Get_Grid(inx=40, iny=40, outx=60, outy=60)
+    inputs = []
+    rng = np.random.default_rng(1)
+    for i in range(6):
+        w1 = cdriz_setup.get_wcs(pars.in_grid)
+        w1.wcs.crpix = w1.wcs.crpix + rng.uniform(-5, 5, 2)
+        w1.wcs.set()
+        insci = rng.normal(size=pars.in_grid).astype(np.float32)
+        inwht = rng.uniform(0.5, 2.0, size=pars.in_grid).astype(np.float32)
+        mapping = cdriz.DefaultWCSMapping(w1, pars.w2, pars.in_grid[1],
+                                          pars.in_grid[0], 1)
+        inputs.append((insci, inwht, mapping))
+    uniqids = list(range(1, len(inputs) + 1))
+
+    outsci, outwht, outctx = _drizzle_inputs(inputs, pars.out_grid, uniqids)
+
+    accumulators = []
+    for group in np.array_split(np.arange(len(inputs)), ngroups):
+        accumulators.append(
+            _drizzle_inputs([inputs[i] for i in group], pars.out_grid,
+                            [uniqids[i] for i in group])
+        )
+    mrgsci = np.empty(pars.out_grid, dtype=np.float32)
+    mrgwht = np.empty(pars.out_grid, dtype=np.float32)
+    mrgctx = np.empty(pars.out_grid, dtype=np.int32)
+    adrizzle.merge_driz_accumulators(mrgsci, mrgwht, mrgctx, accumulators)
+
+    assert np.allclose(mrgsci, outsci, rtol=1e-5, atol=1e-6)
+    assert np.allclose(mrgwht, outwht, rtol=1e-6)
+    assert np.array_equal(mrgctx, outctx)
+
+
+def test_tdriz_threads():
+    """Drizzling from several threads at once gives the serial results."""
+    pars = cdriz_setup.Get_Grid(inx=200, iny=200, outx=220, outy=220)
+    inputs = [(pars.insci * (i + 1), pars.inwht, pars.mapping) for i in range(4)]
+    expected = [_drizzle_inputs([inp], pars.out_grid, [1]) for inp in inputs]
+
+    results = util.run_in_threads(
+        _drizzle_inputs, [([inp], pars.out_grid, [1]) for inp in inputs], 4
+    )
+    for result, truth in zip(results, expected):
+        for arr, truth_arr in zip(result, truth):
+            assert np.array_equal(arr, truth_arr)
+
+
+@pytest.mark.parametrize("kernel", ["square", "point", "turbo", "gaussian",
+                                    "lanczos3"])
+def test_do_driz_bands(kernel):
+    """Drizzling bands of rows from several threads matches a single call."""
+    pars = cdriz_setup.Get_Grid(inx=100, iny=120, outx=140, outy=140)
+    rng = np.random.default_rng(3)
+    insci = rng.normal(10, 1, size=pars.in_grid).astype(np.float32)
+    inwht = rng.uniform(0.5, 2.0, size=pars.in_grid).astype(np.float32)
+    w1 = cdriz_setup.get_wcs(pars.in_grid[::-1], pscale=0.037)
+    w1.wcs.crpix = w1.wcs.crpix + [3.3, -2.6]
+    w1.wcs.set()
+    mapping = cdriz.DefaultWCSMapping(w1, pars.w2, pars.in_grid[1],
+                                      pars.in_grid[0], 10)
+    prior = (pars.insci, pars.inwht,
+             cdriz.DefaultWCSMapping(pars.w1, pars.w2, pars.in_grid[1],
+                                     pars.in_grid[0], 1))
+
+    results = []
+    for nthreads in [1, 3]:
+        # drizzle onto outputs which already hold another input
+        outsci, outwht, outctx = _drizzle_inputs([prior], pars.out_grid, [1])
+        adrizzle._do_driz_bands(insci.copy(), inwht, outsci, outwht, outctx,
+                                2, 1.0, 1.0, kernel, "counts", 2.0, 1.0,
+                                "-1", mapping, nthreads)
+        results.append((outsci, outwht, outctx))
+
+    (sci1, wht1, ctx1), (sci3, wht3, ctx3) = results
+    assert np.allclose(sci3, sci1, rtol=1e-5, atol=1e-5)
+    assert np.allclose(wht3, wht1, rtol=1e-5, atol=1e-5)
+    assert np.array_equal(ctx3, ctx1)
+    assert np.any(sci1 == -1)
+
+
+def test_worker_pool_memory_limit():
+    """Tasks only run together while their memory fits within the limit."""
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def task(mem):
+        with lock:
+            running.append(mem)
+            peak.append(sum(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(mem)
+        return mem
+
+    memory = [3, 2, 2, 4, 1]
+    with util.WorkerPool(num_cores=4, max_memory=5) as pool:
+        pool.max_workers = 4  # regardless of the platform
+        results = pool.run(task, [(m,) for m in memory], 4, threads=True,
+                           memory=[m * 2**20 for m in memory])
+    assert results == memory
+    assert max(peak) <= 5
+
+
+def test_worker_pool_nested():
+    """Nested worker_pool contexts share the pool of the outermost one."""
+    with util.worker_pool(num_cores=2) as outer:
+        with util.worker_pool(num_cores=3) as inner:
+            assert inner is outer
+    with util.worker_pool(num_cores=3) as pool:
+        assert pool is not outer
+
+
+def test_thread_output(monkeypatch):
+    """Worker threads can print while sys.stdout is a StreamTeeLogger."""
+    out = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", logutil.StreamTeeLogger("stdout", stream=out))
+
+    def task(k):
+        print("task", k)
+        return k
+
+    assert util.run_in_threads(task, [(k,) for k in range(6)], 3) == list(range(6))
+    with util.WorkerPool(num_cores=3) as pool:
+        pool.max_workers = 3  # regardless of the platform
+        assert pool.run(task, [(k,) for k in range(6, 9)], 3, threads=True) == [6, 7, 8]
+    assert isinstance(sys.stdout, logutil.StreamTeeLogger)
+    assert sorted(out.getvalue().splitlines()) == sorted("task {}".format(k) for k in range(9))
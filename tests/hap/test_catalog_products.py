@@ -0,0 +1,160 @@
+""" Tests of the generation of the filter product catalogs by hapsequencer, using stand-ins
+for the catalogs so that only the scheduling and the combination of the catalogs get tested.
+"""
+import pickle
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+from drizzlepac import hapsequencer
+from drizzlepac import util
+from drizzlepac.haputils.catalog_utils import CatalogImage
+
+FILTERS = ['f435w', 'f606w', 'f814w']
+NSOURCES = 6
+
+# Catalogs created or written in the calling process
+created = []
+written = []
+
+
+def _image(imgname):
+    image = CatalogImage.__new__(CatalogImage)
+    image.imghdu = None
+    image.imgname = imgname
+    image.ghd_product = 'tdp' if 'total' in imgname else 'fdp'
+    image.keyword_dict = {'texpo_time': 300.}
+    for name in CatalogImage.image_arrays:
+        setattr(image, name, np.ones((20, 30)))
+    return image
+
+
+class FakeCatalog:
+    def __init__(self, cat_type, image, tp_sources):
+        self.cat_type = cat_type
+        self.image = image
+        self.tp_sources = tp_sources
+        self.sources = None
+        self.source_cat = None
+        self.subset_filter_source_cat = None
+
+    def identify_sources(self):
+        self.sources = Table({'ID': np.arange(NSOURCES)})
+        if self.cat_type == 'segment':
+            self.source_cat = Table({'ID': np.arange(NSOURCES)})
+            self.kernel = np.ones((3, 3))
+            self.total_source_cat = Table({'ID': np.arange(NSOURCES)})
+
+    def measure_sources(self, filter_name):
+        self.sources = self.tp_sources[self.cat_type]['sources']
+        if self.cat_type == 'segment':
+            self.kernel = self.tp_sources['segment']['kernel']
+            self.total_source_cat = self.tp_sources['segment']['total_source_cat']
+        # the first filter gets measured last when running in parallel
+        time.sleep(0.1 * (len(FILTERS) - FILTERS.index(filter_name)))
+        self.source_cat = Table({'ID': np.arange(NSOURCES), 'Flags': np.zeros(NSOURCES, dtype=int)})
+        self.subset_filter_source_cat = Table({'ID': np.arange(NSOURCES),
+                                               'Mag_{}'.format(filter_name): np.arange(NSOURCES) + 20.})
+
+
+class FakeHAPCatalogs:
+    def __init__(self, fitsfile, param_dict, param_dict_qc, num_images_mask, log_level,
+                 diagnostic_mode=False, types=None, tp_sources=None):
+        self.imgname = fitsfile
+        self.param_dict = param_dict
+        self.tp_sources = tp_sources
+        self.image = _image(fitsfile)
+        self.catalogs = {cat_type: FakeCatalog(cat_type, self.image, tp_sources)
+                         for cat_type in ['segment', 'aperture']}
+        self.combined = []
+        created.append(self)
+
+    def identify(self, mask=None):
+        for catalog in self.catalogs.values():
+            catalog.identify_sources()
+        self.identified = {cat_type: catalog.sources for cat_type, catalog in self.catalogs.items()}
+
+    def measure(self, filter_name):
+        for catalog in self.catalogs.values():
+            catalog.measure_sources(filter_name)
+
+    def combine(self, subset_dict):
+        for cat_type, catalog in self.catalogs.items():
+            table = catalog.sources if cat_type == 'aperture' else catalog.source_cat
+            flag_columns = [col for col in subset_dict[cat_type]['subset'].colnames if col.startswith('Flags_')]
+            self.combined.append(flag_columns[0][len('Flags_'):])
+            table[flag_columns[0]] = subset_dict[cat_type]['subset'][flag_columns[0]]
+
+    def verify_crthresh(self, n1_exposure_time):
+        return {cat_type: False for cat_type in self.catalogs}
+
+    def write(self, reject_catalogs):
+        written.append(self)
+
+
+class FakePars:
+    def get_pars(self, step):
+        return {'cr_residual': 0.0, 'flag_trim_value': 5}
+
+
+def _total_product():
+    fdp_list = [SimpleNamespace(drizzle_filename='{}_drz.fits'.format(f), filters=f,
+                                point_cat_filename='{}_point-cat.ecsv'.format(f),
+                                segment_cat_filename='{}_segment-cat.ecsv'.format(f))
+                for f in FILTERS]
+    edp_list = [SimpleNamespace(filters=f, exptime=100.) for f in FILTERS for k in range(2)]
+    return SimpleNamespace(drizzle_filename='total_drz.fits', detector='wfc', mask=None,
+                           configobj_pars=FakePars(), fdp_list=fdp_list, edp_list=edp_list,
+                           point_cat_filename='total_point-cat.ecsv',
+                           segment_cat_filename='total_segment-cat.ecsv')
+
+
+@pytest.mark.parametrize("num_cores", [1, 3])
+def test_catalog_products(monkeypatch, num_cores):
+    """The filter catalogs get combined in their order, sharing the sources of the total product."""
+    monkeypatch.setattr(util, "can_parallel", True)
+    monkeypatch.setattr(util, "_cpu_count", 4)
+    monkeypatch.setattr(hapsequencer, "HAPCatalogs", FakeHAPCatalogs)
+    monkeypatch.setattr(hapsequencer, "run_sourcelist_flagging", lambda fdp, catalogs, *args: catalogs)
+    del created[:], written[:]
+
+    total_product_obj = _total_product()
+    product_list = hapsequencer.create_catalog_products([total_product_obj], 20,
+                                                        catalog_switches={'SVM_CATALOG_WFC': True},
+                                                        num_cores=num_cores)
+
+    total = created[0]
+    assert total.imgname == 'total_drz.fits'
+    assert total.combined == [f for f in FILTERS for cat_type in total.catalogs]
+    assert [c.imgname for c in written] == [fdp.drizzle_filename for fdp in total_product_obj.fdp_list] + \
+        ['total_drz.fits']
+    assert product_list[-2:] == ['total_point-cat.ecsv', 'total_segment-cat.ecsv']
+    for cat_type in ['aperture', 'segment']:
+        table = total.catalogs[cat_type].sources if cat_type == 'aperture' else total.catalogs[cat_type].source_cat
+        assert ['Flags_{}'.format(f) for f in FILTERS] == [c for c in table.colnames if c.startswith('Flags_')]
+
+    # the sources of the total product are again those of the calling process, in all the filter catalogs
+    sources_dict = written[0].tp_sources
+    for filter_catalogs in written[:-1]:
+        assert filter_catalogs.tp_sources is sources_dict
+        for cat_type, catalog in filter_catalogs.catalogs.items():
+            assert catalog.tp_sources is sources_dict
+            assert catalog.sources is sources_dict[cat_type]['sources']
+            assert catalog.sources is total.identified[cat_type]
+        assert filter_catalogs.catalogs['segment'].kernel is total.catalogs['segment'].kernel
+        if num_cores > 1:
+            # the images come back without their arrays
+            assert filter_catalogs.image.data is None and filter_catalogs.image.keyword_dict
+
+
+def test_catalog_image_pickle():
+    """Only the header data of the images get pickled, not their arrays."""
+    image = pickle.loads(pickle.dumps(_image('f606w_drz.fits')))
+    assert image.imgname == 'f606w_drz.fits'
+    assert image.ghd_product == 'fdp'
+    assert image.keyword_dict == {'texpo_time': 300.}
+    for name in CatalogImage.image_arrays:
+        assert getattr(image, name) is None
@@ -0,0 +1,146 @@
+""" Tests of the checkpoints letting AstroDrizzle resume the steps completed
+by an earlier run, on copies of a small WFC3/UVIS exposure.
+"""
+import os
+import shutil
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from drizzlepac import astrodrizzle, checkpoint
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, 'drizzlepac',
+                      'haputils', 'tests', 'sample_svm_flc.fits')
+INPUTS = ['ib4606c1q_flc.fits', 'ib4606c2q_flc.fits', 'ib4606c3q_flc.fits']
+ALL_STEPS = [step for step, _ in checkpoint.STEPS]
+OUTPUTS = ['final_drc_sci.fits', 'final_drc_wht.fits',
+           'ib4606c2q_sci1_crmask.fits']
+
+
+def _make_inputs(dirname):
+    for name in INPUTS:
+        shutil.copy(SAMPLE, os.path.join(dirname, name))
+    # a cosmic ray on one of the exposures
+    with fits.open(os.path.join(dirname, INPUTS[1]), mode='update') as hdul:
+        hdul['SCI', 1].data[4:6, 5] += 5000.
+
+
+@pytest.fixture
+def inputs(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    _make_inputs(str(tmpdir))
+    return tmpdir
+
+
+@pytest.fixture
+def steps(monkeypatch):
+    """ Record the steps actually run, with the static mask names and sky
+    values of the chips they start from.
+    """
+    ran = []
+    run = checkpoint.Checkpoints.run
+
+    def spy(self, step, func, *args, **kwargs):
+        def call(*fargs, **fkwargs):
+            chips = [chip for image in self.imgObjList
+                     for chip in checkpoint._group_chips(image)]
+            ran.append((step, [(chip.outputNames['staticMask'], chip.subtractedSky,
+                                chip.computedSky) for chip in chips]))
+            return func(*fargs, **fkwargs)
+        return run(self, step, call, *args, **kwargs)
+
+    monkeypatch.setattr(checkpoint.Checkpoints, 'run', spy)
+    return ran
+
+
+def _run(steps, **pars):
+    del steps[:]
+    pars.setdefault('checkpoint', True)
+    astrodrizzle.AstroDrizzle(INPUTS, output='final', clean=False, build=False,
+                              context=False, preserve=False, num_cores=1, **pars)
+    return [step for step, _ in steps]
+
+
+def _input_state():
+    """ MDRIZSKY values and DQ arrays of the input files. """
+    skies = []
+    dqs = []
+    for name in INPUTS:
+        with fits.open(name) as hdul:
+            skies.append([hdul['SCI', k].header['MDRIZSKY'] for k in (1, 2)])
+            dqs.append([hdul['DQ', k].data.copy() for k in (1, 2)])
+    return skies, dqs
+
+
+def test_resume(inputs, steps, tmpdir_factory, monkeypatch):
+    """ Unchanged steps get skipped, changed ones rerun with the state left
+    by the skipped ones, giving the results of a new run.
+    """
+    assert _run(steps) == ALL_STEPS
+    assert os.path.isfile('final_drc' + checkpoint.MANIFEST_SUFFIX)
+    final_state = steps[-1][1]
+    assert all(name and os.path.isfile(name) for name, _, _ in final_state)
+    state = _input_state()
+    # the cosmic ray got flagged in the input DQ array
+    assert np.any(state[1][1][0] & 4096)
+
+    # MDRIZSKY gets restored when the sky subtraction is skipped
+    for name in INPUTS:
+        with fits.open(name, mode='update') as hdul:
+            hdul['SCI', 1].header['MDRIZSKY'] = 0.
+    assert _run(steps) == []
+    skies2, dqs2 = _input_state()
+    assert skies2 == state[0]
+    # and the final drizzle still flags the cosmic rays in the DQ arrays
+    for dq, dq2 in zip(state[1], dqs2):
+        np.testing.assert_array_equal(dq, dq2)
+
+    assert _run(steps, driz_cr_snr='3.0 2.5') == ['Driz_CR', 'Final Drizzle']
+    # the static mask names and sky values set by the skipped steps
+    assert steps[-1][1] == final_state
+    resumed = [fits.getdata(name) for name in OUTPUTS]
+    resumed_dq = _input_state()[1]
+
+    # same results as a new run with these parameters
+    newdir = tmpdir_factory.mktemp('new')
+    _make_inputs(str(newdir))
+    monkeypatch.chdir(newdir)
+    assert _run(steps, driz_cr_snr='3.0 2.5') == ALL_STEPS
+    for name, data in zip(OUTPUTS, resumed):
+        np.testing.assert_array_equal(fits.getdata(name), data)
+    for dq, dq2 in zip(_input_state()[1], resumed_dq):
+        np.testing.assert_array_equal(dq, dq2)
+
+
+def test_input_changed(inputs, steps):
+    """ All the steps get run again when an input file has changed. """
+    assert _run(steps) == ALL_STEPS
+    with fits.open(INPUTS[2], mode='update') as hdul:
+        hdul['SCI', 2].data[2, 3] += 10.
+    assert _run(steps) == ALL_STEPS
+    assert _run(steps) == []
+
+
+def test_refimage_changed(inputs, steps):
+    """ The contents of the files named by the parameters are part of the
+    checkpoints, not only their names.
+    """
+    shutil.copy(INPUTS[0], 'refimage.fits')
+    pars = dict(final_wcs=True, final_refimage='refimage.fits[sci,1]')
+    assert _run(steps, **pars) == ALL_STEPS
+    assert _run(steps, **pars) == []
+    with fits.open('refimage.fits', mode='update') as hdul:
+        hdul['SCI', 1].header['ORIENTAT'] += 10.
+    assert _run(steps, **pars) == ['Final Drizzle']
+
+
+def test_no_checkpoint(inputs, steps):
+    """ Without checkpoints, all the steps get run and none get recorded. """
+    manifest = 'final_drc' + checkpoint.MANIFEST_SUFFIX
+    assert _run(steps, checkpoint=False) == ALL_STEPS
+    assert not os.path.exists(manifest)
+    assert _run(steps) == ALL_STEPS
+    mtime = os.path.getmtime(manifest)
+    assert _run(steps, checkpoint=False) == ALL_STEPS
+    assert os.path.getmtime(manifest) == mtime
@@ -0,0 +1,87 @@
+""" Tests of the median image combined by sections of rows, in parallel or
+not, on copies of a small WFC3/UVIS exposure.
+"""
+import os
+import shutil
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from drizzlepac import astrodrizzle, createMedian, util
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, 'drizzlepac',
+                      'haputils', 'tests', 'sample_svm_flc.fits')
+INPUTS = ['ib4606c1q_flc.fits', 'ib4606c2q_flc.fits', 'ib4606c3q_flc.fits']
+# the first chip drizzled with a 4 times smaller pixel scale
+NX, NY = 40, 64
+# a buffer of 12 rows of the single drizzled images
+BUFSIZE = 12 * NX * 4 / 2**20
+
+
+@pytest.fixture
+def inputs(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    for k, name in enumerate(INPUTS):
+        shutil.copy(SAMPLE, name)
+        # cosmic rays on each of the exposures
+        with fits.open(name, mode='update') as hdul:
+            hdul['SCI', 1].data[2 * k + 1, 3:5] += 5000.
+            hdul['SCI', 1].data[8, 2 * k] += 3000.
+    return tmpdir
+
+
+def _median(monkeypatch, num_cores, **pars):
+    monkeypatch.setattr(util, "can_parallel", True)
+    monkeypatch.setattr(util, "_cpu_count", 4)
+    astrodrizzle.AstroDrizzle(INPUTS, output='final', group='1', clean=False,
+                              build=False, context=False, preserve=False,
+                              num_cores=num_cores, driz_sep_wcs=True,
+                              driz_sep_scale=0.01, driz_sep_outnx=NX,
+                              driz_sep_outny=NY,
+                              combine_bufsize=BUFSIZE, blot=False,
+                              driz_cr=False, driz_combine=False, **pars)
+    return fits.getdata('final_med.fits')
+
+
+@pytest.mark.parametrize('combine_type, grow',
+                         [('median', 0), ('minmed', 1), ('minmed', 2)])
+@pytest.mark.parametrize('backend', ['process', 'thread'])
+def test_median_sections(inputs, monkeypatch, combine_type, grow, backend):
+    """ Sections combined by parallel workers give the serial median. """
+    pars = dict(combine_type=combine_type, combine_grow=grow,
+                parallel_backend=backend)
+    serial = _median(monkeypatch, 1, **pars)
+    assert serial.shape == (NY, NX)
+    assert np.any(serial)
+
+    calls = []
+    median_parallel = createMedian._median_parallel
+
+    def spy(sections, *args):
+        calls.append((sections, args[-2]))
+        return median_parallel(sections, *args)
+
+    monkeypatch.setattr(createMedian, '_median_parallel', spy)
+    parallel = _median(monkeypatch, 4, **pars)
+
+    assert len(calls) == 1
+    sections, pool_size = calls[0]
+    assert pool_size == 4
+    assert len(sections) > pool_size
+    # the sections cover all the rows, each of them once
+    rows = np.concatenate([np.arange(e1 + u1, e1 + u2) for e1, e2, u1, u2 in sections])
+    np.testing.assert_array_equal(rows, np.arange(NY))
+    np.testing.assert_array_equal(parallel, serial)
+
+
+@pytest.mark.parametrize('imrows, section_nrows, grow',
+                         [(64, 12, 0), (64, 12, 2), (64, 64, 1), (10, 3, 1), (7, 5, 2)])
+def test_row_sections(imrows, section_nrows, grow):
+    """ The used rows of the sections cover the image once and in order. """
+    sections = createMedian._row_sections(imrows, section_nrows, grow)
+    rows = np.concatenate([np.arange(e1 + u1, e1 + u2) for e1, e2, u1, u2 in sections])
+    np.testing.assert_array_equal(rows, np.arange(imrows))
+    for e1, e2, u1, u2 in sections:
+        assert 0 <= e1 < e2 <= imrows
+        assert e2 - e1 <= section_nrows
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from drizzlepac import drizCR
+
+
+@pytest.mark.parametrize("grow,ctegrow,cte_dir",
+                         [(1, 0, 0), (3, 0, 1), (2, 4, 1), (1, 5, -1),
+                          (4, 2, 0)])
+@pytest.mark.parametrize("block_rows", [1, 7, 64])
+def test_cr_mask_blocked(grow, ctegrow, cte_dir, block_rows):
+    """The 'blocked' CR detection engine matches the full-chip computation."""
+    rng = np.random.default_rng(5)
+    shape = (45, 31)
+    blot = rng.normal(100.0, 10.0, size=shape).astype(np.float32)
+    sci = (blot + rng.normal(0.0, 12.0, size=shape)).astype(np.float32)
+    hits = rng.random(shape) < 0.02
+    sci[hits] += rng.uniform(200, 2000, size=hits.sum()).astype(np.float32)
+
+    crpars = {'conversion': 1.5, 'gain': 1.5, 'rn': 3.0, 'backg': 20.0,
+              'snr': (3.5, 3.0), 'mult': (1.2, 0.7), 'grow': grow,
+              'ctegrow': ctegrow, 'cte_dir': cte_dir}
+
+    full = drizCR._cr_mask_full(sci, blot, crpars)
+    blocked = drizCR._cr_mask_blocked(sci, blot, crpars,
+                                      block_rows=block_rows)
+    assert np.array_equal(blocked, full)
+    assert not full.all()
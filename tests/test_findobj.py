@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from drizzlepac import findobj
+
+
+def _star_field(nstars, size=256, fwhm=2.5, seed=1):
+    rng = np.random.default_rng(seed)
+    img = rng.normal(10, 2, (size, size))
+    y, x = np.mgrid[0:size, 0:size]
+    sigma = fwhm / findobj.FWHM2SIG
+    for xs, ys, flux in zip(rng.uniform(3, size - 3, nstars),
+                            rng.uniform(3, size - 3, nstars),
+                            rng.uniform(50, 5000, nstars)):
+        img += (flux / (2 * np.pi * sigma**2) *
+                np.exp(-((x - xs)**2 + (y - ys)**2) / (2 * sigma**2)))
+    return img.astype(np.float32)
+
+
+def test_stacked_measurements():
+    """The stacked measurements match those made one source at a time."""
+    nx, ny, a, b, c, f = findobj.gausspars(2.5)
+    xc, yc = nx // 2, ny // 2
+    yin, xin = np.mgrid[0:ny, 0:nx]
+    kernel = findobj.gaussian1(1.0, xc, yc, a, b, c)(xin, yin)
+    kskip = (kernel > 0.1).astype(np.int16)
+    s2m, s4m = findobj.precompute_sharp_round(nx, ny, xc, yc)
+    xsigsq = ysigsq = (2.5 / findobj.FWHM2SIG)**2
+
+    rng = np.random.default_rng(2)
+    data = (rng.normal(5, 1, (50, ny, nx)) +
+            100 * kernel * rng.uniform(0, 2, (50, 1, 1))).astype(np.float32)
+    density = (data - data.mean(axis=(1, 2), keepdims=True)).astype(np.float32)
+    datamin = data.min(axis=(1, 2))
+    datamax = data.max(axis=(1, 2))
+
+    satur, round1, sharp = findobj._sharp_round_stack(
+        data, density, kskip, xc, yc, s2m, s4m, datamin, datamax
+    )
+    x, y, round2 = findobj._xy_round_stack(data, xc, yc, 5.0, kernel, xsigsq,
+                                           ysigsq, datamin, datamax)
+    assert np.isfinite(x).any()
+    for k in range(data.shape[0]):
+        truth = findobj.sharp_round(data[k], density[k], kskip, xc, yc, s2m,
+                                    s4m, nx, ny, datamin[k], datamax[k])
+        assert satur[k] == truth[0]
+        for value, truth_value in zip((round1[k], sharp[k]), truth[1:]):
+            if truth_value is None:
+                assert np.isnan(value)
+            else:
+                assert value == pytest.approx(truth_value, rel=1e-5)
+
+        truth = findobj.xy_round(data[k], xc, yc, 5.0, kernel, xsigsq, ysigsq,
+                                 datamin[k], datamax[k])
+        if truth[0] is None:
+            assert np.isnan(x[k])
+        else:
+            assert (x[k], y[k], round2[k]) == pytest.approx(truth, rel=1e-6,
+                                                            abs=1e-8)
+
+
+@pytest.mark.parametrize("use_sharp_round", [False, True])
+def test_findstars(use_sharp_round):
+    """Stars get found in a synthetic field."""
+    img = _star_field(150)
+    positions, fluxes = findobj.findstars(img, 2.5, 20.0, 10.0,
+                                          use_sharp_round=use_sharp_round)
+    assert len(positions) == len(fluxes) > 100
+    positions = np.array(positions, dtype=float)
+    assert np.all((positions[:, :2] > 0) & (positions[:, :2] < 256))
+    assert np.all(np.isfinite(positions[:, 4]))
+    assert np.isnan(positions[:, 2]).all() != use_sharp_round
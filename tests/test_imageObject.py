@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 
+import os
+
+import numpy as np
 import pytest
+from astropy.io import fits
 from drizzlepac import imageObject
 
 #from http://blog.moertel.com/articles/2008/03/19/property-checking-with-pythons-nose-testing-framework
@@ -32,3 +36,33 @@ class TestimageObject():
         assert(image._naxis1 > 0)
         assert(image._naxis2 > 0)
         assert(image._instrument != '')
+
+
+def test_DataCache(tmpdir):
+    """Arrays are read once, evicted beyond the byte limit and re-read
+       after the file gets modified.
+    """
+    fname = str(tmpdir.join('cache_test.fits'))
+    hdus = [fits.PrimaryHDU()]
+    for extver in (1, 2):
+        hdus.append(fits.ImageHDU(np.full((10, 10), extver, dtype=np.float32),
+                                  name='SCI', ver=extver))
+    fits.HDUList(hdus).writeto(fname)
+
+    cache = imageObject.DataCache(max_bytes=400)
+    sci1 = cache.get(fname, 'SCI,1')
+    assert cache.get(fname, 'sci,1') is sci1
+    assert cache.hits == 1 and cache.misses == 1
+
+    # only one 10x10 float32 array fits in the cache
+    sci2 = cache.get(fname, 'SCI,2')
+    assert np.all(sci2 == 2) and cache.nbytes == 400
+    assert cache.get(fname, 'SCI,1') is not sci1
+
+    with fits.open(fname, mode='update') as hdul:
+        hdul['SCI', 1].data[:] = 5
+    st = os.stat(fname)
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert np.all(cache.get(fname, 'SCI,1') == 5)
+
+    assert cache.get(str(tmpdir.join('missing.fits')), 'SCI,1') is None
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from drizzlepac import imgclasses
+
+
+def _all_pairs_2dhist(imgxy, refxy, r):
+    """The zero-point histogram computed from all the pairs of positions."""
+    dx = np.subtract.outer(imgxy[:, 0], refxy[:, 0]).ravel()
+    dy = np.subtract.outer(imgxy[:, 1], refxy[:, 1]).ravel()
+    r = int(np.ceil(r))
+    idx = np.where((dx < r + 0.5) & (dx >= -r - 0.5) &
+                   (dy < r + 0.5) & (dy >= -r - 0.5))
+    h = np.histogram2d(dx[idx], dy[idx], 2 * r + 1,
+                       [[-r - 0.5, r + 0.5], [-r - 0.5, r + 0.5]])
+    return h[0].T
+
+
+def _catalogs(seed):
+    rng = np.random.default_rng(seed)
+    nref = rng.choice([0, 1, 5, 60, 300])
+    nimg = rng.choice([0, 1, 5, 60, 300])
+    dtype = rng.choice([np.float32, np.float64])
+    refxy = rng.uniform(0, 200, size=(nref, 2))
+    # shifted copies of some of the reference positions, by whole and half
+    # pixels so that some of the offsets fall on the edges of the bins
+    nshift = min(nref, nimg // 2)
+    shifted = refxy[:nshift] + rng.integers(-8, 8, size=(nshift, 2)) / 2.
+    imgxy = np.vstack([shifted, rng.uniform(-20, 220, size=(nimg - nshift, 2))])
+    # extra columns are ignored
+    imgxy = np.hstack([imgxy, rng.uniform(size=(nimg, 1))])
+    for xy in (imgxy, refxy):
+        if len(xy):
+            xy[rng.choice(len(xy), (len(xy) + 9) // 10), rng.integers(0, 2)] = np.nan
+    return imgxy.astype(dtype), refxy.astype(dtype)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_xy_2dhist(seed):
+    """The histogram of the nearby pairs matches the one of all the pairs."""
+    imgxy, refxy = _catalogs(seed)
+    for r in (0.5, 1.0, 3.0, 4.2):
+        zpmat = imgclasses._xy_2dhist(imgxy, refxy, r)
+        assert zpmat.shape == (2 * int(np.ceil(r)) + 1,) * 2
+        assert np.array_equal(zpmat, _all_pairs_2dhist(imgxy, refxy, r))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_xy_close_pairs(seed):
+    """All the pairs of finite positions within the radius along both axes,
+    and only those, get returned.
+    """
+    imgxy, refxy = _catalogs(seed)
+    r = 3.5
+    imgidx, refidx = imgclasses._xy_close_pairs(imgxy, refxy, r)
+    dx = np.abs(np.subtract.outer(imgxy[:, 0], refxy[:, 0]).astype(np.float64))
+    dy = np.abs(np.subtract.outer(imgxy[:, 1], refxy[:, 1]).astype(np.float64))
+    expected = np.argwhere((dx <= r) & (dy <= r))
+    assert imgidx.dtype.kind == refidx.dtype.kind == 'i'
+    pairs = np.stack([imgidx, refidx], axis=1)
+    assert np.array_equal(pairs[np.lexsort(pairs.T[::-1])], expected)
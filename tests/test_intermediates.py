@@ -0,0 +1,123 @@
+""" Tests of the static mask statistics and sky values reused by the
+AstroDrizzle runs within ``util.reuse_intermediates``, on copies of a
+small WFC3/UVIS exposure.
+"""
+import os
+import shutil
+
+import pytest
+from astropy.io import fits
+
+from drizzlepac import astrodrizzle, sky, staticMask, util
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, 'drizzlepac',
+                      'haputils', 'tests', 'sample_svm_flc.fits')
+INPUTS = ['ib4606c1q_flc.fits', 'ib4606c2q_flc.fits']
+
+
+@pytest.fixture
+def inputs(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    for name in INPUTS:
+        shutil.copy(SAMPLE, name)
+    return tmpdir
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    """ Record the sky values and chip statistics actually computed. """
+    calls = {'sky': 0, 'stats': 0}
+    skymatch = sky._skymatch
+    chip_stats = staticMask.chipStats
+
+    def spy_skymatch(*args, **kwargs):
+        calls['sky'] += 1
+        return skymatch(*args, **kwargs)
+
+    def spy_chip_stats(*args, **kwargs):
+        calls['stats'] += 1
+        return chip_stats(*args, **kwargs)
+
+    monkeypatch.setattr(sky, '_skymatch', spy_skymatch)
+    monkeypatch.setattr(staticMask, 'chipStats', spy_chip_stats)
+    return calls
+
+
+def _run(calls, **pars):
+    calls['sky'] = calls['stats'] = 0
+    astrodrizzle.AstroDrizzle(INPUTS, output='final', clean=False, build=False,
+                              context=False, preserve=False, num_cores=1,
+                              driz_separate=False, median=False, blot=False,
+                              driz_cr=False, driz_combine=False, **pars)
+    return dict(calls)
+
+
+def _skies():
+    skies = []
+    for name in INPUTS:
+        with fits.open(name) as hdul:
+            skies.append([hdul['SCI', k].header['MDRIZSKY'] for k in (1, 2)])
+    return skies
+
+
+def test_reuse(inputs, computed):
+    """ A second run on the same pixel values reuses the chip statistics and
+    sky values, setting MDRIZSKY again.
+    """
+    with util.reuse_intermediates() as cache:
+        assert _run(computed) == {'sky': 1, 'stats': 4}
+        skies = _skies()
+        assert all(value > 0 for values in skies for value in values)
+        for name in INPUTS:
+            with fits.open(name, mode='update') as hdul:
+                for k in (1, 2):
+                    hdul['SCI', k].header['MDRIZSKY'] = 0.
+                # the WCS does not matter
+                hdul['SCI', 1].header['CRVAL1'] += 1e-4
+
+        assert _run(computed) == {'sky': 0, 'stats': 0}
+        assert _skies() == skies
+        assert cache.hits == 5
+        assert util.get_intermediate_cache() is cache
+    assert util.get_intermediate_cache() is None
+
+    # nothing gets reused outside of reuse_intermediates
+    assert _run(computed) == {'sky': 1, 'stats': 4}
+
+
+def test_pixels_changed(inputs, computed):
+    """ Changing a pixel value invalidates the results depending on it. """
+    with util.reuse_intermediates():
+        assert _run(computed) == {'sky': 1, 'stats': 4}
+        with fits.open(INPUTS[1], mode='update') as hdul:
+            hdul['SCI', 2].data[3, 4] += 100.
+        assert _run(computed) == {'sky': 1, 'stats': 1}
+        assert _run(computed) == {'sky': 0, 'stats': 0}
+
+
+@pytest.mark.parametrize('pars', [dict(skystat='mean'), dict(skylower=-100.),
+                                  dict(sky_bits='16'), dict(use_static=False)])
+def test_sky_pars_changed(inputs, computed, pars):
+    """ Changing a sky parameter invalidates the sky values only. """
+    with util.reuse_intermediates():
+        assert _run(computed) == {'sky': 1, 'stats': 4}
+        assert _run(computed, **pars) == {'sky': 1, 'stats': 0}
+        assert _run(computed, **pars) == {'sky': 0, 'stats': 0}
+
+
+@pytest.mark.parametrize('skymethod', ['match', 'globalmin+match'])
+def test_no_sky_reuse(inputs, computed, skymethod):
+    """ Sky values depending on the overlap of the images get computed again. """
+    with util.reuse_intermediates():
+        assert _run(computed, skymethod=skymethod) == {'sky': 1, 'stats': 4}
+        assert _run(computed, skymethod=skymethod) == {'sky': 1, 'stats': 0}
+
+
+def test_can_reuse_sky():
+    """ Neither the matched sky values nor those using sky masks get reused. """
+    pars = {'skymethod': 'localmin', 'skymask_cat': ''}
+    assert sky._canReuseSky(pars)
+    assert sky._canReuseSky(dict(pars, skymethod='globalmin'))
+    assert not sky._canReuseSky(dict(pars, skymethod='match'))
+    assert not sky._canReuseSky(dict(pars, skymethod='globalmin+match'))
+    assert not sky._canReuseSky(dict(pars, skymask_cat='skymasks.cat'))
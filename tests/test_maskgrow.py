@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from drizzlepac import maskgrow
+
+
+def _kernel_box(kernel):
+    """Offsets of the rows and columns of the ones in a box-shaped kernel,
+    as applied by ``convolve2d(..., mode='same')``."""
+    iy, ix = np.nonzero(kernel)
+    ylo, yhi = maskgrow.convolve_box_window(kernel.shape[0])
+    xlo, xhi = maskgrow.convolve_box_window(kernel.shape[1])
+    return (yhi - iy.max(), yhi - iy.min()), (xhi - ix.max(), xhi - ix.min())
+
+
+@pytest.mark.parametrize("boundary", ["symm", "fill"])
+@pytest.mark.parametrize("shape", [(1, 7), (5, 3), (40, 57)])
+def test_box_count(boundary, shape):
+    """Box counts match the convolution of the mask with boxes of ones."""
+    rng = np.random.default_rng(7)
+    mask = rng.random(shape) < 0.3
+    kernels = [np.ones((3, 3)), np.ones((2, 2)), np.ones((4, 1)),
+               np.ones((9, 9))]
+    for ctegrow in (1, 3):
+        kernel = np.zeros((2 * ctegrow + 1, 2 * ctegrow + 1))
+        kernel[:ctegrow, ctegrow] = 1
+        kernels.extend([kernel, kernel[::-1]])
+
+    for kernel in kernels:
+        truth = signal.convolve2d(mask, kernel, boundary=boundary,
+                                  mode='same')
+        rows, cols = _kernel_box(kernel)
+        count = maskgrow.box_count(mask, rows, cols, boundary=boundary)
+        assert np.array_equal(count, truth.astype(int))
+
+
+def test_erode_dilate():
+    rng = np.random.default_rng(3)
+    mask = rng.random((30, 20)) < 0.5
+    truth = signal.convolve2d(mask, np.ones((3, 3)), boundary='symm',
+                              mode='same') >= 9
+    assert np.array_equal(maskgrow.erode(mask, (-1, 1), (-1, 1)), truth)
+
+    ker = np.ones((5, 5)) / 25.0
+    truth = signal.convolve2d(mask.astype(np.float64), ker, boundary='fill',
+                              mode='same') != 0
+    assert np.array_equal(maskgrow.dilate(mask, (-2, 2), (-2, 2)), truth)
+
+
+def test_empty_box():
+    with pytest.raises(ValueError):
+        maskgrow.box_count(np.ones((3, 3), dtype=bool), (0, -1), (0, 0))
@@ -0,0 +1,108 @@
+""" Tests of the WCS of the input files updated by parallel workers, on
+copies of a small WFC3/UVIS exposure with alternate WCSs.
+"""
+import glob
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+from astropy.io import fits
+from stwcs.wcsutil import altwcs
+
+from drizzlepac import processInput, util
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, 'drizzlepac',
+                      'haputils', 'tests', 'sample_svm_flc.fits')
+NFILES = 7
+
+
+def _make_inputs(dirname):
+    names = []
+    for k in range(NFILES):
+        name = os.path.join(dirname, 'ib4606c{:d}q_flc.fits'.format(k))
+        shutil.copy(SAMPLE, name)
+        # the WCSCORR table gets created again
+        with fits.open(name, mode='update') as hdul:
+            del hdul['WCSCORR']
+        names.append(name)
+    return names
+
+
+def _wcs_state(names):
+    """ Headers of the science extensions and WCSCORR tables of the files. """
+    state = []
+    for name in names:
+        with fits.open(name) as hdul:
+            headers = [hdul['SCI', k].header.tostring() for k in (1, 2)]
+            state.append((headers, np.array(hdul['WCSCORR'].data)))
+    return state
+
+
+@pytest.fixture
+def workers(tmpdir, monkeypatch):
+    """ Record the start and end times of the files updated by each process. """
+    monkeypatch.setattr(util, "can_parallel", True)
+    monkeypatch.setattr(util, "_cpu_count", 8)
+    logdir = tmpdir.mkdir('workers')
+    update = processInput._process_input_wcs_single
+
+    def spy(fname, wcskey, updatewcs):
+        start = time.time()
+        time.sleep(0.2)
+        update(fname, wcskey, updatewcs)
+        with open(str(logdir.join(os.path.basename(fname) + '.json')), 'w') as fh:
+            json.dump([os.getpid(), start, time.time()], fh)
+
+    monkeypatch.setattr(processInput, '_process_input_wcs_single', spy)
+
+    def records():
+        result = []
+        for name in sorted(glob.glob(str(logdir.join('*.json')))):
+            with open(name) as fh:
+                result.append(json.load(fh))
+            os.remove(name)
+        return result
+
+    return records
+
+
+@pytest.mark.parametrize('wcskey', ['B', 'IDC_2731450pi-HSC30'])
+def test_parallel_wcs(tmpdir, workers, wcskey):
+    """ The WCS of the files updated in parallel, by at most MAX_WCS_UPDATES
+    processes at a time, match those updated serially.
+    """
+    serial = _make_inputs(str(tmpdir.mkdir('serial')))
+    assert processInput._process_input_wcs(serial, wcskey, False, num_cores=1) == serial
+    assert {pid for pid, _, _ in workers()} == {os.getpid()}
+
+    parallel = _make_inputs(str(tmpdir.mkdir('parallel')))
+    assert processInput._process_input_wcs(parallel, wcskey, False, num_cores=8) == parallel
+    records = workers()
+    assert len(records) == NFILES
+    assert os.getpid() not in {pid for pid, _, _ in records}
+    # number of files updated at the same time
+    times = [(start, 1) for _, start, _ in records] + [(end, -1) for _, _, end in records]
+    running = np.cumsum([step for _, step in sorted(times)])
+    assert 1 < running.max() <= processInput.MAX_WCS_UPDATES
+
+    serial_state = _wcs_state(serial)
+    for (headers, table), (serial_headers, serial_table) in zip(_wcs_state(parallel), serial_state):
+        assert headers == serial_headers
+        np.testing.assert_array_equal(table, serial_table)
+    # the WCS got restored
+    with fits.open(parallel[0]) as hdul:
+        assert hdul['SCI', 1].header['WCSNAME'] == 'IDC_2731450pi-HSC30'
+        assert 'B' in altwcs.wcskeys(hdul['SCI', 1].header)
+
+
+@pytest.mark.parametrize('wcskey', [None, '', 'INDEF'])
+def test_no_wcs_update(tmpdir, workers, wcskey):
+    """ No workers get started when there is no WCS to update. """
+    names = _make_inputs(str(tmpdir))
+    mtimes = [os.path.getmtime(name) for name in names]
+    assert processInput._process_input_wcs(names, wcskey, False, num_cores=8) == names
+    assert workers() == []
+    assert [os.path.getmtime(name) for name in names] == mtimes
@@ -0,0 +1,120 @@
+""" Tests of the profile of the resources used by each processing step and
+chip, written by ``util.ProcSteps``.
+"""
+import csv
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from drizzlepac import util
+
+NBYTES = 2**20
+
+
+def _process_chip(step, chip, filename):
+    start = util.start_chip_usage()
+    data = np.full(NBYTES // 8, 1.5)
+    data.tofile(filename)
+    np.fromfile(filename).sum()
+    util.record_chip_usage(step, chip, start, npix=data.size)
+
+
+def _profile(tmpdir):
+    profile = str(tmpdir.join('run_profile'))
+    steps = util.ProcSteps(profile=profile)
+
+    steps.addStep('Read')
+    for k in (1, 2):
+        _process_chip('Read', 'sci,{:d}'.format(k), str(tmpdir.join('chip{:d}.dat'.format(k))))
+    time.sleep(0.2)
+    steps.endStep('Read')
+
+    steps.addStep('Compute')
+    # chips processed by threads
+    threads = [threading.Thread(target=_process_chip,
+                                args=('Compute', 'sci,{:d}'.format(k),
+                                      str(tmpdir.join('thread{:d}.dat'.format(k)))))
+               for k in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # and some CPU time and memory used by the step itself
+    big = np.ones((4 * NBYTES) // 8)
+    t0 = time.process_time()
+    while time.process_time() - t0 < 0.1:
+        big.sum()
+    steps.endStep('Compute')
+
+    steps.writeProfile()
+    return profile, big.nbytes
+
+
+def test_profile(tmpdir):
+    """ The resources used by the steps and chips get written out to the
+    JSON and CSV files.
+    """
+    profile, nbytes = _profile(tmpdir)
+    assert not os.path.exists(profile + '_chips.tmp')
+    # no more chips get recorded once the profile has been written
+    util.record_chip_usage('Read', 'sci,3', util.get_resource_usage(thread=True))
+
+    with open(profile + '.json') as fh:
+        report = json.load(fh)
+    assert report['version'] == util.__version__
+    assert set(report['total']) == set(util.USAGE_FIELDS)
+
+    steps = report['steps']
+    assert [row['step'] for row in steps] == ['Read', 'Compute']
+    for row in steps:
+        assert set(row) == {'step'} | set(util.USAGE_FIELDS)
+    read, compute = steps
+    assert read['wall_time'] >= 0.2
+    assert compute['cpu_time'] >= 0.1
+    assert read['write_bytes'] >= 2 * NBYTES
+    assert read['read_bytes'] >= 2 * NBYTES
+    assert compute['peak_rss'] >= nbytes
+    assert report['total']['wall_time'] >= read['wall_time'] + compute['wall_time']
+    assert report['total']['cpu_time'] >= compute['cpu_time']
+
+    chips = report['chips']
+    assert sorted((row['step'], row['chip']) for row in chips) == \
+        [('Compute', 'sci,1'), ('Compute', 'sci,2'), ('Read', 'sci,1'), ('Read', 'sci,2')]
+    for row in chips:
+        assert set(row) == {'step', 'chip', 'npix'} | set(util.USAGE_FIELDS)
+        assert row['npix'] == NBYTES // 8
+        assert row['wall_time'] > 0
+        assert row['cpu_time'] >= 0
+        # the I/O of the thread processing the chip only
+        assert NBYTES <= row['write_bytes'] < 2 * NBYTES
+        assert NBYTES <= row['read_bytes'] < 2 * NBYTES
+        assert row['peak_rss'] >= NBYTES
+
+    with open(profile + '.csv', newline='') as fh:
+        reader = csv.DictReader(fh)
+        assert reader.fieldnames == ['step', 'chip'] + list(util.USAGE_FIELDS)
+        rows = list(reader)
+    expected = [dict(report['total'], step='Total', chip='')]
+    expected += [dict(row, chip='') for row in steps]
+    expected += [{key: value for key, value in row.items() if key != 'npix'} for row in chips]
+    assert len(rows) == len(expected)
+    for row, values in zip(rows, expected):
+        assert row['step'] == values['step'] and row['chip'] == values['chip']
+        for field in util.USAGE_FIELDS:
+            assert float(row[field]) == pytest.approx(values[field])
+
+
+def test_no_profile(tmpdir):
+    """ Nothing gets recorded nor written without a profile. """
+    steps = util.ProcSteps()
+    steps.addStep('Read')
+    assert util.start_chip_usage() is None
+    _process_chip('Read', 'sci,1', str(tmpdir.join('chip.dat')))
+    steps.endStep('Read')
+    steps.writeProfile()
+    assert 'usage' not in steps.steps['Read']
+    assert sorted(os.listdir(str(tmpdir))) == ['chip.dat']
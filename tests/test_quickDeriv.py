@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from drizzlepac import quickDeriv
+
+
+def _qderiv_reference(array):
+    """ Absolute derivative computed pixel by pixel. """
+    naxis1, naxis2 = array.shape
+    data = array.astype(np.float64)
+    out = np.zeros(array.shape, dtype=np.float64)
+    for j in range(naxis1):
+        for i in range(naxis2):
+            values = []
+            # neighbors compared by each shift, or 0 outside of its range
+            for ok, (y, x) in [(j < naxis1 - 1 and 1 <= i < naxis2 - 1, (j, i - 1)),
+                               (j < naxis1 - 1 and i < naxis2 - 2, (j, i + 1)),
+                               (1 <= j < naxis1 - 1 and i < naxis2 - 1, (j - 1, i)),
+                               (j < naxis1 - 2 and i < naxis2 - 1, (j + 1, i))]:
+                values.append(abs(data[j, i] - (data[y, x] if ok else 0.)))
+            out[j, i] = np.max(values)
+    return out.astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.int16])
+@pytest.mark.parametrize("shape", [(1, 1), (3, 2), (9, 7), (70, 12)])
+def test_qderiv(shape, dtype):
+    rng = np.random.default_rng(2)
+    array = (rng.normal(0., 50., size=shape)).astype(dtype)
+    expected = _qderiv_reference(array)
+
+    deriv = quickDeriv.qderiv(array)
+    assert deriv.dtype == np.float32
+    np.testing.assert_array_equal(deriv, expected)
+    for start, stop in [(0, 1), (2, 5), (shape[0] - 1, shape[0] + 3)]:
+        np.testing.assert_array_equal(quickDeriv.qderiv_rows(array, start, stop),
+                                      expected[max(start, 0):stop])
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_qderiv_not_finite(dtype):
+    """ Infinite differences give infinite pixels, differences with NaN or
+    between infinities of the same sign NaN pixels, edges included. """
+    rng = np.random.default_rng(5)
+    array = rng.normal(0., 50., size=(20, 15)).astype(dtype)
+    for value in [np.inf, -np.inf, np.nan]:
+        array[rng.integers(0, 20, 6), rng.integers(0, 15, 6)] = value
+    array[0, :2] = np.inf
+    array[-1, -1] = -np.inf
+    array[5:7, -1] = np.nan
+    with np.errstate(invalid='ignore'):
+        expected = _qderiv_reference(array)
+        assert np.isinf(expected).any() and np.isnan(expected).any()
+        np.testing.assert_array_equal(quickDeriv.qderiv(array), expected)
+        np.testing.assert_array_equal(quickDeriv.qderiv_rows(array, 4, 9), expected[4:9])
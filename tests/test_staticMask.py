@@ -0,0 +1,64 @@
+import glob
+import os
+import shutil
+
+import numpy as np
+import pytest
+from stsci.imagestats import ImageStats
+
+from drizzlepac import astrodrizzle, staticMask
+
+SAMPLE = os.path.join(os.path.dirname(__file__), os.pardir, 'drizzlepac',
+                      'haputils', 'tests', 'sample_svm_flc.fits')
+INPUTS = ['ib4606c1q_flc.fits', 'ib4606c2q_flc.fits']
+
+
+@pytest.fixture
+def chip():
+    rng = np.random.default_rng(3)
+    data = rng.normal(50., 5., size=(1500, 1400)).astype(np.float32)
+    # bad columns and pixels well below the sky
+    data[:, 100:103] = -20.
+    data[rng.integers(0, 1500, 500), rng.integers(0, 1400, 500)] = 2.
+    data[7, 5] = np.nan
+    return data
+
+
+def test_mask_below(chip):
+    """The mask computed by blocks of rows matches the one computed at once."""
+    threshold = 30.
+    expected = np.ones(chip.shape, dtype=np.int16)
+    expected[:, 1] = 0
+    mask = expected.copy()
+    np.bitwise_and(expected, np.logical_not(np.less(chip, threshold)), expected)
+
+    staticMask.maskBelow(mask, chip, threshold, block_rows=97)
+    assert mask.dtype == np.int16
+    np.testing.assert_array_equal(mask, expected)
+
+
+def test_chip_stats(chip):
+    """Statistics from a sample of the pixels are close to those from all of them."""
+    chip = np.nan_to_num(chip)
+    stats = ImageStats(chip, nclip=3, fields='mode')
+    assert staticMask.chipStats(chip) == (stats.mode, stats.stddev, len(stats.histogram))
+
+    mode, rms, nbins = staticMask.chipStats(chip, engine='sampled')
+    assert nbins >= 2
+    assert abs(mode - stats.mode) < 0.1 * stats.stddev
+    assert abs(rms - stats.stddev) < 0.01 * stats.stddev
+
+
+@pytest.mark.parametrize('static_prefix', [False, True])
+def test_mask_names(tmpdir, monkeypatch, static_prefix):
+    """The static mask names only start with the output rootname on request."""
+    monkeypatch.chdir(tmpdir)
+    for name in INPUTS:
+        shutil.copy(SAMPLE, name)
+    astrodrizzle.AstroDrizzle(INPUTS, output='final', clean=False, build=False,
+                              context=False, preserve=False, num_cores=1,
+                              skysub=False, driz_separate=False, median=False,
+                              blot=False, driz_cr=False, static_prefix=static_prefix)
+    prefix = 'final_drc_' if static_prefix else ''
+    names = sorted(glob.glob('*staticMask.fits'))
+    assert names == [prefix + '_10x10_{}_staticMask.fits'.format(k) for k in (1, 2)]